@@ -5,7 +5,6 @@ import time
 import os
 from timeit import default_timer as timer
 from datetime import datetime
-import subprocess
 
 # metadata
 metadata = {
@@ -45,7 +44,109 @@ OPENTRONS_TIPS          = True
 switch_off_lights       = False # Switch of the lights when the program finishes
 
 
+# >>> audio_worker.py
+import os
+import subprocess
+import threading
+import time
+from queue import Queue
+
+
+class AudioWorker:
+    def __init__(self, sounds_path):
+        self.sounds_path = sounds_path
+        self.queue = Queue()
+        self.thread = None
+
+    def play(self, filenames, delay = 0):
+        '''
+        Queue the sounds (mp3 files of sounds_path, the extension may be left
+        out) to play in order, delay seconds after the previous cue ends
+        '''
+        self.queue.put((delay, list(filenames)))
+        if self.thread is None:
+            self.thread = threading.Thread(target = self.work, name = 'audio_worker', daemon = True)
+            self.thread.start()
+
+    def work(self):
+        while True:
+            delay, filenames = self.queue.get()
+            time.sleep(delay)
+            for filename in filenames:
+                path = os.path.join(self.sounds_path, filename if filename.endswith('.mp3') else filename + '.mp3')
+                try:
+                    subprocess.call(['mpg123', '-q', path], stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+                except OSError: # mpg123 not installed
+                    pass
+            self.queue.task_done()
+# <<< audio_worker.py
+
+# >>> light_signals.py
+import threading
+
+# steps: (keyword arguments of hardware.set_lights, seconds), repeated in order.
+# end: lights set when the pattern ends or is stopped, None to leave the last step.
+LIGHT_PATTERNS = {
+    'tip_swap': {'steps': [({'rails': False, 'button': (1, 0, 0)}, 0.3), ({'rails': True, 'button': (0, 0, 1)}, 0.3)],
+                 'end': {'button': (0, 1, 0)}},
+    'finished': {'steps': [({'button': False, 'rails': False}, 0.3), ({'button': True, 'rails': True}, 0.3)],
+                 'end': None},
+    'error':    {'steps': [({'rails': False, 'button': (1, 0, 0)}, 0.15), ({'rails': False, 'button': False}, 0.15)],
+                 'end': {'button': (1, 0, 0)}},
+}
+
+
+class LightSignals:
+    def __init__(self, hardware, photosensitive = False):
+        self.hardware = hardware
+        self.photosensitive = photosensitive
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def set_lights(self, lights):
+        if self.photosensitive and lights.get('rails'):
+            lights = dict(lights, rails = False)
+        self.hardware.set_lights(**lights)
+
+    def start(self, pattern, times = None, end = None):
+        '''
+        Play pattern times (None: until stop()) in the background, replacing
+        the pattern being played. end replaces the end lights of the pattern.
+        '''
+        if pattern not in LIGHT_PATTERNS:
+            raise ValueError('Unknown light pattern ' + repr(pattern) + ', use one of ' + ', '.join(sorted(LIGHT_PATTERNS)))
+        self.stop()
+        if self.hardware is None:
+            return
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target = self.play, name = 'light_signals', daemon = True,
+                                       args = (LIGHT_PATTERNS[pattern], times, end, self.stopped))
+        self.thread.start()
+
+    def play(self, pattern, times, end, stopped):
+        repeat = 0
+        while (times is None or repeat < times) and not stopped.is_set():
+            for lights, seconds in pattern['steps']:
+                self.set_lights(lights)
+                if stopped.wait(seconds):
+                    break
+            repeat += 1
+        end = end if end is not None else pattern['end']
+        if end is not None:
+            self.set_lights(end)
+
+    def stop(self):
+        '''
+        Stop the pattern being played, once its end lights are set
+        '''
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+# <<< light_signals.py
+
 def run(ctx: protocol_api.ProtocolContext):
+    lights = LightSignals(None if ctx.is_simulating() else ctx._hw_manager.hardware, photosensitive = PHOTOSENSITIVE) # Light patterns played in the background
     STEP = 0
     STEPS = {  # Dictionary with STEP activation, description and times
         1: {'Execute': True, 'description': 'Mezclar y dispensar muestras ('+str(VOLUME_SAMPLE)+'ul)'}
@@ -177,20 +278,10 @@ def run(ctx: protocol_api.ProtocolContext):
                 tip_track['counts'][pip] = 0
         pip.pick_up_tip()
 
-    def run_quiet_process(command):
-        subprocess.check_output('{} &> /dev/null'.format(command), shell=True)
+    audio = AudioWorker(path_sounds) # Sounds played in the background
 
-    def play_sound(filename):
-        print('Speaker')
-        print('Next\t--> CTRL-C')
-        try:
-            run_quiet_process('mpg123 {}'.format(path_sounds + filename + '.mp3'))
-            run_quiet_process('mpg123 {}'.format(path_sounds + sonido_defecto))
-            run_quiet_process('mpg123 {}'.format(path_sounds + filename + '.mp3'))
-
-        except KeyboardInterrupt:
-            pass
-            print()
+    def play_sound(filename, delay = 0):
+        audio.play([filename, sonido_defecto, filename], delay)
     def start_run():
         ctx.comment(' ')
         ctx.comment('###############################################')
@@ -214,30 +305,15 @@ def run(ctx: protocol_api.ProtocolContext):
         now = datetime.now()
         # dd/mm/YY H:M:S
         finish_time = now.strftime("%Y/%m/%d %H:%M:%S")
-        if PHOTOSENSITIVE==False:
-            for i in range(10):
-                ctx._hw_manager.hardware.set_lights(button = False, rails =  False)
-                time.sleep(0.3)
-                ctx._hw_manager.hardware.set_lights(button = True, rails =  True)
-                time.sleep(0.3)
-        else:
-            for i in range(10):
-                ctx._hw_manager.hardware.set_lights(button = False, rails =  False)
-                time.sleep(0.3)
-                ctx._hw_manager.hardware.set_lights(button = True, rails =  False)
-                time.sleep(0.3)
-        if switch_off_lights:
-            ctx._hw_manager.hardware.set_lights(button = True, rails =  False)
+        lights.start('finished', times = 10, end = {'button': True, 'rails': False} if switch_off_lights else None)
 
         used_tips = tip_track['num_refills'][p1000] * 96 * len(p1000.tip_racks) + tip_track['counts'][p1000]
         ctx.comment('Puntas de 1000 ul utilizadas: ' + str(used_tips) + ' (' + str(round(used_tips / 96, 2)) + ' caja(s))')
         ctx.comment('###############################################')
 
         if not ctx.is_simulating():
-            for i in range(SOUND_NUM_PLAYS):
-                if i > 0:
-                    time.sleep(60)
-                play_sound('finished_process_esp')
+            for i in range(SOUND_NUM_PLAYS): # Every minute, without holding the run
+                play_sound('finished_process_esp', delay = 60 if i > 0 else 0)
 
             return finish_time
 
@@ -287,6 +363,17 @@ def run(ctx: protocol_api.ProtocolContext):
         'tips': { p1000: [tip for rack in tips1000 for tip in rack.rows()[0]]}
     }
 
+    # Tip of every sample, taken in rack order
+    tip_wells = [tip for rack in tips1000 for tip in rack.wells()]
+    sample_tips = [tip_wells[i % len(tip_wells)] for i in range(len(sample_sources))]
+
+    # Sample map for traceability
+    if not ctx.is_simulating():
+        with open(folder_path + '/StationA_sample_map.txt', 'w') as f:
+            f.write('sample\tsource\tdestination\ttip\n')
+            for i, (s, d, tip) in enumerate(zip(sample_sources, destinations, sample_tips)):
+                f.write(str(i + 1) + '\t' + str(s) + '\t' + d.well_name + '\t' + tip.well_name + '\n')
+
 
     start_run()
 
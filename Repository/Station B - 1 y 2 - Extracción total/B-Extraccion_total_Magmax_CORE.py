@@ -1,17 +1,10 @@
 import math
-from opentrons.types import Point
 from opentrons import protocol_api
-import time
-import numpy as np
-from timeit import default_timer as timer
-import json
-from datetime import datetime
-import csv
 
 
 # metadata
 metadata = {
-    'protocolName': 'Station B - RNA extraction',
+    'protocolName': 'Station B - RNA extraction - Magmax CORE',
     'author': 'Aitor Gastaminza & José Luis Villanueva & Alex Gasulla & Manuel Alba & Daniel Peñil',
     'source': 'Hospital Clínic Barcelona & HU Vall Hebrón & HU Marqués de Valdecilla',
     'apiLevel': '2.3',
@@ -21,7 +14,7 @@ metadata = {
 ################################################
 # CHANGE THESE VARIABLES ONLY
 ################################################
-NUM_SAMPLES                         = 96    # Must be multiple of 8
+NUM_SAMPLES                         = 96    # If not a multiple of 8 the last column is done with fewer tips
 LYSIS_VOLUME_PER_SAMPLE             = 700   # Original: 300
 BEADS_VOLUME_PER_SAMPLE             = 30
 WASH_VOLUME_PER_SAMPLE              = 500
@@ -37,23 +30,1188 @@ ELUTION_NUM_MIXES                   = 20
 VOLUME_SAMPLE                       = 200   # Sample volume received in station A
 SET_TEMP_ON                         = True  # Do you want to start temperature module?
 TEMPERATURE                         = 4     # Set temperature. It will be uesed if set_temp_on is set to True
+SPEED_PROFILE                       = 'safe' # Liquid class settings: 'safe' (validated) or 'fast'
+TIP_RECYCLING_IN_WASH               = False # Return the tip of every column to its rack after the wash and use it again to remove the supernatant
+TIP_RECYCLING_IN_ELUTION            = False # Return the tip of every column to its rack after the elution and use it again to transfer it
+CONTINUE_TIPRACKS                   = False # Continue from the tips the previous run left in the tipracks (tip inventory, also when resuming a checkpoint), otherwise every tiprack is new
+NEW_TIPRACK_SLOTS                   = []    # With CONTINUE_TIPRACKS, slots with new tipracks
+LOG_LEVEL                           = 'operator' # Run log detail: 'operator' or 'debug' (every pickup height and reservoir column)
+RESUME_FROM_CHECKPOINT              = False # True to continue a stopped run from the column it stopped in (checkpoint.json of its folder)
 ################################################
 
 
-run_id                      = 'B_Extraccion_total_TurboBeads'
+run_id                      = 'B_Extraccion_total_Magmax_CORE'
 
 recycle_tip                 = False # Do you want to recycle tips? It shoud only be set True for testing
 mag_height                  = 7 # Height needed for NEST deepwell in magnetic deck
-multi_well_rack_area        = 8 * 71 #Cross section of the 12 well reservoir
+reagent_follow_depth        = 1     # mm below the liquid level when aspirating the reagents
+supernatant_extra_vol       = 20    # Volume over the supernatant removed to leave the well empty
+supernatant_final_height    = 0.5   # Pickup height of the final trip, next to the pellet
+supernatant_follow_depth    = 2     # mm below the liquid level when aspirating the upper trips
+supernatant_fast_rate       = 1     # Aspirate rate of the upper trips (next to the pellet Sample.flow_rate_aspirate is used)
 
 num_cols = math.ceil(NUM_SAMPLES / 8) # Columns we are working on
+full_cols = NUM_SAMPLES // 8 # Complete columns, the last one may have fewer samples
+
+# Shared code of Utils/, copied into the uploaded protocol by Utils/bundle.py: edit
+# Fuentes/B-Extraccion_total_Magmax_CORE.py and bundle it again (see README.md)
+# >>> liquid_classes.py: EXTRACTION_FIELDS, liquid_class
+SPEED_PROFILES = ['safe', 'fast']
+
+# Arguments of the Reagent classes of the extraction protocols
+EXTRACTION_FIELDS   = ['flow_rate_aspirate', 'flow_rate_dispense', 'flow_rate_aspirate_mix', 'flow_rate_dispense_mix',
+                       'air_gap_vol_bottom', 'air_gap_vol_top', 'disposal_volume']
+
+LIQUID_DEFAULTS = {
+    'air_gap_vol_bottom':   5,
+    'air_gap_vol_top':      0,
+    'disposal_volume':      1,
+}
+
+LIQUID_CLASSES = {
+    'lysis': {
+        'safe': {'flow_rate_aspirate': 1, 'flow_rate_dispense': 1, 'flow_rate_aspirate_mix': 1, 'flow_rate_dispense_mix': 1},
+        'fast': {'flow_rate_aspirate': 25, 'flow_rate_dispense': 100, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 100},
+    },
+    'lysis_binding': {  # Magmax CORE lysis + binding solution, viscous
+        'safe': {'flow_rate_aspirate': 0.5, 'flow_rate_dispense': 0.5, 'flow_rate_aspirate_mix': 0.5, 'flow_rate_dispense_mix': 0.5},
+    },
+    'beads': {
+        'safe': {'flow_rate_aspirate': 3, 'flow_rate_dispense': 3, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 50},
+        'fast': {'flow_rate_aspirate': 25, 'flow_rate_dispense': 100, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 100},
+    },
+    'beads_pk': {
+        'safe': {'flow_rate_aspirate': 3, 'flow_rate_dispense': 3, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 50},
+        'fast': {'flow_rate_aspirate': 25, 'flow_rate_dispense': 100, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 100},
+    },
+    'wash': {
+        'safe': {'flow_rate_aspirate': 3, 'flow_rate_dispense': 3, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 100},
+        'fast': {'flow_rate_aspirate': 25, 'flow_rate_dispense': 100, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 100},
+    },
+    'ethanol': {        # Drips from the tips when aspirated fast
+        'safe': {'flow_rate_aspirate': 3, 'flow_rate_dispense': 3, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 100},
+    },
+    'elution': {
+        'safe': {'flow_rate_aspirate': 3, 'flow_rate_dispense': 3, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 40},
+        'fast': {'flow_rate_aspirate': 25, 'flow_rate_dispense': 100, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 100},
+    },
+    'sample': {         # Sample / supernatant in the deepwell plate
+        'safe': {'flow_rate_aspirate': 0.5, 'flow_rate_dispense': 1, 'flow_rate_aspirate_mix': 1, 'flow_rate_dispense_mix': 1},
+        'fast': {'flow_rate_aspirate': 5, 'flow_rate_dispense': 100},
+    },
+}
+
+
+def liquid_class(name, profile = 'safe', fields = None):
+    '''
+    Settings of a liquid class for a speed profile, as keyword arguments of a
+    Reagent. fields restricts them to the arguments the Reagent class accepts.
+    '''
+    if name not in LIQUID_CLASSES:
+        raise ValueError('Unknown liquid class ' + repr(name) + ', use one of ' + ', '.join(sorted(LIQUID_CLASSES)))
+    if profile not in SPEED_PROFILES:
+        raise ValueError('Unknown speed profile ' + repr(profile) + ', use one of ' + ', '.join(SPEED_PROFILES))
+    settings = dict(LIQUID_DEFAULTS)
+    settings.update(LIQUID_CLASSES[name]['safe'])
+    settings.update(LIQUID_CLASSES[name].get(profile, {}))
+    if fields is not None:
+        settings = dict((field, settings[field]) for field in fields)
+    return settings
+# <<< liquid_classes.py
+
+# >>> tip_inventory.py: partial_pickup_racks, column_tips, RunTips
+import json
+import os
+from datetime import datetime
+
+TIP_INVENTORY_PATH = '/var/lib/jupyter/notebooks/tip_inventory'
+
+
+def tip_inventory_file(slot, tip_type):
+    return os.path.join(TIP_INVENTORY_PATH, 'slot_' + str(slot) + '_' + tip_type + '.json')
+
+
+def read_tip_count(slot, tip_type):
+    '''
+    Tips already taken from the rack of a slot, 0 for a slot without inventory
+    '''
+    try:
+        with open(tip_inventory_file(slot, tip_type)) as f:
+            return int(json.load(f)['used'])
+    except (IOError, ValueError, KeyError):
+        return 0
+
+
+def write_tip_count(slot, tip_type, used):
+    path = tip_inventory_file(slot, tip_type)
+    os.makedirs(TIP_INVENTORY_PATH, exist_ok = True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'slot': str(slot), 'tip_type': tip_type, 'used': used,
+                   'updated': datetime.now().strftime('%Y/%m/%d %H:%M:%S')}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def used_tips(rack):
+    '''
+    Position after the last tip taken from the rack. Tips returned to the rack
+    (tip recycling) have been used, so the gaps before it count as used too.
+    '''
+    wells = rack.wells()
+    for i in reversed(range(len(wells))):
+        if not wells[i].has_tip:
+            return i + 1
+    return 0
+
+
+def free_tips(pip):
+    '''
+    Tips the pipette can still pick up from each of its racks: multichannel
+    pipettes need full columns
+    '''
+    if pip.channels == 1:
+        return [len([well for well in rack.wells() if well.has_tip]) for rack in pip.tip_racks]
+    return [pip.channels * len([column for column in rack.columns() if all(well.has_tip for well in column)])
+            for rack in pip.tip_racks]
+
+
+def available_tips(pip):
+    return sum(free_tips(pip))
+
+
+def tip_refills(free, capacity, demand, replace_all = False):
+    '''
+    Refills of plan_tip_refills, replacing all the racks every time with
+    replace_all
+    '''
+    free = list(free)
+    refills = []
+    for i, (step, tips, wait) in enumerate(demand):
+        if i == 0 or wait:
+            needed = tips
+            for later_step, later_tips, later_wait in demand[i + 1:]:
+                if later_wait:
+                    break
+                needed += later_tips
+            if sum(free) < needed:
+                racks = [k for k in range(len(free)) if free[k] == 0]
+                if replace_all or sum(free) + capacity * len(racks) < needed:
+                    racks = list(range(len(free)))
+                for k in racks:
+                    free[k] = capacity
+                refills.append((step, racks))
+        for k in range(len(free)):
+            taken = min(free[k], tips)
+            free[k] -= taken
+            tips -= taken
+    return refills
+
+
+def plan_tip_refills(free, capacity, demand):
+    '''
+    Racks to replace so that the tips do not run out in the middle of a STEP.
+    free: tips left in each rack (free_tips), capacity: tips of a full rack,
+    demand: (STEP, tips it uses, True if it is a wait) for the STEPS still to
+    run, in order. The racks are checked before the first STEP and at every
+    wait: when the tips left do not reach the next wait, the empty racks are
+    replaced, or all of them if that is not enough. When replacing only the
+    empty racks needs more pauses than replacing all of them, every refill is a
+    full swap. Returns [(STEP, [rack indexes])].
+    '''
+    refills = tip_refills(free, capacity, demand)
+    full_swaps = tip_refills(free, capacity, demand, replace_all = True)
+    return full_swaps if len(full_swaps) < len(refills) else refills
+
+
+def load_tip_inventory(pip, slots, new_slots = None):
+    '''
+    Mark as used the tips the previous runs took from the racks of pip (loaded
+    in slots, in the same order). The racks in new_slots start from their first
+    tip: pass every slot unless the operator chose to continue the racks of the
+    previous run. Returns the counts to pass to save_tip_inventory.
+    '''
+    new_slots = [str(slot) for slot in (new_slots or [])]
+    saved = {}
+    for slot, rack in zip(slots, pip.tip_racks):
+        used = 0 if str(slot) in new_slots else min(read_tip_count(slot, rack.load_name), len(rack.wells()))
+        for well in rack.wells()[:used]:
+            rack.use_tips(well)
+        write_tip_count(slot, rack.load_name, used)
+        saved[str(slot)] = used
+    return saved
+
+
+def save_tip_inventory(pip, slots, saved):
+    '''
+    Write the racks of pip whose used tips changed since the last save
+    '''
+    for slot, rack in zip(slots, pip.tip_racks):
+        used = max(used_tips(rack), saved.get(str(slot), 0))
+        if saved.get(str(slot)) != used:
+            write_tip_count(slot, rack.load_name, used)
+            saved[str(slot)] = used
+
+
+def front_slot(slot):
+    '''
+    Deck slot in front of slot (closer to the operator), None for the front row
+    '''
+    return str(int(slot) - 3) if int(slot) > 3 else None
+
+
+def partial_pickup_racks(pip, deck):
+    '''
+    Racks of pip a partial column can be picked up from: the front nozzles
+    without tip hang past row H, so only the racks with nothing loaded in the
+    slot in front of them (deck: ctx.deck)
+    '''
+    return [rack for rack in pip.tip_racks if front_slot(rack.parent) is None or deck[front_slot(rack.parent)] is None]
+
+
+def next_tip(pip, num_tips = None, deck = None):
+    '''
+    Tip (well of its rack) the next pip.pick_up_tip() without location takes,
+    None when the racks are empty. With num_tips fewer than the channels of a
+    multichannel pipette, the well of the first column whose last num_tips
+    tips are left in the racks of partial_pickup_racks: picking up from it the
+    back nozzles take those tips and the front ones stay out of the rack. A full
+    column without such a rack (or deck).
+    '''
+    if num_tips is not None and num_tips < pip.channels and deck is not None:
+        for rack in partial_pickup_racks(pip, deck):
+            for column in rack.columns():
+                if all(well.has_tip for well in column[len(column) - num_tips:]):
+                    return column[len(column) - num_tips]
+    for rack in pip.tip_racks:
+        tip = rack.next_tip(pip.channels)
+        if tip is not None:
+            return tip
+    return None
+
+
+def pick_up(pip, tip_track, replace_tipracks, num_tips = None, tip_reuse = None, events = None, slots = None, saved = None,
+            deck = None):
+    '''
+    Pick up the next tip of pip (num_tips of a multichannel, see next_tip with
+    deck) and return it. When tip_track counts as many tips as its maxes,
+    replace_tipracks(pip, racks) replaces first the racks without tips kept by
+    tip_reuse. The pickup goes to events and the racks to the inventory (slots
+    and saved as in save_tip_inventory) when given.
+    '''
+    if tip_track['counts'][pip] >= tip_track['maxes'][pip]:
+        replace_tipracks(pip, [k for k, rack in enumerate(pip.tip_racks) if tip_reuse is None or not tip_reuse.holds(rack)])
+    tip = next_tip(pip, num_tips, deck)
+    pip.pick_up_tip(tip)
+    if events is not None:
+        events.event('tip_pickup', tip = tip.display_name)
+    if slots is not None:
+        save_tip_inventory(pip, slots, saved)
+    return tip
+
+
+def column_tips(num_samples, col):
+    '''
+    Tips of column col of num_samples samples: the last column has fewer samples
+    when num_samples is not a multiple of 8
+    '''
+    full_cols = num_samples // 8
+    return 8 if col < full_cols else num_samples - 8 * full_cols
+
+
+RUN_TIPS_MESSAGES = {
+    'en': {'replace': 'Replace the {volume}µl tipracks in slots {slots} before resuming.',
+           'planned': 'Tipracks in slots {slots} will be replaced {when}',
+           'before': 'before starting',
+           'in_step': 'in STEP {step}: {description}'},
+    'es': {'replace': 'Reemplaza las cajas de puntas de {volume}µl de los slots {slots} antes de continuar.',
+           'planned': 'Las cajas de puntas de los slots {slots} se reemplazarán {when}',
+           'before': 'antes de empezar',
+           'in_step': 'en el PASO {step}: {description}'},
+}
+
+
+class RunTips:
+    '''
+    Tips of the multichannel pipette pip of an extraction run, loaded with its
+    racks in slots. Counts the tips used (track, as in pick_up), keeps the
+    inventory of the racks (new_slots as in load_tip_inventory, nothing is read
+    or saved while simulating) and the tip of every column of the chains of
+    tip_reuse, and replaces the racks in the waits of the STEPS: demand holds
+    the tips every STEP uses, see plan_tip_refills. With recycle (testing
+    only) the tips are returned to their racks instead of dropped.
+    '''
+    def __init__(self, ctx, pip, slots, num_samples, steps, demand, tip_reuse, events, lights, new_slots = None,
+                 recycle = False, language = 'en'):
+        self.ctx = ctx
+        self.pip = pip
+        self.slots = slots
+        self.num_samples = num_samples
+        self.steps = steps
+        self.demand = demand
+        self.tip_reuse = tip_reuse
+        self.events = events
+        self.lights = lights
+        self.recycle = recycle
+        self.messages = RUN_TIPS_MESSAGES[language]
+        self.saved = {}
+        self.inventory_slots = None
+        if not ctx.is_simulating():
+            self.saved = load_tip_inventory(pip, slots, new_slots)
+            self.inventory_slots = slots
+        self.track = {'counts': {pip: 0}, 'maxes': {pip: available_tips(pip)}}
+
+    @property
+    def used(self):
+        return self.track['counts'][self.pip]
+
+    @property
+    def maximum(self):
+        return self.track['maxes'][self.pip]
+
+    # ctx.pause() returns at once and the run only stops at the next motion, so the
+    # pipette waits above the trash: the lights blink until the operator resumes
+    def wait_for_operator(self, message):
+        '''
+        Seconds from the pause until the run is resumed
+        '''
+        self.events.event('pause', reason = 'tipracks')
+        self.lights.start('tip_swap')
+        start = datetime.now()
+        self.ctx.pause(message)
+        self.pip.move_to(self.ctx.fixed_trash['A1'].top(z = 10))
+        waited = 0 if self.ctx.is_simulating() else (datetime.now() - start).total_seconds()
+        self.lights.stop()
+        self.events.event('resume', seconds = round(waited, 1))
+        return waited
+
+    # Racks with tips kept for a chain (tip_reuse) are never replaced: those tips are picked up again
+    def replace_tipracks(self, pip, racks):
+        '''
+        Replace the tipracks racks (indexes in pip.tip_racks), returns the seconds paused
+        '''
+        paused = self.wait_for_operator(self.messages['replace'].format(volume = pip.max_volume,
+                                        slots = ', '.join(self.slots[k] for k in racks)))
+        for k in racks:
+            pip.tip_racks[k].reset()
+            self.saved.pop(self.slots[k], None)
+        self.track['maxes'][pip] = self.track['counts'][pip] + available_tips(pip)
+        if self.inventory_slots is not None:
+            save_tip_inventory(pip, self.slots, self.saved)
+        return paused
+
+    def pick_up(self, num_tips = None):
+        '''
+        Pick up a new tip (num_tips of the column, see next_tip) and return it
+        '''
+        return pick_up(self.pip, self.track, self.replace_tipracks, num_tips, tip_reuse = self.tip_reuse, events = self.events,
+                       slots = self.inventory_slots, saved = self.saved, deck = self.ctx.deck)
+
+    def drop(self):
+        '''
+        Drop the tip and count it
+        '''
+        if self.recycle:
+            self.pip.return_tip()
+        else:
+            self.pip.drop_tip(home_after = False)
+        self.track['counts'][self.pip] += 8
+
+    # The same tip for a column along a chain of operations (the wash and the removal
+    # of its supernatant...): it is returned to its rack in between, see tip_reuse
+    def pick_up_column(self, chain, column):
+        '''
+        Pick up the tip kept for column in chain (returns True) or a new one
+        '''
+        tip = self.tip_reuse.tip(chain, column)
+        if tip is not None:
+            self.pip.pick_up_tip(tip)
+            self.events.event('tip_pickup', tip = tip.display_name, kept = True)
+            return True
+        self.tip_reuse.keep(chain, column, self.pick_up(column_tips(self.num_samples, column)))
+        self.track['counts'][self.pip] += 8
+        return False
+
+    def drop_column(self, chain, column, keep):
+        '''
+        Return the tip to its rack if the chain goes on (keep), otherwise drop it
+        '''
+        if self.recycle or (keep and self.tip_reuse.enabled(chain)):
+            self.pip.return_tip()
+        else:
+            self.pip.drop_tip(home_after = False)
+        if not keep:
+            self.tip_reuse.release(chain, column)
+
+    # Tipracks replaced in the waits: the tips of every STEP are known before the run,
+    # so the racks that would run out are replaced in the last wait before it happens
+    def refill_plan(self, first_step):
+        if self.recycle:
+            return []
+        demand = [(s, self.demand.get(s, 0), 'wait_time' in self.steps[s]) for s in sorted(self.steps)
+                  if s >= first_step and self.steps[s]['Execute']]
+        return plan_tip_refills(free_tips(self.pip), len(self.pip.tip_racks[0].wells()), demand)
+
+    def refill_break(self, step):
+        '''
+        Replace the tipracks planned for step, returns the seconds paused
+        '''
+        refills = self.refill_plan(step)
+        if not refills or refills[0][0] != step:
+            return 0
+        racks = [k for k in refills[0][1] if not self.tip_reuse.holds(self.pip.tip_racks[k])] # Not the racks with kept tips
+        if not racks:
+            return 0
+        return self.replace_tipracks(self.pip, racks)
+
+    def start(self, run_log, first_step):
+        '''
+        Log the tipracks the run will replace and replace the ones planned before first_step
+        '''
+        for step, racks in self.refill_plan(first_step):
+            when = self.messages['before'] if step == first_step else \
+                self.messages['in_step'].format(step = step, description = self.steps[step]['description'])
+            run_log.operator(self.messages['planned'].format(slots = ', '.join(self.slots[k] for k in racks), when = when))
+        return self.refill_break(first_step)
+# <<< tip_inventory.py
+
+# >>> tip_reuse.py: TipReuse
+class TipReuse:
+    '''
+    Tips kept for each column of the enabled chains. Chains not enabled get a
+    new tip for every operation.
+    '''
+    def __init__(self, chains):
+        self.chains = dict((chain, {}) for chain in chains)
+
+    def enabled(self, chain):
+        return chain in self.chains
+
+    def tip(self, chain, column):
+        '''
+        Tip kept for column in chain, None when the column needs a new tip
+        '''
+        return self.chains.get(chain, {}).get(column)
+
+    def keep(self, chain, column, tip):
+        if not self.enabled(chain):
+            return
+        for other_chain, tips in self.chains.items():
+            for other_column, other_tip in tips.items():
+                if other_tip is tip and (other_chain, other_column) != (chain, column):
+                    raise ValueError('Tip ' + str(tip) + ' is already kept for column ' + str(other_column + 1) +
+                                     ' in ' + other_chain)
+        self.chains[chain][column] = tip
+
+    def release(self, chain, column):
+        '''
+        The tip of column in chain is thrown away
+        '''
+        self.chains.get(chain, {}).pop(column, None)
+
+    def holds(self, rack):
+        '''
+        True if a tip kept for a chain is in rack (it must not be replaced)
+        '''
+        return any(tip.parent is rack for tips in self.chains.values() for tip in tips.values())
+# <<< tip_reuse.py
+
+# >>> liquid_height.py: height_table
+import math
+from bisect import bisect_right
+
+TABLE_STEP = 0.1 # mm between the points of the tables
+
+# (shape, depth in mm) of the bottom of the wells: 'flat', 'v' (a groove along
+# the well, as in the 12 well reservoir), 'pyramid' (square wells) or 'cone'
+# (round wells, to a point)
+BOTTOM_SHAPES = {
+    'kingfisher_96_wellplate_2000ul':           ('pyramid', 4),
+    'nest_12_reservoir_15ml':                   ('v', 1.95),
+    'nest_1_reservoir_195ml':                   ('flat', 0),
+    'opentrons_6_tuberack_falcon_50ml_conical': ('cone', 20),
+}
+
+HEIGHT_TABLES = {}
+
+
+def cross_section(well, bottom_shape, bottom_depth, z):
+    '''
+    Area in mm2 of the well at z mm over its bottom
+    '''
+    if well['shape'] == 'circular':
+        area = math.pi * (well['diameter'] / 2) ** 2
+    else:
+        area = well['xDimension'] * well['yDimension']
+    if bottom_shape == 'flat' or z >= bottom_depth:
+        return area
+    if bottom_shape == 'v':
+        return area * z / bottom_depth
+    if bottom_shape in ['pyramid', 'cone']:
+        return area * (z / bottom_depth) ** 2
+    raise ValueError('Unknown bottom shape ' + repr(bottom_shape) + ', use flat, v, pyramid or cone')
+
+
+class HeightTable:
+    '''
+    (volume, height) points of a well. The area of a section is at most
+    quadratic in the height, so the volume of every step (Simpson) is exact and
+    only the interpolation between points is approximated.
+    '''
+    def __init__(self, well, bottom_shape = 'flat', bottom_depth = 0, step = TABLE_STEP):
+        num_steps = max(1, int(math.ceil(well['depth'] / step)))
+        self.heights = [well['depth'] * i / num_steps for i in range(num_steps + 1)]
+        self.volumes = [0]
+        for z0, z1 in zip(self.heights, self.heights[1:]):
+            areas = [cross_section(well, bottom_shape, bottom_depth, z) for z in [z0, (z0 + z1) / 2, z1]]
+            self.volumes.append(self.volumes[-1] + (z1 - z0) * (areas[0] + 4 * areas[1] + areas[2]) / 6)
+        capacity = well.get('totalLiquidVolume')
+        if capacity is not None and capacity < self.volumes[-1]: # Up to the nominal volume
+            i = bisect_right(self.volumes, capacity)
+            top = self.heights[i - 1] + (self.heights[i] - self.heights[i - 1]) * (capacity - self.volumes[i - 1]) / (self.volumes[i] - self.volumes[i - 1])
+            self.heights = self.heights[:i] + [top]
+            self.volumes = self.volumes[:i] + [capacity]
+        self.depth = self.heights[-1]
+
+    def height(self, volume):
+        '''
+        Height in mm of volume uL in the well, 0 when empty and the depth of the
+        well when full
+        '''
+        if volume <= 0:
+            return 0
+        if volume >= self.volumes[-1]:
+            return self.depth
+        i = bisect_right(self.volumes, volume)
+        v0, v1 = self.volumes[i - 1], self.volumes[i]
+        return self.heights[i - 1] + (self.heights[i] - self.heights[i - 1]) * (volume - v0) / (v1 - v0)
+
+    def volume(self, height):
+        '''
+        uL in the well up to height mm
+        '''
+        if height <= 0:
+            return 0
+        if height >= self.depth:
+            return self.volumes[-1]
+        i = bisect_right(self.heights, height)
+        h0, h1 = self.heights[i - 1], self.heights[i]
+        return self.volumes[i - 1] + (self.volumes[i] - self.volumes[i - 1]) * (height - h0) / (h1 - h0)
+
+
+def well_definition(labware):
+    '''
+    Entry of the first well of labware in its definition: older robot software
+    keeps it in labware._definition, newer in the implementation of the labware
+    '''
+    definition = getattr(labware, '_definition', None)
+    if definition is None:
+        definition = labware._implementation.get_definition()
+    return definition['wells'][labware.wells()[0].well_name]
+
+
+def height_table(labware):
+    '''
+    HeightTable of the wells of a labware, built the first time
+    '''
+    if labware.load_name not in HEIGHT_TABLES:
+        bottom_shape, bottom_depth = BOTTOM_SHAPES.get(labware.load_name, ('flat', 0))
+        HEIGHT_TABLES[labware.load_name] = HeightTable(well_definition(labware), bottom_shape, bottom_depth)
+    return HEIGHT_TABLES[labware.load_name]
+# <<< liquid_height.py
+
+# >>> reservoir_packing.py: pack_channels, fill_sheet
+import math
+
+CHANNEL_MAX_VOLUME  = 12200 # uL a channel is filled with at most, dead volume and margin included
+FILL_MARGIN         = 0.1   # Fraction of the volume of a channel added when it is filled
+
+
+def pack_channels(demands, num_channels = 12, max_volume = CHANNEL_MAX_VOLUME):
+    '''
+    demands: (name, uL of every aspiration in the order they are taken, dead
+    volume of a channel) of each reagent. Reagents without aspirations take no
+    channel. Returns {name: [(channel from 1, uL to fill)]}, the channels of the
+    reagents consecutive and in the order of demands. The uL to fill do not
+    include the margin (see fill_volume).
+    '''
+    max_volume = max_volume / (1 + FILL_MARGIN)
+    packing = {}
+    channel = 1
+    for name, aspirations, dead_vol in demands:
+        if not aspirations:
+            continue
+        useful = [0]
+        for volume in aspirations:
+            if volume > max_volume - dead_vol:
+                raise ValueError('An aspiration of ' + str(round(volume, 1)) + ' uL of ' + name +
+                                 ' does not fit in a channel of ' + str(int(max_volume * (1 + FILL_MARGIN))) + ' uL')
+            if useful[-1] + volume > max_volume - dead_vol:
+                useful.append(0)
+            useful[-1] += volume
+        # 1 uL more so that rounding does not change channel before its last aspiration
+        packing[name] = [(channel + k, int(math.ceil(volume)) + dead_vol + 1) for k, volume in enumerate(useful)]
+        channel += len(useful)
+    if channel - 1 > num_channels:
+        raise ValueError('The reagents need ' + str(channel - 1) + ' channels and the reservoir has ' + str(num_channels))
+    return packing
+
+
+def fill_volume(volume):
+    '''
+    uL to fill a channel the run takes volume uL from (dead volume included) with
+    '''
+    return int(math.ceil(volume * (1 + FILL_MARGIN)))
+
+
+def fill_sheet(packing, label = 'Channel'):
+    '''
+    One line per channel with the reagent and the uL to fill it with
+    '''
+    lines = []
+    for name, channels in packing.items():
+        for channel, volume in channels:
+            lines.append(label + ' ' + str(channel) + ': ' + name + ', ' + str(fill_volume(volume)) + ' uL')
+    return lines
+# <<< reservoir_packing.py
+
+# >>> run_log.py: RunLog
+from datetime import datetime
+
+LOG_LEVELS          = ['operator', 'debug']
+LOG_BUFFER_LINES    = 200
+LOG_SEPARATOR       = '###############################################'
+
+
+class RunLog:
+    def __init__(self, ctx, path = None, level = 'operator'):
+        if level not in LOG_LEVELS:
+            raise ValueError('Unknown log level ' + repr(level) + ', use one of ' + ', '.join(LOG_LEVELS))
+        self.ctx = ctx
+        self.path = path
+        self.level = level
+        self.buffer = []
+
+    def write(self, level, msg):
+        if self.path is None:
+            return
+        self.buffer.append(datetime.now().strftime('%Y/%m/%d %H:%M:%S') + '\t' + level + '\t' + msg)
+        if len(self.buffer) >= LOG_BUFFER_LINES:
+            self.flush()
+
+    def operator(self, msg):
+        self.ctx.comment(msg)
+        self.write('operator', msg)
+        self.flush()
+
+    def debug(self, msg):
+        if self.level == 'debug':
+            self.ctx.comment(msg)
+        self.write('debug', msg)
+
+    def banner(self, title):
+        '''
+        Title of a part of the run, between separator lines in debug level
+        '''
+        self.debug(' ')
+        self.debug(LOG_SEPARATOR)
+        self.operator(title)
+        self.debug(LOG_SEPARATOR)
+        self.debug(' ')
+
+    def flush(self):
+        if self.path is None or not self.buffer:
+            return
+        with open(self.path, 'a') as f:
+            f.write('\n'.join(self.buffer) + '\n')
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+# <<< run_log.py
+
+# >>> event_log.py: EventLog
+import json
+import os
+import time
+from datetime import datetime
+
+EVENT_SYNC_LINES    = 20
+EVENT_SYNC_SECONDS  = 30
+
+
+class EventLog:
+    def __init__(self, path = None):
+        self.file = None if path is None else open(path, 'a')
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+        self.step = None
+        self.column = None
+
+    def event(self, event, **fields):
+        if self.file is None:
+            return
+        record = {'time': datetime.now().isoformat(timespec = 'milliseconds'), 'event': event}
+        if self.step is not None:
+            record['step'] = self.step
+        if self.column is not None:
+            record['column'] = self.column
+        record.update(fields)
+        self.file.write(json.dumps(record, default = str) + '\n')
+        self.file.flush()
+        self.unsynced += 1
+        if self.unsynced >= EVENT_SYNC_LINES or time.monotonic() - self.synced_at >= EVENT_SYNC_SECONDS:
+            self.sync()
+
+    def sync(self):
+        if self.file is None or not self.unsynced:
+            return
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+
+    def step_start(self, step, description):
+        self.column = None
+        self.step = step
+        self.event('step_start', description = description)
+
+    def step_end(self, seconds):
+        self.column_end()
+        self.event('step_end', seconds = round(seconds, 1))
+        self.step = None
+        self.sync()
+
+    def column_start(self, column):
+        '''
+        Column (from 1) the STEP works on next, the previous one ends
+        '''
+        self.column_end()
+        self.column = column
+        self.event('column_start')
+
+    def column_end(self):
+        if self.column is not None:
+            self.event('column_end')
+            self.column = None
+
+    def close(self):
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
+# <<< event_log.py
+
+# >>> checkpoint.py: Checkpoint, restore_reagents
+import json
+import os
+from datetime import datetime
+
+CHECKPOINT_MAX_AGE  = 6 * 3600 # seconds after its last save a checkpoint is resumed
+CHECKPOINT_FORMAT   = '%Y/%m/%d %H:%M:%S'
+
+
+class Checkpoint:
+    def __init__(self, path = None, protocol = None):
+        self.path = path
+        self.protocol = protocol
+
+    def load(self, num_samples, max_age = CHECKPOINT_MAX_AGE):
+        '''
+        State saved, None without a checkpoint of this protocol and num_samples
+        younger than max_age
+        '''
+        if self.path is None:
+            return None
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            age = (datetime.now() - datetime.strptime(state['updated'], CHECKPOINT_FORMAT)).total_seconds()
+        except (IOError, ValueError, KeyError):
+            return None
+        if state.get('protocol') != self.protocol or state.get('num_samples') != num_samples or age > max_age:
+            return None
+        return state
+
+    def save(self, step, column, num_samples, reagents, tips, magnet):
+        if self.path is None:
+            return
+        state = {'protocol': self.protocol, 'step': step, 'column': column, 'num_samples': num_samples,
+                 'reagents': {reagent.name: {'col': reagent.col, 'vol_well': reagent.vol_well} for reagent in reagents},
+                 'tips': tips, 'magnet': magnet, 'updated': datetime.now().strftime(CHECKPOINT_FORMAT)}
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.path + '.tmp', self.path)
+
+    def clear(self):
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def restore_reagents(reagents, state):
+    '''
+    Channel and volume left of the reagents as saved in state
+    '''
+    for reagent in reagents:
+        if reagent.name in state['reagents']:
+            reagent.col         = state['reagents'][reagent.name]['col']
+            reagent.vol_well    = state['reagents'][reagent.name]['vol_well']
+# <<< checkpoint.py
+
+# >>> light_signals.py: LightSignals
+import threading
+
+# steps: (keyword arguments of hardware.set_lights, seconds), repeated in order.
+# end: lights set when the pattern ends or is stopped, None to leave the last step.
+LIGHT_PATTERNS = {
+    'tip_swap': {'steps': [({'rails': False, 'button': (1, 0, 0)}, 0.3), ({'rails': True, 'button': (0, 0, 1)}, 0.3)],
+                 'end': {'button': (0, 1, 0)}},
+    'finished': {'steps': [({'button': False, 'rails': False}, 0.3), ({'button': True, 'rails': True}, 0.3)],
+                 'end': None},
+    'error':    {'steps': [({'rails': False, 'button': (1, 0, 0)}, 0.15), ({'rails': False, 'button': False}, 0.15)],
+                 'end': {'button': (1, 0, 0)}},
+}
+
+
+class LightSignals:
+    def __init__(self, hardware, photosensitive = False):
+        self.hardware = hardware
+        self.photosensitive = photosensitive
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def set_lights(self, lights):
+        if self.photosensitive and lights.get('rails'):
+            lights = dict(lights, rails = False)
+        self.hardware.set_lights(**lights)
+
+    def start(self, pattern, times = None, end = None):
+        '''
+        Play pattern times (None: until stop()) in the background, replacing
+        the pattern being played. end replaces the end lights of the pattern.
+        '''
+        if pattern not in LIGHT_PATTERNS:
+            raise ValueError('Unknown light pattern ' + repr(pattern) + ', use one of ' + ', '.join(sorted(LIGHT_PATTERNS)))
+        self.stop()
+        if self.hardware is None:
+            return
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target = self.play, name = 'light_signals', daemon = True,
+                                       args = (LIGHT_PATTERNS[pattern], times, end, self.stopped))
+        self.thread.start()
+
+    def play(self, pattern, times, end, stopped):
+        repeat = 0
+        while (times is None or repeat < times) and not stopped.is_set():
+            for lights, seconds in pattern['steps']:
+                self.set_lights(lights)
+                if stopped.wait(seconds):
+                    break
+            repeat += 1
+        end = end if end is not None else pattern['end']
+        if end is not None:
+            self.set_lights(end)
+
+    def stop(self):
+        '''
+        Stop the pattern being played, once its end lights are set
+        '''
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+# <<< light_signals.py
+
+# >>> incubation.py: start_temperature, await_temperature, Incubations
+import math
+from datetime import datetime
+
+INCUBATION_MESSAGES = {
+    'en': {'ramp': 'Temperature module ramping to {celsius} C in the background',
+           'await': 'Waiting for the temperature module to reach {celsius} C (now {temperature} C)',
+           'dosed': 'Last column dosed {elapsed} seconds ago, first column will have {longest} seconds.',
+           'delay': '{msg} for {seconds} seconds.'},
+    'es': {'ramp': 'Módulo de temperatura en rampa hacia {celsius} ºC en segundo plano',
+           'await': 'Esperando a que el módulo de temperatura llegue a {celsius} ºC (ahora {temperature} ºC)',
+           'dosed': 'La última columna recibió el reactivo hace {elapsed} segundos, la primera tendrá {longest} segundos.',
+           'delay': '{msg} durante {seconds} segundos.'},
+}
+
+
+def start_temperature(run_log, module, celsius, language = 'en'):
+    module.start_set_temperature(celsius)
+    run_log.operator(INCUBATION_MESSAGES[language]['ramp'].format(celsius = celsius))
+
+
+def await_temperature(run_log, module, celsius, language = 'en'):
+    if module.status != 'holding at target':
+        run_log.operator(INCUBATION_MESSAGES[language]['await'].format(celsius = celsius, temperature = module.temperature))
+    module.await_temperature(celsius)
+
+
+class Incubations:
+    def __init__(self, ctx, run_log, language = 'en'):
+        self.ctx = ctx
+        self.run_log = run_log
+        self.messages = INCUBATION_MESSAGES[language]
+        self.dose_times = {}
+
+    def record_dose(self, stage, col):
+        self.dose_times.setdefault(stage, {})[col] = datetime.now()
+
+    def delay(self, stage, wait_time, msg):
+        '''
+        Wait until the last column dosed in stage has incubated wait_time seconds
+        '''
+        remaining = wait_time
+        doses = self.dose_times.get(stage)
+        if doses and not self.ctx.is_simulating(): # Simulated runs keep the full wait
+            now = datetime.now()
+            elapsed = (now - max(doses.values())).total_seconds()
+            remaining = max(0, math.ceil(wait_time - elapsed))
+            longest = (now - min(doses.values())).total_seconds() + remaining
+            self.run_log.operator(self.messages['dosed'].format(elapsed = int(elapsed), longest = int(longest)))
+        if remaining > 0:
+            self.ctx.delay(seconds = remaining, msg = self.messages['delay'].format(msg = msg, seconds = remaining))
+# <<< incubation.py
+
+# >>> pipetting.py: find_side, custom_mix, calc_height, move_vol_multichannel, plan_supernatant_trips
+import math
+from opentrons.types import Point
+
+
+def find_side(col):
+    '''
+    Side of the wells of column col the offsets in x go to: -1 (left) for the
+    even columns, 1 (right) for the odd ones
+    '''
+    if col%2 == 0:
+        side = -1 # left
+    else:
+        side = 1 # right
+    return side
+
+
+def custom_mix(ctx, pipet, reagent, location, vol, rounds, blow_out, mix_height, offset, wait_time = 0, drop_height = -1, two_thirds_mix_bottom = False):
+    '''
+    Function for mix in the same location a certain number of rounds. Blow out optional. Offset
+    can set to 0 or a higher/lower value which indicates the lateral movement
+    '''
+    if mix_height <= 0:
+        mix_height = 1
+    pipet.aspirate(1, location = location.bottom(z = mix_height), rate = reagent.flow_rate_aspirate_mix)
+    for i in range(rounds):
+        pipet.aspirate(vol, location = location.bottom(z = mix_height), rate = reagent.flow_rate_aspirate_mix)
+        if two_thirds_mix_bottom and i < ((rounds / 3) * 2):
+            pipet.dispense(vol, location = location.bottom(z = 5).move(Point(x = offset)), rate = reagent.flow_rate_dispense_mix)
+        else:
+            pipet.dispense(vol, location = location.top(z = drop_height).move(Point(x = offset)), rate = reagent.flow_rate_dispense_mix)
+    pipet.dispense(1, location = location.bottom(z = mix_height), rate = reagent.flow_rate_dispense_mix)
+    if blow_out == True:
+        pipet.blow_out(location.top(z = -2)) # Blow out
+    if wait_time != 0:
+        ctx.delay(seconds=wait_time, msg='Waiting for ' + str(wait_time) + ' seconds.')
+
+
+def calc_height(run_log, events, reagent, heights, aspirate_volume, follow_depth = 0, min_height = 0.4):
+    '''
+    (pickup height follow_depth mm below the liquid left once aspirate_volume
+    uL are taken from the channel of reagent, True if the channel changed).
+    heights is the HeightTable of the reservoir (see liquid_height).
+    '''
+    run_log.debug('Remaining volume ' + str(reagent.vol_well) +
+                '< needed volume ' + str(aspirate_volume) + '?')
+    if (reagent.vol_well - reagent.dead_vol) < aspirate_volume:
+        run_log.debug('Next column should be picked')
+        run_log.debug('Previous to change: ' + str(reagent.col))
+        # column selector position; intialize to required number
+        reagent.col = reagent.col + 1
+        events.event('channel_change', reagent = reagent.name, channel = reagent.channels[reagent.col])
+        run_log.debug(str('After change: ' + str(reagent.col)))
+        reagent.vol_well = reagent.channel_volumes[reagent.col]
+        run_log.debug('New volume:' + str(reagent.vol_well))
+        height = heights.height(reagent.vol_well - aspirate_volume) - follow_depth
+        reagent.vol_well = reagent.vol_well - aspirate_volume
+        run_log.debug('Remaining volume:' + str(reagent.vol_well))
+        if height < min_height:
+            height = min_height
+        col_change = True
+    else:
+        height = heights.height(reagent.vol_well - aspirate_volume) - follow_depth
+        reagent.vol_well = reagent.vol_well - aspirate_volume
+        run_log.debug('Calculated height is ' + str(height))
+        if height < min_height:
+            height = min_height
+        run_log.debug('Used height is ' + str(height))
+        col_change = False
+    return height, col_change
+
+
+def plan_supernatant_trips(heights, volume, max_trip_vol, extra_vol, follow_depth, final_height):
+    '''
+    Trips (volume, pickup height, near pellet) to remove volume uL from a well of
+    HeightTable heights, extra_vol uL more to leave it empty. The upper trips
+    aspirate fast follow_depth mm below the liquid level; only the trips that
+    reach final_height, next to the pellet, go slowly, and the final one removes
+    what is left.
+    '''
+    num_trips = math.ceil((volume + extra_vol) / max_trip_vol)
+    trips = []
+    remaining = volume
+    for i in range(num_trips - 1):
+        remaining -= max_trip_vol
+        height = heights.height(remaining) - follow_depth
+        trips.append((max_trip_vol, max(height, final_height), height <= final_height))
+    trips.append((max_trip_vol, final_height, True))
+    return trips
+
+
+def aspirate_with_x_scrolling(pip, volume, src, pickup_height = 0, rate = 1, start_x_offset_src = 0, stop_x_offset_src = 0):
+    '''
+    Aspirate volume uL pip.min_volume at a time, moving from stop_x_offset_src
+    to start_x_offset_src mm across the bottom of src
+    '''
+    max_asp = volume/pip.min_volume
+    inc_step = (start_x_offset_src - stop_x_offset_src) / max_asp
+
+    num_asp = math.ceil((start_x_offset_src - stop_x_offset_src) / inc_step) # Points of numpy.arange(stop, start, inc_step)
+    for x in reversed([stop_x_offset_src + k * inc_step for k in range(num_asp)]):
+        s = src.bottom(pickup_height).move(Point(x = x))
+        pip.aspirate(volume = pip.min_volume, location = s, rate = rate)
+
+
+def move_vol_multichannel(ctx, run_log, pipet, reagent, source, dest, vol, x_offset_source, x_offset_dest, pickup_height, rinse,
+    avoid_droplet, wait_time, blow_out, touch_tip = False, touch_tip_v_offset = -10, drop_height = -5,
+    aspirate_with_x_scroll = False, dispense_bottom_air_gap_before = False, aspirate_rate = None):
+    if aspirate_rate is None:
+        aspirate_rate = reagent.flow_rate_aspirate
+    # Rinse before aspirating
+    if rinse == True:
+        custom_mix(ctx, pipet, reagent, location = source, vol = vol, rounds = 20, blow_out = False, mix_height = 3, offset = 0)
+
+    # SOURCE
+    if dispense_bottom_air_gap_before and reagent.air_gap_vol_bottom:
+        pipet.dispense(reagent.air_gap_vol_bottom, source.top(z = -2), rate = reagent.flow_rate_dispense)
+
+    if reagent.air_gap_vol_top != 0: #If there is air_gap_vol, switch pipette to slow speed
+        pipet.move_to(source.top(z = 0))
+        pipet.air_gap(reagent.air_gap_vol_top) #air gap
+
+    if aspirate_with_x_scroll:
+        aspirate_with_x_scrolling(pip = pipet, volume = vol, src = source, pickup_height = pickup_height, rate = aspirate_rate, start_x_offset_src = 0, stop_x_offset_src = x_offset_source)
+    else:
+        s = source.bottom(pickup_height).move(Point(x = x_offset_source))
+        pipet.aspirate(vol, s, rate = aspirate_rate) # aspirate liquid
+
+    if reagent.air_gap_vol_bottom != 0: #If there is air_gap_vol, switch pipette to slow speed
+        pipet.move_to(source.top(z = 0))
+        pipet.air_gap(reagent.air_gap_vol_bottom) #air gap
+
+    if wait_time != 0:
+        ctx.delay(seconds=wait_time, msg='Waiting for ' + str(wait_time) + ' seconds.')
+
+    if avoid_droplet == True: # Touch the liquid surface to avoid droplets
+        run_log.debug("Moving to: " + str(round(pickup_height, 2)) + ' mm')
+        pipet.move_to(source.bottom(pickup_height))
+
+    # GO TO DESTINATION
+    d = dest.top(z = drop_height).move(Point(x = x_offset_dest))
+    pipet.dispense(vol - reagent.disposal_volume + reagent.air_gap_vol_bottom, d, rate = reagent.flow_rate_dispense)
+
+    if reagent.air_gap_vol_top != 0:
+        pipet.dispense(reagent.air_gap_vol_top, dest.top(z = 0), rate = reagent.flow_rate_dispense)
+
+    if blow_out == True:
+        pipet.blow_out(dest.top(z = -5))
+
+    if touch_tip == True:
+        pipet.touch_tip(speed = 20, v_offset = touch_tip_v_offset, radius=0.7)
+
+    if wait_time != 0:
+        ctx.delay(seconds=wait_time, msg='Waiting for ' + str(wait_time) + ' seconds.')
+# <<< pipetting.py
+
+# >>> step_log.py: log_step_start, log_step_end, start_run, finish_run
+from datetime import datetime
+
+STEP_LOG_MESSAGES = {
+    'en': {'step': 'Step', 'took': ' took ', 'start': 'Starting the run', 'finish': 'Run finished',
+           'tips': 'Used tips in total: {tips} ({racks} racks)'},
+    'es': {'step': 'PASO', 'took': ' hizo un tiempo de ', 'start': 'Empezando protocolo', 'finish': 'Protocolo finalizado',
+           'tips': 'Puntas utilizadas: {tips} ({racks} caja(s))'},
+}
+
+
+def log_step_start(run_log, events, steps, step, language = 'en'):
+    '''
+    Log the start of STEP step, returns its start time for log_step_end
+    '''
+    start = datetime.now()
+    run_log.banner(STEP_LOG_MESSAGES[language]['step'] + ' ' + str(step) + ': ' + steps[step]['description'])
+    events.step_start(step, steps[step]['description'])
+    return start
+
+
+def log_step_end(run_log, events, steps, step, start, language = 'en'):
+    '''
+    Log the end of STEP step and keep the time it took in steps, returns it
+    '''
+    messages = STEP_LOG_MESSAGES[language]
+    time_taken = datetime.now() - start
+    run_log.operator(messages['step'] + ' ' + str(step) + ': ' + steps[step]['description'] + messages['took'] + str(time_taken))
+    steps[step]['Time:'] = str(time_taken)
+    events.step_end(time_taken.total_seconds())
+    return time_taken
+
+
+def start_run(ctx, run_log, button = None, rails = None, language = 'en'):
+    '''
+    Log the start of the run and set the lights (None leaves them as they are),
+    returns the start time
+    '''
+    run_log.debug(' ')
+    run_log.debug('###############################################')
+    run_log.operator(STEP_LOG_MESSAGES[language]['start'])
+    ctx._hw_manager.hardware.set_lights(button = button, rails = rails)
+    return datetime.now().strftime('%Y/%m/%d %H:%M:%S')
+
+
+def write_time_log(path, steps):
+    '''
+    Tab separated time log of the STEPS: activation, description, wait and time taken
+    '''
+    with open(path, 'w') as f:
+        f.write('STEP\texecution\tdescription\twait_time\texecution_time\n')
+        for key in steps.keys():
+            row = str(key)
+            for key2 in steps[key].keys():
+                row += '\t' + format(steps[key][key2])
+            f.write(row + '\n')
+
+
+def finish_run(run_log, events, checkpoint, steps, used_tips, time_log_path = None, language = 'en'):
+    '''
+    Write the time log of the STEPS to time_log_path (None while simulating), log
+    the tips used and close the logs of the run. The run ended, so its checkpoint
+    is cleared. Returns the finish time.
+    '''
+    if time_log_path is not None:
+        write_time_log(time_log_path, steps)
+    run_log.debug('###############################################')
+    run_log.operator(STEP_LOG_MESSAGES[language]['finish'])
+    run_log.operator(STEP_LOG_MESSAGES[language]['tips'].format(tips = used_tips, racks = round(used_tips / 96, 2)))
+    run_log.close()
+    events.close()
+    checkpoint.clear()
+    return datetime.now().strftime('%Y/%m/%d %H:%M:%S')
+# <<< step_log.py
+
 
 def run(ctx: protocol_api.ProtocolContext):
+    lights = LightSignals(None if ctx.is_simulating() else ctx._hw_manager.hardware) # Light patterns played in the background
 
-    #Change light to red
-    ctx._hw_manager.hardware.set_lights(button=(1, 0 ,0))
 
-    ctx.comment('Actual used columns: '+str(num_cols))
     STEP = 0
     STEPS = { #Dictionary with STEP activation, description, and times
             3:{'Execute': True, 'description': 'Transfer BEADS + PK'},
@@ -85,6 +1243,12 @@ def run(ctx: protocol_api.ProtocolContext):
         if not os.path.isdir(folder_path):
             os.mkdir(folder_path)
         file_path = folder_path + '/Station_B_Extraccion_total_time_log.txt'
+    run_log = RunLog(ctx, None if ctx.is_simulating() else folder_path + '/run_log.txt', LOG_LEVEL)
+    events = EventLog(None if ctx.is_simulating() else folder_path + '/events.jsonl') # Events of the run, see event_log
+    checkpoint = Checkpoint(None if ctx.is_simulating() else folder_path + '/checkpoint.json', metadata['protocolName']) # Progress to resume the run, see checkpoint
+    start_run(ctx, run_log, button = (1, 0, 0)) # Red light
+    incubations = Incubations(ctx, run_log) # Incubation deadlines of the columns, see incubation
+    run_log.operator('Actual used columns: '+str(num_cols))
 
     #Define Reagents as objects with their properties
     class Reagent:
@@ -109,17 +1273,13 @@ def run(ctx: protocol_api.ProtocolContext):
             self.v_cono = v_fondo
             self.tip_recycling = tip_recycling
             self.dead_vol = dead_vol
+            self.channels = []
+            self.channel_volumes = []
             self.vol_well_original = (reagent_reservoir_volume / num_wells) + dead_vol if num_wells > 0 else 0
 
     #Reagents and their characteristics
     Beads_PK = Reagent(name = 'Magnetic beads + PK',
-                    flow_rate_aspirate = 3,
-                    flow_rate_dispense = 3,
-                    flow_rate_aspirate_mix = 25,
-                    flow_rate_dispense_mix = 50,
-                    air_gap_vol_bottom = 5,
-                    air_gap_vol_top = 0,
-                    disposal_volume = 1,
+                    **liquid_class('beads_pk', SPEED_PROFILE, EXTRACTION_FIELDS),
                     rinse = True,
                     max_volume_allowed = 180,
                     reagent_volume = BEADS_VOLUME_PER_SAMPLE,
@@ -129,13 +1289,7 @@ def run(ctx: protocol_api.ProtocolContext):
                     v_fondo = 695) #1.95 * multi_well_rack_area / 2, #Prismatic
 
     Lysis = Reagent(name = 'Lysis + Binding',
-                    flow_rate_aspirate = 0.5,
-                    flow_rate_dispense = 0.5,
-                    flow_rate_aspirate_mix = 0.5,
-                    flow_rate_dispense_mix = 0.5,
-                    air_gap_vol_bottom = 5,
-                    air_gap_vol_top = 0,
-                    disposal_volume = 1,
+                    **liquid_class('lysis_binding', SPEED_PROFILE, EXTRACTION_FIELDS),
                     rinse = True,
                     max_volume_allowed = 180,
                     reagent_volume = LYSIS_VOLUME_PER_SAMPLE,
@@ -145,13 +1299,7 @@ def run(ctx: protocol_api.ProtocolContext):
                     v_fondo = 695) #1.95 * multi_well_rack_area / 2, #Prismatic
 
     Wash = Reagent(name = 'WASH',
-                    flow_rate_aspirate = 3,
-                    flow_rate_dispense = 3,
-                    flow_rate_aspirate_mix = 25,
-                    flow_rate_dispense_mix = 100,
-                    air_gap_vol_bottom = 5,
-                    air_gap_vol_top = 0,
-                    disposal_volume = 1,
+                    **liquid_class('wash', SPEED_PROFILE, EXTRACTION_FIELDS),
                     rinse = True,
                     max_volume_allowed = 180,
                     reagent_volume = WASH_VOLUME_PER_SAMPLE,
@@ -162,13 +1310,7 @@ def run(ctx: protocol_api.ProtocolContext):
                     tip_recycling = 'A1')
 
     Ethanol = Reagent(name = 'Ethanol',
-                    flow_rate_aspirate = 3,
-                    flow_rate_dispense = 3,
-                    flow_rate_aspirate_mix = 25,
-                    flow_rate_dispense_mix = 100,
-                    air_gap_vol_bottom = 5,
-                    air_gap_vol_top = 0,
-                    disposal_volume = 1,
+                    **liquid_class('ethanol', SPEED_PROFILE, EXTRACTION_FIELDS),
                     rinse = True,
                     max_volume_allowed = 180,
                     reagent_volume = ETHANOL_VOLUME_PER_SAMPLE,
@@ -179,13 +1321,7 @@ def run(ctx: protocol_api.ProtocolContext):
                     tip_recycling = 'A1')
 
     Elution = Reagent(name = 'Elution',
-                    flow_rate_aspirate = 3,
-                    flow_rate_dispense = 3,
-                    flow_rate_aspirate_mix = 25,
-                    flow_rate_dispense_mix = 40,
-                    air_gap_vol_bottom = 5,
-                    air_gap_vol_top = 0,
-                    disposal_volume = 1,
+                    **liquid_class('elution', SPEED_PROFILE, EXTRACTION_FIELDS),
                     rinse = False,
                     max_volume_allowed = 180,
                     reagent_volume = ELUTION_VOLUME_PER_SAMPLE,
@@ -195,13 +1331,7 @@ def run(ctx: protocol_api.ProtocolContext):
                     v_fondo = 695) #1.95*multi_well_rack_area/2) #Prismatic
 
     Sample = Reagent(name = 'Sample',
-                    flow_rate_aspirate = 0.5, # Original 0.5
-                    flow_rate_dispense = 1, # Original 1
-                    flow_rate_aspirate_mix = 1,
-                    flow_rate_dispense_mix = 1,
-                    air_gap_vol_bottom = 5,
-                    air_gap_vol_top = 0,
-                    disposal_volume = 1,
+                    **liquid_class('sample', SPEED_PROFILE, EXTRACTION_FIELDS),
                     rinse = False,
                     max_volume_allowed = 150,
                     reagent_volume = 50,
@@ -221,164 +1351,20 @@ def run(ctx: protocol_api.ProtocolContext):
     def str_rounded(num):
         return str(int(num + 0.5))
 
-    ctx.comment(' ')
-    ctx.comment('###############################################')
-    ctx.comment('VOLUMES FOR ' + str(NUM_SAMPLES) + ' SAMPLES')
-    ctx.comment(' ')
-    ctx.comment('Beads: ' + str(Beads_PK.num_wells) + ' wells from well 1 in 12 well reservoir with volume ' + str_rounded(Beads_PK.vol_well_original) + ' uL each one')
-    ctx.comment('Lysis: ' + str(Lysis.num_wells) + ' wells from well 3 in 12 well reservoir with volume ' + str_rounded(Lysis.vol_well_original) + ' uL each one')
-    ctx.comment('Elution: ' + str(Elution.num_wells) + ' wells from well 12 in 12 well reservoir with volume ' + str_rounded(Elution.vol_well_original) + ' uL each one')
-    ctx.comment('Wash: in 195 mL reservoir 1 with volume ' + str(Wash.vol_well_original) + ' uL (+ dead volume)' )
-    ctx.comment('Ethanol: in 195 mL reservoir 2 with volume ' + str(Ethanol.vol_well_original) + ' uL (+ dead volume)' )
-    ctx.comment('###############################################')
-    ctx.comment(' ')
-
-    ###################
-    #Custom functions
-    def custom_mix(pipet, reagent, location, vol, rounds, blow_out, mix_height, offset, wait_time = 0, drop_height = -1, two_thirds_mix_bottom = False):
-        '''
-        Function for mix in the same location a certain number of rounds. Blow out optional. Offset
-        can set to 0 or a higher/lower value which indicates the lateral movement
-        '''
-        if mix_height <= 0:
-            mix_height = 1
-        pipet.aspirate(1, location = location.bottom(z = mix_height), rate = reagent.flow_rate_aspirate_mix)
-        for i in range(rounds):
-            pipet.aspirate(vol, location = location.bottom(z = mix_height), rate = reagent.flow_rate_aspirate_mix)
-            if two_thirds_mix_bottom and i < ((rounds / 3) * 2):
-                pipet.dispense(vol, location = location.bottom(z = 5).move(Point(x = offset)), rate = reagent.flow_rate_dispense_mix)
-            else:
-                pipet.dispense(vol, location = location.top(z = drop_height).move(Point(x = offset)), rate = reagent.flow_rate_dispense_mix)
-        pipet.dispense(1, location = location.bottom(z = mix_height), rate = reagent.flow_rate_dispense_mix)
-        if blow_out == True:
-            pipet.blow_out(location.top(z = -2)) # Blow out
-        if wait_time != 0:
-            ctx.delay(seconds=wait_time, msg='Waiting for ' + str(wait_time) + ' seconds.')
-
-    def calc_height(reagent, cross_section_area, aspirate_volume, min_height = 0.4):
-        nonlocal ctx
-        ctx.comment('Remaining volume ' + str(reagent.vol_well) +
-                    '< needed volume ' + str(aspirate_volume) + '?')
-        if (reagent.vol_well - reagent.dead_vol) < aspirate_volume:
-            ctx.comment('Next column should be picked')
-            ctx.comment('Previous to change: ' + str(reagent.col))
-            # column selector position; intialize to required number
-            reagent.col = reagent.col + 1
-            ctx.comment(str('After change: ' + str(reagent.col)))
-            reagent.vol_well = reagent.vol_well_original
-            ctx.comment('New volume:' + str(reagent.vol_well))
-            height = (reagent.vol_well - aspirate_volume - reagent.v_cono) / cross_section_area
-                    #- reagent.h_cono
-            reagent.vol_well = reagent.vol_well - aspirate_volume
-            ctx.comment('Remaining volume:' + str(reagent.vol_well))
-            if height < min_height:
-                height = min_height
-            col_change = True
-        else:
-            height = (reagent.vol_well - aspirate_volume - reagent.v_cono) / cross_section_area
-            reagent.vol_well = reagent.vol_well - aspirate_volume
-            ctx.comment('Calculated height is ' + str(height))
-            if height < min_height:
-                height = min_height
-            ctx.comment('Used height is ' + str(height))
-            col_change = False
-        return height, col_change
-
-    def move_vol_multi(pipet, reagent, source, dest, vol, x_offset_source, x_offset_dest, pickup_height, rinse, 
-        avoid_droplet, wait_time, blow_out, touch_tip = False, touch_tip_v_offset = -10, drop_height = -5, 
-        aspirate_with_x_scroll = False, dispense_bottom_air_gap_before = False):
-        # Rinse before aspirating
-        if rinse == True:
-            custom_mix(pipet, reagent, location = source, vol = vol, rounds = 20, blow_out = False, mix_height = 3, offset = 0)
-
-        # SOURCE
-        if dispense_bottom_air_gap_before and reagent.air_gap_vol_bottom:
-            pipet.dispense(reagent.air_gap_vol_bottom, source.top(z = -2), rate = reagent.flow_rate_dispense)
-
-        if reagent.air_gap_vol_top != 0: #If there is air_gap_vol, switch pipette to slow speed
-            pipet.move_to(source.top(z = 0))
-            pipet.air_gap(reagent.air_gap_vol_top) #air gap
-
-        if aspirate_with_x_scroll:
-            aspirate_with_x_scrolling(pip = pipet, volume = vol, src = source, pickup_height = pickup_height, rate = reagent.flow_rate_aspirate, start_x_offset_src = 0, stop_x_offset_src = x_offset_source)
-        else:    
-            s = source.bottom(pickup_height).move(Point(x = x_offset_source))
-            pipet.aspirate(vol, s, rate = reagent.flow_rate_aspirate) # aspirate liquid
-
-        if reagent.air_gap_vol_bottom != 0: #If there is air_gap_vol, switch pipette to slow speed
-            pipet.move_to(source.top(z = 0))
-            pipet.air_gap(reagent.air_gap_vol_bottom) #air gap
-
-        if wait_time != 0:
-            ctx.delay(seconds=wait_time, msg='Waiting for ' + str(wait_time) + ' seconds.')
-
-        if avoid_droplet == True: # Touch the liquid surface to avoid droplets
-            ctx.comment("Moving to: " + str(round(pickup_height, 2)) + ' mm')
-            pipet.move_to(source.bottom(pickup_height))
-
-        # GO TO DESTINATION
-        d = dest.top(z = drop_height).move(Point(x = x_offset_dest))
-        pipet.dispense(vol - reagent.disposal_volume + reagent.air_gap_vol_bottom, d, rate = reagent.flow_rate_dispense)
-
-        if reagent.air_gap_vol_top != 0:
-            pipet.dispense(reagent.air_gap_vol_top, dest.top(z = 0), rate = reagent.flow_rate_dispense)
-
-        if blow_out == True:
-            pipet.blow_out(dest.top(z = -5))
-
-        if touch_tip == True:
-            pipet.touch_tip(speed = 20, v_offset = touch_tip_v_offset, radius=0.7)
-            
-        if wait_time != 0:
-            ctx.delay(seconds=wait_time, msg='Waiting for ' + str(wait_time) + ' seconds.')
-
-        #if reagent.air_gap_vol_bottom != 0:
-            #pipet.move_to(dest.top(z = 0))
-            #pipet.air_gap(reagent.air_gap_vol_bottom) #air gap
-            #pipet.aspirate(air_gap_vol_bottom, dest.top(z = 0),rate = reagent.flow_rate_aspirate) #air gap
-
-    def aspirate_with_x_scrolling(pip, volume, src, pickup_height = 0, rate = 1, start_x_offset_src = 0, stop_x_offset_src = 0):
-
-        max_asp = volume/pip.min_volume
-        inc_step = (start_x_offset_src - stop_x_offset_src) / max_asp
-
-        for x in reversed(np.arange(stop_x_offset_src, start_x_offset_src, inc_step)):
-            s = src.bottom(pickup_height).move(Point(x = x))
-            pip.aspirate(volume = pip.min_volume, location = s, rate = rate)
-
-    ##########
-    # pick up tip and if there is none left, prompt user for a new rack
-    def pick_up(pip):
-        nonlocal tip_track
-        #if not ctx.is_simulating():
-        if tip_track['counts'][pip] >= tip_track['maxes'][pip]:
-            for i in range(3):
-                ctx._hw_manager.hardware.set_lights(rails=False)
-                ctx._hw_manager.hardware.set_lights(button=(1, 0 ,0))
-                time.sleep(0.3)
-                ctx._hw_manager.hardware.set_lights(rails=True)
-                ctx._hw_manager.hardware.set_lights(button=(0, 0 ,1))
-                time.sleep(0.3)
-            ctx._hw_manager.hardware.set_lights(button=(0, 1 ,0))
-            ctx.pause('Replace ' + str(pip.max_volume) + 'µl tipracks before \
-            resuming.')
-            pip.reset_tipracks()
-            tip_track['counts'][pip] = 0
-            tip_track['num_refills'][pip] += 1
-        pip.pick_up_tip()
-
-    ##########
-    def find_side(col):
-        if col%2 == 0:
-            side = -1 # left
-        else:
-            side = 1 # right
-        return side
+    run_log.debug(' ')
+    run_log.debug('###############################################')
+    run_log.operator('VOLUMES FOR ' + str(NUM_SAMPLES) + ' SAMPLES')
+    run_log.debug(' ')
+    run_log.operator('Wash: in 195 mL reservoir 1 with volume ' + str(Wash.vol_well_original) + ' uL (+ dead volume)' )
+    run_log.operator('Ethanol: in 195 mL reservoir 2 with volume ' + str(Ethanol.vol_well_original) + ' uL (+ dead volume)' )
+    run_log.debug('###############################################')
+    run_log.debug(' ')
 
 ####################################
     # load labware and modules
     ######## 12 well rack
     reagent_res = ctx.load_labware('nest_12_reservoir_15ml', '7','reagent deepwell plate')
+    reservoir_heights = height_table(reagent_res) # Liquid height from the volume in the channels
 
 ####################################
     ######## Single reservoirs
@@ -391,6 +1377,8 @@ def run(ctx: protocol_api.ProtocolContext):
 ############################################
     ########## tempdeck
     tempdeck = ctx.load_module('Temperature Module Gen2', '1')
+    if SET_TEMP_ON == True:
+        start_temperature(run_log, tempdeck, TEMPERATURE)
 
 ##################################
     ####### Elution plate - final plate, goes to C
@@ -405,6 +1393,7 @@ def run(ctx: protocol_api.ProtocolContext):
     magdeck = ctx.load_module('Magnetic Module Gen2', '4')
     #deepwell_plate = magdeck.load_labware('nest_96_wellplate_2ml_deep', 'NEST 96 Deepwell Plate 2mL') # Change to NEST deepwell plate.
     deepwell_plate = magdeck.load_labware('kingfisher_96_wellplate_2000ul', 'KingFisher 96 Well Plate 2mL') # Change to NEST deepwell plate.
+    deepwell_heights = height_table(deepwell_plate) # Liquid height from the volume in the wells
     magdeck.disengage()
 
 ####################################
@@ -414,14 +1403,42 @@ def run(ctx: protocol_api.ProtocolContext):
 
 ####################################
     ######### Load tip_racks
+    tip_slots = ['2', '3', '5', '6', '9']
     tips300 = [ctx.load_labware('opentrons_96_tiprack_300ul', slot, '200µl filter tiprack')
-        for slot in ['2', '3', '5', '6', '9']]
+        for slot in tip_slots]
 
 ###############################################################################
     #Declare which reagents are in each reservoir as well as deepwell and elution plate
-    Beads_PK.reagent_reservoir  = reagent_res.rows()[0][0:1]
-    Lysis.reagent_reservoir     = reagent_res.rows()[0][2:9]
-    Elution.reagent_reservoir   = reagent_res.rows()[0][11:12]
+    def reservoir_aspirations(reagent, disposal_volume, first_trip_extra = 0):
+        '''
+        uL calc_height takes from the 12 well reservoir at every trip of reagent, in order
+        '''
+        trips = math.ceil(reagent.reagent_volume / reagent.max_volume_allowed)
+        return [(reagent.reagent_volume / trips + disposal_volume + (first_trip_extra if j == 0 else 0)) * column_tips(NUM_SAMPLES, i)
+                for i in range(num_cols) for j in range(trips)]
+
+    def assign_channels(reagent, channels):
+        reagent.channels            = [channel for channel, volume in channels]
+        reagent.channel_volumes     = [volume for channel, volume in channels]
+        reagent.num_wells           = len(channels)
+        reagent.vol_well_original   = reagent.channel_volumes[0]
+        reagent.vol_well            = reagent.vol_well_original
+        reagent.reagent_reservoir   = [reagent_res.rows()[0][channel - 1] for channel in reagent.channels]
+
+    # As few channels as the aspirations of every reagent fit in
+    reservoir_reagents = [Beads_PK, Lysis, Elution]
+    reservoir_packing = pack_channels([(Beads_PK.name, reservoir_aspirations(Beads_PK, Beads_PK.disposal_volume), Beads_PK.dead_vol),
+                                       (Lysis.name, reservoir_aspirations(Lysis, Lysis.disposal_volume), Lysis.dead_vol),
+                                       (Elution.name, reservoir_aspirations(Elution, Sample.disposal_volume), Elution.dead_vol)])
+    for reagent in reservoir_reagents:
+        if reagent.name in reservoir_packing:
+            assign_channels(reagent, reservoir_packing[reagent.name])
+    run_log.operator('12 well reservoir:')
+    for line in fill_sheet(reservoir_packing):
+        run_log.operator(line)
+    if not ctx.is_simulating():
+        with open(folder_path + '/fill_sheet.txt', 'w') as f:
+            f.write('\n'.join(fill_sheet(reservoir_packing)) + '\n')
     Wash.reagent_reservoir      = res_1
     Ethanol.reagent_reservoir   = res_2
     work_destinations           = deepwell_plate.rows()[0][:Sample.num_wells]
@@ -430,12 +1447,65 @@ def run(ctx: protocol_api.ProtocolContext):
     # pipettes.
     m300 = ctx.load_instrument('p300_multi_gen2', 'right', tip_racks = tips300) # Load multi pipette
 
-    #### used tip counter and set maximum tips available
-    tip_track = {
-        'counts': {m300: 0},
-        'maxes': {m300: 96 * len(m300.tip_racks)}, #96 tips per tiprack * number or tipracks in the layout
-        'num_refills' : {m300 : 0}
-        }
+    #### tip kept for every column between the operations of a chain, see tip_reuse
+    tip_reuse = TipReuse((['WASH', 'ETHANOL'] if TIP_RECYCLING_IN_WASH else []) + (['ELUTION'] if TIP_RECYCLING_IN_ELUTION else []))
+
+    #### tips used by every STEP, to replace the tipracks in the waits of the run. The partial column
+    #### takes as many tips as samples when a rack has nothing in front, see next_tip
+    columns_tips = NUM_SAMPLES if partial_pickup_racks(m300, ctx.deck) else 8 * num_cols
+    tip_demand = {1: (8 if full_cols > 0 else 0) + (columns_tips - 8 * full_cols), # One tip for the complete columns, another for the partial one
+                  3: columns_tips, 6: columns_tips, 8: columns_tips, 10: 0 if TIP_RECYCLING_IN_WASH else columns_tips,
+                  12: columns_tips, 14: 0 if TIP_RECYCLING_IN_WASH else columns_tips, 17: columns_tips,
+                  20: 0 if TIP_RECYCLING_IN_ELUTION else columns_tips}
+
+    #### tips of the run: inventory of the racks, counter and the racks replaced in the waits
+    tips = RunTips(ctx, m300, tip_slots, NUM_SAMPLES, STEPS, tip_demand, tip_reuse, events, lights,
+                   NEW_TIPRACK_SLOTS if CONTINUE_TIPRACKS or RESUME_FROM_CHECKPOINT else tip_slots, recycle_tip)
+
+    #### progress saved to resume a stopped run, see checkpoint
+    checkpoint_reagents = [Beads_PK, Lysis, Wash, Ethanol, Elution]
+    def save_checkpoint(step, column):
+        used_tips = tips.used + tips_before_resume
+        checkpoint.save(step, column, NUM_SAMPLES, checkpoint_reagents, used_tips, magdeck.status == 'engaged')
+
+    def resuming_columns():
+        '''
+        True when the run is resumed in the columns of STEP
+        '''
+        return resume is not None and resume['step'] == STEP and resume['column'] is not None
+
+    def step_columns():
+        '''
+        Columns of STEP, from the one the run stopped in when it is resumed in them
+        '''
+        return range(resume['column'] if resuming_columns() else 0, num_cols)
+
+    def column_start(i):
+        save_checkpoint(STEP, i)
+        events.column_start(i + 1)
+
+    resume = checkpoint.load(NUM_SAMPLES) if RESUME_FROM_CHECKPOINT else None
+    if resume is not None and resume['step'] not in STEPS: # Stopped once every STEP was done
+        resume = None
+    tips_before_resume = 0
+    if resume is not None:
+        for s in STEPS:
+            if s < resume['step']:
+                STEPS[s]['Execute'] = False
+        restore_reagents(checkpoint_reagents, resume)
+        tips_before_resume = resume['tips']
+        if resume['magnet']:
+            magdeck.engage(height = mag_height)
+        where = 'Step ' + str(resume['step']) + ': ' + STEPS[resume['step']]['description']
+        if resume['column'] is not None:
+            where += ', column ' + str(resume['column'] + 1)
+        run_log.operator('Resuming the run stopped at ' + resume['updated'] + ' from ' + where)
+        events.event('run_resumed', from_step = resume['step'], from_column = None if resume['column'] is None else resume['column'] + 1)
+        ctx.pause('Resuming from ' + where + ('. That column may be partly done, check it' if resume['column'] is not None else '') + '.')
+
+    #### tipracks to replace during the run
+    first_step = min(s for s in STEPS if STEPS[s]['Execute'])
+    tips.start(run_log, first_step)
 
 ###############################################################################
 
@@ -445,12 +1515,7 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = datetime.now()
-        ctx.comment(' ')
-        ctx.comment('###############################################')
-        ctx.comment('Step '+str(STEP)+': '+STEPS[STEP]['description'])
-        ctx.comment('###############################################')
-        ctx.comment(' ')
+        start = log_step_start(run_log, events, STEPS, STEP)
 
         beads_trips = math.ceil(Beads_PK.reagent_volume / Beads_PK.max_volume_allowed)
         beads_volume = Beads_PK.reagent_volume / beads_trips #136.66
@@ -462,40 +1527,38 @@ def run(ctx: protocol_api.ProtocolContext):
         rinse = False # Original: True
         first_mix_done = False
 
-        for i in range(num_cols):
-            ctx.comment("Column: " + str(i))
+        for i in step_columns():
+            column_start(i)
+            run_log.debug("Column: " + str(i))
+            if m300.hw_pipette['has_tip'] and column_tips(NUM_SAMPLES, i) < 8: # Partial column, as many tips as samples
+                tips.drop()
             if not m300.hw_pipette['has_tip']:
-                pick_up(m300)
+                tips.pick_up(column_tips(NUM_SAMPLES, i))
             for j,transfer_vol in enumerate(beads_transfer_vol):
                 #Calculate pickup_height based on remaining volume and shape of container
-                [pickup_height, change_col] = calc_height(Beads_PK, multi_well_rack_area, transfer_vol * 8)
+                [pickup_height, change_col] = calc_height(run_log, events, Beads_PK, reservoir_heights, transfer_vol * column_tips(NUM_SAMPLES, i), reagent_follow_depth)
                 if change_col == True or not first_mix_done: #If we switch column because there is not enough volume left in current reservoir column we mix new column
-                    ctx.comment('Mixing new reservoir column: ' + str(Beads_PK.col))
-                    custom_mix(m300, Beads_PK, Beads_PK.reagent_reservoir[Beads_PK.col],
+                    run_log.debug('Mixing new reservoir column: ' + str(Beads_PK.col))
+                    custom_mix(ctx, m300, Beads_PK, Beads_PK.reagent_reservoir[Beads_PK.col],
                             vol = Beads_PK.max_volume_allowed, rounds = BEADS_WELL_FIRST_TIME_NUM_MIXES, blow_out = False, mix_height = 0.5, offset = 0)
                     first_mix_done = True
                 else:
-                    ctx.comment('Mixing reservoir column: ' + str(Beads_PK.col))
-                    custom_mix(m300, Beads_PK, Beads_PK.reagent_reservoir[Beads_PK.col],
+                    run_log.debug('Mixing reservoir column: ' + str(Beads_PK.col))
+                    custom_mix(ctx, m300, Beads_PK, Beads_PK.reagent_reservoir[Beads_PK.col],
                             vol = Beads_PK.max_volume_allowed, rounds = BEADS_WELL_NUM_MIXES, blow_out = False, mix_height = 0.5, offset = 0)
-                ctx.comment('Aspirate from reservoir column: ' + str(Beads_PK.col))
-                ctx.comment('Pickup height is ' + str(round(pickup_height, 2)) + ' mm')
+                run_log.debug('Aspirate from reservoir column: ' + str(Beads_PK.col))
+                run_log.debug('Pickup height is ' + str(round(pickup_height, 2)) + ' mm')
  
-                move_vol_multi(m300, reagent = Beads_PK, source = Beads_PK.reagent_reservoir[Beads_PK.col],
+                move_vol_multichannel(ctx, run_log, m300, reagent = Beads_PK, source = Beads_PK.reagent_reservoir[Beads_PK.col],
                         dest = work_destinations[i], vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
                         pickup_height = pickup_height, rinse = rinse, avoid_droplet = False, wait_time = 2, blow_out = True, touch_tip = True, drop_height = -1)
+            incubations.record_dose('BEADS', i)
 
-        if recycle_tip == True:
-            m300.return_tip()
-        else:
-            m300.drop_tip(home_after = False)
-        tip_track['counts'][m300] += 8
-
-        end = datetime.now()
-        time_taken = (end - start)
-        ctx.comment('Step ' + str(STEP) + ': ' + STEPS[STEP]['description'] + ' took ' + str(time_taken))
-        STEPS[STEP]['Time:']=str(time_taken)
-        ctx.comment('Used tips in total: '+ str(tip_track['counts'][m300]))
+        tips.drop()
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+ str(tips.used))
         ###############################################################################
         # STEP 1 TRANSFER BEADS + PK
         ########
@@ -505,22 +1568,16 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = datetime.now()
-        ctx.comment(' ')
-        ctx.comment('###############################################')
-        ctx.comment('Step '+str(STEP)+': '+STEPS[STEP]['description'])
-        ctx.comment('###############################################')
-        ctx.comment(' ')
-
-        ctx.comment(' ')
-        ctx.delay(seconds=STEPS[STEP]['wait_time'], msg='Rest for ' + format(STEPS[STEP]['wait_time']) + ' seconds.')
-        ctx.comment(' ')
-
-        end = datetime.now()
-        time_taken = (end - start)
-        ctx.comment('Step ' + str(STEP) + ': ' + STEPS[STEP]['description'] + ' took ' + str(time_taken))
-        STEPS[STEP]['Time:']=str(time_taken)
-        ctx.comment('Used tips in total: '+ str(tip_track['counts'][m300]))
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        run_log.debug(' ')
+        tips.refill_break(STEP)
+        incubations.delay('BEADS', STEPS[STEP]['wait_time'], msg = 'Rest')
+        run_log.debug(' ')
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+ str(tips.used))
         ###############################################################################
         # STEP 2 WAIT REST
         ########
@@ -530,12 +1587,7 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = datetime.now()
-        ctx.comment(' ')
-        ctx.comment('###############################################')
-        ctx.comment('Step '+str(STEP)+': '+STEPS[STEP]['description'])
-        ctx.comment('###############################################')
-        ctx.comment(' ')
+        start = log_step_start(run_log, events, STEPS, STEP)
 
         lysis_trips = math.ceil(Lysis.reagent_volume / Lysis.max_volume_allowed)
         lysis_volume = Lysis.reagent_volume / lysis_trips #136.66
@@ -546,34 +1598,31 @@ def run(ctx: protocol_api.ProtocolContext):
         x_offset_dest   = 0
         rinse = False # Original: True
 
-        for i in range(num_cols):
-            ctx.comment("Column: " + str(i))
+        for i in step_columns():
+            column_start(i)
+            run_log.debug("Column: " + str(i))
             if not m300.hw_pipette['has_tip']:
-                pick_up(m300)
+                tips.pick_up(column_tips(NUM_SAMPLES, i))
             for j,transfer_vol in enumerate(lysis_transfer_vol):
                 #Calculate pickup_height based on remaining volume and shape of container
-                [pickup_height, change_col] = calc_height(Lysis, multi_well_rack_area, transfer_vol * 8)
-                move_vol_multi(m300, reagent = Lysis, source = Lysis.reagent_reservoir[Lysis.col],
+                [pickup_height, change_col] = calc_height(run_log, events, Lysis, reservoir_heights, transfer_vol * column_tips(NUM_SAMPLES, i), reagent_follow_depth)
+                move_vol_multichannel(ctx, run_log, m300, reagent = Lysis, source = Lysis.reagent_reservoir[Lysis.col],
                         dest = work_destinations[i], vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
                         pickup_height = pickup_height, rinse = rinse, avoid_droplet = False, wait_time = 2, blow_out = True, touch_tip = True, drop_height = -1)
             
+            incubations.record_dose('LYSIS', i)
+
             if LYSIS_NUM_MIXES > 0:
-                ctx.comment(' ')
-                ctx.comment('Mixing sample ')
-                custom_mix(m300, Lysis, location = work_destinations[i], vol =  Lysis.max_volume_allowed,
+                run_log.debug(' ')
+                run_log.debug('Mixing sample ')
+                custom_mix(ctx, m300, Lysis, location = work_destinations[i], vol =  Lysis.max_volume_allowed,
                         rounds = LYSIS_NUM_MIXES, blow_out = False, mix_height = 3, offset = 0, wait_time = 2)
 
-            if recycle_tip == True:
-                m300.return_tip()
-            else:
-                m300.drop_tip(home_after = False)
-            tip_track['counts'][m300] += 8
-
-        end = datetime.now()
-        time_taken = (end - start)
-        ctx.comment('Step ' + str(STEP) + ': ' + STEPS[STEP]['description'] + ' took ' + str(time_taken))
-        STEPS[STEP]['Time:']=str(time_taken)
-        ctx.comment('Used tips in total: '+ str(tip_track['counts'][m300]))
+            tips.drop()
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+ str(tips.used))
         ###############################################################################
         # STEP 3 TRANSFER LYSIS + BINDING
         ########
@@ -583,22 +1632,16 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = datetime.now()
-        ctx.comment(' ')
-        ctx.comment('###############################################')
-        ctx.comment('Step '+str(STEP)+': '+STEPS[STEP]['description'])
-        ctx.comment('###############################################')
-        ctx.comment(' ')
-
-        ctx.comment(' ')
-        ctx.delay(seconds=STEPS[STEP]['wait_time'], msg='Rest for ' + format(STEPS[STEP]['wait_time']) + ' seconds.')
-        ctx.comment(' ')
-
-        end = datetime.now()
-        time_taken = (end - start)
-        ctx.comment('Step ' + str(STEP) + ': ' + STEPS[STEP]['description'] + ' took ' + str(time_taken))
-        STEPS[STEP]['Time:']=str(time_taken)
-        ctx.comment('Used tips in total: '+ str(tip_track['counts'][m300]))
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        run_log.debug(' ')
+        tips.refill_break(STEP)
+        incubations.delay('LYSIS', STEPS[STEP]['wait_time'], msg = 'Rest')
+        run_log.debug(' ')
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+ str(tips.used))
         ###############################################################################
         # STEP 4 WAIT REST
         ########
@@ -608,23 +1651,17 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = datetime.now()
-        ctx.comment(' ')
-        ctx.comment('###############################################')
-        ctx.comment('Step '+str(STEP)+': '+STEPS[STEP]['description'])
-        ctx.comment('###############################################')
-        ctx.comment(' ')
+        start = log_step_start(run_log, events, STEPS, STEP)
 
-        ctx.comment(' ')
+        run_log.debug(' ')
         magdeck.engage(height = mag_height)
-        ctx.delay(seconds = STEPS[STEP]['wait_time'], msg = 'Incubating ON magnet for ' + format(STEPS[STEP]['wait_time']) + ' seconds.')
-        ctx.comment(' ')
-
-        end = datetime.now()
-        time_taken = (end - start)
-        ctx.comment('Step ' + str(STEP) + ': ' + STEPS[STEP]['description'] + ' took ' + str(time_taken))
-        STEPS[STEP]['Time:']=str(time_taken)
-        ctx.comment('Used tips in total: '+ str(tip_track['counts'][m300]))
+        paused = tips.refill_break(STEP)
+        ctx.delay(seconds = max(0, STEPS[STEP]['wait_time'] - paused), msg = 'Incubating ON magnet for ' + format(STEPS[STEP]['wait_time']) + ' seconds.')
+        run_log.debug(' ')
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+ str(tips.used))
         ###############################################################################
         # STEP 5 INCUBATE WAIT WITH MAGNET ON
         ########
@@ -634,51 +1671,36 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = datetime.now()
-        ctx.comment(' ')
-        ctx.comment('###############################################')
-        ctx.comment('Step '+str(STEP)+': '+STEPS[STEP]['description'])
-        ctx.comment('###############################################')
-        ctx.comment(' ')
+        start = log_step_start(run_log, events, STEPS, STEP)
 
         actual_vol_well = Beads_PK.reagent_volume + Lysis.reagent_volume + VOLUME_SAMPLE
-        supernatant_trips = math.ceil((actual_vol_well) / Lysis.max_volume_allowed)
-        supernatant_volume = Lysis.max_volume_allowed # We try to remove an exceeding amount of supernatant to make sure it is empty
-        supernatant_transfer_vol = []
-        for i in range(supernatant_trips):
-            supernatant_transfer_vol.append(supernatant_volume + Sample.disposal_volume)
+        supernatant_trips = plan_supernatant_trips(deepwell_heights, actual_vol_well, Lysis.max_volume_allowed, supernatant_extra_vol, supernatant_follow_depth, supernatant_final_height)
         x_offset_rs = 2
-        #Pickup_height is fixed here
-        pickup_height = 0.5 # Original 0.5
-        for i in range(num_cols):
+        for i in step_columns():
+            column_start(i)
             x_offset_source = find_side(i) * x_offset_rs
             x_offset_dest   = 0
             not_first_transfer = False
 
             if not m300.hw_pipette['has_tip']:
-                pick_up(m300)
-            for transfer_vol in supernatant_transfer_vol:
-                ctx.comment('Aspirate from deep well column: ' + str(i+1))
-                ctx.comment('Pickup height is ' + str(round(pickup_height, 2)) + ' mm' +' (fixed)')
-
-                move_vol_multi(m300, reagent = Sample, source = work_destinations[i],
-                        dest = waste, vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
-                        pickup_height = pickup_height, rinse = False, avoid_droplet = False, wait_time = 2, blow_out = True,
-                        dispense_bottom_air_gap_before = not_first_transfer)
+                tips.pick_up(column_tips(NUM_SAMPLES, i))
+            for transfer_vol, pickup_height, near_pellet in supernatant_trips:
+                run_log.debug('Aspirate from deep well column: ' + str(i+1))
+                run_log.debug('Pickup height is ' + str(round(pickup_height, 2)) + ' mm')
+
+                move_vol_multichannel(ctx, run_log, m300, reagent = Sample, source = work_destinations[i],
+                        dest = waste, vol = transfer_vol + Sample.disposal_volume, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
+                        pickup_height = pickup_height, rinse = False, avoid_droplet = False, wait_time = 2 if near_pellet else 0, blow_out = True,
+                        dispense_bottom_air_gap_before = not_first_transfer,
+                        aspirate_rate = Sample.flow_rate_aspirate if near_pellet else supernatant_fast_rate)
                 m300.air_gap(Sample.air_gap_vol_bottom)
                 not_first_transfer = True
 
-            if recycle_tip == True:
-                m300.return_tip()
-            else:
-                m300.drop_tip(home_after = False)
-            tip_track['counts'][m300] += 8
-
-        end = datetime.now()
-        time_taken = (end - start)
-        ctx.comment('Step ' + str(STEP) + ': ' + STEPS[STEP]['description'] + ' took ' + str(time_taken))
-        STEPS[STEP]['Time:']=str(time_taken)
-        ctx.comment('Used tips in total: '+ str(tip_track['counts'][m300]))
+            tips.drop()
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+ str(tips.used))
         ###############################################################################
         # STEP 6 REMOVE SUPERNATANT
         ########
@@ -688,21 +1710,14 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = datetime.now()
-        ctx.comment(' ')
-        ctx.comment('###############################################')
-        ctx.comment('Step '+str(STEP)+': '+STEPS[STEP]['description'])
-        ctx.comment('###############################################')
-        ctx.comment(' ')
+        start = log_step_start(run_log, events, STEPS, STEP)
 
         # switch off magnet
         magdeck.disengage()
 
-        end = datetime.now()
-        time_taken = (end - start)
-        ctx.comment('Step ' + str(STEP) + ': ' + STEPS[STEP]['description'] + ' took ' + str(time_taken))
-        STEPS[STEP]['Time:']=str(time_taken)
-        ctx.comment('Used tips in total: '+ str(tip_track['counts'][m300]))
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+ str(tips.used))
         ###############################################################################
         # STEP 7 MAGNET OFF
         ########
@@ -712,12 +1727,7 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = datetime.now()
-        ctx.comment(' ')
-        ctx.comment('###############################################')
-        ctx.comment('Step '+str(STEP)+': '+STEPS[STEP]['description'])
-        ctx.comment('###############################################')
-        ctx.comment(' ')
+        start = log_step_start(run_log, events, STEPS, STEP)
 
         wash_trips = math.ceil(Wash.reagent_volume / Wash.max_volume_allowed)
         wash_volume = Wash.reagent_volume / wash_trips #136.66
@@ -728,35 +1738,30 @@ def run(ctx: protocol_api.ProtocolContext):
         pickup_height = 0.5
         rinse = False # Not needed
 
-        for i in range(num_cols):
+        for i in step_columns():
+            column_start(i)
             x_offset_source = 0
             x_offset_dest   = -1 * find_side(i) * x_offset_rs
             if not m300.hw_pipette['has_tip']:
-                pick_up(m300)
+                tips.pick_up_column('WASH', i)
             for transfer_vol in wash_transfer_vol:
-                ctx.comment('Aspirate from reservoir 1')
-                move_vol_multi(m300, reagent = Wash, source = Wash.reagent_reservoir,
+                run_log.debug('Aspirate from reservoir 1')
+                move_vol_multichannel(ctx, run_log, m300, reagent = Wash, source = Wash.reagent_reservoir,
                         dest = work_destinations[i], vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
                         pickup_height = pickup_height, rinse = rinse, avoid_droplet = False, wait_time = 0, blow_out = False)
             
             if WASH_NUM_MIXES > 0:
-                custom_mix(m300, Wash, location = work_destinations[i], vol = 180, two_thirds_mix_bottom = True,
+                custom_mix(ctx, m300, Wash, location = work_destinations[i], vol = 180, two_thirds_mix_bottom = True,
                         rounds = WASH_NUM_MIXES, blow_out = False, mix_height = 3, offset = x_offset_dest)
             
             m300.move_to(work_destinations[i].top(0))
             m300.air_gap(Wash.air_gap_vol_bottom) #air gap
 
-            if recycle_tip == True:
-                m300.return_tip()
-            else:
-                m300.drop_tip(home_after = False)
-            tip_track['counts'][m300] += 8
-
-        end = datetime.now()
-        time_taken = (end - start)
-        ctx.comment('Step ' + str(STEP) + ': ' + STEPS[STEP]['description'] + ' took ' + str(time_taken))
-        STEPS[STEP]['Time:']=str(time_taken)
-        ctx.comment('Used tips in total: '+ str(tip_track['counts'][m300]))
+            tips.drop_column('WASH', i, keep = True)
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+ str(tips.used))
         ###############################################################################
         # STEP 8 ADD WASH
         ########
@@ -766,22 +1771,16 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = datetime.now()
-        ctx.comment(' ')
-        ctx.comment('###############################################')
-        ctx.comment('Step '+str(STEP)+': '+STEPS[STEP]['description'])
-        ctx.comment('###############################################')
-        ctx.comment(' ')
+        start = log_step_start(run_log, events, STEPS, STEP)
 
         # switch on magnet
         magdeck.engage(mag_height)
-        ctx.delay(seconds=STEPS[STEP]['wait_time'], msg='Incubating ON magnet for ' + format(STEPS[STEP]['wait_time']) + ' seconds.')
+        paused = tips.refill_break(STEP)
+        ctx.delay(seconds = max(0, STEPS[STEP]['wait_time'] - paused), msg = 'Incubating ON magnet for ' + format(STEPS[STEP]['wait_time']) + ' seconds.')
 
-        end = datetime.now()
-        time_taken = (end - start)
-        ctx.comment('Step ' + str(STEP) + ': ' + STEPS[STEP]['description'] + ' took ' + str(time_taken))
-        STEPS[STEP]['Time:']=str(time_taken)
-        ctx.comment('Used tips in total: '+ str(tip_track['counts'][m300]))
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+ str(tips.used))
         ####################################################################
         # STEP 9 INCUBATE WAIT WITH MAGNET ON
         ########
@@ -791,50 +1790,35 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = datetime.now()
-        ctx.comment(' ')
-        ctx.comment('###############################################')
-        ctx.comment('Step '+str(STEP)+': '+STEPS[STEP]['description'])
-        ctx.comment('###############################################')
-        ctx.comment(' ')
-
-        supernatant_trips = math.ceil(Wash.reagent_volume / Wash.max_volume_allowed)
-        supernatant_volume = Wash.max_volume_allowed # We try to remove an exceeding amount of supernatant to make sure it is empty
-        supernatant_transfer_vol = []
-        for i in range(supernatant_trips):
-            supernatant_transfer_vol.append(supernatant_volume + Sample.disposal_volume)
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        supernatant_trips = plan_supernatant_trips(deepwell_heights, Wash.reagent_volume, Wash.max_volume_allowed, supernatant_extra_vol, supernatant_follow_depth, supernatant_final_height)
         x_offset_rs = 2
 
-        for i in range(num_cols):
+        for i in step_columns():
+            column_start(i)
             x_offset_source = find_side(i) * x_offset_rs
             x_offset_dest   = 0
             not_first_transfer = False
 
             if not m300.hw_pipette['has_tip']:
-                pick_up(m300)
-            for transfer_vol in supernatant_transfer_vol:
-                #Pickup_height is fixed here
-                pickup_height = 0.5 # Original 0.5
-                ctx.comment('Aspirate from deep well column: ' + str(i+1))
-                ctx.comment('Pickup height is ' + str(round(pickup_height, 2)) + ' mm' +' (fixed)')
-                move_vol_multi(m300, reagent = Sample, source = work_destinations[i],
-                    dest = waste, vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
-                    pickup_height = pickup_height, rinse = False, avoid_droplet = False, wait_time = 2, blow_out = False,
-                    dispense_bottom_air_gap_before = not_first_transfer)
+                tips.pick_up_column('WASH', i)
+            for transfer_vol, pickup_height, near_pellet in supernatant_trips:
+                run_log.debug('Aspirate from deep well column: ' + str(i+1))
+                run_log.debug('Pickup height is ' + str(round(pickup_height, 2)) + ' mm')
+                move_vol_multichannel(ctx, run_log, m300, reagent = Sample, source = work_destinations[i],
+                    dest = waste, vol = transfer_vol + Sample.disposal_volume, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
+                    pickup_height = pickup_height, rinse = False, avoid_droplet = False, wait_time = 2 if near_pellet else 0, blow_out = False,
+                    dispense_bottom_air_gap_before = not_first_transfer,
+                    aspirate_rate = Sample.flow_rate_aspirate if near_pellet else supernatant_fast_rate)
                 m300.air_gap(Sample.air_gap_vol_bottom)
                 not_first_transfer = True
 
-            if recycle_tip == True:
-                m300.return_tip()
-            else:
-                m300.drop_tip(home_after = False)
-            tip_track['counts'][m300] += 8
-
-        end = datetime.now()
-        time_taken = (end - start)
-        ctx.comment('Step ' + str(STEP) + ': ' + STEPS[STEP]['description'] + ' took ' + str(time_taken))
-        STEPS[STEP]['Time:']=str(time_taken)
-        ctx.comment('Used tips in total: '+ str(tip_track['counts'][m300]))
+            tips.drop_column('WASH', i, keep = False)
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+ str(tips.used))
         ###############################################################################
         # STEP 10 REMOVE SUPERNATANT
         ########
@@ -844,21 +1828,14 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = datetime.now()
-        ctx.comment(' ')
-        ctx.comment('###############################################')
-        ctx.comment('Step '+str(STEP)+': '+STEPS[STEP]['description'])
-        ctx.comment('###############################################')
-        ctx.comment(' ')
+        start = log_step_start(run_log, events, STEPS, STEP)
 
         # switch off magnet
         magdeck.disengage()
 
-        end = datetime.now()
-        time_taken = (end - start)
-        ctx.comment('Step ' + str(STEP) + ': ' + STEPS[STEP]['description'] + ' took ' + str(time_taken))
-        STEPS[STEP]['Time:']=str(time_taken)
-        ctx.comment('Used tips in total: '+ str(tip_track['counts'][m300]))
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+ str(tips.used))
         ###############################################################################
         # STEP 11 MAGNET OFF
         ########
@@ -868,12 +1845,7 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = datetime.now()
-        ctx.comment(' ')
-        ctx.comment('###############################################')
-        ctx.comment('Step '+str(STEP)+': '+STEPS[STEP]['description'])
-        ctx.comment('###############################################')
-        ctx.comment(' ')
+        start = log_step_start(run_log, events, STEPS, STEP)
 
         ethanol_trips = math.ceil(Ethanol.reagent_volume / Ethanol.max_volume_allowed)
         ethanol_volume = Ethanol.reagent_volume / ethanol_trips #136.66
@@ -884,35 +1856,30 @@ def run(ctx: protocol_api.ProtocolContext):
         pickup_height = 0.5
         rinse = False # Not needed
 
-        for i in range(num_cols):
+        for i in step_columns():
+            column_start(i)
             x_offset_source = 0
             x_offset_dest   = -1 * find_side(i) * x_offset_rs
             if not m300.hw_pipette['has_tip']:
-                pick_up(m300)
+                tips.pick_up_column('ETHANOL', i)
             for transfer_vol in ethanol_transfer_vol:
-                ctx.comment('Aspirate from reservoir 1')
-                move_vol_multi(m300, reagent = Ethanol, source = Ethanol.reagent_reservoir,
+                run_log.debug('Aspirate from reservoir 1')
+                move_vol_multichannel(ctx, run_log, m300, reagent = Ethanol, source = Ethanol.reagent_reservoir,
                         dest = work_destinations[i], vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
                         pickup_height = pickup_height, rinse = rinse, avoid_droplet = False, wait_time = 0, blow_out = False)
             
             if ETHANOL_NUM_MIXES > 0:
-                custom_mix(m300, Ethanol, location = work_destinations[i], vol = 180, two_thirds_mix_bottom = True,
+                custom_mix(ctx, m300, Ethanol, location = work_destinations[i], vol = 180, two_thirds_mix_bottom = True,
                     rounds = ETHANOL_NUM_MIXES, blow_out = False, mix_height = 3, offset = x_offset_dest)
             
             m300.move_to(work_destinations[i].top(0))
             m300.air_gap(Ethanol.air_gap_vol_bottom) #air gap
 
-            if recycle_tip == True:
-                m300.return_tip()
-            else:
-                m300.drop_tip(home_after = False)
-            tip_track['counts'][m300] += 8
-
-        end = datetime.now()
-        time_taken = (end - start)
-        ctx.comment('Step ' + str(STEP) + ': ' + STEPS[STEP]['description'] + ' took ' + str(time_taken))
-        STEPS[STEP]['Time:']=str(time_taken)
-        ctx.comment('Used tips in total: '+ str(tip_track['counts'][m300]))
+            tips.drop_column('ETHANOL', i, keep = True)
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+ str(tips.used))
         ###############################################################################
         # STEP 12 ADD ETHANOL
         ########
@@ -922,22 +1889,16 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = datetime.now()
-        ctx.comment(' ')
-        ctx.comment('###############################################')
-        ctx.comment('Step '+str(STEP)+': '+STEPS[STEP]['description'])
-        ctx.comment('###############################################')
-        ctx.comment(' ')
+        start = log_step_start(run_log, events, STEPS, STEP)
 
         # switch on magnet
         magdeck.engage(mag_height)
-        ctx.delay(seconds=STEPS[STEP]['wait_time'], msg='Incubating ON magnet for ' + format(STEPS[STEP]['wait_time']) + ' seconds.')
+        paused = tips.refill_break(STEP)
+        ctx.delay(seconds = max(0, STEPS[STEP]['wait_time'] - paused), msg = 'Incubating ON magnet for ' + format(STEPS[STEP]['wait_time']) + ' seconds.')
         
-        end = datetime.now()
-        time_taken = (end - start)
-        ctx.comment('Step ' + str(STEP) + ': ' + STEPS[STEP]['description'] + ' took ' + str(time_taken))
-        STEPS[STEP]['Time:']=str(time_taken)
-        ctx.comment('Used tips in total: '+str(tip_track['counts'][m300]))
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+str(tips.used))
         ####################################################################
         # STEP 13 INCUBATE WAIT WITH MAGNET ON
         ########
@@ -947,50 +1908,36 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = datetime.now()
-        ctx.comment(' ')
-        ctx.comment('###############################################')
-        ctx.comment('Step '+str(STEP)+': '+STEPS[STEP]['description'])
-        ctx.comment('###############################################')
-        ctx.comment(' ')
-
-        supernatant_trips = math.ceil(Ethanol.reagent_volume / Ethanol.max_volume_allowed)
-        supernatant_volume = Ethanol.max_volume_allowed # We try to remove an exceeding amount of supernatant to make sure it is empty
-        supernatant_transfer_vol = []
-        for i in range(supernatant_trips):
-            supernatant_transfer_vol.append(supernatant_volume + Sample.disposal_volume)
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        supernatant_trips = plan_supernatant_trips(deepwell_heights, Ethanol.reagent_volume, Ethanol.max_volume_allowed, supernatant_extra_vol, supernatant_follow_depth, supernatant_final_height)
         x_offset_rs = 2
 
-        for i in range(num_cols):
+        for i in step_columns():
+            column_start(i)
             x_offset_source = find_side(i) * x_offset_rs
             x_offset_dest   = 0
             not_first_transfer = False
 
             if not m300.hw_pipette['has_tip']:
-                pick_up(m300)
-            for transfer_vol in supernatant_transfer_vol:
-                #Pickup_height is fixed here
-                pickup_height = 0.5 # Original 0.5
-                ctx.comment('Aspirate from deep well column: ' + str(i+1))
-                ctx.comment('Pickup height is ' + str(round(pickup_height, 2)) + ' mm' +' (fixed)')
-                move_vol_multi(m300, reagent = Sample, source = work_destinations[i],
-                    dest = waste, vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
-                    pickup_height = pickup_height, rinse = False, avoid_droplet = False, wait_time = 2, blow_out = False,
-                    dispense_bottom_air_gap_before = not_first_transfer)
+                tips.pick_up_column('ETHANOL', i)
+            for transfer_vol, pickup_height, near_pellet in supernatant_trips:
+                run_log.debug('Aspirate from deep well column: ' + str(i+1))
+                run_log.debug('Pickup height is ' + str(round(pickup_height, 2)) + ' mm')
+                move_vol_multichannel(ctx, run_log, m300, reagent = Sample, source = work_destinations[i],
+                    dest = waste, vol = transfer_vol + Sample.disposal_volume, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
+                    pickup_height = pickup_height, rinse = False, avoid_droplet = False, wait_time = 2 if near_pellet else 0, blow_out = False,
+                    dispense_bottom_air_gap_before = not_first_transfer,
+                    aspirate_rate = Sample.flow_rate_aspirate if near_pellet else supernatant_fast_rate)
                 m300.air_gap(Sample.air_gap_vol_bottom)
                 not_first_transfer = True
 
-            if recycle_tip == True:
-                m300.return_tip()
-            else:
-                m300.drop_tip(home_after = False)
-            tip_track['counts'][m300] += 8
-
-        end = datetime.now()
-        time_taken = (end - start)
-        ctx.comment('Step ' + str(STEP) + ': ' + STEPS[STEP]['description'] + ' took ' + str(time_taken))
-        STEPS[STEP]['Time:']=str(time_taken)
-        ctx.comment('Used tips in total: '+str(tip_track['counts'][m300]))
+            tips.drop_column('ETHANOL', i, keep = False)
+            incubations.record_dose('DRY', i)
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+str(tips.used))
         ###############################################################################
         # STEP 14 REMOVE SUPERNATANT
         ########
@@ -1000,21 +1947,16 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = datetime.now()
-        ctx.comment(' ')
-        ctx.comment('###############################################')
-        ctx.comment('Step '+str(STEP)+': '+STEPS[STEP]['description'])
-        ctx.comment('###############################################')
-
-        ctx.comment(' ')
-        ctx.delay(seconds=STEPS[STEP]['wait_time'], msg='Dry for ' + format(STEPS[STEP]['wait_time']) + ' seconds.') # 
-        ctx.comment(' ')
-
-        end = datetime.now()
-        time_taken = (end - start)
-        ctx.comment('Step ' + str(STEP) + ': ' + STEPS[STEP]['description'] + ' took ' + str(time_taken))
-        STEPS[STEP]['Time:'] = str(time_taken)
-        ctx.comment('Used tips in total: ' + str(tip_track['counts'][m300]))
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        run_log.debug(' ')
+        tips.refill_break(STEP)
+        incubations.delay('DRY', STEPS[STEP]['wait_time'], msg = 'Dry')
+        run_log.debug(' ')
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: ' + str(tips.used))
         ###############################################################################
         # STEP 15 ALLOW DRY
         ########
@@ -1025,21 +1967,14 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = datetime.now()
-        ctx.comment(' ')
-        ctx.comment('###############################################')
-        ctx.comment('Step '+str(STEP)+': '+STEPS[STEP]['description'])
-        ctx.comment('###############################################')
-        ctx.comment(' ')
+        start = log_step_start(run_log, events, STEPS, STEP)
 
         # switch off magnet
         magdeck.disengage()
 
-        end = datetime.now()
-        time_taken = (end - start)
-        ctx.comment('Step ' + str(STEP) + ': ' + STEPS[STEP]['description'] + ' took ' + str(time_taken))
-        STEPS[STEP]['Time:']=str(time_taken)
-        ctx.comment('Used tips in total: '+str(tip_track['counts'][m300]))
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+str(tips.used))
         ###############################################################################
         # STEP 16 MAGNET OFF
         ########
@@ -1049,12 +1984,7 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = datetime.now()
-        ctx.comment(' ')
-        ctx.comment('###############################################')
-        ctx.comment('Step '+str(STEP)+': '+STEPS[STEP]['description'])
-        ctx.comment('###############################################')
-        ctx.comment(' ')
+        start = log_step_start(run_log, events, STEPS, STEP)
 
         elution_trips = math.ceil(Elution.reagent_volume / Elution.max_volume_allowed)
         elution_volume = Elution.reagent_volume / elution_trips
@@ -1065,40 +1995,37 @@ def run(ctx: protocol_api.ProtocolContext):
 
         ########
         # Water or elution buffer
-        for i in range(num_cols):
+        for i in step_columns():
+            column_start(i)
             x_offset_source = 0
             x_offset_dest   = -1 * find_side(i) * x_offset_rs # Original 0
             if not m300.hw_pipette['has_tip']:
-                pick_up(m300)
+                tips.pick_up_column('ELUTION', i)
             for transfer_vol in elution_wash_vol:
                 #Calculate pickup_height based on remaining volume and shape of container
-                [pickup_height, change_col] = calc_height(Elution, multi_well_rack_area, transfer_vol*8)
-                ctx.comment('Aspirate from Reservoir column: ' + str(Elution.col))
-                ctx.comment('Pickup height is ' + str(round(pickup_height, 2)) + ' mm')
+                [pickup_height, change_col] = calc_height(run_log, events, Elution, reservoir_heights, transfer_vol * column_tips(NUM_SAMPLES, i), reagent_follow_depth)
+                run_log.debug('Aspirate from Reservoir column: ' + str(Elution.col))
+                run_log.debug('Pickup height is ' + str(round(pickup_height, 2)) + ' mm')
 
-                move_vol_multi(m300, reagent = Elution, source = Elution.reagent_reservoir[Elution.col],
+                move_vol_multichannel(ctx, run_log, m300, reagent = Elution, source = Elution.reagent_reservoir[Elution.col],
                         dest = work_destinations[i], vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
                         pickup_height = pickup_height, rinse = False, avoid_droplet = False, wait_time = 0, blow_out = False, drop_height = -35)
             
+            incubations.record_dose('ELUTION', i)
+
             if ELUTION_NUM_MIXES > 0:
-                ctx.comment(' ')
-                ctx.comment('Mixing sample with Elution')
-                custom_mix(m300, Elution, work_destinations[i], vol = Elution.reagent_volume, rounds = ELUTION_NUM_MIXES,
+                run_log.debug(' ')
+                run_log.debug('Mixing sample with Elution')
+                custom_mix(ctx, m300, Elution, work_destinations[i], vol = Elution.reagent_volume, rounds = ELUTION_NUM_MIXES,
                     blow_out = False, mix_height = 1, offset = x_offset_dest, drop_height = -35)
             
             m300.move_to(work_destinations[i].top(0))
             m300.air_gap(Elution.air_gap_vol_bottom) #air gap
             
-            if recycle_tip == True:
-                m300.return_tip()
-            else:
-                m300.drop_tip(home_after = False)
-            tip_track['counts'][m300] += 8
-        end = datetime.now()
-        time_taken = (end - start)
-        ctx.comment('Step ' + str(STEP) + ': ' + STEPS[STEP]['description'] + ' took ' + str(time_taken))
-        STEPS[STEP]['Time:']=str(time_taken)
-        ctx.comment('Used tips in total: '+str(tip_track['counts'][m300]))
+            tips.drop_column('ELUTION', i, keep = True)
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+str(tips.used))
         ###############################################################################
         # STEP 17 ADD ELUTION
         ########
@@ -1108,20 +2035,14 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = datetime.now()
-        ctx.comment(' ')
-        ctx.comment('###############################################')
-        ctx.comment('Step '+str(STEP)+': '+STEPS[STEP]['description'])
-        ctx.comment('###############################################')
-        ctx.comment(' ')
-
-        ctx.delay(seconds=STEPS[STEP]['wait_time'], msg='Wait for ' + format(STEPS[STEP]['wait_time']) + ' seconds.')
-
-        end = datetime.now()
-        time_taken = (end - start)
-        ctx.comment('Step ' + str(STEP) + ': ' + STEPS[STEP]['description'] + ' took ' + str(time_taken))
-        STEPS[STEP]['Time:']=str(time_taken)
-        ctx.comment('Used tips in total: '+str(tip_track['counts'][m300]))
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        tips.refill_break(STEP)
+        incubations.delay('ELUTION', STEPS[STEP]['wait_time'], msg = 'Wait')
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+str(tips.used))
         ####################################################################
         # STEP 18 WAIT
         ########
@@ -1131,22 +2052,16 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = datetime.now()
-        ctx.comment(' ')
-        ctx.comment('###############################################')
-        ctx.comment('Step '+str(STEP)+': '+STEPS[STEP]['description'])
-        ctx.comment('###############################################')
-        ctx.comment(' ')
+        start = log_step_start(run_log, events, STEPS, STEP)
 
         # switch on magnet
         magdeck.engage(mag_height)
-        ctx.delay(seconds=STEPS[STEP]['wait_time'], msg='Incubate with magnet ON for ' + format(STEPS[STEP]['wait_time']) + ' seconds.')
+        paused = tips.refill_break(STEP)
+        ctx.delay(seconds = max(0, STEPS[STEP]['wait_time'] - paused), msg = 'Incubate with magnet ON for ' + format(STEPS[STEP]['wait_time']) + ' seconds.')
 
-        end = datetime.now()
-        time_taken = (end - start)
-        ctx.comment('Step ' + str(STEP) + ': ' + STEPS[STEP]['description'] + ' took ' + str(time_taken))
-        STEPS[STEP]['Time:']=str(time_taken)
-        ctx.comment('Used tips in total: '+str(tip_track['counts'][m300]))
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+str(tips.used))
         ####################################################################
         # STEP 19 INCUBATE WAIT WITH MAGNET ON
         ########
@@ -1156,12 +2071,10 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = datetime.now()
-        ctx.comment(' ')
-        ctx.comment('###############################################')
-        ctx.comment('Step '+str(STEP)+': '+STEPS[STEP]['description'])
-        ctx.comment('###############################################')
-        ctx.comment(' ')
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        if SET_TEMP_ON == True:
+            await_temperature(run_log, tempdeck, TEMPERATURE)
 
         elution_trips = math.ceil(ELUTION_FINAL_VOLUME_PER_SAMPLE / Elution.max_volume_allowed)
         elution_volume = ELUTION_FINAL_VOLUME_PER_SAMPLE / elution_trips
@@ -1169,35 +2082,27 @@ def run(ctx: protocol_api.ProtocolContext):
         for i in range(elution_trips):
             elution_vol.append(elution_volume + Elution.disposal_volume)
         x_offset_rs = 2
-        for i in range(num_cols):
+        for i in step_columns():
+            column_start(i)
             x_offset_source = find_side(i) * x_offset_rs
             x_offset_dest   = 0
             if not m300.hw_pipette['has_tip']:
-                pick_up(m300)
+                tips.pick_up_column('ELUTION', i)
             for transfer_vol in elution_vol:
                 #Pickup_height is fixed here
                 pickup_height = 1
-                ctx.comment('Aspirate from deep well column: ' + str(i+1))
-                ctx.comment('Pickup height is ' + str(round(pickup_height, 2)) + ' mm' +' (fixed)')
+                run_log.debug('Aspirate from deep well column: ' + str(i+1))
+                run_log.debug('Pickup height is ' + str(round(pickup_height, 2)) + ' mm' +' (fixed)')
 
-                move_vol_multi(m300, reagent = Sample, source = work_destinations[i],
+                move_vol_multichannel(ctx, run_log, m300, reagent = Sample, source = work_destinations[i],
                         dest = final_destinations[i], vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
                         pickup_height = pickup_height, rinse = False, avoid_droplet = False, wait_time = 2, blow_out = True, touch_tip = True)
             
-            if recycle_tip == True:
-                m300.return_tip()
-            else:
-                m300.drop_tip(home_after = False)
-                tip_track['counts'][m300] += 8
-
-        end = datetime.now()
-        time_taken = (end - start)
-        ctx.comment('Step ' + str(STEP) + ': ' + STEPS[STEP]['description'] + ' took ' + str(time_taken))
-        STEPS[STEP]['Time:']=str(time_taken)
-        ctx.comment('Used tips in total: '+str(tip_track['counts'][m300]))
+            tips.drop_column('ELUTION', i, keep = False)
 
-        if SET_TEMP_ON == True:
-            tempdeck.set_temperature(TEMPERATURE)
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+str(tips.used))
         ###############################################################################
         # STEP 20 TRANSFER TO ELUTION PLATE
         ########
@@ -1207,37 +2112,10 @@ def run(ctx: protocol_api.ProtocolContext):
             json.dump(STEPS, outfile)'''
 
     magdeck.disengage()
-    ctx.comment(' ')
-    ctx.comment('###############################################')
-    ctx.comment('Homing robot')
-    ctx.comment('###############################################')
-    ctx.comment(' ')
+    run_log.banner('Homing robot')
     ctx.home()
 ###############################################################################
-    # Export the time log to a tsv file
-    if not ctx.is_simulating():
-        with open(file_path, 'w') as f:
-            f.write('STEP\texecution\tdescription\twait_time\texecution_time\n')
-            for key in STEPS.keys():
-                row = str(key)
-                for key2 in STEPS[key].keys():
-                    row += '\t' + format(STEPS[key][key2])
-                f.write(row + '\n')
-        f.close()
-
     # Light flash end of program
-    import os
-    #os.system('mpg123 /etc/audio/speaker-test.mp3')
-    for i in range(3):
-        ctx._hw_manager.hardware.set_lights(rails=False)
-        ctx._hw_manager.hardware.set_lights(button=(1, 0 ,0))
-        time.sleep(0.3)
-        ctx._hw_manager.hardware.set_lights(rails=True)
-        ctx._hw_manager.hardware.set_lights(button=(0, 0 ,1))
-        time.sleep(0.3)
-    ctx._hw_manager.hardware.set_lights(button=(0, 1 ,0))
-    ctx.comment('Finished! \nMove deepwell plate (slot 5) to Station C for MMIX addition and PCR preparation.')
-    used_tips = tip_track['num_refills'][m300] * 96 * len(m300.tip_racks) + tip_track['counts'][m300]
-    ctx.comment('Used tips in total: '+str(used_tips))
-    ctx.comment('Used racks in total: '+str(used_tips/96))
-    ctx.comment('Available tips: '+str(tip_track['maxes'][m300]))
+    lights.start('finished', times = 3, end = {'button': (0, 1, 0)})
+    run_log.operator('Finished! \nMove deepwell plate (slot 5) to Station C for MMIX addition and PCR preparation.')
+    finish_run(run_log, events, checkpoint, STEPS, tips.used + tips_before_resume, None if ctx.is_simulating() else file_path)
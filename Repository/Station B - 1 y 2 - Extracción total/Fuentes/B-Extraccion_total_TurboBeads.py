@@ -0,0 +1,983 @@
+import math
+from opentrons import protocol_api
+
+
+# metadata
+metadata = {
+    'protocolName': 'Station B - RNA extraction - TurboBeads',
+    'author': 'Aitor Gastaminza & José Luis Villanueva & Alex Gasulla & Manuel Alba & Daniel Peñil',
+    'source': 'Hospital Clínic Barcelona & HU Vall Hebrón & HU Marqués de Valdecilla',
+    'apiLevel': '2.3',
+    'description': 'Protocol for RNA extraction'
+}
+
+################################################
+# CHANGE THESE VARIABLES ONLY
+################################################
+NUM_SAMPLES                         = 96    # If not a multiple of 8 the last column is done with fewer tips
+LYSIS_VOLUME_PER_SAMPLE             = 300   # Original: 300
+BEADS_VOLUME_PER_SAMPLE             = 420
+WASH_VOLUME_PER_SAMPLE              = 300   # For each wash cycle
+ELUTION_VOLUME_PER_SAMPLE           = 90
+ELUTION_FINAL_VOLUME_PER_SAMPLE     = 50    # Volume transfered to final elution plate
+LYSIS_NUM_MIXES                     = 5
+BEADS_WELL_FIRST_TIME_NUM_MIXES     = 20
+BEADS_WELL_NUM_MIXES                = 20
+BEADS_NUM_MIXES                     = 20
+WASH_NUM_MIXES                      = 20
+ELUTION_NUM_MIXES                   = 20
+VOLUME_SAMPLE                       = 200   # Sample volume received in station A
+SET_TEMP_ON                         = True  # Do you want to start temperature module?
+TEMPERATURE                         = 4     # Set temperature. It will be uesed if set_temp_on is set to True
+SPEED_PROFILE                       = 'safe' # Liquid class settings: 'safe' (validated) or 'fast'
+TIP_RECYCLING_IN_WASH               = False # Return the tip of every column to its rack after the wash and use it again to remove the supernatant
+TIP_RECYCLING_IN_ELUTION            = False # Return the tip of every column to its rack after the elution and use it again to transfer it
+CONTINUE_TIPRACKS                   = False # Continue from the tips the previous run left in the tipracks (tip inventory, also when resuming a checkpoint), otherwise every tiprack is new
+NEW_TIPRACK_SLOTS                   = []    # With CONTINUE_TIPRACKS, slots with new tipracks
+LOG_LEVEL                           = 'operator' # Run log detail: 'operator' or 'debug' (every pickup height and reservoir column)
+RESUME_FROM_CHECKPOINT              = False # True to continue a stopped run from the column it stopped in (checkpoint.json of its folder)
+################################################
+
+
+run_id                      = 'B_Extraccion_total_TurboBeads'
+
+recycle_tip                 = False # Do you want to recycle tips? It shoud only be set True for testing
+mag_height                  = 7 # Height needed for NEST deepwell in magnetic deck
+reagent_follow_depth        = 1     # mm below the liquid level when aspirating the reagents
+supernatant_extra_vol       = 20    # Volume over the supernatant removed to leave the well empty
+supernatant_final_height    = 0.5   # Pickup height of the final trip, next to the pellet
+supernatant_follow_depth    = 2     # mm below the liquid level when aspirating the upper trips
+supernatant_fast_rate       = 1     # Aspirate rate of the upper trips (next to the pellet Sample.flow_rate_aspirate is used)
+
+num_cols = math.ceil(NUM_SAMPLES / 8) # Columns we are working on
+full_cols = NUM_SAMPLES // 8 # Complete columns, the last one may have fewer samples
+
+# Shared code of Utils/, copied into the uploaded protocol by Utils/bundle.py: edit
+# Fuentes/B-Extraccion_total_TurboBeads.py and bundle it again (see README.md)
+from liquid_classes import EXTRACTION_FIELDS, liquid_class
+from tip_inventory import partial_pickup_racks, column_tips, RunTips
+from tip_reuse import TipReuse
+from liquid_height import height_table
+from reservoir_packing import pack_channels, fill_sheet
+from run_log import RunLog
+from event_log import EventLog
+from checkpoint import Checkpoint, restore_reagents
+from light_signals import LightSignals
+from incubation import start_temperature, await_temperature, Incubations
+from pipetting import find_side, custom_mix, calc_height, move_vol_multichannel, plan_supernatant_trips
+from step_log import log_step_start, log_step_end, start_run, finish_run
+
+
+def run(ctx: protocol_api.ProtocolContext):
+    lights = LightSignals(None if ctx.is_simulating() else ctx._hw_manager.hardware) # Light patterns played in the background
+
+
+    STEP = 0
+    STEPS = { #Dictionary with STEP activation, description, and times
+            1:{'Execute': True, 'description': 'Transfer LYSIS'},   # Change the num of this step may affect remove supernatant step
+            2:{'Execute': False, 'description': 'Wait rest', 'wait_time': 300},
+            3:{'Execute': True, 'description': 'Transfer BEADS'},
+            4:{'Execute': True, 'description': 'Wait rest', 'wait_time': 300},
+            5:{'Execute': True, 'description': 'Incubate wait with magnet ON', 'wait_time': 600}, 
+            6:{'Execute': True, 'description': 'Remove supernatant'},
+            7:{'Execute': True, 'description': 'Switch off magnet'},
+            8:{'Execute': True, 'description': 'Add WASH'},
+            9:{'Execute': True, 'description': 'Incubate wait with magnet ON', 'wait_time': 300},
+            10:{'Execute': True, 'description': 'Remove supernatant'},
+            11:{'Execute': True, 'description': 'Switch off magnet'},
+            12:{'Execute': True, 'description': 'Add WASH'},
+            13:{'Execute': True, 'description': 'Incubate wait with magnet ON', 'wait_time': 300},
+            14:{'Execute': True, 'description': 'Remove supernatant'},
+            15:{'Execute': True, 'description': 'Allow to dry', 'wait_time': 1200},
+            16:{'Execute': True, 'description': 'Switch off magnet'},
+            17:{'Execute': True, 'description': 'Add ELUTION'},
+            18:{'Execute': False, 'description': 'Wait rest', 'wait_time': 300},
+            19:{'Execute': True, 'description': 'Incubate wait with magnet ON', 'wait_time': 300},
+            20:{'Execute': True, 'description': 'Transfer to final elution plate'},
+            }
+
+    #Folder and file_path for log time
+    import os
+    folder_path = '/var/lib/jupyter/notebooks' + run_id
+    if not ctx.is_simulating():
+        if not os.path.isdir(folder_path):
+            os.mkdir(folder_path)
+        file_path = folder_path + '/Station_B_Extraccion_total_time_log.txt'
+    run_log = RunLog(ctx, None if ctx.is_simulating() else folder_path + '/run_log.txt', LOG_LEVEL)
+    events = EventLog(None if ctx.is_simulating() else folder_path + '/events.jsonl') # Events of the run, see event_log
+    checkpoint = Checkpoint(None if ctx.is_simulating() else folder_path + '/checkpoint.json', metadata['protocolName']) # Progress to resume the run, see checkpoint
+    start_run(ctx, run_log, button = (1, 0, 0)) # Red light
+    incubations = Incubations(ctx, run_log) # Incubation deadlines of the columns, see incubation
+    run_log.operator('Actual used columns: '+str(num_cols))
+
+    #Define Reagents as objects with their properties
+    class Reagent:
+        def __init__(self, name, flow_rate_aspirate, flow_rate_dispense, flow_rate_aspirate_mix, flow_rate_dispense_mix,
+        air_gap_vol_bottom, air_gap_vol_top, disposal_volume, rinse, max_volume_allowed, reagent_volume, reagent_reservoir_volume, num_wells, h_cono, v_fondo, tip_recycling = 'none', dead_vol = 700):
+            self.name = name
+            self.flow_rate_aspirate = flow_rate_aspirate
+            self.flow_rate_dispense = flow_rate_dispense
+            self.flow_rate_aspirate_mix = flow_rate_aspirate_mix
+            self.flow_rate_dispense_mix = flow_rate_dispense_mix
+            self.air_gap_vol_bottom = air_gap_vol_bottom
+            self.air_gap_vol_top = air_gap_vol_top
+            self.disposal_volume = disposal_volume
+            self.rinse = bool(rinse)
+            self.max_volume_allowed = max_volume_allowed
+            self.reagent_volume = reagent_volume
+            self.reagent_reservoir_volume = reagent_reservoir_volume
+            self.num_wells = num_wells
+            self.col = 0
+            self.vol_well = 0
+            self.h_cono = h_cono
+            self.v_cono = v_fondo
+            self.tip_recycling = tip_recycling
+            self.dead_vol = dead_vol
+            self.channels = []
+            self.channel_volumes = []
+            self.vol_well_original = (reagent_reservoir_volume / num_wells) + dead_vol if num_wells > 0 else 0
+
+    #Reagents and their characteristics
+    Lysis = Reagent(name = 'Lysis',
+                    **liquid_class('lysis', SPEED_PROFILE, EXTRACTION_FIELDS),
+                    rinse = True,
+                    max_volume_allowed = 180,
+                    reagent_volume = LYSIS_VOLUME_PER_SAMPLE, # reagent volume needed per sample
+                    reagent_reservoir_volume =  (NUM_SAMPLES + 5) * LYSIS_VOLUME_PER_SAMPLE, 
+                    num_wells = math.ceil((NUM_SAMPLES + 5) * LYSIS_VOLUME_PER_SAMPLE / 11500), #num_Wells max is 4, 13000 is the reservoir max volume (eventhough reservoir allows 15000)
+                    h_cono = 1.95,
+                    v_fondo = 695) #1.95 * multi_well_rack_area / 2, #Prismatic
+            
+    Beads = Reagent(name = 'Beads',
+                    **liquid_class('beads', SPEED_PROFILE, EXTRACTION_FIELDS),
+                    rinse = True,
+                    max_volume_allowed = 180,
+                    reagent_volume = BEADS_VOLUME_PER_SAMPLE, # reagent volume needed per sample
+                    reagent_reservoir_volume =  math.ceil(NUM_SAMPLES * (BEADS_VOLUME_PER_SAMPLE + 100) * 1.1),  # 100 uL extra ispr per sample
+                    num_wells = math.ceil(NUM_SAMPLES * (BEADS_VOLUME_PER_SAMPLE + 100) * 1.1 / 11500), #num_Wells max is 4, 13000 is the reservoir max volume (eventhough reservoir allows 15000)
+                    h_cono = 1.95,
+                    v_fondo = 695, #1.95 * multi_well_rack_area / 2, #Prismatic
+                    tip_recycling = 'A1')
+
+    Wash = Reagent(name = 'WASH',
+                    **liquid_class('wash', SPEED_PROFILE, EXTRACTION_FIELDS),
+                    rinse = True,
+                    max_volume_allowed = 180,
+                    reagent_volume = WASH_VOLUME_PER_SAMPLE,
+                    reagent_reservoir_volume = (2 * NUM_SAMPLES + 5) * WASH_VOLUME_PER_SAMPLE,
+                    num_wells = math.ceil((2 * NUM_SAMPLES + 5) * WASH_VOLUME_PER_SAMPLE / 13000), 
+                    h_cono = 1.95,
+                    v_fondo = 695, #1.95 * multi_well_rack_area / 2, #Prismatic
+                    tip_recycling = 'A1')
+
+    Elution = Reagent(name = 'Elution',
+                    **liquid_class('elution', SPEED_PROFILE, EXTRACTION_FIELDS),
+                    rinse = False,
+                    max_volume_allowed = 180,
+                    reagent_volume = ELUTION_VOLUME_PER_SAMPLE,
+                    reagent_reservoir_volume = (NUM_SAMPLES + 5) * ELUTION_VOLUME_PER_SAMPLE,
+                    num_wells = math.ceil((NUM_SAMPLES + 5) * ELUTION_VOLUME_PER_SAMPLE / 11500), #num_Wells max is 1
+                    h_cono = 1.95,
+                    v_fondo = 695) #1.95*multi_well_rack_area/2) #Prismatic
+
+    Sample = Reagent(name = 'Sample',
+                    **liquid_class('sample', SPEED_PROFILE, EXTRACTION_FIELDS),
+                    rinse = False,
+                    max_volume_allowed = 150,
+                    reagent_volume = 50,
+                    reagent_reservoir_volume = (NUM_SAMPLES + 5) * 50, #14800,
+                    num_wells = num_cols, #num_cols comes from available columns
+                    h_cono = 4,
+                    v_fondo = 4 * math.pi * 4**3 / 3) #Sphere
+
+    Lysis.vol_well      = Lysis.vol_well_original
+    Beads.vol_well      = Beads.vol_well_original
+    Wash.vol_well       = Wash.vol_well_original
+    Elution.vol_well    = Elution.vol_well_original
+    Sample.vol_well     = 350 # Arbitrary value
+
+    #########
+    def str_rounded(num):
+        return str(int(num + 0.5))
+
+    run_log.debug(' ')
+    run_log.debug('###############################################')
+    run_log.operator('VOLUMES FOR ' + str(NUM_SAMPLES) + ' SAMPLES')
+    run_log.debug(' ')
+    run_log.operator('Wash: in 195 mL reservoir 1 with volume ' + str(Wash.vol_well_original) + ' uL (+ dead volume)' )
+    run_log.debug('###############################################')
+    run_log.debug(' ')
+
+####################################
+    # load labware and modules
+    ######## 12 well rack
+    reagent_res = ctx.load_labware('nest_12_reservoir_15ml', '7','reagent deepwell plate')
+    reservoir_heights = height_table(reagent_res) # Liquid height from the volume in the channels
+
+####################################
+    ######## Single reservoirs
+    reagent_res_1 = ctx.load_labware('nest_1_reservoir_195ml', '8', 'Single reagent reservoir 1')
+    res_1 = reagent_res_1.wells()[0]
+
+############################################
+    ########## tempdeck
+    tempdeck = ctx.load_module('Temperature Module Gen2', '1')
+    if SET_TEMP_ON == True:
+        start_temperature(run_log, tempdeck, TEMPERATURE)
+
+##################################
+    ####### Elution plate - final plate, goes to C
+    #elution_plate = tempdeck.load_labware(
+     #   'biorad_96_alum',
+      #  'cooled elution plate')
+    elution_plate = tempdeck.load_labware('kingfisher_96_aluminumblock_200ul', 
+        'Kingfisher 96 Aluminum Block 200 uL')
+
+############################################
+    ######## Deepwell - comes from A
+    magdeck = ctx.load_module('Magnetic Module Gen2', '4')
+    #deepwell_plate = magdeck.load_labware('nest_96_wellplate_2ml_deep', 'NEST 96 Deepwell Plate 2mL') # Change to NEST deepwell plate.
+    deepwell_plate = magdeck.load_labware('kingfisher_96_wellplate_2000ul', 'KingFisher 96 Well Plate 2mL') # Change to NEST deepwell plate.
+    deepwell_heights = height_table(deepwell_plate) # Liquid height from the volume in the wells
+    magdeck.disengage()
+
+####################################
+    ######## Waste reservoir
+    waste_reservoir = ctx.load_labware('nest_1_reservoir_195ml', '11', 'waste reservoir') # Change to our waste reservoir
+    waste = waste_reservoir.wells()[0] # referenced as reservoir
+
+####################################
+    ######### Load tip_racks
+    tip_slots = ['2', '3', '5', '6', '9']
+    tips300 = [ctx.load_labware('opentrons_96_tiprack_300ul', slot, '200µl filter tiprack')
+        for slot in tip_slots]
+
+###############################################################################
+    #Declare which reagents are in each reservoir as well as deepwell and elution plate
+    def reservoir_aspirations(reagent, disposal_volume, first_trip_extra = 0):
+        '''
+        uL calc_height takes from the 12 well reservoir at every trip of reagent, in order
+        '''
+        trips = math.ceil(reagent.reagent_volume / reagent.max_volume_allowed)
+        return [(reagent.reagent_volume / trips + disposal_volume + (first_trip_extra if j == 0 else 0)) * column_tips(NUM_SAMPLES, i)
+                for i in range(num_cols) for j in range(trips)]
+
+    def assign_channels(reagent, channels):
+        reagent.channels            = [channel for channel, volume in channels]
+        reagent.channel_volumes     = [volume for channel, volume in channels]
+        reagent.num_wells           = len(channels)
+        reagent.vol_well_original   = reagent.channel_volumes[0]
+        reagent.vol_well            = reagent.vol_well_original
+        reagent.reagent_reservoir   = [reagent_res.rows()[0][channel - 1] for channel in reagent.channels]
+
+    # As few channels as the aspirations of every reagent fit in (100 uL more for the first trip of the beads, as in STEP 3)
+    reservoir_reagents = [Lysis, Beads, Elution]
+    reservoir_packing = pack_channels([(Lysis.name, reservoir_aspirations(Lysis, Lysis.disposal_volume), Lysis.dead_vol),
+                                       (Beads.name, reservoir_aspirations(Beads, Beads.disposal_volume, 100), Beads.dead_vol),
+                                       (Elution.name, reservoir_aspirations(Elution, Sample.disposal_volume), Elution.dead_vol)])
+    for reagent in reservoir_reagents:
+        if reagent.name in reservoir_packing:
+            assign_channels(reagent, reservoir_packing[reagent.name])
+    run_log.operator('12 well reservoir:')
+    for line in fill_sheet(reservoir_packing):
+        run_log.operator(line)
+    if not ctx.is_simulating():
+        with open(folder_path + '/fill_sheet.txt', 'w') as f:
+            f.write('\n'.join(fill_sheet(reservoir_packing)) + '\n')
+    Wash.reagent_reservoir      = res_1
+    work_destinations           = deepwell_plate.rows()[0][:Sample.num_wells]
+    final_destinations          = elution_plate.rows()[0][:Sample.num_wells]
+
+    # pipettes.
+    m300 = ctx.load_instrument('p300_multi_gen2', 'right', tip_racks = tips300) # Load multi pipette
+
+    #### tip kept for every column between the operations of a chain, see tip_reuse
+    tip_reuse = TipReuse((['WASH_1', 'WASH_2'] if TIP_RECYCLING_IN_WASH else []) + (['ELUTION'] if TIP_RECYCLING_IN_ELUTION else []))
+
+    #### tips used by every STEP, to replace the tipracks in the waits of the run. The partial column
+    #### takes as many tips as samples when a rack has nothing in front, see next_tip
+    columns_tips = NUM_SAMPLES if partial_pickup_racks(m300, ctx.deck) else 8 * num_cols
+    tip_demand = {1: columns_tips, 3: columns_tips, 6: columns_tips, 8: columns_tips, 10: 0 if TIP_RECYCLING_IN_WASH else columns_tips,
+                  12: columns_tips, 14: 0 if TIP_RECYCLING_IN_WASH else columns_tips, 17: columns_tips,
+                  20: 0 if TIP_RECYCLING_IN_ELUTION else columns_tips}
+
+    #### tips of the run: inventory of the racks, counter and the racks replaced in the waits
+    tips = RunTips(ctx, m300, tip_slots, NUM_SAMPLES, STEPS, tip_demand, tip_reuse, events, lights,
+                   NEW_TIPRACK_SLOTS if CONTINUE_TIPRACKS or RESUME_FROM_CHECKPOINT else tip_slots, recycle_tip)
+
+    #### progress saved to resume a stopped run, see checkpoint
+    checkpoint_reagents = [Lysis, Beads, Wash, Elution]
+    def save_checkpoint(step, column):
+        used_tips = tips.used + tips_before_resume
+        checkpoint.save(step, column, NUM_SAMPLES, checkpoint_reagents, used_tips, magdeck.status == 'engaged')
+
+    def resuming_columns():
+        '''
+        True when the run is resumed in the columns of STEP
+        '''
+        return resume is not None and resume['step'] == STEP and resume['column'] is not None
+
+    def step_columns():
+        '''
+        Columns of STEP, from the one the run stopped in when it is resumed in them
+        '''
+        return range(resume['column'] if resuming_columns() else 0, num_cols)
+
+    def column_start(i):
+        save_checkpoint(STEP, i)
+        events.column_start(i + 1)
+
+    resume = checkpoint.load(NUM_SAMPLES) if RESUME_FROM_CHECKPOINT else None
+    if resume is not None and resume['step'] not in STEPS: # Stopped once every STEP was done
+        resume = None
+    tips_before_resume = 0
+    if resume is not None:
+        for s in STEPS:
+            if s < resume['step']:
+                STEPS[s]['Execute'] = False
+        restore_reagents(checkpoint_reagents, resume)
+        tips_before_resume = resume['tips']
+        if resume['magnet']:
+            magdeck.engage(height = mag_height)
+        where = 'Step ' + str(resume['step']) + ': ' + STEPS[resume['step']]['description']
+        if resume['column'] is not None:
+            where += ', column ' + str(resume['column'] + 1)
+        run_log.operator('Resuming the run stopped at ' + resume['updated'] + ' from ' + where)
+        events.event('run_resumed', from_step = resume['step'], from_column = None if resume['column'] is None else resume['column'] + 1)
+        ctx.pause('Resuming from ' + where + ('. That column may be partly done, check it' if resume['column'] is not None else '') + '.')
+
+    #### tipracks to replace during the run
+    first_step = min(s for s in STEPS if STEPS[s]['Execute'])
+    tips.start(run_log, first_step)
+
+###############################################################################
+
+###############################################################################
+    # STEP 1 TRANSFER LYSIS
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+    #Transfer lysis
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        lysis_trips = math.ceil(Lysis.reagent_volume / Lysis.max_volume_allowed)
+        lysis_volume = Lysis.reagent_volume / lysis_trips
+        lysis_transfer_vol = []
+        for i in range(lysis_trips):
+            lysis_transfer_vol.append(lysis_volume + Lysis.disposal_volume)
+        x_offset_source = 0
+        x_offset_dest   = 0
+        rinse = False
+
+        for i in step_columns():
+            column_start(i)
+            run_log.debug("Column: " + str(i))
+            if not m300.hw_pipette['has_tip']:
+                tips.pick_up(column_tips(NUM_SAMPLES, i))
+            for j,transfer_vol in enumerate(lysis_transfer_vol):
+                #Calculate pickup_height based on remaining volume and shape of container
+                [pickup_height, change_col] = calc_height(run_log, events, Lysis, reservoir_heights, transfer_vol * column_tips(NUM_SAMPLES, i), reagent_follow_depth)
+                run_log.debug('Aspirate from reservoir column: ' + str(Lysis.col))
+                run_log.debug('Pickup height is ' + str(round(pickup_height, 2)) + ' mm')
+                move_vol_multichannel(ctx, run_log, m300, reagent = Lysis, source = Lysis.reagent_reservoir[Lysis.col],
+                        dest = work_destinations[i], vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
+                        pickup_height = pickup_height, rinse = rinse, avoid_droplet = False, wait_time = 0, blow_out = True, touch_tip = False, drop_height = 1)
+            
+            incubations.record_dose('LYSIS', i)
+
+            if LYSIS_NUM_MIXES > 0:
+                run_log.debug(' ')
+                run_log.debug('Mixing sample ')
+                custom_mix(ctx, m300, Lysis, location = work_destinations[i], vol =  Lysis.max_volume_allowed,
+                        rounds = LYSIS_NUM_MIXES, blow_out = False, mix_height = 1, offset = 0)
+            
+            m300.move_to(work_destinations[i].top(0))
+            m300.air_gap(Lysis.air_gap_vol_bottom) #air gap
+            
+            tips.drop()
+            
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+ str(tips.used))
+        ###############################################################################
+        # STEP 1 TRANSFER LYSIS
+        ########
+
+    ###############################################################################
+    # STEP 2 WAIT REST
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        run_log.debug(' ')
+        tips.refill_break(STEP)
+        incubations.delay('LYSIS', STEPS[STEP]['wait_time'], msg = 'Rest')
+        run_log.debug(' ')
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+ str(tips.used))
+        ###############################################################################
+        # STEP 2 WAIT REST
+        ########
+
+    ###############################################################################
+    # STEP 3 TRANSFER BEADS
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+    #Transfer beads
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        beads_trips = math.ceil(Beads.reagent_volume / Beads.max_volume_allowed)
+        beads_volume = Beads.reagent_volume / beads_trips
+        beads_transfer_vol = []
+        for i in range(beads_trips):
+            beads_transfer_vol.append(beads_volume + Beads.disposal_volume)
+        x_offset_source = 0
+        x_offset_dest   = 0
+        rinse = False # Original: True 
+        first_mix_done = False
+
+        for i in step_columns():
+            column_start(i)
+            run_log.debug("Column: " + str(i))
+            if not m300.hw_pipette['has_tip']:
+                tips.pick_up(column_tips(NUM_SAMPLES, i))
+            for j,transfer_vol in enumerate(beads_transfer_vol):
+                #Calculate pickup_height based on remaining volume and shape of container
+                transfer_vol_extra = transfer_vol if j > 0 else transfer_vol + 100  # Extra 100 isopropanol for calcs
+                [pickup_height, change_col] = calc_height(run_log, events, Beads, reservoir_heights, transfer_vol_extra * column_tips(NUM_SAMPLES, i), reagent_follow_depth)
+                if change_col == True or not first_mix_done: #If we switch column because there is not enough volume left in current reservoir column we mix new column
+                    run_log.debug('Mixing new reservoir column: ' + str(Beads.col))
+                    custom_mix(ctx, m300, Beads, Beads.reagent_reservoir[Beads.col],
+                        vol = Beads.max_volume_allowed, rounds = BEADS_WELL_FIRST_TIME_NUM_MIXES, 
+                        blow_out = False, mix_height = 1.5, offset = 0)
+                    first_mix_done = True
+                else:
+                    run_log.debug('Mixing reservoir column: ' + str(Beads.col))
+                    custom_mix(ctx, m300, Beads, Beads.reagent_reservoir[Beads.col],
+                        vol = Beads.max_volume_allowed, rounds = BEADS_WELL_NUM_MIXES, 
+                        blow_out = False, mix_height = 1.5, offset = 0)
+
+                run_log.debug('Aspirate from reservoir column: ' + str(Beads.col))
+                run_log.debug('Pickup height is ' + str(round(pickup_height, 2)) + ' mm')
+                move_vol_multichannel(ctx, run_log, m300, reagent = Beads, source = Beads.reagent_reservoir[Beads.col],
+                        dest = work_destinations[i], vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
+                        pickup_height = pickup_height, rinse = rinse, avoid_droplet = False, wait_time = 0, blow_out = True, touch_tip = True, drop_height = 1)
+            
+            incubations.record_dose('BEADS', i)
+
+            if BEADS_NUM_MIXES > 0:
+                run_log.debug(' ')
+                run_log.debug('Mixing sample ')
+                custom_mix(ctx, m300, Beads, location = work_destinations[i], vol =  Beads.max_volume_allowed,
+                        rounds = BEADS_NUM_MIXES, blow_out = False, mix_height = 1, offset = 0, wait_time = 2)
+            
+            m300.move_to(work_destinations[i].top(0))
+            m300.air_gap(Beads.air_gap_vol_bottom) #air gap
+
+            tips.drop()
+            
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+ str(tips.used))
+        ###############################################################################
+        # STEP 3 TRANSFER BEADS
+        ########
+
+    ###############################################################################
+    # STEP 4 WAIT REST
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        run_log.debug(' ')
+        tips.refill_break(STEP)
+        incubations.delay('BEADS', STEPS[STEP]['wait_time'], msg = 'Rest')
+        run_log.debug(' ')
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+ str(tips.used))
+        ###############################################################################
+        # STEP 4 WAIT REST
+        ########
+
+    ###############################################################################
+    # STEP 5 INCUBATE WAIT WITH MAGNET ON
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        run_log.debug(' ')
+        magdeck.engage(height = mag_height)
+        paused = tips.refill_break(STEP)
+        ctx.delay(seconds = max(0, STEPS[STEP]['wait_time'] - paused), msg = 'Incubating ON magnet for ' + format(STEPS[STEP]['wait_time']) + ' seconds.')
+        run_log.debug(' ')
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+ str(tips.used))
+        ###############################################################################
+        # STEP 5 INCUBATE WAIT WITH MAGNET ON
+        ########
+
+    ###############################################################################
+    # STEP 6 REMOVE SUPERNATANT
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        actual_vol_well = Beads.reagent_volume + VOLUME_SAMPLE
+        if STEPS[1]['Execute'] == True:             # Step 1 is lysis transfer
+            actual_vol_well += Lysis.reagent_volume
+        supernatant_trips = plan_supernatant_trips(deepwell_heights, actual_vol_well, Lysis.max_volume_allowed, supernatant_extra_vol, supernatant_follow_depth, supernatant_final_height)
+        x_offset_rs = 2
+        for i in step_columns():
+            column_start(i)
+            x_offset_source = find_side(i) * x_offset_rs
+            x_offset_dest   = 0
+            not_first_transfer = False
+
+            if not m300.hw_pipette['has_tip']:
+                tips.pick_up(column_tips(NUM_SAMPLES, i))
+            for transfer_vol, pickup_height, near_pellet in supernatant_trips:
+                run_log.debug('Aspirate from deep well column: ' + str(i+1))
+                run_log.debug('Pickup height is ' + str(round(pickup_height, 2)) + ' mm')
+
+                move_vol_multichannel(ctx, run_log, m300, reagent = Sample, source = work_destinations[i],
+                        dest = waste, vol = transfer_vol + Sample.disposal_volume, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
+                        pickup_height = pickup_height, rinse = False, avoid_droplet = False, wait_time = 2 if near_pellet else 0, blow_out = True,
+                        dispense_bottom_air_gap_before = not_first_transfer,
+                        aspirate_rate = Sample.flow_rate_aspirate if near_pellet else supernatant_fast_rate)
+                m300.air_gap(Sample.air_gap_vol_bottom)
+                not_first_transfer = True
+
+            tips.drop()
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+ str(tips.used))
+        ###############################################################################
+        # STEP 6 REMOVE SUPERNATANT
+        ########
+
+    ###############################################################################
+    # STEP 7 MAGNET OFF
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        # switch off magnet
+        magdeck.disengage()
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+ str(tips.used))
+        ###############################################################################
+        # STEP 7 MAGNET OFF
+        ########
+
+    ###############################################################################
+    # STEP 8 ADD WASH
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        wash_trips = math.ceil(Wash.reagent_volume / Wash.max_volume_allowed)
+        wash_volume = Wash.reagent_volume / wash_trips #136.66
+        wash_transfer_vol = []
+        for i in range(wash_trips):
+            wash_transfer_vol.append(wash_volume + Wash.disposal_volume)
+        x_offset_rs = 2.5
+        pickup_height = 0.5
+        rinse = False # Not needed
+
+        for i in step_columns():
+            column_start(i)
+            x_offset_source = 0
+            x_offset_dest   = -1 * find_side(i) * x_offset_rs
+            if not m300.hw_pipette['has_tip']:
+                tips.pick_up_column('WASH_1', i)
+            for transfer_vol in wash_transfer_vol:
+                run_log.debug('Aspirate from reservoir 1')
+                move_vol_multichannel(ctx, run_log, m300, reagent = Wash, source = Wash.reagent_reservoir,
+                        dest = work_destinations[i], vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
+                        pickup_height = pickup_height, rinse = rinse, avoid_droplet = False, wait_time = 0, blow_out = False)
+            
+            if WASH_NUM_MIXES > 0:
+                custom_mix(ctx, m300, Wash, location = work_destinations[i], vol = 180, two_thirds_mix_bottom = True,
+                        rounds = WASH_NUM_MIXES, blow_out = False, mix_height = 3, offset = x_offset_dest)
+            
+            m300.move_to(work_destinations[i].top(0))
+            m300.air_gap(Wash.air_gap_vol_bottom) #air gap
+
+            tips.drop_column('WASH_1', i, keep = True)
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+ str(tips.used))
+        ###############################################################################
+        # STEP 8 ADD WASH
+        ########
+
+    ###############################################################################
+    # STEP 9 INCUBATE WAIT WITH MAGNET ON
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        # switch on magnet
+        magdeck.engage(mag_height)
+        paused = tips.refill_break(STEP)
+        ctx.delay(seconds = max(0, STEPS[STEP]['wait_time'] - paused), msg = 'Incubating ON magnet for ' + format(STEPS[STEP]['wait_time']) + ' seconds.')
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+ str(tips.used))
+        ####################################################################
+        # STEP 9 INCUBATE WAIT WITH MAGNET ON
+        ########
+
+    ###############################################################################
+    # STEP 10 REMOVE SUPERNATANT
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        supernatant_trips = plan_supernatant_trips(deepwell_heights, Wash.reagent_volume, Wash.max_volume_allowed, supernatant_extra_vol, supernatant_follow_depth, supernatant_final_height)
+        x_offset_rs = 2
+
+        for i in step_columns():
+            column_start(i)
+            x_offset_source = find_side(i) * x_offset_rs
+            x_offset_dest   = 0
+            not_first_transfer = False
+
+            if not m300.hw_pipette['has_tip']:
+                tips.pick_up_column('WASH_1', i)
+            for transfer_vol, pickup_height, near_pellet in supernatant_trips:
+                run_log.debug('Aspirate from deep well column: ' + str(i+1))
+                run_log.debug('Pickup height is ' + str(round(pickup_height, 2)) + ' mm')
+                move_vol_multichannel(ctx, run_log, m300, reagent = Sample, source = work_destinations[i],
+                    dest = waste, vol = transfer_vol + Sample.disposal_volume, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
+                    pickup_height = pickup_height, rinse = False, avoid_droplet = False, wait_time = 2 if near_pellet else 0, blow_out = False,
+                    dispense_bottom_air_gap_before = not_first_transfer,
+                    aspirate_rate = Sample.flow_rate_aspirate if near_pellet else supernatant_fast_rate)
+                m300.air_gap(Sample.air_gap_vol_bottom)
+                not_first_transfer = True
+
+            tips.drop_column('WASH_1', i, keep = False)
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+ str(tips.used))
+        ###############################################################################
+        # STEP 10 REMOVE SUPERNATANT
+        ########
+
+    ###############################################################################
+    # STEP 11 MAGNET OFF
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        # switch off magnet
+        magdeck.disengage()
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+ str(tips.used))
+        ###############################################################################
+        # STEP 11 MAGNET OFF
+        ########
+
+    ###############################################################################
+    # STEP 12 ADD WASH
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        wash_trips = math.ceil(Wash.reagent_volume / Wash.max_volume_allowed)
+        wash_volume = Wash.reagent_volume / wash_trips #136.66
+        wash_transfer_vol = []
+        for i in range(wash_trips):
+            wash_transfer_vol.append(wash_volume + Wash.disposal_volume)
+        x_offset_rs = 2.5
+        pickup_height = 0.5
+        rinse = False # Not needed
+
+        for i in step_columns():
+            column_start(i)
+            x_offset_source = 0
+            x_offset_dest   = -1 * find_side(i) * x_offset_rs
+            if not m300.hw_pipette['has_tip']:
+                tips.pick_up_column('WASH_2', i)
+            for transfer_vol in wash_transfer_vol:
+                run_log.debug('Aspirate from reservoir 1')
+                move_vol_multichannel(ctx, run_log, m300, reagent = Wash, source = Wash.reagent_reservoir,
+                        dest = work_destinations[i], vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
+                        pickup_height = pickup_height, rinse = rinse, avoid_droplet = False, wait_time = 0, blow_out = False)
+            
+            if WASH_NUM_MIXES > 0:
+                custom_mix(ctx, m300, Wash, location = work_destinations[i], vol = 180, two_thirds_mix_bottom = True,
+                    rounds = WASH_NUM_MIXES, blow_out = False, mix_height = 3, offset = x_offset_dest)
+            
+            m300.move_to(work_destinations[i].top(0))
+            m300.air_gap(Wash.air_gap_vol_bottom) #air gap
+
+            tips.drop_column('WASH_2', i, keep = True)
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+ str(tips.used))
+        ###############################################################################
+        # STEP 12 ADD WASH
+        ########
+
+    ###############################################################################
+    # STEP 13 INCUBATE WAIT WITH MAGNET ON
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        # switch on magnet
+        magdeck.engage(mag_height)
+        paused = tips.refill_break(STEP)
+        ctx.delay(seconds = max(0, STEPS[STEP]['wait_time'] - paused), msg = 'Incubating ON magnet for ' + format(STEPS[STEP]['wait_time']) + ' seconds.')
+        
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+str(tips.used))
+        ####################################################################
+        # STEP 13 INCUBATE WAIT WITH MAGNET ON
+        ########
+
+    ###############################################################################
+    # STEP 14 REMOVE SUPERNATANT
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        supernatant_trips = plan_supernatant_trips(deepwell_heights, Wash.reagent_volume, Wash.max_volume_allowed, supernatant_extra_vol, supernatant_follow_depth, supernatant_final_height)
+        x_offset_rs = 2
+
+        for i in step_columns():
+            column_start(i)
+            x_offset_source = find_side(i) * x_offset_rs
+            x_offset_dest   = 0
+            not_first_transfer = False
+
+            if not m300.hw_pipette['has_tip']:
+                tips.pick_up_column('WASH_2', i)
+            for transfer_vol, pickup_height, near_pellet in supernatant_trips:
+                run_log.debug('Aspirate from deep well column: ' + str(i+1))
+                run_log.debug('Pickup height is ' + str(round(pickup_height, 2)) + ' mm')
+                move_vol_multichannel(ctx, run_log, m300, reagent = Sample, source = work_destinations[i],
+                    dest = waste, vol = transfer_vol + Sample.disposal_volume, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
+                    pickup_height = pickup_height, rinse = False, avoid_droplet = False, wait_time = 2 if near_pellet else 0, blow_out = False,
+                    dispense_bottom_air_gap_before = not_first_transfer,
+                    aspirate_rate = Sample.flow_rate_aspirate if near_pellet else supernatant_fast_rate)
+                m300.air_gap(Sample.air_gap_vol_bottom)
+                not_first_transfer = True
+
+            tips.drop_column('WASH_2', i, keep = False)
+            incubations.record_dose('DRY', i)
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+str(tips.used))
+        ###############################################################################
+        # STEP 14 REMOVE SUPERNATANT
+        ########
+
+    ###############################################################################
+    # STEP 15 ALLOW DRY
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        run_log.debug(' ')
+        tips.refill_break(STEP)
+        incubations.delay('DRY', STEPS[STEP]['wait_time'], msg = 'Dry')
+        run_log.debug(' ')
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: ' + str(tips.used))
+        ###############################################################################
+        # STEP 15 ALLOW DRY
+        ########
+
+
+    ###############################################################################
+    # STEP 16 MAGNET OFF
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        # switch off magnet
+        magdeck.disengage()
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+str(tips.used))
+        ###############################################################################
+        # STEP 16 MAGNET OFF
+        ########
+    
+    ###############################################################################
+    # STEP 17 ADD ELUTION
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        elution_trips = math.ceil(Elution.reagent_volume / Elution.max_volume_allowed)
+        elution_volume = Elution.reagent_volume / elution_trips
+        elution_wash_vol = []
+        for i in range(elution_trips):
+            elution_wash_vol.append(elution_volume + Sample.disposal_volume)
+        x_offset_rs = 2.5
+
+        ########
+        # Water or elution buffer
+        for i in step_columns():
+            column_start(i)
+            x_offset_source = 0
+            x_offset_dest   = -1 * find_side(i) * x_offset_rs # Original 0
+            if not m300.hw_pipette['has_tip']:
+                tips.pick_up_column('ELUTION', i)
+            for transfer_vol in elution_wash_vol:
+                #Calculate pickup_height based on remaining volume and shape of container
+                [pickup_height, change_col] = calc_height(run_log, events, Elution, reservoir_heights, transfer_vol * column_tips(NUM_SAMPLES, i), reagent_follow_depth)
+                run_log.debug('Aspirate from Reservoir column: ' + str(Elution.col))
+                run_log.debug('Pickup height is ' + str(round(pickup_height, 2)) + ' mm')
+
+                move_vol_multichannel(ctx, run_log, m300, reagent = Elution, source = Elution.reagent_reservoir[Elution.col],
+                        dest = work_destinations[i], vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
+                        pickup_height = pickup_height, rinse = False, avoid_droplet = False, wait_time = 0, blow_out = False, drop_height = -35)
+            
+            incubations.record_dose('ELUTION', i)
+
+            if ELUTION_NUM_MIXES > 0:
+                run_log.debug(' ')
+                run_log.debug('Mixing sample with Elution')
+                custom_mix(ctx, m300, Elution, work_destinations[i], vol = Elution.reagent_volume, rounds = ELUTION_NUM_MIXES,
+                    blow_out = False, mix_height = 1, offset = x_offset_dest, drop_height = -35)
+            
+            m300.move_to(work_destinations[i].top(0))
+            m300.air_gap(Elution.air_gap_vol_bottom) #air gap
+            
+            tips.drop_column('ELUTION', i, keep = True)
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+str(tips.used))
+        ###############################################################################
+        # STEP 17 ADD ELUTION
+        ########
+
+    ###############################################################################
+    # STEP 18 WAIT
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        tips.refill_break(STEP)
+        incubations.delay('ELUTION', STEPS[STEP]['wait_time'], msg = 'Wait')
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+str(tips.used))
+        ####################################################################
+        # STEP 18 WAIT
+        ########
+
+    ###############################################################################
+    # STEP 19 INCUBATE WAIT WITH MAGNET ON
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        # switch on magnet
+        magdeck.engage(mag_height)
+        paused = tips.refill_break(STEP)
+        ctx.delay(seconds = max(0, STEPS[STEP]['wait_time'] - paused), msg = 'Incubate with magnet ON for ' + format(STEPS[STEP]['wait_time']) + ' seconds.')
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+str(tips.used))
+        ####################################################################
+        # STEP 19 INCUBATE WAIT WITH MAGNET ON
+        ########
+
+    ###############################################################################
+    # STEP 20 TRANSFER TO ELUTION PLATE
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP)
+
+        if SET_TEMP_ON == True:
+            await_temperature(run_log, tempdeck, TEMPERATURE)
+
+        elution_trips = math.ceil(ELUTION_FINAL_VOLUME_PER_SAMPLE / Elution.max_volume_allowed)
+        elution_volume = ELUTION_FINAL_VOLUME_PER_SAMPLE / elution_trips
+        elution_vol = []
+        for i in range(elution_trips):
+            elution_vol.append(elution_volume + Elution.disposal_volume)
+        x_offset_rs = 2
+        for i in step_columns():
+            column_start(i)
+            x_offset_source = find_side(i) * x_offset_rs
+            x_offset_dest   = 0
+            if not m300.hw_pipette['has_tip']:
+                tips.pick_up_column('ELUTION', i)
+            for transfer_vol in elution_vol:
+                #Pickup_height is fixed here
+                pickup_height = 1
+                run_log.debug('Aspirate from deep well column: ' + str(i+1))
+                run_log.debug('Pickup height is ' + str(round(pickup_height, 2)) + ' mm' +' (fixed)')
+
+                move_vol_multichannel(ctx, run_log, m300, reagent = Sample, source = work_destinations[i],
+                        dest = final_destinations[i], vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
+                        pickup_height = pickup_height, rinse = False, avoid_droplet = False, wait_time = 2, blow_out = True, touch_tip = True)
+            
+            tips.drop_column('ELUTION', i, keep = False)
+
+        log_step_end(run_log, events, STEPS, STEP, start)
+        save_checkpoint(STEP + 1, None)
+        run_log.operator('Used tips in total: '+str(tips.used))
+        ###############################################################################
+        # STEP 20 TRANSFER TO ELUTION PLATE
+        ########
+
+    '''if not ctx.is_simulating():
+        with open(file_path,'w') as outfile:
+            json.dump(STEPS, outfile)'''
+
+    magdeck.disengage()
+    run_log.banner('Homing robot')
+    ctx.home()
+###############################################################################
+    # Light flash end of program
+    lights.start('finished', times = 3, end = {'button': (0, 1, 0)})
+    run_log.operator('Finished! \nMove deepwell plate (slot 5) to Station C for MMIX addition and PCR preparation.')
+    finish_run(run_log, events, checkpoint, STEPS, tips.used + tips_before_resume, None if ctx.is_simulating() else file_path)
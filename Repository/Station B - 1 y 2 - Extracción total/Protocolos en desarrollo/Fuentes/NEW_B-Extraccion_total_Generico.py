@@ -0,0 +1,1234 @@
+import math
+from opentrons.types import Point
+from opentrons import protocol_api
+
+
+# metadata
+metadata = {
+    'protocolName': 'Station B - RNA extraction - Generic',
+    'author': 'Aitor Gastaminza & José Luis Villanueva & Alex Gasulla & Manuel Alba & Daniel Peñil & David Martínez',
+    'source': 'HU Marqués de Valdecilla',
+    'apiLevel': '2.6',
+    'description': 'Protocol for RNA extraction'
+}
+
+################################################
+# CHANGE THESE VARIABLES ONLY
+################################################
+NUM_SAMPLES                         = 96    # Si no es múltiplo de 8 la última columna se hace con menos puntas
+NUM_WASHES                          = 2     # Number of washes to do. Value between 0 - 3.
+USE_300_TIPS                        = True  # Check that TIP_RECYCLING variables have desired values
+
+VOLUME_SAMPLE                       = 200   # Volume received from station A
+LYSIS_VOLUME_PER_SAMPLE             = 200   # 0 to ignore Lysis transfer
+BEADS_VOLUME_PER_SAMPLE             = 200   # 0 to ignore Beads transfer
+WASH_1_VOLUME_PER_SAMPLE            = 200
+WASH_2_VOLUME_PER_SAMPLE            = 200
+WASH_3_VOLUME_PER_SAMPLE            = 200
+ELUTION_VOLUME_PER_SAMPLE           = 100
+ELUTION_FINAL_VOLUME_PER_SAMPLE     = 100    # Volume transfered to final plates
+
+LYSIS_NUM_MIXES                     = 10
+BEADS_WELL_FIRST_TIME_NUM_MIXES     = 5
+BEADS_WELL_NUM_MIXES                = 1
+BEADS_NUM_MIXES                     = 10
+WASH_1_NUM_MIXES                    = 10
+WASH_2_NUM_MIXES                    = 10
+WASH_3_NUM_MIXES                    = 10
+ELUTION_NUM_MIXES                   = 10
+
+TIP_RECYCLING_IN_WASH               = True
+TIP_RECYCLING_IN_ELUTION            = True
+
+SET_TEMP_ON                         = True  # Do you want to start temperature module?
+TEMPERATURE                         = 4     # Set temperature. It will be uesed if set_temp_on is set to True
+
+PHOTOSENSITIVE                      = False # True if it has photosensitive reagents
+SOUND_NUM_PLAYS                     = 3
+SPEED_PROFILE                       = 'fast' # Liquid class settings: 'safe' (validated) or 'fast'
+CONTINUE_TIPRACKS                   = False # Continue from the tips the previous run left in the tipracks (tip inventory, also when resuming a checkpoint), otherwise every tiprack is new
+NEW_TIPRACK_SLOTS                   = []    # With CONTINUE_TIPRACKS, slots with new tipracks
+LOG_LEVEL                           = 'operator' # Run log detail: 'operator' or 'debug' (every pickup height and reservoir column)
+RESUME_FROM_CHECKPOINT              = False # True para continuar un protocolo detenido desde la columna en que se detuvo (checkpoint.json de su carpeta)
+################################################
+
+run_id                      = 'B-Extraccion_total-Generico'
+path_sounds                 = '/var/lib/jupyter/notebooks/sonidos/'
+
+recycle_tip                 = False     # Do you want to recycle tips? It shoud only be set True for testing
+mag_height                  = 6         # Height needed for NEST deepwell in magnetic deck
+waste_drop_height           = -5
+reagent_follow_depth        = 1         # mm por debajo del nivel del líquido al aspirar los reactivos
+supernatant_extra_vol       = 20        # Volumen por encima del sobrenadante que se retira para vaciar el pocillo
+supernatant_final_height    = 0.5       # Altura de recogida del último viaje, junto al pellet
+supernatant_follow_depth    = 2         # mm por debajo del nivel del líquido en los viajes superiores
+supernatant_fast_rate       = 1         # Velocidad de aspiración de los viajes superiores (junto al pellet se usa Sample.flow_rate_aspirate)
+
+pipette_allowed_capacity    = 280 if USE_300_TIPS else 180
+txt_tip_capacity            = '300 uL' if USE_300_TIPS else '200 uL'
+
+num_cols = math.ceil(NUM_SAMPLES / 8) # Columns we are working on
+switch_off_lights           = False # Switch of the lights when the program finishes
+
+# Shared code of Utils/, copied into the uploaded protocol by Utils/bundle.py: edit
+# Fuentes/NEW_B-Extraccion_total_Generico.py and bundle it again (see README.md)
+from liquid_classes import EXTRACTION_FIELDS, liquid_class
+from tip_inventory import partial_pickup_racks, column_tips, RunTips
+from tip_reuse import TipReuse
+from liquid_height import height_table
+from reservoir_packing import pack_channels, fill_sheet
+from run_log import RunLog
+from event_log import EventLog
+from checkpoint import Checkpoint, restore_reagents
+from audio_worker import AudioWorker
+from light_signals import LightSignals
+from incubation import start_temperature, await_temperature, Incubations
+from pipetting import find_side, aspirate_with_x_scrolling, plan_supernatant_trips
+from step_log import log_step_start, log_step_end, start_run, finish_run
+
+
+def run(ctx: protocol_api.ProtocolContext):
+    lights = LightSignals(None if ctx.is_simulating() else ctx._hw_manager.hardware, photosensitive = PHOTOSENSITIVE) # Light patterns played in the background
+    STEP = 0
+    STEPS = { #Dictionary with STEP activation, description, and times
+            1:{'Execute': LYSIS_VOLUME_PER_SAMPLE > 0, 'description': 'Transferir lisis'},
+            2:{'Execute': BEADS_VOLUME_PER_SAMPLE > 0, 'description': 'Transferir bolas magnéticas'},
+            3:{'Execute': False, 'description': 'Espera', 'wait_time': 300},         # TODO: Ver si es necesaria
+            4:{'Execute': True, 'description': 'Incubación con el imán ON', 'wait_time': 600}, 
+            5:{'Execute': True, 'description': 'Desechar sobrenadante'},
+            6:{'Execute': NUM_WASHES > 0, 'description': 'Imán OFF'},
+            7:{'Execute': NUM_WASHES > 0, 'description': 'Transferir primer lavado'},
+            8:{'Execute': NUM_WASHES > 0, 'description': 'Incubación con el imán ON', 'wait_time': 300},
+            9:{'Execute': NUM_WASHES > 0, 'description': 'Desechar sobrenadante'},
+            10:{'Execute': NUM_WASHES > 1, 'description': 'Imán OFF'},
+            11:{'Execute': NUM_WASHES > 1, 'description': 'Transferir segundo lavado'},
+            12:{'Execute': NUM_WASHES > 1, 'description': 'Incubación con el imán ON', 'wait_time': 300},
+            13:{'Execute': NUM_WASHES > 1, 'description': 'Desechar sobrenadante'},
+            14:{'Execute': NUM_WASHES > 2, 'description': 'Imán OFF'},
+            15:{'Execute': NUM_WASHES > 2, 'description': 'Transferir tercer lavado'},
+            16:{'Execute': NUM_WASHES > 2, 'description': 'Incubación con el imán ON', 'wait_time': 300},
+            17:{'Execute': NUM_WASHES > 2, 'description': 'Desechar sobrenadante'},
+            18:{'Execute': True, 'description': 'Secado', 'wait_time': 180},
+            19:{'Execute': True, 'description': 'Imán OFF'},
+            20:{'Execute': True, 'description': 'Transferir elución'},
+            21:{'Execute': True, 'description': 'Incubación con el imán ON', 'wait_time': 180},
+            22:{'Execute': True, 'description': 'Transferir elución a la placa'},
+            }
+
+    #Folder and file_path for log time
+    import os
+    folder_path = '/var/lib/jupyter/notebooks/' + run_id
+    if not ctx.is_simulating():
+        if not os.path.isdir(folder_path):
+            os.mkdir(folder_path)
+        file_path = folder_path + '/Station_B_Extraccion_total_time_log.txt'
+    run_log = RunLog(ctx, None if ctx.is_simulating() else folder_path + '/run_log.txt', LOG_LEVEL)
+    events = EventLog(None if ctx.is_simulating() else folder_path + '/events.jsonl') # Eventos del protocolo, ver event_log
+    checkpoint = Checkpoint(None if ctx.is_simulating() else folder_path + '/checkpoint.json', metadata['protocolName']) # Progreso para continuar el protocolo, ver checkpoint
+    incubations = Incubations(ctx, run_log, 'es') # Plazos de incubación de las columnas, ver incubation
+
+    #Define Reagents as objects with their properties
+    class Reagent:
+        def calc_vol_well(self):
+            if(self.name == 'Sample'):
+                self.num_wells = num_cols
+                return VOLUME_SAMPLE
+            elif self.placed_in_multi:
+                self.num_wells = 0 # Los canales los asigna pack_channels
+                return 0
+            else:
+                self.num_wells = 1
+                return self.reagent_volume * NUM_SAMPLES
+
+        def __init__(self, name, flow_rate_aspirate, flow_rate_dispense, flow_rate_aspirate_mix, flow_rate_dispense_mix,
+        air_gap_vol_bottom, air_gap_vol_top, disposal_volume, max_volume_allowed, reagent_volume, v_fondo, 
+        dead_vol = 700, first_well = None, placed_in_multi = False):
+            self.name = name
+            self.flow_rate_aspirate = flow_rate_aspirate
+            self.flow_rate_dispense = flow_rate_dispense
+            self.flow_rate_aspirate_mix = flow_rate_aspirate_mix
+            self.flow_rate_dispense_mix = flow_rate_dispense_mix
+            self.air_gap_vol_bottom = air_gap_vol_bottom
+            self.air_gap_vol_top = air_gap_vol_top
+            self.disposal_volume = disposal_volume
+            self.max_volume_allowed = max_volume_allowed
+            self.reagent_volume = reagent_volume
+            self.col = 0
+            self.vol_well = 0
+            self.v_cono = v_fondo
+            self.dead_vol = dead_vol
+            self.channels = []
+            self.channel_volumes = []
+            self.first_well = first_well
+            self.placed_in_multi = placed_in_multi
+            self.vol_well_original = self.calc_vol_well() if reagent_volume * NUM_SAMPLES > 0 else 0
+            self.vol_well = self.vol_well_original
+
+    #Reagents and their characteristics
+    Lysis = Reagent(name = 'Lysis',
+                    **liquid_class('lysis', SPEED_PROFILE, EXTRACTION_FIELDS),
+                    max_volume_allowed = 180,
+                    reagent_volume = LYSIS_VOLUME_PER_SAMPLE,
+                    v_fondo = 695, #1.95 * multi_well_rack_area / 2, #Prismatic
+                    placed_in_multi = True)
+
+    Beads = Reagent(name = 'Beads',
+                    **liquid_class('beads', SPEED_PROFILE, EXTRACTION_FIELDS),
+                    max_volume_allowed = 180,
+                    reagent_volume = BEADS_VOLUME_PER_SAMPLE,
+                    v_fondo = 695, #1.95 * multi_well_rack_area / 2, #Prismatic
+                    placed_in_multi = True)
+
+    Wash_1 = Reagent(name = 'Wash 1',
+                    **liquid_class('wash', SPEED_PROFILE, EXTRACTION_FIELDS),
+                    max_volume_allowed = 180,
+                    reagent_volume = WASH_1_VOLUME_PER_SAMPLE, 
+                    v_fondo = 695) #1.95 * multi_well_rack_area / 2, #Prismatic)
+
+    Wash_2 = Reagent(name = 'Wash 2',
+                    **liquid_class('wash', SPEED_PROFILE, EXTRACTION_FIELDS),
+                    max_volume_allowed = 180,
+                    reagent_volume = WASH_2_VOLUME_PER_SAMPLE, 
+                    v_fondo = 695) #1.95 * multi_well_rack_area / 2, #Prismatic)
+
+    Wash_3 = Reagent(name = 'Wash 3',
+                    **liquid_class('wash', SPEED_PROFILE, EXTRACTION_FIELDS),
+                    max_volume_allowed = 180,
+                    reagent_volume = WASH_3_VOLUME_PER_SAMPLE, 
+                    v_fondo = 695) #1.95 * multi_well_rack_area / 2, #Prismatic)
+
+    Elution = Reagent(name = 'Elution',
+                    **liquid_class('elution', SPEED_PROFILE, EXTRACTION_FIELDS),
+                    max_volume_allowed = 180,
+                    reagent_volume = ELUTION_VOLUME_PER_SAMPLE,
+                    placed_in_multi = True,
+                    v_fondo = 695) #1.95*multi_well_rack_area/2) #Prismatic
+
+    Sample = Reagent(name = 'Sample',
+                    **liquid_class('sample', SPEED_PROFILE, EXTRACTION_FIELDS),
+                    max_volume_allowed = 180,
+                    reagent_volume = VOLUME_SAMPLE,
+                    v_fondo = 4 * math.pi * 4**3 / 3) #Sphere
+
+    run_log.debug(' ')
+    run_log.debug('###############################################')
+    run_log.operator('VALORES DE VARIABLES')
+    run_log.debug(' ')
+    run_log.operator('Número de muestras: ' + str(NUM_SAMPLES) + ' (' + str(num_cols) + ' columnas)')
+    run_log.operator('Número de ciclos de lavado: ' + str(NUM_WASHES))
+    run_log.operator('Capacidad de puntas: ' + txt_tip_capacity)
+    run_log.debug(' ') 
+    run_log.operator('Volumen de muestra en el deepwell: ' + str(VOLUME_SAMPLE) + ' ul') 
+    run_log.operator('Volumen de lisis por muestra: ' + str(LYSIS_VOLUME_PER_SAMPLE) + ' ul')
+    run_log.operator('Volumen de solución con bolas magnéticas por muestra: ' + str(BEADS_VOLUME_PER_SAMPLE) + ' ul')
+    run_log.operator('Volumen del primer lavado por muestra: ' + str(WASH_1_VOLUME_PER_SAMPLE) + ' ul') 
+    run_log.operator('Volumen del segundo lavado por muestra: ' + str(WASH_2_VOLUME_PER_SAMPLE) + ' ul') 
+    run_log.operator('Volumen del tercer lavado por muestra: ' + str(WASH_3_VOLUME_PER_SAMPLE) + ' ul')
+    run_log.operator('Volumen de elución por muestra: ' + str(ELUTION_VOLUME_PER_SAMPLE) + ' ul') 	
+    run_log.operator('Volumen de elución a retirar del deepwell: ' + str(ELUTION_FINAL_VOLUME_PER_SAMPLE) + ' ul')
+    run_log.debug(' ') 	 	
+    run_log.operator('Número de mezclas con el lisis: ' + str(LYSIS_NUM_MIXES)) 
+    run_log.operator('Número de mezclas en la primera recogida de un canal con bolas magnéticas: ' + str(BEADS_WELL_FIRST_TIME_NUM_MIXES))
+    run_log.operator('Número de mezclas en el resto de recogidas de un canal con bolas magnéticas: ' + str(BEADS_WELL_NUM_MIXES)) 	
+    run_log.operator('Número de mezclas con la solución de bolas magnéticas: ' + str(BEADS_NUM_MIXES))
+    run_log.operator('Número de mezclas con el primer lavado: ' + str(WASH_1_NUM_MIXES)) 
+    run_log.operator('Número de mezclas con el segundo lavado: ' + str(WASH_2_NUM_MIXES)) 
+    run_log.operator('Número de mezclas con el tercer lavado: ' + str(WASH_3_NUM_MIXES)) 
+    run_log.operator('Número de mezclas con la elución: ' + str(ELUTION_NUM_MIXES))
+    run_log.debug(' ') 	
+    run_log.operator('Reciclado de puntas en los lavados activado: ' + str(TIP_RECYCLING_IN_WASH)) 
+    run_log.operator('Reciclado de puntas en la elución activado: ' + str(TIP_RECYCLING_IN_ELUTION))
+    run_log.debug(' ')
+    run_log.operator('Activar módulo de temperatura: ' + str(SET_TEMP_ON)) 	
+    run_log.operator('Valor objetivo módulo de temepratura: ' + str(TEMPERATURE) + ' ºC')
+    run_log.debug(' ') 	
+    run_log.operator('Foto-sensible: ' + str(PHOTOSENSITIVE)) 	
+    run_log.operator('Repeticiones del sonido final: ' + str(SOUND_NUM_PLAYS))
+    run_log.debug(' ')
+
+    #########
+    def str_rounded(num):
+        return str(int(num + 0.5))
+
+    ###################
+    #Custom functions
+    def custom_mix(pipet, reagent, location, vol, rounds, blow_out, mix_height, offset, wait_time = 0, drop_height = -1, two_thirds_mix_bottom = False):
+        '''
+        Function for mix in the same location a certain number of rounds. Blow out optional. Offset
+        can set to 0 or a higher/lower value which indicates the lateral movement
+        '''
+        if mix_height <= 0:
+            mix_height = 1
+        pipet.aspirate(1, location = location.bottom(z = mix_height), rate = reagent.flow_rate_aspirate_mix)
+        for i in range(rounds):
+            pipet.aspirate(vol, location = location.bottom(z = mix_height), rate = reagent.flow_rate_aspirate_mix)
+            if two_thirds_mix_bottom and i < ((rounds / 3) * 2):
+                pipet.dispense(vol, location = location.bottom(z = 5).move(Point(x = offset)), rate = reagent.flow_rate_dispense_mix)
+            else:
+                pipet.dispense(vol, location = location.top(z = drop_height).move(Point(x = offset)), rate = reagent.flow_rate_dispense_mix)
+        pipet.dispense(1, location = location.bottom(z = mix_height), rate = reagent.flow_rate_dispense_mix)
+        if blow_out == True:
+            pipet.blow_out(location.top(z = -2)) # Blow out
+        if wait_time != 0:
+            ctx.delay(seconds=wait_time, msg='Esperando durante ' + str(wait_time) + ' segundos.')
+
+    def calc_height(reagent, heights, aspirate_volume, min_height = 0.4):
+        run_log.debug('¿Volumen útil restante ' + str(reagent.vol_well - reagent.dead_vol) +
+                    ' uL < volumen necesario ' + str(aspirate_volume - reagent.disposal_volume * 8) + ' uL?')
+        if (reagent.vol_well - reagent.dead_vol + 1) < (aspirate_volume - reagent.disposal_volume * 8):
+            run_log.debug('Se debe utilizar el siguiente canal')
+            run_log.debug('Canal anterior: ' + str(reagent.col))
+            # column selector position; intialize to required number
+            reagent.col = reagent.col + 1
+            events.event('channel_change', reagent = reagent.name, channel = reagent.channels[reagent.col])
+            run_log.debug('Nuevo canal: ' + str(reagent.col))
+            reagent.vol_well = reagent.channel_volumes[reagent.col]
+            run_log.debug('Nuevo volumen: ' + str(reagent.vol_well) + ' uL')
+            height = heights.height(reagent.vol_well - aspirate_volume) - reagent_follow_depth
+            reagent.vol_well = reagent.vol_well - (aspirate_volume - reagent.disposal_volume * 8)
+            run_log.debug('Volumen restante: ' + str(reagent.vol_well) + ' uL')
+            if height < min_height:
+                height = min_height
+            col_change = True
+        else:
+            height = heights.height(reagent.vol_well - aspirate_volume) - reagent_follow_depth
+            reagent.vol_well = reagent.vol_well - (aspirate_volume - (reagent.disposal_volume * 8))
+            run_log.debug('La altura calculada es ' + str(round(height, 2)) + ' mm')
+            if height < min_height:
+                height = min_height
+            run_log.debug('La altura utilizada es ' + str(round(height, 2)) + ' mm')
+            col_change = False
+        return height, col_change
+
+    def move_vol_multi(pipet, reagent, source, dest, vol, x_offset_source, x_offset_dest, pickup_height,
+        blow_out, wait_time = 0, touch_tip = False, touch_tip_v_offset = 0, drop_height = -5, 
+        aspirate_with_x_scroll = False, dispense_bottom_air_gap_before = False, aspirate_rate = None):
+        if aspirate_rate is None:
+            aspirate_rate = reagent.flow_rate_aspirate
+
+        # SOURCE
+        if dispense_bottom_air_gap_before and reagent.air_gap_vol_bottom:
+            pipet.dispense(reagent.air_gap_vol_bottom, source.top(z = -2), rate = reagent.flow_rate_dispense)
+
+        if reagent.air_gap_vol_top != 0: #If there is air_gap_vol, switch pipette to slow speed
+            pipet.move_to(source.top(z = 0))
+            pipet.air_gap(reagent.air_gap_vol_top) #air gap
+
+        if aspirate_with_x_scroll:
+            aspirate_with_x_scrolling(pip = pipet, volume = vol, src = source, pickup_height = pickup_height, rate = aspirate_rate, start_x_offset_src = 0, stop_x_offset_src = x_offset_source)
+        else:    
+            s = source.bottom(pickup_height).move(Point(x = x_offset_source))
+            pipet.aspirate(vol, s, rate = aspirate_rate) # aspirate liquid
+
+        if reagent.air_gap_vol_bottom != 0: #If there is air_gap_vol, switch pipette to slow speed
+            pipet.move_to(source.top(z = 0))
+            pipet.air_gap(reagent.air_gap_vol_bottom) #air gap
+
+        # if wait_time != 0:
+        #     ctx.delay(seconds=wait_time, msg='Esperando durante ' + str(wait_time) + ' segundos.')
+
+        # GO TO DESTINATION
+        d = dest.top(z = drop_height).move(Point(x = x_offset_dest))
+        pipet.dispense(vol - reagent.disposal_volume + reagent.air_gap_vol_bottom, d, rate = reagent.flow_rate_dispense)
+
+        if reagent.air_gap_vol_top != 0:
+            pipet.dispense(reagent.air_gap_vol_top, dest.top(z = 0), rate = reagent.flow_rate_dispense)
+
+        if blow_out == True:
+            pipet.blow_out(dest.top(z = drop_height))
+
+        if touch_tip == True:
+            pipet.touch_tip(speed = 20, v_offset = touch_tip_v_offset, radius=0.7)
+            
+        if wait_time != 0:
+            ctx.delay(seconds=wait_time, msg='Esperando durante ' + str(wait_time) + ' segundos.')
+
+        #if reagent.air_gap_vol_bottom != 0:
+            #pipet.move_to(dest.top(z = 0))
+            #pipet.air_gap(reagent.air_gap_vol_bottom) #air gap
+            #pipet.aspirate(air_gap_vol_bottom, dest.top(z = 0),rate = reagent.flow_rate_aspirate) #air gap
+
+    audio = AudioWorker(path_sounds) # Sounds played in the background
+
+    def play_sound(filename, delay = 0):
+        audio.play([filename], delay)
+
+    def reservoir_aspirations(reagent, disposal_volume):
+        '''
+        uL que calc_height toma del reservorio de 12 canales en cada viaje del reactivo, en orden
+        '''
+        trips = math.ceil(reagent.reagent_volume / reagent.max_volume_allowed)
+        return [(reagent.reagent_volume / trips + disposal_volume) * column_tips(NUM_SAMPLES, i) - reagent.disposal_volume * 8
+                for i in range(num_cols) for j in range(trips)] if reagent.reagent_volume > 0 else []
+
+    def assign_channels(reagent, channels):
+        reagent.channels            = [channel for channel, volume in channels]
+        reagent.channel_volumes     = [volume for channel, volume in channels]
+        reagent.num_wells           = len(channels)
+        reagent.first_well          = reagent.channels[0]
+        reagent.vol_well_original   = reagent.channel_volumes[0]
+        reagent.vol_well            = reagent.vol_well_original
+        reagent.reagent_reservoir   = [reagent_res.rows()[0][channel - 1] for channel in reagent.channels]
+
+####################################
+    # load labware and modules
+    ######## 12 well rack
+    reagent_res = ctx.load_labware('nest_12_reservoir_15ml', '5','reagent deepwell plate')
+    reservoir_heights = height_table(reagent_res) # Altura del líquido a partir del volumen de los canales
+
+##################################
+    ######## Single reservoirs
+    if NUM_WASHES > 0:
+        reagent_res_1 = ctx.load_labware('nest_1_reservoir_195ml', '8', 'Single reagent reservoir 1')
+        res_1 = reagent_res_1.wells()[0]
+        if NUM_WASHES > 1:
+            reagent_res_2 = ctx.load_labware('nest_1_reservoir_195ml', '10', 'Single reagent reservoir 2')
+            res_2 = reagent_res_2.wells()[0]
+            if NUM_WASHES > 2:
+                reagent_res_3 = ctx.load_labware('nest_1_reservoir_195ml', '11', 'Single reagent reservoir 3')
+                res_3 = reagent_res_3.wells()[0]
+
+    
+
+##################################
+    ########## tempdeck
+    tempdeck = ctx.load_module('Temperature Module Gen2', '1')
+    if SET_TEMP_ON == True:
+        start_temperature(run_log, tempdeck, TEMPERATURE, 'es')
+
+    ####### Elution plate - final plate, goes to C
+    elution_plate = tempdeck.load_labware('kingfisher_96_aluminumblock_200ul', 'Kingfisher 96 Aluminum Block 200 uL')
+
+############################################
+    ######## Deepwell - comes from A
+    magdeck = ctx.load_module('Magnetic Module Gen2', '4')
+    deepwell_plate = magdeck.load_labware('kingfisher_96_wellplate_2000ul', 'KingFisher 96 Well Plate 2mL')
+    deepwell_heights = height_table(deepwell_plate) # Altura del líquido a partir del volumen de los pocillos
+    
+####################################
+    ######## Waste reservoir
+    waste_reservoir = ctx.load_labware('nest_1_reservoir_195ml', '7', 'waste reservoir') # Change to our waste reservoir
+    waste = waste_reservoir.wells()[0] # referenced as reservoir
+
+####################################
+    ######### Load tip_racks
+    tip_rack_slots = ['2', '3', '6', '9']
+    if NUM_WASHES < 3:
+        tip_rack_slots.insert(4, '11')
+        if NUM_WASHES < 2:
+            tip_rack_slots.insert(4, '10')
+            if NUM_WASHES < 1:
+                tip_rack_slots.insert(3, '8')
+
+    tips300 = [ctx.load_labware('opentrons_96_tiprack_300ul', slot, '200µl filter tiprack')
+        for slot in tip_rack_slots]
+
+###############################################################################
+    #Declare which reagents are in each reservoir as well as deepwell and elution plate
+    run_log.debug(' ')
+    run_log.debug('###############################################')
+    run_log.operator('VOLÚMENES PARA ' + str(NUM_SAMPLES) + ' MUESTRAS')
+    run_log.debug(' ')
+    # Cada reactivo en el menor número de canales en que caben sus aspiraciones
+    reservoir_packing = pack_channels([(reagent.name, reservoir_aspirations(reagent, disposal_volume), reagent.dead_vol)
+                                       for reagent, disposal_volume in [(Lysis, Lysis.disposal_volume), (Beads, Beads.disposal_volume),
+                                                                        (Elution, Sample.disposal_volume)]])
+    for reagent in [Lysis, Beads, Elution]:
+        if reagent.name in reservoir_packing:
+            assign_channels(reagent, reservoir_packing[reagent.name])
+    run_log.operator('Reservorio de 12 canales:')
+    for line in fill_sheet(reservoir_packing, 'Canal'):
+        run_log.operator(line)
+    if not ctx.is_simulating():
+        with open(folder_path + '/fill_sheet.txt', 'w') as f:
+            f.write('\n'.join(fill_sheet(reservoir_packing, 'Canal')) + '\n')
+
+    if NUM_WASHES > 0:
+        Wash_1.reagent_reservoir = res_1
+        run_log.operator(Wash_1.name + ': en el reservorio del slot 8 con un volumen de ' + str_rounded(Wash_1.vol_well_original) + ' uL')
+        if NUM_WASHES > 1:
+            Wash_2.reagent_reservoir = res_2
+            run_log.operator(Wash_2.name + ': en el reservorio del slot 10 con un volumen de ' + str_rounded(Wash_2.vol_well_original) + ' uL')
+            if NUM_WASHES > 2:
+                Wash_3.reagent_reservoir = res_3
+                run_log.operator(Wash_3.name + ': en el reservorio del slot 11 con un volumen de ' + str_rounded(Wash_3.vol_well_original) + ' uL')
+
+    run_log.debug('###############################################')
+    run_log.debug(' ')
+
+    work_destinations           = deepwell_plate.rows()[0][:Sample.num_wells]
+    final_destinations          = elution_plate.rows()[0][:Sample.num_wells]
+
+    # pipettes.
+    m300 = ctx.load_instrument('p300_multi_gen2', 'right', tip_racks = tips300) # Load multi pipette
+
+    #### punta guardada para cada columna entre las operaciones de una cadena, ver tip_reuse
+    tip_reuse = TipReuse((['WASH_1', 'WASH_2', 'WASH_3'] if TIP_RECYCLING_IN_WASH else []) +
+                         (['ELUTION'] if TIP_RECYCLING_IN_ELUTION else []))
+
+    #### puntas que usa cada PASO, para reemplazar las cajas durante las esperas. La columna
+    #### parcial coge tantas puntas como muestras si una caja no tiene nada delante, ver next_tip
+    columns_tips = NUM_SAMPLES if partial_pickup_racks(m300, ctx.deck) else 8 * num_cols
+    tip_demand = {1: columns_tips, 2: columns_tips, 5: columns_tips, 7: columns_tips, 9: 0 if TIP_RECYCLING_IN_WASH else columns_tips,
+                  11: columns_tips, 13: 0 if TIP_RECYCLING_IN_WASH else columns_tips, 15: columns_tips,
+                  17: 0 if TIP_RECYCLING_IN_WASH else columns_tips, 20: columns_tips, 22: 0 if TIP_RECYCLING_IN_ELUTION else columns_tips}
+
+    #### puntas del protocolo: inventario de las cajas, contador y cajas reemplazadas en las esperas
+    tips = RunTips(ctx, m300, tip_rack_slots, NUM_SAMPLES, STEPS, tip_demand, tip_reuse, events, lights,
+                   NEW_TIPRACK_SLOTS if CONTINUE_TIPRACKS or RESUME_FROM_CHECKPOINT else tip_rack_slots, recycle_tip, 'es')
+
+    #### progreso guardado para continuar un protocolo detenido, ver checkpoint
+    checkpoint_reagents = [Lysis, Beads, Wash_1, Wash_2, Wash_3, Elution]
+    def save_checkpoint(step, column):
+        used_tips = tips.used + tips_before_resume
+        checkpoint.save(step, column, NUM_SAMPLES, checkpoint_reagents, used_tips, magdeck.status == 'engaged')
+
+    def resuming_columns():
+        '''
+        True si el protocolo continúa en las columnas del PASO actual
+        '''
+        return resume is not None and resume['step'] == STEP and resume['column'] is not None
+
+    def step_columns():
+        '''
+        Columnas del PASO, desde la que se detuvo si el protocolo continúa en ellas
+        '''
+        return range(resume['column'] if resuming_columns() else 0, num_cols)
+
+    def column_start(i):
+        save_checkpoint(STEP, i)
+        events.column_start(i + 1)
+
+    resume = checkpoint.load(NUM_SAMPLES) if RESUME_FROM_CHECKPOINT else None
+    if resume is not None and resume['step'] not in STEPS: # Detenido con todos los PASOS hechos
+        resume = None
+    tips_before_resume = 0
+    if resume is not None:
+        for s in STEPS:
+            if s < resume['step']:
+                STEPS[s]['Execute'] = False
+        restore_reagents(checkpoint_reagents, resume)
+        tips_before_resume = resume['tips']
+        where = 'el PASO ' + str(resume['step']) + ': ' + STEPS[resume['step']]['description']
+        if resume['column'] is not None:
+            where += ', columna ' + str(resume['column'] + 1)
+        run_log.operator('Continuando el protocolo detenido el ' + resume['updated'] + ' desde ' + where)
+        events.event('run_resumed', from_step = resume['step'], from_column = None if resume['column'] is None else resume['column'] + 1)
+        ctx.pause('Continuando desde ' + where + ('. Esa columna puede estar a medias, revísala' if resume['column'] is not None else '') + '.')
+
+    #### cajas de puntas a reemplazar durante la ejecución
+    first_step = min(s for s in STEPS if STEPS[s]['Execute'])
+    tips.start(run_log, first_step)
+
+###############################################################################
+    start_run(ctx, run_log, button = True, rails = not PHOTOSENSITIVE, language = 'es')
+    if resume is not None and resume['magnet']:
+        magdeck.engage(height = mag_height) # Como estaba al detenerse
+    else:
+        magdeck.disengage()
+
+    ###############################################################################
+    # STEP 1 Transferir lisis
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
+
+        lysis_trips = math.ceil(Lysis.reagent_volume / Lysis.max_volume_allowed)
+        lysis_volume = Lysis.reagent_volume / lysis_trips
+        lysis_transfer_vol = []
+        for i in range(lysis_trips):
+            lysis_transfer_vol.append(lysis_volume + Lysis.disposal_volume)
+        x_offset_source = 0
+        x_offset_dest   = 0
+
+        for i in step_columns():
+            column_start(i)
+            run_log.debug("Column: " + str(i))
+            if not m300.hw_pipette['has_tip']:
+                tips.pick_up(column_tips(NUM_SAMPLES, i))
+            for j,transfer_vol in enumerate(lysis_transfer_vol):
+                #Calculate pickup_height based on remaining volume and shape of container
+                [pickup_height, change_col] = calc_height(Lysis, reservoir_heights, transfer_vol * column_tips(NUM_SAMPLES, i))
+                run_log.debug('Aspirando desde la columna del reservorio: ' + str(Lysis.first_well + Lysis.col + 1))
+                run_log.debug('La altura de recogida es ' + str(round(pickup_height, 2)) + ' mm')
+                move_vol_multi(m300, reagent = Lysis, source = Lysis.reagent_reservoir[Lysis.col],
+                        dest = work_destinations[i], vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
+                        pickup_height = pickup_height, blow_out = True, touch_tip = False, drop_height = 1)
+            
+            if LYSIS_NUM_MIXES > 0:
+                run_log.debug(' ')
+                run_log.debug('Mezclando muestra ')
+                custom_mix(m300, Lysis, location = work_destinations[i], vol =  Lysis.max_volume_allowed,
+                        rounds = LYSIS_NUM_MIXES, blow_out = False, mix_height = 1, offset = 0)
+            
+            m300.move_to(work_destinations[i].top(0))
+            m300.air_gap(Lysis.air_gap_vol_bottom) #air gap
+            
+            tips.drop()
+            
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
+        ###############################################################################
+        # STEP 1 Transferir lisis
+        ########
+
+    ###############################################################################
+    # STEP 2 Transferir bolas magnéticas
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
+
+        beads_trips = math.ceil(Beads.reagent_volume / Beads.max_volume_allowed)
+        beads_volume = Beads.reagent_volume / beads_trips
+        beads_transfer_vol = []
+        for i in range(beads_trips):
+            beads_transfer_vol.append(beads_volume + Beads.disposal_volume)
+        x_offset_source = 0
+        x_offset_dest   = 0
+        first_mix_done = False
+
+        for i in step_columns():
+            column_start(i)
+            run_log.debug("Column: " + str(i))
+            if not m300.hw_pipette['has_tip']:
+                tips.pick_up(column_tips(NUM_SAMPLES, i))
+            for j,transfer_vol in enumerate(beads_transfer_vol):
+                #Calculate pickup_height based on remaining volume and shape of container
+                # transfer_vol_extra = transfer_vol if j > 0 else transfer_vol + 100  # Extra 100 isopropanol for calcs
+                # [pickup_height, change_col] = calc_height(Beads, multi_well_rack_area, transfer_vol_extra * 8)    
+                [pickup_height, change_col] = calc_height(Beads, reservoir_heights, transfer_vol * column_tips(NUM_SAMPLES, i))    
+                if change_col == True or not first_mix_done: #If we switch column because there is not enough volume left in current reservoir column we mix new column
+                    run_log.debug('Mezclando nuevo canal del reservorio: ' + str(Beads.first_well + Beads.col))
+                    custom_mix(m300, Beads, Beads.reagent_reservoir[Beads.col],
+                            vol = Beads.max_volume_allowed, rounds = BEADS_WELL_FIRST_TIME_NUM_MIXES, 
+                            blow_out = False, mix_height = 1.5, offset = 0)
+                    first_mix_done = True
+                else:
+                    run_log.debug('Mezclando canal del reservorio: ' + str(Beads.first_well + Beads.col))
+                    mix_height = 1.5 if pickup_height > 1.5 else pickup_height
+                    custom_mix(m300, Beads, Beads.reagent_reservoir[Beads.col],
+                            vol = Beads.max_volume_allowed, rounds = BEADS_WELL_NUM_MIXES, 
+                            blow_out = False, mix_height = mix_height, offset = 0)
+
+                run_log.debug('Aspirando desde la columna del reservorio: ' + str(Beads.first_well + Beads.col))
+                run_log.debug('La altura de recogida es ' + str(round(pickup_height, 2)) + ' mm')
+                move_vol_multi(m300, reagent = Beads, source = Beads.reagent_reservoir[Beads.col],
+                        dest = work_destinations[i], vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
+                        pickup_height = pickup_height, blow_out = True, touch_tip = False, drop_height = 1)
+            
+            incubations.record_dose('BEADS', i)
+
+            if BEADS_NUM_MIXES > 0:
+                run_log.debug(' ')
+                run_log.debug('Mezclando muestra ')
+                custom_mix(m300, Beads, location = work_destinations[i], vol =  Beads.max_volume_allowed,
+                        rounds = BEADS_NUM_MIXES, blow_out = False, mix_height = 1, offset = 0, wait_time = 2)
+            
+            m300.move_to(work_destinations[i].top(0))
+            m300.air_gap(Beads.air_gap_vol_bottom) #air gap
+
+            tips.drop()
+            
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
+        ###############################################################################
+        # STEP 2 Transferir bolas magnéticas
+        ########
+
+    ###############################################################################
+    # STEP 3 Espera
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
+
+        run_log.debug(' ')
+        tips.refill_break(STEP)
+        incubations.delay('BEADS', STEPS[STEP]['wait_time'], msg = 'Espera')
+        run_log.debug(' ')
+
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
+        ###############################################################################
+        # STEP 3 Espera
+        ########
+    
+    ###############################################################################
+    # STEP 4 Incubación con el imán ON
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
+
+        run_log.debug(' ')
+        magdeck.engage(height = mag_height)
+        paused = tips.refill_break(STEP)
+        ctx.delay(seconds = max(0, STEPS[STEP]['wait_time'] - paused), msg = 'Incubación con el imán ON durante ' + format(STEPS[STEP]['wait_time']) + ' segundos.')
+        run_log.debug(' ')
+
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
+        ###############################################################################
+        # STEP 4 Incubación con el imán ON
+        ########
+
+    ###############################################################################
+    # STEP 5 Desechar sobrenadante
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
+
+        total_supernatant_volume = Sample.reagent_volume
+        if LYSIS_VOLUME_PER_SAMPLE > 0:
+            total_supernatant_volume += Lysis.reagent_volume
+        if BEADS_VOLUME_PER_SAMPLE > 0:
+            total_supernatant_volume += Beads.reagent_volume
+
+        supernatant_trips = plan_supernatant_trips(deepwell_heights, total_supernatant_volume, Sample.max_volume_allowed, supernatant_extra_vol, supernatant_follow_depth, supernatant_final_height)
+        
+        x_offset_rs = 2
+
+        for i in step_columns():
+            column_start(i)
+            x_offset_source = find_side(i) * x_offset_rs
+            x_offset_dest   = 0
+            not_first_transfer = False
+
+            if not m300.hw_pipette['has_tip']:
+                tips.pick_up(column_tips(NUM_SAMPLES, i))
+            for transfer_vol, pickup_height, near_pellet in supernatant_trips:
+                run_log.debug('Aspirando de la columna del deepwell: ' + str(i+1))
+                run_log.debug('La altura de recogida es ' + str(round(pickup_height, 2)) + ' mm' )
+
+                move_vol_multi(m300, reagent = Sample, source = work_destinations[i], dest = waste, vol = transfer_vol + Sample.disposal_volume,
+                        x_offset_source = x_offset_source, x_offset_dest = x_offset_dest, pickup_height = pickup_height,
+                        wait_time = 2 if near_pellet else 0, blow_out = True, drop_height = waste_drop_height,
+                        dispense_bottom_air_gap_before = not_first_transfer,
+                        aspirate_rate = Sample.flow_rate_aspirate if near_pellet else supernatant_fast_rate)
+                m300.move_to(waste.top(z = waste_drop_height))
+                m300.air_gap(Sample.air_gap_vol_bottom)
+                not_first_transfer = True
+
+            tips.drop()
+            incubations.record_dose('DRY', i)
+
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
+        ###############################################################################
+        # STEP 5 Desechar sobrenadante
+        ########
+
+    ###############################################################################
+    # STEP 6 Imán OFF
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
+
+        # Imán OFF
+        magdeck.disengage()
+
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
+        ###############################################################################
+        # STEP 6 Imán OFF
+        ########
+
+    ###############################################################################
+    # STEP 7 Transferir primer lavado
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
+
+        wash_trips = math.ceil(Wash_1.reagent_volume / Wash_1.max_volume_allowed)
+        wash_volume = Wash_1.reagent_volume / wash_trips #136.66
+        wash_transfer_vol = []
+        for i in range(wash_trips):
+            wash_transfer_vol.append(wash_volume + Wash_1.disposal_volume)
+        x_offset_rs = 2.5
+        pickup_height = 0.5
+
+        for i in step_columns():
+            column_start(i)
+            x_offset_source = 0
+            x_offset_dest   = -1 * find_side(i) * x_offset_rs
+            if not m300.hw_pipette['has_tip']:
+                tips.pick_up_column('WASH_1', i)
+            for transfer_vol in wash_transfer_vol:
+                run_log.debug('Aspirando desde el reservorio del slot 8')
+
+                move_vol_multi(m300, reagent = Wash_1, source = Wash_1.reagent_reservoir, dest = work_destinations[i],
+                        vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
+                        pickup_height = pickup_height, blow_out = False)
+            
+            if WASH_1_NUM_MIXES > 0:
+                custom_mix(m300, Wash_1, location = work_destinations[i], vol = 180, two_thirds_mix_bottom = True,
+                        rounds = WASH_1_NUM_MIXES, blow_out = False, mix_height = 1.5, offset = x_offset_dest)
+            
+            m300.move_to(work_destinations[i].top(0))
+            m300.air_gap(Wash_1.air_gap_vol_bottom) #air gap
+
+            tips.drop_column('WASH_1', i, keep = True)
+
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
+        ###############################################################################
+        # STEP 7 Transferir primer lavado
+        ########
+
+    ###############################################################################
+    # STEP 8 Incubación con el imán ON
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
+
+        # switch on magnet
+        magdeck.engage(mag_height)
+        paused = tips.refill_break(STEP)
+        ctx.delay(seconds = max(0, STEPS[STEP]['wait_time'] - paused), msg = 'Incubación con el imán ON durante ' + format(STEPS[STEP]['wait_time']) + ' segundos.')
+
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
+        ####################################################################
+        # STEP 8 Incubación con el imán ON
+        ########
+
+    ###############################################################################
+    # STEP 9 Desechar sobrenadante
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
+
+        supernatant_trips = plan_supernatant_trips(deepwell_heights, Wash_1.reagent_volume, Wash_1.max_volume_allowed, supernatant_extra_vol, supernatant_follow_depth, supernatant_final_height)
+        
+        x_offset_rs = 2
+
+        for i in step_columns():
+            column_start(i)
+            x_offset_source = find_side(i) * x_offset_rs
+            x_offset_dest   = 0
+            not_first_transfer = False
+
+            if not m300.hw_pipette['has_tip']:
+                if tips.pick_up_column('WASH_1', i):
+                    m300.dispense(Wash_1.air_gap_vol_top, work_destinations[i].top(z = 0), rate = Wash_1.flow_rate_dispense)
+            for transfer_vol, pickup_height, near_pellet in supernatant_trips:
+                run_log.debug('Aspirando de la columna del deepwell: ' + str(i+1))
+                run_log.debug('La altura de recogida es ' + str(round(pickup_height, 2)) + ' mm' )
+                move_vol_multi(m300, reagent = Sample, source = work_destinations[i], dest = waste, vol = transfer_vol + Sample.disposal_volume,
+                        x_offset_source = x_offset_source, x_offset_dest = x_offset_dest, pickup_height = pickup_height, 
+                        wait_time = 2 if near_pellet else 0, blow_out = False, drop_height = waste_drop_height,
+                        dispense_bottom_air_gap_before = not_first_transfer,
+                        aspirate_rate = Sample.flow_rate_aspirate if near_pellet else supernatant_fast_rate)
+                m300.move_to(waste.top(z = waste_drop_height))
+                m300.air_gap(Sample.air_gap_vol_bottom)
+                not_first_transfer = True
+
+            tips.drop_column('WASH_1', i, keep = False)
+            incubations.record_dose('DRY', i)
+
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
+        ###############################################################################
+        # STEP 9 Desechar sobrenadante
+        ########
+
+    ###############################################################################
+    # STEP 10 Imán OFF
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
+
+        # Imán OFF
+        magdeck.disengage()
+
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
+        ###############################################################################
+        # STEP 10 Imán OFF
+        ########
+
+    ###############################################################################
+    # STEP 11 Transferir segundo lavado
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
+
+        wash_trips = math.ceil(Wash_2.reagent_volume / Wash_2.max_volume_allowed)
+        wash_volume = Wash_2.reagent_volume / wash_trips #136.66
+        wash_transfer_vol = []
+        for i in range(wash_trips):
+            wash_transfer_vol.append(wash_volume + Wash_2.disposal_volume)
+        x_offset_rs = 2.5
+        pickup_height = 0.5
+
+        for i in step_columns():
+            column_start(i)
+            x_offset_source = 0
+            x_offset_dest   = -1 * find_side(i) * x_offset_rs
+            if not m300.hw_pipette['has_tip']:
+                tips.pick_up_column('WASH_2', i)
+            for transfer_vol in wash_transfer_vol:
+                run_log.debug('Aspirando desde el reservorio del slot 10')
+
+                move_vol_multi(m300, reagent = Wash_2, source = Wash_2.reagent_reservoir, dest = work_destinations[i],
+                        vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
+                        pickup_height = pickup_height, blow_out = False)
+            
+            if WASH_2_NUM_MIXES > 0:
+                custom_mix(m300, Wash_2, location = work_destinations[i], vol = 180, two_thirds_mix_bottom = True,
+                        rounds = WASH_2_NUM_MIXES, blow_out = False, mix_height = 1.5, offset = x_offset_dest)
+            
+            m300.move_to(work_destinations[i].top(0))
+            m300.air_gap(Wash_2.air_gap_vol_bottom) #air gap
+
+            tips.drop_column('WASH_2', i, keep = True)
+
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
+        ###############################################################################
+        # STEP 11 ADD WASH
+        ########
+
+    ###############################################################################
+    # STEP 12 Incubación con el imán ON
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
+
+        # switch on magnet
+        magdeck.engage(mag_height)
+        paused = tips.refill_break(STEP)
+        ctx.delay(seconds = max(0, STEPS[STEP]['wait_time'] - paused), msg = 'Incubación con el imán ON durante ' + format(STEPS[STEP]['wait_time']) + ' segundos.')
+
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
+        ####################################################################
+        # STEP 12 Incubación con el imán ON
+        ########
+
+    ###############################################################################
+    # STEP 13 Desechar sobrenadante
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
+
+        supernatant_trips = plan_supernatant_trips(deepwell_heights, Wash_2.reagent_volume, Wash_2.max_volume_allowed, supernatant_extra_vol, supernatant_follow_depth, supernatant_final_height)
+        
+        x_offset_rs = 2
+
+        for i in step_columns():
+            column_start(i)
+            x_offset_source = find_side(i) * x_offset_rs
+            x_offset_dest   = 0
+            not_first_transfer = False
+
+            if not m300.hw_pipette['has_tip']:
+                if tips.pick_up_column('WASH_2', i):
+                    m300.dispense(Wash_2.air_gap_vol_top, work_destinations[i].top(z = 0), rate = Wash_2.flow_rate_dispense)
+            for transfer_vol, pickup_height, near_pellet in supernatant_trips:
+                run_log.debug('Aspirando de la columna del deepwell: ' + str(i+1))
+                run_log.debug('La altura de recogida es ' + str(round(pickup_height, 2)) + ' mm' )
+                move_vol_multi(m300, reagent = Sample, source = work_destinations[i], dest = waste, vol = transfer_vol + Sample.disposal_volume,
+                        x_offset_source = x_offset_source, x_offset_dest = x_offset_dest, pickup_height = pickup_height,
+                        wait_time = 2 if near_pellet else 0, blow_out = False, dispense_bottom_air_gap_before = not_first_transfer,
+                        aspirate_rate = Sample.flow_rate_aspirate if near_pellet else supernatant_fast_rate,
+                        drop_height = waste_drop_height)
+                m300.move_to(waste.top(z = waste_drop_height))
+                m300.air_gap(Sample.air_gap_vol_bottom)
+                not_first_transfer = True
+
+            tips.drop_column('WASH_2', i, keep = False)
+            incubations.record_dose('DRY', i)
+
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
+        ###############################################################################
+        # STEP 13 Desechar sobrenadante
+        ########
+
+    ###############################################################################
+    # STEP 14 Imán OFF
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
+
+        # Imán OFF
+        magdeck.disengage()
+
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
+        ###############################################################################
+        # STEP 14 Imán OFF
+        ########
+
+    ###############################################################################
+    # STEP 15 Transferir tercer lavado
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
+
+        wash_trips = math.ceil(Wash_3.reagent_volume / Wash_3.max_volume_allowed)
+        wash_volume = Wash_3.reagent_volume / wash_trips #136.66
+        wash_transfer_vol = []
+        for i in range(wash_trips):
+            wash_transfer_vol.append(wash_volume + Wash_3.disposal_volume)
+        x_offset_rs = 2.5
+        pickup_height = 0.5
+
+        for i in step_columns():
+            column_start(i)
+            x_offset_source = 0
+            x_offset_dest   = -1 * find_side(i) * x_offset_rs
+            if not m300.hw_pipette['has_tip']:
+                tips.pick_up_column('WASH_3', i)
+            for transfer_vol in wash_transfer_vol:
+                run_log.debug('Aspirando desde el reservorio del slot 11')
+
+                move_vol_multi(m300, reagent = Wash_3, source = Wash_3.reagent_reservoir, dest = work_destinations[i],
+                        vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
+                        pickup_height = pickup_height, blow_out = False)
+            
+            if WASH_3_NUM_MIXES > 0:
+                custom_mix(m300, Wash_3, location = work_destinations[i], vol = 180, two_thirds_mix_bottom = True,
+                        rounds = WASH_3_NUM_MIXES, blow_out = False, mix_height = 1.5, offset = x_offset_dest)
+            
+            m300.move_to(work_destinations[i].top(0))
+            m300.air_gap(Wash_3.air_gap_vol_bottom) #air gap
+
+            tips.drop_column('WASH_3', i, keep = True)
+
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
+        ###############################################################################
+        # STEP 15 Transferir tercer lavado
+        ########
+
+    ###############################################################################
+    # STEP 16 Incubación con el imán ON
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
+
+        # switch on magnet
+        magdeck.engage(mag_height)
+        paused = tips.refill_break(STEP)
+        ctx.delay(seconds = max(0, STEPS[STEP]['wait_time'] - paused), msg = 'Incubación con el imán ON durante ' + format(STEPS[STEP]['wait_time']) + ' segundos.')
+
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
+        ####################################################################
+        # STEP 16 Incubación con el imán ON
+        ########
+
+    ###############################################################################
+    # STEP 17 Desechar sobrenadante
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
+
+        supernatant_trips = plan_supernatant_trips(deepwell_heights, Wash_3.reagent_volume, Wash_3.max_volume_allowed, supernatant_extra_vol, supernatant_follow_depth, supernatant_final_height)
+        
+        x_offset_rs = 2
+
+        for i in step_columns():
+            column_start(i)
+            x_offset_source = find_side(i) * x_offset_rs
+            x_offset_dest   = 0
+            not_first_transfer = False
+
+            if not m300.hw_pipette['has_tip']:
+                tips.pick_up_column('WASH_3', i)
+            for transfer_vol, pickup_height, near_pellet in supernatant_trips:
+                run_log.debug('Aspirando de la columna del deepwell: ' + str(i+1))
+                run_log.debug('La altura de recogida es ' + str(round(pickup_height, 2)) + ' mm' )
+                move_vol_multi(m300, reagent = Sample, source = work_destinations[i],
+                    dest = waste, vol = transfer_vol + Sample.disposal_volume, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
+                    pickup_height = pickup_height, wait_time = 2 if near_pellet else 0, blow_out = False, drop_height = waste_drop_height,
+                    dispense_bottom_air_gap_before = not_first_transfer,
+                    aspirate_rate = Sample.flow_rate_aspirate if near_pellet else supernatant_fast_rate)
+                m300.move_to(waste.top(z = waste_drop_height))
+                m300.air_gap(Sample.air_gap_vol_bottom)
+                not_first_transfer = True
+
+            tips.drop_column('WASH_3', i, keep = False)
+            incubations.record_dose('DRY', i)
+
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
+        ###############################################################################
+        # STEP 17 Desechar sobrenadante
+        ########
+
+    ###############################################################################
+    # STEP 18 Secado
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
+
+        run_log.debug(' ')
+        tips.refill_break(STEP)
+        incubations.delay('DRY', STEPS[STEP]['wait_time'], msg = 'Secado')
+        run_log.debug(' ')
+
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
+        ###############################################################################
+        # STEP 18 Secado
+        ########
+
+    ###############################################################################
+    # STEP 19 Imán OFF
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
+
+        # Imán OFF
+        magdeck.disengage()
+
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
+        ###############################################################################
+        # STEP 19 Imán OFF
+        ########
+    
+    ###############################################################################
+    # STEP 20 Transferir elución
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
+
+        elution_trips = math.ceil(Elution.reagent_volume / Elution.max_volume_allowed)
+        elution_volume = Elution.reagent_volume / elution_trips
+        elution_wash_vol = []
+        for i in range(elution_trips):
+            elution_wash_vol.append(elution_volume + Sample.disposal_volume)
+        x_offset_rs = 2.5
+
+        ########
+        # Water or elution buffer
+        for i in step_columns():
+            column_start(i)
+            x_offset_source = 0
+            x_offset_dest   = -1 * find_side(i) * x_offset_rs # Original 0
+            if not m300.hw_pipette['has_tip']:
+                tips.pick_up_column('ELUTION', i)
+            for transfer_vol in elution_wash_vol:
+                #Calculate pickup_height based on remaining volume and shape of container
+                [pickup_height, change_col] = calc_height(Elution, reservoir_heights, transfer_vol * column_tips(NUM_SAMPLES, i))
+                run_log.debug('Aspirando desde la columna del reservorio: ' + str(Elution.first_well + Elution.col))
+                run_log.debug('La altura de recogida es ' + str(round(pickup_height, 2)) + ' mm')
+
+                move_vol_multi(m300, reagent = Elution, source = Elution.reagent_reservoir[Elution.col], dest = work_destinations[i],
+                        vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
+                        pickup_height = pickup_height, blow_out = False, drop_height = -35)
+            
+            if ELUTION_NUM_MIXES > 0:
+                run_log.debug(' ')
+                run_log.debug('Mezclando muestra con Elution')
+                custom_mix(m300, Elution, work_destinations[i], vol = Elution.reagent_volume, rounds = ELUTION_NUM_MIXES,
+                        blow_out = False, mix_height = 1, offset = x_offset_dest, drop_height = -35)
+            
+            m300.move_to(work_destinations[i].top(0))
+            m300.air_gap(Elution.air_gap_vol_bottom) #air gap
+            
+            tips.drop_column('ELUTION', i, keep = True)
+            
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
+        ###############################################################################
+        # STEP 20 Transferir elución
+        ########
+
+    ###############################################################################
+    # STEP 21 Incubación con el imán ON
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
+
+        # switch on magnet
+        magdeck.engage(mag_height)
+        paused = tips.refill_break(STEP)
+        ctx.delay(seconds = max(0, STEPS[STEP]['wait_time'] - paused), msg = 'Incubación con el imán ON durante ' + format(STEPS[STEP]['wait_time']) + ' segundos.')
+
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
+        ####################################################################
+        # STEP 21 Incubación con el imán ON
+        ########
+
+    ###############################################################################
+    # STEP 22 Transferir elución a la placa
+    ########
+    STEP += 1
+    if STEPS[STEP]['Execute']==True:
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
+
+        if SET_TEMP_ON == True:
+            await_temperature(run_log, tempdeck, TEMPERATURE, 'es')
+
+        elution_trips = math.ceil(ELUTION_FINAL_VOLUME_PER_SAMPLE / Elution.max_volume_allowed)
+        elution_volume = ELUTION_FINAL_VOLUME_PER_SAMPLE / elution_trips
+        elution_vol = []
+        for i in range(elution_trips):
+            elution_vol.append(elution_volume + Elution.disposal_volume)
+        x_offset_rs = 2
+        for i in step_columns():
+            column_start(i)
+            x_offset_source = find_side(i) * x_offset_rs
+            x_offset_dest   = 0
+            if not m300.hw_pipette['has_tip']:
+                if tips.pick_up_column('ELUTION', i):
+                    m300.dispense(Elution.air_gap_vol_top, work_destinations[i].top(z = 0), rate = Elution.flow_rate_dispense)
+            for transfer_vol in elution_vol:
+                #Pickup_height is fixed here
+                pickup_height = 1
+                run_log.debug('Aspirando de la columna del deepwell: ' + str(i+1))
+                run_log.debug('La altura de recogida es ' + str(round(pickup_height, 2)) + ' mm' )
+
+                move_vol_multi(m300, reagent = Sample, source = work_destinations[i],
+                        dest = final_destinations[i], vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
+                        pickup_height = pickup_height, blow_out = True, touch_tip = False, drop_height = 3)
+            
+            m300.move_to(final_destinations[i].top(0))
+            m300.air_gap(Sample.air_gap_vol_bottom) #air gap
+
+            tips.drop_column('ELUTION', i, keep = False)
+
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
+
+        ###############################################################################
+        # STEP 22 Transferir elución a la placa
+        ########
+
+
+    magdeck.disengage()
+    run_log.banner('Homing robot')
+    ctx.home()
+###############################################################################
+    # Luz azul y parpadeo de fin del protocolo
+    ctx._hw_manager.hardware.set_lights(button = True, rails = False)
+    lights.start('finished', times = 10, end = {'button': True, 'rails': False} if switch_off_lights else None)
+    finish_run(run_log, events, checkpoint, STEPS, tips.used + tips_before_resume, None if ctx.is_simulating() else file_path, 'es')
+    if not ctx.is_simulating():
+        for i in range(SOUND_NUM_PLAYS): # Every minute, without holding the run
+            play_sound('finalizado', delay = 60 if i > 0 else 0)
\ No newline at end of file
@@ -1,13 +1,6 @@
 import math
 from opentrons.types import Point
 from opentrons import protocol_api
-import subprocess
-import time
-import numpy as np
-from timeit import default_timer as timer
-import json
-from datetime import datetime
-import csv
 
 
 # metadata
@@ -22,7 +15,7 @@ metadata = {
 ################################################
 # CHANGE THESE VARIABLES ONLY
 ################################################
-NUM_SAMPLES                         = 96    # Must be multiple of 8
+NUM_SAMPLES                         = 96    # Si no es múltiplo de 8 la última columna se hace con menos puntas
 NUM_WASHES                          = 2     # Number of washes to do. Value between 0 - 3.
 USE_300_TIPS                        = True  # Check that TIP_RECYCLING variables have desired values
 
@@ -52,6 +45,11 @@ TEMPERATURE                         = 4     # Set temperature. It will be uesed
 
 PHOTOSENSITIVE                      = False # True if it has photosensitive reagents
 SOUND_NUM_PLAYS                     = 3
+SPEED_PROFILE                       = 'fast' # Liquid class settings: 'safe' (validated) or 'fast'
+CONTINUE_TIPRACKS                   = False # Continue from the tips the previous run left in the tipracks (tip inventory, also when resuming a checkpoint), otherwise every tiprack is new
+NEW_TIPRACK_SLOTS                   = []    # With CONTINUE_TIPRACKS, slots with new tipracks
+LOG_LEVEL                           = 'operator' # Run log detail: 'operator' or 'debug' (every pickup height and reservoir column)
+RESUME_FROM_CHECKPOINT              = False # True para continuar un protocolo detenido desde la columna en que se detuvo (checkpoint.json de su carpeta)
 ################################################
 
 run_id                      = 'B-Extraccion_total-Generico'
@@ -60,8 +58,11 @@ path_sounds                 = '/var/lib/jupyter/notebooks/sonidos/'
 recycle_tip                 = False     # Do you want to recycle tips? It shoud only be set True for testing
 mag_height                  = 6         # Height needed for NEST deepwell in magnetic deck
 waste_drop_height           = -5
-multi_well_rack_area        = 8 * 71    #Cross section of the 12 well reservoir
-next_well_index             = 0         # First reservoir well to use
+reagent_follow_depth        = 1         # mm por debajo del nivel del líquido al aspirar los reactivos
+supernatant_extra_vol       = 20        # Volumen por encima del sobrenadante que se retira para vaciar el pocillo
+supernatant_final_height    = 0.5       # Altura de recogida del último viaje, junto al pellet
+supernatant_follow_depth    = 2         # mm por debajo del nivel del líquido en los viajes superiores
+supernatant_fast_rate       = 1         # Velocidad de aspiración de los viajes superiores (junto al pellet se usa Sample.flow_rate_aspirate)
 
 pipette_allowed_capacity    = 280 if USE_300_TIPS else 180
 txt_tip_capacity            = '300 uL' if USE_300_TIPS else '200 uL'
@@ -69,12 +70,1094 @@ txt_tip_capacity            = '300 uL' if USE_300_TIPS else '200 uL'
 num_cols = math.ceil(NUM_SAMPLES / 8) # Columns we are working on
 switch_off_lights           = False # Switch of the lights when the program finishes
 
-def run(ctx: protocol_api.ProtocolContext):
-    w1_tip_pos_list             = []
-    w2_tip_pos_list             = []
-    w3_tip_pos_list             = []
-    elution_tip_pos_list        = []
+# Shared code of Utils/, copied into the uploaded protocol by Utils/bundle.py: edit
+# Fuentes/NEW_B-Extraccion_total_Generico.py and bundle it again (see README.md)
+# >>> liquid_classes.py: EXTRACTION_FIELDS, liquid_class
+SPEED_PROFILES = ['safe', 'fast']
+
+# Arguments of the Reagent classes of the extraction protocols
+EXTRACTION_FIELDS   = ['flow_rate_aspirate', 'flow_rate_dispense', 'flow_rate_aspirate_mix', 'flow_rate_dispense_mix',
+                       'air_gap_vol_bottom', 'air_gap_vol_top', 'disposal_volume']
+
+LIQUID_DEFAULTS = {
+    'air_gap_vol_bottom':   5,
+    'air_gap_vol_top':      0,
+    'disposal_volume':      1,
+}
+
+LIQUID_CLASSES = {
+    'lysis': {
+        'safe': {'flow_rate_aspirate': 1, 'flow_rate_dispense': 1, 'flow_rate_aspirate_mix': 1, 'flow_rate_dispense_mix': 1},
+        'fast': {'flow_rate_aspirate': 25, 'flow_rate_dispense': 100, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 100},
+    },
+    'lysis_binding': {  # Magmax CORE lysis + binding solution, viscous
+        'safe': {'flow_rate_aspirate': 0.5, 'flow_rate_dispense': 0.5, 'flow_rate_aspirate_mix': 0.5, 'flow_rate_dispense_mix': 0.5},
+    },
+    'beads': {
+        'safe': {'flow_rate_aspirate': 3, 'flow_rate_dispense': 3, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 50},
+        'fast': {'flow_rate_aspirate': 25, 'flow_rate_dispense': 100, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 100},
+    },
+    'beads_pk': {
+        'safe': {'flow_rate_aspirate': 3, 'flow_rate_dispense': 3, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 50},
+        'fast': {'flow_rate_aspirate': 25, 'flow_rate_dispense': 100, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 100},
+    },
+    'wash': {
+        'safe': {'flow_rate_aspirate': 3, 'flow_rate_dispense': 3, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 100},
+        'fast': {'flow_rate_aspirate': 25, 'flow_rate_dispense': 100, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 100},
+    },
+    'ethanol': {        # Drips from the tips when aspirated fast
+        'safe': {'flow_rate_aspirate': 3, 'flow_rate_dispense': 3, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 100},
+    },
+    'elution': {
+        'safe': {'flow_rate_aspirate': 3, 'flow_rate_dispense': 3, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 40},
+        'fast': {'flow_rate_aspirate': 25, 'flow_rate_dispense': 100, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 100},
+    },
+    'sample': {         # Sample / supernatant in the deepwell plate
+        'safe': {'flow_rate_aspirate': 0.5, 'flow_rate_dispense': 1, 'flow_rate_aspirate_mix': 1, 'flow_rate_dispense_mix': 1},
+        'fast': {'flow_rate_aspirate': 5, 'flow_rate_dispense': 100},
+    },
+}
+
+
+def liquid_class(name, profile = 'safe', fields = None):
+    '''
+    Settings of a liquid class for a speed profile, as keyword arguments of a
+    Reagent. fields restricts them to the arguments the Reagent class accepts.
+    '''
+    if name not in LIQUID_CLASSES:
+        raise ValueError('Unknown liquid class ' + repr(name) + ', use one of ' + ', '.join(sorted(LIQUID_CLASSES)))
+    if profile not in SPEED_PROFILES:
+        raise ValueError('Unknown speed profile ' + repr(profile) + ', use one of ' + ', '.join(SPEED_PROFILES))
+    settings = dict(LIQUID_DEFAULTS)
+    settings.update(LIQUID_CLASSES[name]['safe'])
+    settings.update(LIQUID_CLASSES[name].get(profile, {}))
+    if fields is not None:
+        settings = dict((field, settings[field]) for field in fields)
+    return settings
+# <<< liquid_classes.py
+
+# >>> tip_inventory.py: partial_pickup_racks, column_tips, RunTips
+import json
+import os
+from datetime import datetime
+
+TIP_INVENTORY_PATH = '/var/lib/jupyter/notebooks/tip_inventory'
+
+
+def tip_inventory_file(slot, tip_type):
+    return os.path.join(TIP_INVENTORY_PATH, 'slot_' + str(slot) + '_' + tip_type + '.json')
+
+
+def read_tip_count(slot, tip_type):
+    '''
+    Tips already taken from the rack of a slot, 0 for a slot without inventory
+    '''
+    try:
+        with open(tip_inventory_file(slot, tip_type)) as f:
+            return int(json.load(f)['used'])
+    except (IOError, ValueError, KeyError):
+        return 0
+
+
+def write_tip_count(slot, tip_type, used):
+    path = tip_inventory_file(slot, tip_type)
+    os.makedirs(TIP_INVENTORY_PATH, exist_ok = True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'slot': str(slot), 'tip_type': tip_type, 'used': used,
+                   'updated': datetime.now().strftime('%Y/%m/%d %H:%M:%S')}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def used_tips(rack):
+    '''
+    Position after the last tip taken from the rack. Tips returned to the rack
+    (tip recycling) have been used, so the gaps before it count as used too.
+    '''
+    wells = rack.wells()
+    for i in reversed(range(len(wells))):
+        if not wells[i].has_tip:
+            return i + 1
+    return 0
+
+
+def free_tips(pip):
+    '''
+    Tips the pipette can still pick up from each of its racks: multichannel
+    pipettes need full columns
+    '''
+    if pip.channels == 1:
+        return [len([well for well in rack.wells() if well.has_tip]) for rack in pip.tip_racks]
+    return [pip.channels * len([column for column in rack.columns() if all(well.has_tip for well in column)])
+            for rack in pip.tip_racks]
+
+
+def available_tips(pip):
+    return sum(free_tips(pip))
+
+
+def tip_refills(free, capacity, demand, replace_all = False):
+    '''
+    Refills of plan_tip_refills, replacing all the racks every time with
+    replace_all
+    '''
+    free = list(free)
+    refills = []
+    for i, (step, tips, wait) in enumerate(demand):
+        if i == 0 or wait:
+            needed = tips
+            for later_step, later_tips, later_wait in demand[i + 1:]:
+                if later_wait:
+                    break
+                needed += later_tips
+            if sum(free) < needed:
+                racks = [k for k in range(len(free)) if free[k] == 0]
+                if replace_all or sum(free) + capacity * len(racks) < needed:
+                    racks = list(range(len(free)))
+                for k in racks:
+                    free[k] = capacity
+                refills.append((step, racks))
+        for k in range(len(free)):
+            taken = min(free[k], tips)
+            free[k] -= taken
+            tips -= taken
+    return refills
+
+
+def plan_tip_refills(free, capacity, demand):
+    '''
+    Racks to replace so that the tips do not run out in the middle of a STEP.
+    free: tips left in each rack (free_tips), capacity: tips of a full rack,
+    demand: (STEP, tips it uses, True if it is a wait) for the STEPS still to
+    run, in order. The racks are checked before the first STEP and at every
+    wait: when the tips left do not reach the next wait, the empty racks are
+    replaced, or all of them if that is not enough. When replacing only the
+    empty racks needs more pauses than replacing all of them, every refill is a
+    full swap. Returns [(STEP, [rack indexes])].
+    '''
+    refills = tip_refills(free, capacity, demand)
+    full_swaps = tip_refills(free, capacity, demand, replace_all = True)
+    return full_swaps if len(full_swaps) < len(refills) else refills
+
+
+def load_tip_inventory(pip, slots, new_slots = None):
+    '''
+    Mark as used the tips the previous runs took from the racks of pip (loaded
+    in slots, in the same order). The racks in new_slots start from their first
+    tip: pass every slot unless the operator chose to continue the racks of the
+    previous run. Returns the counts to pass to save_tip_inventory.
+    '''
+    new_slots = [str(slot) for slot in (new_slots or [])]
+    saved = {}
+    for slot, rack in zip(slots, pip.tip_racks):
+        used = 0 if str(slot) in new_slots else min(read_tip_count(slot, rack.load_name), len(rack.wells()))
+        for well in rack.wells()[:used]:
+            rack.use_tips(well)
+        write_tip_count(slot, rack.load_name, used)
+        saved[str(slot)] = used
+    return saved
+
+
+def save_tip_inventory(pip, slots, saved):
+    '''
+    Write the racks of pip whose used tips changed since the last save
+    '''
+    for slot, rack in zip(slots, pip.tip_racks):
+        used = max(used_tips(rack), saved.get(str(slot), 0))
+        if saved.get(str(slot)) != used:
+            write_tip_count(slot, rack.load_name, used)
+            saved[str(slot)] = used
+
+
+def front_slot(slot):
+    '''
+    Deck slot in front of slot (closer to the operator), None for the front row
+    '''
+    return str(int(slot) - 3) if int(slot) > 3 else None
+
+
+def partial_pickup_racks(pip, deck):
+    '''
+    Racks of pip a partial column can be picked up from: the front nozzles
+    without tip hang past row H, so only the racks with nothing loaded in the
+    slot in front of them (deck: ctx.deck)
+    '''
+    return [rack for rack in pip.tip_racks if front_slot(rack.parent) is None or deck[front_slot(rack.parent)] is None]
+
+
+def next_tip(pip, num_tips = None, deck = None):
+    '''
+    Tip (well of its rack) the next pip.pick_up_tip() without location takes,
+    None when the racks are empty. With num_tips fewer than the channels of a
+    multichannel pipette, the well of the first column whose last num_tips
+    tips are left in the racks of partial_pickup_racks: picking up from it the
+    back nozzles take those tips and the front ones stay out of the rack. A full
+    column without such a rack (or deck).
+    '''
+    if num_tips is not None and num_tips < pip.channels and deck is not None:
+        for rack in partial_pickup_racks(pip, deck):
+            for column in rack.columns():
+                if all(well.has_tip for well in column[len(column) - num_tips:]):
+                    return column[len(column) - num_tips]
+    for rack in pip.tip_racks:
+        tip = rack.next_tip(pip.channels)
+        if tip is not None:
+            return tip
+    return None
+
+
+def pick_up(pip, tip_track, replace_tipracks, num_tips = None, tip_reuse = None, events = None, slots = None, saved = None,
+            deck = None):
+    '''
+    Pick up the next tip of pip (num_tips of a multichannel, see next_tip with
+    deck) and return it. When tip_track counts as many tips as its maxes,
+    replace_tipracks(pip, racks) replaces first the racks without tips kept by
+    tip_reuse. The pickup goes to events and the racks to the inventory (slots
+    and saved as in save_tip_inventory) when given.
+    '''
+    if tip_track['counts'][pip] >= tip_track['maxes'][pip]:
+        replace_tipracks(pip, [k for k, rack in enumerate(pip.tip_racks) if tip_reuse is None or not tip_reuse.holds(rack)])
+    tip = next_tip(pip, num_tips, deck)
+    pip.pick_up_tip(tip)
+    if events is not None:
+        events.event('tip_pickup', tip = tip.display_name)
+    if slots is not None:
+        save_tip_inventory(pip, slots, saved)
+    return tip
+
+
+def column_tips(num_samples, col):
+    '''
+    Tips of column col of num_samples samples: the last column has fewer samples
+    when num_samples is not a multiple of 8
+    '''
+    full_cols = num_samples // 8
+    return 8 if col < full_cols else num_samples - 8 * full_cols
+
+
+RUN_TIPS_MESSAGES = {
+    'en': {'replace': 'Replace the {volume}µl tipracks in slots {slots} before resuming.',
+           'planned': 'Tipracks in slots {slots} will be replaced {when}',
+           'before': 'before starting',
+           'in_step': 'in STEP {step}: {description}'},
+    'es': {'replace': 'Reemplaza las cajas de puntas de {volume}µl de los slots {slots} antes de continuar.',
+           'planned': 'Las cajas de puntas de los slots {slots} se reemplazarán {when}',
+           'before': 'antes de empezar',
+           'in_step': 'en el PASO {step}: {description}'},
+}
+
+
+class RunTips:
+    '''
+    Tips of the multichannel pipette pip of an extraction run, loaded with its
+    racks in slots. Counts the tips used (track, as in pick_up), keeps the
+    inventory of the racks (new_slots as in load_tip_inventory, nothing is read
+    or saved while simulating) and the tip of every column of the chains of
+    tip_reuse, and replaces the racks in the waits of the STEPS: demand holds
+    the tips every STEP uses, see plan_tip_refills. With recycle (testing
+    only) the tips are returned to their racks instead of dropped.
+    '''
+    def __init__(self, ctx, pip, slots, num_samples, steps, demand, tip_reuse, events, lights, new_slots = None,
+                 recycle = False, language = 'en'):
+        self.ctx = ctx
+        self.pip = pip
+        self.slots = slots
+        self.num_samples = num_samples
+        self.steps = steps
+        self.demand = demand
+        self.tip_reuse = tip_reuse
+        self.events = events
+        self.lights = lights
+        self.recycle = recycle
+        self.messages = RUN_TIPS_MESSAGES[language]
+        self.saved = {}
+        self.inventory_slots = None
+        if not ctx.is_simulating():
+            self.saved = load_tip_inventory(pip, slots, new_slots)
+            self.inventory_slots = slots
+        self.track = {'counts': {pip: 0}, 'maxes': {pip: available_tips(pip)}}
+
+    @property
+    def used(self):
+        return self.track['counts'][self.pip]
+
+    @property
+    def maximum(self):
+        return self.track['maxes'][self.pip]
+
+    # ctx.pause() returns at once and the run only stops at the next motion, so the
+    # pipette waits above the trash: the lights blink until the operator resumes
+    def wait_for_operator(self, message):
+        '''
+        Seconds from the pause until the run is resumed
+        '''
+        self.events.event('pause', reason = 'tipracks')
+        self.lights.start('tip_swap')
+        start = datetime.now()
+        self.ctx.pause(message)
+        self.pip.move_to(self.ctx.fixed_trash['A1'].top(z = 10))
+        waited = 0 if self.ctx.is_simulating() else (datetime.now() - start).total_seconds()
+        self.lights.stop()
+        self.events.event('resume', seconds = round(waited, 1))
+        return waited
+
+    # Racks with tips kept for a chain (tip_reuse) are never replaced: those tips are picked up again
+    def replace_tipracks(self, pip, racks):
+        '''
+        Replace the tipracks racks (indexes in pip.tip_racks), returns the seconds paused
+        '''
+        paused = self.wait_for_operator(self.messages['replace'].format(volume = pip.max_volume,
+                                        slots = ', '.join(self.slots[k] for k in racks)))
+        for k in racks:
+            pip.tip_racks[k].reset()
+            self.saved.pop(self.slots[k], None)
+        self.track['maxes'][pip] = self.track['counts'][pip] + available_tips(pip)
+        if self.inventory_slots is not None:
+            save_tip_inventory(pip, self.slots, self.saved)
+        return paused
+
+    def pick_up(self, num_tips = None):
+        '''
+        Pick up a new tip (num_tips of the column, see next_tip) and return it
+        '''
+        return pick_up(self.pip, self.track, self.replace_tipracks, num_tips, tip_reuse = self.tip_reuse, events = self.events,
+                       slots = self.inventory_slots, saved = self.saved, deck = self.ctx.deck)
+
+    def drop(self):
+        '''
+        Drop the tip and count it
+        '''
+        if self.recycle:
+            self.pip.return_tip()
+        else:
+            self.pip.drop_tip(home_after = False)
+        self.track['counts'][self.pip] += 8
+
+    # The same tip for a column along a chain of operations (the wash and the removal
+    # of its supernatant...): it is returned to its rack in between, see tip_reuse
+    def pick_up_column(self, chain, column):
+        '''
+        Pick up the tip kept for column in chain (returns True) or a new one
+        '''
+        tip = self.tip_reuse.tip(chain, column)
+        if tip is not None:
+            self.pip.pick_up_tip(tip)
+            self.events.event('tip_pickup', tip = tip.display_name, kept = True)
+            return True
+        self.tip_reuse.keep(chain, column, self.pick_up(column_tips(self.num_samples, column)))
+        self.track['counts'][self.pip] += 8
+        return False
+
+    def drop_column(self, chain, column, keep):
+        '''
+        Return the tip to its rack if the chain goes on (keep), otherwise drop it
+        '''
+        if self.recycle or (keep and self.tip_reuse.enabled(chain)):
+            self.pip.return_tip()
+        else:
+            self.pip.drop_tip(home_after = False)
+        if not keep:
+            self.tip_reuse.release(chain, column)
+
+    # Tipracks replaced in the waits: the tips of every STEP are known before the run,
+    # so the racks that would run out are replaced in the last wait before it happens
+    def refill_plan(self, first_step):
+        if self.recycle:
+            return []
+        demand = [(s, self.demand.get(s, 0), 'wait_time' in self.steps[s]) for s in sorted(self.steps)
+                  if s >= first_step and self.steps[s]['Execute']]
+        return plan_tip_refills(free_tips(self.pip), len(self.pip.tip_racks[0].wells()), demand)
+
+    def refill_break(self, step):
+        '''
+        Replace the tipracks planned for step, returns the seconds paused
+        '''
+        refills = self.refill_plan(step)
+        if not refills or refills[0][0] != step:
+            return 0
+        racks = [k for k in refills[0][1] if not self.tip_reuse.holds(self.pip.tip_racks[k])] # Not the racks with kept tips
+        if not racks:
+            return 0
+        return self.replace_tipracks(self.pip, racks)
+
+    def start(self, run_log, first_step):
+        '''
+        Log the tipracks the run will replace and replace the ones planned before first_step
+        '''
+        for step, racks in self.refill_plan(first_step):
+            when = self.messages['before'] if step == first_step else \
+                self.messages['in_step'].format(step = step, description = self.steps[step]['description'])
+            run_log.operator(self.messages['planned'].format(slots = ', '.join(self.slots[k] for k in racks), when = when))
+        return self.refill_break(first_step)
+# <<< tip_inventory.py
+
+# >>> tip_reuse.py: TipReuse
+class TipReuse:
+    '''
+    Tips kept for each column of the enabled chains. Chains not enabled get a
+    new tip for every operation.
+    '''
+    def __init__(self, chains):
+        self.chains = dict((chain, {}) for chain in chains)
+
+    def enabled(self, chain):
+        return chain in self.chains
+
+    def tip(self, chain, column):
+        '''
+        Tip kept for column in chain, None when the column needs a new tip
+        '''
+        return self.chains.get(chain, {}).get(column)
+
+    def keep(self, chain, column, tip):
+        if not self.enabled(chain):
+            return
+        for other_chain, tips in self.chains.items():
+            for other_column, other_tip in tips.items():
+                if other_tip is tip and (other_chain, other_column) != (chain, column):
+                    raise ValueError('Tip ' + str(tip) + ' is already kept for column ' + str(other_column + 1) +
+                                     ' in ' + other_chain)
+        self.chains[chain][column] = tip
+
+    def release(self, chain, column):
+        '''
+        The tip of column in chain is thrown away
+        '''
+        self.chains.get(chain, {}).pop(column, None)
+
+    def holds(self, rack):
+        '''
+        True if a tip kept for a chain is in rack (it must not be replaced)
+        '''
+        return any(tip.parent is rack for tips in self.chains.values() for tip in tips.values())
+# <<< tip_reuse.py
+
+# >>> liquid_height.py: height_table
+import math
+from bisect import bisect_right
+
+TABLE_STEP = 0.1 # mm between the points of the tables
+
+# (shape, depth in mm) of the bottom of the wells: 'flat', 'v' (a groove along
+# the well, as in the 12 well reservoir), 'pyramid' (square wells) or 'cone'
+# (round wells, to a point)
+BOTTOM_SHAPES = {
+    'kingfisher_96_wellplate_2000ul':           ('pyramid', 4),
+    'nest_12_reservoir_15ml':                   ('v', 1.95),
+    'nest_1_reservoir_195ml':                   ('flat', 0),
+    'opentrons_6_tuberack_falcon_50ml_conical': ('cone', 20),
+}
+
+HEIGHT_TABLES = {}
+
+
+def cross_section(well, bottom_shape, bottom_depth, z):
+    '''
+    Area in mm2 of the well at z mm over its bottom
+    '''
+    if well['shape'] == 'circular':
+        area = math.pi * (well['diameter'] / 2) ** 2
+    else:
+        area = well['xDimension'] * well['yDimension']
+    if bottom_shape == 'flat' or z >= bottom_depth:
+        return area
+    if bottom_shape == 'v':
+        return area * z / bottom_depth
+    if bottom_shape in ['pyramid', 'cone']:
+        return area * (z / bottom_depth) ** 2
+    raise ValueError('Unknown bottom shape ' + repr(bottom_shape) + ', use flat, v, pyramid or cone')
+
+
+class HeightTable:
+    '''
+    (volume, height) points of a well. The area of a section is at most
+    quadratic in the height, so the volume of every step (Simpson) is exact and
+    only the interpolation between points is approximated.
+    '''
+    def __init__(self, well, bottom_shape = 'flat', bottom_depth = 0, step = TABLE_STEP):
+        num_steps = max(1, int(math.ceil(well['depth'] / step)))
+        self.heights = [well['depth'] * i / num_steps for i in range(num_steps + 1)]
+        self.volumes = [0]
+        for z0, z1 in zip(self.heights, self.heights[1:]):
+            areas = [cross_section(well, bottom_shape, bottom_depth, z) for z in [z0, (z0 + z1) / 2, z1]]
+            self.volumes.append(self.volumes[-1] + (z1 - z0) * (areas[0] + 4 * areas[1] + areas[2]) / 6)
+        capacity = well.get('totalLiquidVolume')
+        if capacity is not None and capacity < self.volumes[-1]: # Up to the nominal volume
+            i = bisect_right(self.volumes, capacity)
+            top = self.heights[i - 1] + (self.heights[i] - self.heights[i - 1]) * (capacity - self.volumes[i - 1]) / (self.volumes[i] - self.volumes[i - 1])
+            self.heights = self.heights[:i] + [top]
+            self.volumes = self.volumes[:i] + [capacity]
+        self.depth = self.heights[-1]
+
+    def height(self, volume):
+        '''
+        Height in mm of volume uL in the well, 0 when empty and the depth of the
+        well when full
+        '''
+        if volume <= 0:
+            return 0
+        if volume >= self.volumes[-1]:
+            return self.depth
+        i = bisect_right(self.volumes, volume)
+        v0, v1 = self.volumes[i - 1], self.volumes[i]
+        return self.heights[i - 1] + (self.heights[i] - self.heights[i - 1]) * (volume - v0) / (v1 - v0)
+
+    def volume(self, height):
+        '''
+        uL in the well up to height mm
+        '''
+        if height <= 0:
+            return 0
+        if height >= self.depth:
+            return self.volumes[-1]
+        i = bisect_right(self.heights, height)
+        h0, h1 = self.heights[i - 1], self.heights[i]
+        return self.volumes[i - 1] + (self.volumes[i] - self.volumes[i - 1]) * (height - h0) / (h1 - h0)
+
+
+def well_definition(labware):
+    '''
+    Entry of the first well of labware in its definition: older robot software
+    keeps it in labware._definition, newer in the implementation of the labware
+    '''
+    definition = getattr(labware, '_definition', None)
+    if definition is None:
+        definition = labware._implementation.get_definition()
+    return definition['wells'][labware.wells()[0].well_name]
+
+
+def height_table(labware):
+    '''
+    HeightTable of the wells of a labware, built the first time
+    '''
+    if labware.load_name not in HEIGHT_TABLES:
+        bottom_shape, bottom_depth = BOTTOM_SHAPES.get(labware.load_name, ('flat', 0))
+        HEIGHT_TABLES[labware.load_name] = HeightTable(well_definition(labware), bottom_shape, bottom_depth)
+    return HEIGHT_TABLES[labware.load_name]
+# <<< liquid_height.py
+
+# >>> reservoir_packing.py: pack_channels, fill_sheet
+import math
+
+CHANNEL_MAX_VOLUME  = 12200 # uL a channel is filled with at most, dead volume and margin included
+FILL_MARGIN         = 0.1   # Fraction of the volume of a channel added when it is filled
+
+
+def pack_channels(demands, num_channels = 12, max_volume = CHANNEL_MAX_VOLUME):
+    '''
+    demands: (name, uL of every aspiration in the order they are taken, dead
+    volume of a channel) of each reagent. Reagents without aspirations take no
+    channel. Returns {name: [(channel from 1, uL to fill)]}, the channels of the
+    reagents consecutive and in the order of demands. The uL to fill do not
+    include the margin (see fill_volume).
+    '''
+    max_volume = max_volume / (1 + FILL_MARGIN)
+    packing = {}
+    channel = 1
+    for name, aspirations, dead_vol in demands:
+        if not aspirations:
+            continue
+        useful = [0]
+        for volume in aspirations:
+            if volume > max_volume - dead_vol:
+                raise ValueError('An aspiration of ' + str(round(volume, 1)) + ' uL of ' + name +
+                                 ' does not fit in a channel of ' + str(int(max_volume * (1 + FILL_MARGIN))) + ' uL')
+            if useful[-1] + volume > max_volume - dead_vol:
+                useful.append(0)
+            useful[-1] += volume
+        # 1 uL more so that rounding does not change channel before its last aspiration
+        packing[name] = [(channel + k, int(math.ceil(volume)) + dead_vol + 1) for k, volume in enumerate(useful)]
+        channel += len(useful)
+    if channel - 1 > num_channels:
+        raise ValueError('The reagents need ' + str(channel - 1) + ' channels and the reservoir has ' + str(num_channels))
+    return packing
+
+
+def fill_volume(volume):
+    '''
+    uL to fill a channel the run takes volume uL from (dead volume included) with
+    '''
+    return int(math.ceil(volume * (1 + FILL_MARGIN)))
+
+
+def fill_sheet(packing, label = 'Channel'):
+    '''
+    One line per channel with the reagent and the uL to fill it with
+    '''
+    lines = []
+    for name, channels in packing.items():
+        for channel, volume in channels:
+            lines.append(label + ' ' + str(channel) + ': ' + name + ', ' + str(fill_volume(volume)) + ' uL')
+    return lines
+# <<< reservoir_packing.py
+
+# >>> run_log.py: RunLog
+from datetime import datetime
+
+LOG_LEVELS          = ['operator', 'debug']
+LOG_BUFFER_LINES    = 200
+LOG_SEPARATOR       = '###############################################'
+
+
+class RunLog:
+    def __init__(self, ctx, path = None, level = 'operator'):
+        if level not in LOG_LEVELS:
+            raise ValueError('Unknown log level ' + repr(level) + ', use one of ' + ', '.join(LOG_LEVELS))
+        self.ctx = ctx
+        self.path = path
+        self.level = level
+        self.buffer = []
+
+    def write(self, level, msg):
+        if self.path is None:
+            return
+        self.buffer.append(datetime.now().strftime('%Y/%m/%d %H:%M:%S') + '\t' + level + '\t' + msg)
+        if len(self.buffer) >= LOG_BUFFER_LINES:
+            self.flush()
+
+    def operator(self, msg):
+        self.ctx.comment(msg)
+        self.write('operator', msg)
+        self.flush()
+
+    def debug(self, msg):
+        if self.level == 'debug':
+            self.ctx.comment(msg)
+        self.write('debug', msg)
+
+    def banner(self, title):
+        '''
+        Title of a part of the run, between separator lines in debug level
+        '''
+        self.debug(' ')
+        self.debug(LOG_SEPARATOR)
+        self.operator(title)
+        self.debug(LOG_SEPARATOR)
+        self.debug(' ')
+
+    def flush(self):
+        if self.path is None or not self.buffer:
+            return
+        with open(self.path, 'a') as f:
+            f.write('\n'.join(self.buffer) + '\n')
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+# <<< run_log.py
+
+# >>> event_log.py: EventLog
+import json
+import os
+import time
+from datetime import datetime
+
+EVENT_SYNC_LINES    = 20
+EVENT_SYNC_SECONDS  = 30
+
+
+class EventLog:
+    def __init__(self, path = None):
+        self.file = None if path is None else open(path, 'a')
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+        self.step = None
+        self.column = None
+
+    def event(self, event, **fields):
+        if self.file is None:
+            return
+        record = {'time': datetime.now().isoformat(timespec = 'milliseconds'), 'event': event}
+        if self.step is not None:
+            record['step'] = self.step
+        if self.column is not None:
+            record['column'] = self.column
+        record.update(fields)
+        self.file.write(json.dumps(record, default = str) + '\n')
+        self.file.flush()
+        self.unsynced += 1
+        if self.unsynced >= EVENT_SYNC_LINES or time.monotonic() - self.synced_at >= EVENT_SYNC_SECONDS:
+            self.sync()
+
+    def sync(self):
+        if self.file is None or not self.unsynced:
+            return
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+
+    def step_start(self, step, description):
+        self.column = None
+        self.step = step
+        self.event('step_start', description = description)
+
+    def step_end(self, seconds):
+        self.column_end()
+        self.event('step_end', seconds = round(seconds, 1))
+        self.step = None
+        self.sync()
+
+    def column_start(self, column):
+        '''
+        Column (from 1) the STEP works on next, the previous one ends
+        '''
+        self.column_end()
+        self.column = column
+        self.event('column_start')
+
+    def column_end(self):
+        if self.column is not None:
+            self.event('column_end')
+            self.column = None
+
+    def close(self):
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
+# <<< event_log.py
+
+# >>> checkpoint.py: Checkpoint, restore_reagents
+import json
+import os
+from datetime import datetime
+
+CHECKPOINT_MAX_AGE  = 6 * 3600 # seconds after its last save a checkpoint is resumed
+CHECKPOINT_FORMAT   = '%Y/%m/%d %H:%M:%S'
+
+
+class Checkpoint:
+    def __init__(self, path = None, protocol = None):
+        self.path = path
+        self.protocol = protocol
+
+    def load(self, num_samples, max_age = CHECKPOINT_MAX_AGE):
+        '''
+        State saved, None without a checkpoint of this protocol and num_samples
+        younger than max_age
+        '''
+        if self.path is None:
+            return None
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            age = (datetime.now() - datetime.strptime(state['updated'], CHECKPOINT_FORMAT)).total_seconds()
+        except (IOError, ValueError, KeyError):
+            return None
+        if state.get('protocol') != self.protocol or state.get('num_samples') != num_samples or age > max_age:
+            return None
+        return state
+
+    def save(self, step, column, num_samples, reagents, tips, magnet):
+        if self.path is None:
+            return
+        state = {'protocol': self.protocol, 'step': step, 'column': column, 'num_samples': num_samples,
+                 'reagents': {reagent.name: {'col': reagent.col, 'vol_well': reagent.vol_well} for reagent in reagents},
+                 'tips': tips, 'magnet': magnet, 'updated': datetime.now().strftime(CHECKPOINT_FORMAT)}
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.path + '.tmp', self.path)
+
+    def clear(self):
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def restore_reagents(reagents, state):
+    '''
+    Channel and volume left of the reagents as saved in state
+    '''
+    for reagent in reagents:
+        if reagent.name in state['reagents']:
+            reagent.col         = state['reagents'][reagent.name]['col']
+            reagent.vol_well    = state['reagents'][reagent.name]['vol_well']
+# <<< checkpoint.py
+
+# >>> audio_worker.py: AudioWorker
+import os
+import subprocess
+import threading
+import time
+from queue import Queue
+
+
+class AudioWorker:
+    def __init__(self, sounds_path):
+        self.sounds_path = sounds_path
+        self.queue = Queue()
+        self.thread = None
+
+    def play(self, filenames, delay = 0):
+        '''
+        Queue the sounds (mp3 files of sounds_path, the extension may be left
+        out) to play in order, delay seconds after the previous cue ends
+        '''
+        self.queue.put((delay, list(filenames)))
+        if self.thread is None:
+            self.thread = threading.Thread(target = self.work, name = 'audio_worker', daemon = True)
+            self.thread.start()
+
+    def work(self):
+        while True:
+            delay, filenames = self.queue.get()
+            time.sleep(delay)
+            for filename in filenames:
+                path = os.path.join(self.sounds_path, filename if filename.endswith('.mp3') else filename + '.mp3')
+                try:
+                    subprocess.call(['mpg123', '-q', path], stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+                except OSError: # mpg123 not installed
+                    pass
+            self.queue.task_done()
+# <<< audio_worker.py
+
+# >>> light_signals.py: LightSignals
+import threading
+
+# steps: (keyword arguments of hardware.set_lights, seconds), repeated in order.
+# end: lights set when the pattern ends or is stopped, None to leave the last step.
+LIGHT_PATTERNS = {
+    'tip_swap': {'steps': [({'rails': False, 'button': (1, 0, 0)}, 0.3), ({'rails': True, 'button': (0, 0, 1)}, 0.3)],
+                 'end': {'button': (0, 1, 0)}},
+    'finished': {'steps': [({'button': False, 'rails': False}, 0.3), ({'button': True, 'rails': True}, 0.3)],
+                 'end': None},
+    'error':    {'steps': [({'rails': False, 'button': (1, 0, 0)}, 0.15), ({'rails': False, 'button': False}, 0.15)],
+                 'end': {'button': (1, 0, 0)}},
+}
+
+
+class LightSignals:
+    def __init__(self, hardware, photosensitive = False):
+        self.hardware = hardware
+        self.photosensitive = photosensitive
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def set_lights(self, lights):
+        if self.photosensitive and lights.get('rails'):
+            lights = dict(lights, rails = False)
+        self.hardware.set_lights(**lights)
+
+    def start(self, pattern, times = None, end = None):
+        '''
+        Play pattern times (None: until stop()) in the background, replacing
+        the pattern being played. end replaces the end lights of the pattern.
+        '''
+        if pattern not in LIGHT_PATTERNS:
+            raise ValueError('Unknown light pattern ' + repr(pattern) + ', use one of ' + ', '.join(sorted(LIGHT_PATTERNS)))
+        self.stop()
+        if self.hardware is None:
+            return
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target = self.play, name = 'light_signals', daemon = True,
+                                       args = (LIGHT_PATTERNS[pattern], times, end, self.stopped))
+        self.thread.start()
+
+    def play(self, pattern, times, end, stopped):
+        repeat = 0
+        while (times is None or repeat < times) and not stopped.is_set():
+            for lights, seconds in pattern['steps']:
+                self.set_lights(lights)
+                if stopped.wait(seconds):
+                    break
+            repeat += 1
+        end = end if end is not None else pattern['end']
+        if end is not None:
+            self.set_lights(end)
+
+    def stop(self):
+        '''
+        Stop the pattern being played, once its end lights are set
+        '''
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+# <<< light_signals.py
+
+# >>> incubation.py: start_temperature, await_temperature, Incubations
+import math
+from datetime import datetime
+
+INCUBATION_MESSAGES = {
+    'en': {'ramp': 'Temperature module ramping to {celsius} C in the background',
+           'await': 'Waiting for the temperature module to reach {celsius} C (now {temperature} C)',
+           'dosed': 'Last column dosed {elapsed} seconds ago, first column will have {longest} seconds.',
+           'delay': '{msg} for {seconds} seconds.'},
+    'es': {'ramp': 'Módulo de temperatura en rampa hacia {celsius} ºC en segundo plano',
+           'await': 'Esperando a que el módulo de temperatura llegue a {celsius} ºC (ahora {temperature} ºC)',
+           'dosed': 'La última columna recibió el reactivo hace {elapsed} segundos, la primera tendrá {longest} segundos.',
+           'delay': '{msg} durante {seconds} segundos.'},
+}
+
+
+def start_temperature(run_log, module, celsius, language = 'en'):
+    module.start_set_temperature(celsius)
+    run_log.operator(INCUBATION_MESSAGES[language]['ramp'].format(celsius = celsius))
+
+
+def await_temperature(run_log, module, celsius, language = 'en'):
+    if module.status != 'holding at target':
+        run_log.operator(INCUBATION_MESSAGES[language]['await'].format(celsius = celsius, temperature = module.temperature))
+    module.await_temperature(celsius)
+
 
+class Incubations:
+    def __init__(self, ctx, run_log, language = 'en'):
+        self.ctx = ctx
+        self.run_log = run_log
+        self.messages = INCUBATION_MESSAGES[language]
+        self.dose_times = {}
+
+    def record_dose(self, stage, col):
+        self.dose_times.setdefault(stage, {})[col] = datetime.now()
+
+    def delay(self, stage, wait_time, msg):
+        '''
+        Wait until the last column dosed in stage has incubated wait_time seconds
+        '''
+        remaining = wait_time
+        doses = self.dose_times.get(stage)
+        if doses and not self.ctx.is_simulating(): # Simulated runs keep the full wait
+            now = datetime.now()
+            elapsed = (now - max(doses.values())).total_seconds()
+            remaining = max(0, math.ceil(wait_time - elapsed))
+            longest = (now - min(doses.values())).total_seconds() + remaining
+            self.run_log.operator(self.messages['dosed'].format(elapsed = int(elapsed), longest = int(longest)))
+        if remaining > 0:
+            self.ctx.delay(seconds = remaining, msg = self.messages['delay'].format(msg = msg, seconds = remaining))
+# <<< incubation.py
+
+# >>> pipetting.py: find_side, aspirate_with_x_scrolling, plan_supernatant_trips
+import math
+from opentrons.types import Point
+
+
+def find_side(col):
+    '''
+    Side of the wells of column col the offsets in x go to: -1 (left) for the
+    even columns, 1 (right) for the odd ones
+    '''
+    if col%2 == 0:
+        side = -1 # left
+    else:
+        side = 1 # right
+    return side
+
+
+def plan_supernatant_trips(heights, volume, max_trip_vol, extra_vol, follow_depth, final_height):
+    '''
+    Trips (volume, pickup height, near pellet) to remove volume uL from a well of
+    HeightTable heights, extra_vol uL more to leave it empty. The upper trips
+    aspirate fast follow_depth mm below the liquid level; only the trips that
+    reach final_height, next to the pellet, go slowly, and the final one removes
+    what is left.
+    '''
+    num_trips = math.ceil((volume + extra_vol) / max_trip_vol)
+    trips = []
+    remaining = volume
+    for i in range(num_trips - 1):
+        remaining -= max_trip_vol
+        height = heights.height(remaining) - follow_depth
+        trips.append((max_trip_vol, max(height, final_height), height <= final_height))
+    trips.append((max_trip_vol, final_height, True))
+    return trips
+
+
+def aspirate_with_x_scrolling(pip, volume, src, pickup_height = 0, rate = 1, start_x_offset_src = 0, stop_x_offset_src = 0):
+    '''
+    Aspirate volume uL pip.min_volume at a time, moving from stop_x_offset_src
+    to start_x_offset_src mm across the bottom of src
+    '''
+    max_asp = volume/pip.min_volume
+    inc_step = (start_x_offset_src - stop_x_offset_src) / max_asp
+
+    num_asp = math.ceil((start_x_offset_src - stop_x_offset_src) / inc_step) # Points of numpy.arange(stop, start, inc_step)
+    for x in reversed([stop_x_offset_src + k * inc_step for k in range(num_asp)]):
+        s = src.bottom(pickup_height).move(Point(x = x))
+        pip.aspirate(volume = pip.min_volume, location = s, rate = rate)
+# <<< pipetting.py
+
+# >>> step_log.py: log_step_start, log_step_end, start_run, finish_run
+from datetime import datetime
+
+STEP_LOG_MESSAGES = {
+    'en': {'step': 'Step', 'took': ' took ', 'start': 'Starting the run', 'finish': 'Run finished',
+           'tips': 'Used tips in total: {tips} ({racks} racks)'},
+    'es': {'step': 'PASO', 'took': ' hizo un tiempo de ', 'start': 'Empezando protocolo', 'finish': 'Protocolo finalizado',
+           'tips': 'Puntas utilizadas: {tips} ({racks} caja(s))'},
+}
+
+
+def log_step_start(run_log, events, steps, step, language = 'en'):
+    '''
+    Log the start of STEP step, returns its start time for log_step_end
+    '''
+    start = datetime.now()
+    run_log.banner(STEP_LOG_MESSAGES[language]['step'] + ' ' + str(step) + ': ' + steps[step]['description'])
+    events.step_start(step, steps[step]['description'])
+    return start
+
+
+def log_step_end(run_log, events, steps, step, start, language = 'en'):
+    '''
+    Log the end of STEP step and keep the time it took in steps, returns it
+    '''
+    messages = STEP_LOG_MESSAGES[language]
+    time_taken = datetime.now() - start
+    run_log.operator(messages['step'] + ' ' + str(step) + ': ' + steps[step]['description'] + messages['took'] + str(time_taken))
+    steps[step]['Time:'] = str(time_taken)
+    events.step_end(time_taken.total_seconds())
+    return time_taken
+
+
+def start_run(ctx, run_log, button = None, rails = None, language = 'en'):
+    '''
+    Log the start of the run and set the lights (None leaves them as they are),
+    returns the start time
+    '''
+    run_log.debug(' ')
+    run_log.debug('###############################################')
+    run_log.operator(STEP_LOG_MESSAGES[language]['start'])
+    ctx._hw_manager.hardware.set_lights(button = button, rails = rails)
+    return datetime.now().strftime('%Y/%m/%d %H:%M:%S')
+
+
+def write_time_log(path, steps):
+    '''
+    Tab separated time log of the STEPS: activation, description, wait and time taken
+    '''
+    with open(path, 'w') as f:
+        f.write('STEP\texecution\tdescription\twait_time\texecution_time\n')
+        for key in steps.keys():
+            row = str(key)
+            for key2 in steps[key].keys():
+                row += '\t' + format(steps[key][key2])
+            f.write(row + '\n')
+
+
+def finish_run(run_log, events, checkpoint, steps, used_tips, time_log_path = None, language = 'en'):
+    '''
+    Write the time log of the STEPS to time_log_path (None while simulating), log
+    the tips used and close the logs of the run. The run ended, so its checkpoint
+    is cleared. Returns the finish time.
+    '''
+    if time_log_path is not None:
+        write_time_log(time_log_path, steps)
+    run_log.debug('###############################################')
+    run_log.operator(STEP_LOG_MESSAGES[language]['finish'])
+    run_log.operator(STEP_LOG_MESSAGES[language]['tips'].format(tips = used_tips, racks = round(used_tips / 96, 2)))
+    run_log.close()
+    events.close()
+    checkpoint.clear()
+    return datetime.now().strftime('%Y/%m/%d %H:%M:%S')
+# <<< step_log.py
+
+
+def run(ctx: protocol_api.ProtocolContext):
+    lights = LightSignals(None if ctx.is_simulating() else ctx._hw_manager.hardware, photosensitive = PHOTOSENSITIVE) # Light patterns played in the background
     STEP = 0
     STEPS = { #Dictionary with STEP activation, description, and times
             1:{'Execute': LYSIS_VOLUME_PER_SAMPLE > 0, 'description': 'Transferir lisis'},
@@ -108,6 +1191,10 @@ def run(ctx: protocol_api.ProtocolContext):
         if not os.path.isdir(folder_path):
             os.mkdir(folder_path)
         file_path = folder_path + '/Station_B_Extraccion_total_time_log.txt'
+    run_log = RunLog(ctx, None if ctx.is_simulating() else folder_path + '/run_log.txt', LOG_LEVEL)
+    events = EventLog(None if ctx.is_simulating() else folder_path + '/events.jsonl') # Eventos del protocolo, ver event_log
+    checkpoint = Checkpoint(None if ctx.is_simulating() else folder_path + '/checkpoint.json', metadata['protocolName']) # Progreso para continuar el protocolo, ver checkpoint
+    incubations = Incubations(ctx, run_log, 'es') # Plazos de incubación de las columnas, ver incubation
 
     #Define Reagents as objects with their properties
     class Reagent:
@@ -115,13 +1202,9 @@ def run(ctx: protocol_api.ProtocolContext):
             if(self.name == 'Sample'):
                 self.num_wells = num_cols
                 return VOLUME_SAMPLE
-            elif self.placed_in_multi:    
-                trips = math.ceil(self.reagent_volume / self.max_volume_allowed)
-                vol_trip = self.reagent_volume / trips * 8
-                max_trips_well = math.floor(18000 / vol_trip)
-                total_trips = num_cols * trips
-                self.num_wells = math.ceil(total_trips / max_trips_well)
-                return math.ceil(total_trips / self.num_wells) * vol_trip + self.dead_vol
+            elif self.placed_in_multi:
+                self.num_wells = 0 # Los canales los asigna pack_channels
+                return 0
             else:
                 self.num_wells = 1
                 return self.reagent_volume * NUM_SAMPLES
@@ -143,6 +1226,8 @@ def run(ctx: protocol_api.ProtocolContext):
             self.vol_well = 0
             self.v_cono = v_fondo
             self.dead_vol = dead_vol
+            self.channels = []
+            self.channel_volumes = []
             self.first_well = first_well
             self.placed_in_multi = placed_in_multi
             self.vol_well_original = self.calc_vol_well() if reagent_volume * NUM_SAMPLES > 0 else 0
@@ -150,127 +1235,85 @@ def run(ctx: protocol_api.ProtocolContext):
 
     #Reagents and their characteristics
     Lysis = Reagent(name = 'Lysis',
-                    flow_rate_aspirate = 25,        # 1
-                    flow_rate_dispense = 100,       # 1
-                    flow_rate_aspirate_mix = 25,    # 1
-                    flow_rate_dispense_mix = 100,   # 1
-                    air_gap_vol_bottom = 5,
-                    air_gap_vol_top = 0,
-                    disposal_volume = 1,
+                    **liquid_class('lysis', SPEED_PROFILE, EXTRACTION_FIELDS),
                     max_volume_allowed = 180,
                     reagent_volume = LYSIS_VOLUME_PER_SAMPLE,
                     v_fondo = 695, #1.95 * multi_well_rack_area / 2, #Prismatic
                     placed_in_multi = True)
 
     Beads = Reagent(name = 'Beads',
-                    flow_rate_aspirate = 25,
-                    flow_rate_dispense = 100,
-                    flow_rate_aspirate_mix = 25,
-                    flow_rate_dispense_mix = 100,
-                    air_gap_vol_bottom = 5,
-                    air_gap_vol_top = 0,
-                    disposal_volume = 1,
+                    **liquid_class('beads', SPEED_PROFILE, EXTRACTION_FIELDS),
                     max_volume_allowed = 180,
                     reagent_volume = BEADS_VOLUME_PER_SAMPLE,
                     v_fondo = 695, #1.95 * multi_well_rack_area / 2, #Prismatic
                     placed_in_multi = True)
 
     Wash_1 = Reagent(name = 'Wash 1',
-                    flow_rate_aspirate = 25,
-                    flow_rate_dispense = 100,
-                    flow_rate_aspirate_mix = 25,
-                    flow_rate_dispense_mix = 100,
-                    air_gap_vol_bottom = 5,
-                    air_gap_vol_top = 0,
-                    disposal_volume = 1,
+                    **liquid_class('wash', SPEED_PROFILE, EXTRACTION_FIELDS),
                     max_volume_allowed = 180,
                     reagent_volume = WASH_1_VOLUME_PER_SAMPLE, 
                     v_fondo = 695) #1.95 * multi_well_rack_area / 2, #Prismatic)
 
     Wash_2 = Reagent(name = 'Wash 2',
-                    flow_rate_aspirate = 25,
-                    flow_rate_dispense = 100,
-                    flow_rate_aspirate_mix = 25,
-                    flow_rate_dispense_mix = 100,
-                    air_gap_vol_bottom = 5,
-                    air_gap_vol_top = 0,
-                    disposal_volume = 1,
+                    **liquid_class('wash', SPEED_PROFILE, EXTRACTION_FIELDS),
                     max_volume_allowed = 180,
                     reagent_volume = WASH_2_VOLUME_PER_SAMPLE, 
                     v_fondo = 695) #1.95 * multi_well_rack_area / 2, #Prismatic)
 
     Wash_3 = Reagent(name = 'Wash 3',
-                    flow_rate_aspirate = 25,
-                    flow_rate_dispense = 100,
-                    flow_rate_aspirate_mix = 25,
-                    flow_rate_dispense_mix = 100,
-                    air_gap_vol_bottom = 5,
-                    air_gap_vol_top = 0,
-                    disposal_volume = 1,
+                    **liquid_class('wash', SPEED_PROFILE, EXTRACTION_FIELDS),
                     max_volume_allowed = 180,
                     reagent_volume = WASH_3_VOLUME_PER_SAMPLE, 
                     v_fondo = 695) #1.95 * multi_well_rack_area / 2, #Prismatic)
 
     Elution = Reagent(name = 'Elution',
-                    flow_rate_aspirate = 25,
-                    flow_rate_dispense = 100,
-                    flow_rate_aspirate_mix = 25,
-                    flow_rate_dispense_mix = 100,
-                    air_gap_vol_bottom = 5,
-                    air_gap_vol_top = 0,
-                    disposal_volume = 1,
+                    **liquid_class('elution', SPEED_PROFILE, EXTRACTION_FIELDS),
                     max_volume_allowed = 180,
                     reagent_volume = ELUTION_VOLUME_PER_SAMPLE,
                     placed_in_multi = True,
                     v_fondo = 695) #1.95*multi_well_rack_area/2) #Prismatic
 
     Sample = Reagent(name = 'Sample',
-                    flow_rate_aspirate = 5, # Original 0.5
-                    flow_rate_dispense = 100, # Original 1
-                    flow_rate_aspirate_mix = 1,
-                    flow_rate_dispense_mix = 1,
-                    air_gap_vol_bottom = 5,
-                    air_gap_vol_top = 0,
-                    disposal_volume = 1,
+                    **liquid_class('sample', SPEED_PROFILE, EXTRACTION_FIELDS),
                     max_volume_allowed = 180,
                     reagent_volume = VOLUME_SAMPLE,
                     v_fondo = 4 * math.pi * 4**3 / 3) #Sphere
 
-    ctx.comment(' ')
-    ctx.comment('###############################################')
-    ctx.comment('VALORES DE VARIABLES')
-    ctx.comment(' ')
-    ctx.comment('Número de muestras: ' + str(NUM_SAMPLES) + ' (' + str(num_cols) + ' columnas)')
-    ctx.comment('Número de ciclos de lavado: ' + str(NUM_WASHES))
-    ctx.comment('Capacidad de puntas: ' + txt_tip_capacity)
-    ctx.comment(' ') 
-    ctx.comment('Volumen de muestra en el deepwell: ' + str(VOLUME_SAMPLE) + ' ul') 
-    ctx.comment('Volumen de lisis por muestra: ' + str(LYSIS_VOLUME_PER_SAMPLE) + ' ul')
-    ctx.comment('Volumen de solución con bolas magnéticas por muestra: ' + str(BEADS_VOLUME_PER_SAMPLE) + ' ul')
-    ctx.comment('Volumen del primer lavado por muestra: ' + str(WASH_1_VOLUME_PER_SAMPLE) + ' ul') 
-    ctx.comment('Volumen del segundo lavado por muestra: ' + str(WASH_2_VOLUME_PER_SAMPLE) + ' ul') 
-    ctx.comment('Volumen del tercer lavado por muestra: ' + str(WASH_3_VOLUME_PER_SAMPLE) + ' ul')
-    ctx.comment('Volumen de elución por muestra: ' + str(ELUTION_VOLUME_PER_SAMPLE) + ' ul') 	
-    ctx.comment('Volumen de elución a retirar del deepwell: ' + str(ELUTION_FINAL_VOLUME_PER_SAMPLE) + ' ul')
-    ctx.comment(' ') 	 	
-    ctx.comment('Número de mezclas con el lisis: ' + str(LYSIS_NUM_MIXES)) 
-    ctx.comment('Número de mezclas en la primera recogida de un canal con bolas magnéticas: ' + str(BEADS_WELL_FIRST_TIME_NUM_MIXES))
-    ctx.comment('Número de mezclas en el resto de recogidas de un canal con bolas magnéticas: ' + str(BEADS_WELL_NUM_MIXES)) 	
-    ctx.comment('Número de mezclas con la solución de bolas magnéticas: ' + str(BEADS_NUM_MIXES))
-    ctx.comment('Número de mezclas con el primer lavado: ' + str(WASH_1_NUM_MIXES)) 
-    ctx.comment('Número de mezclas con el segundo lavado: ' + str(WASH_2_NUM_MIXES)) 
-    ctx.comment('Número de mezclas con el tercer lavado: ' + str(WASH_3_NUM_MIXES)) 
-    ctx.comment('Número de mezclas con la elución: ' + str(ELUTION_NUM_MIXES))
-    ctx.comment(' ') 	
-    ctx.comment('Reciclado de puntas en los lavados activado: ' + str(TIP_RECYCLING_IN_WASH)) 
-    ctx.comment('Reciclado de puntas en la elución activado: ' + str(TIP_RECYCLING_IN_ELUTION))
-    ctx.comment(' ')
-    ctx.comment('Activar módulo de temperatura: ' + str(SET_TEMP_ON)) 	
-    ctx.comment('Valor objetivo módulo de temepratura: ' + str(TEMPERATURE) + ' ºC')
-    ctx.comment(' ') 	
-    ctx.comment('Foto-sensible: ' + str(PHOTOSENSITIVE)) 	
-    ctx.comment('Repeticiones del sonido final: ' + str(SOUND_NUM_PLAYS))
-    ctx.comment(' ')
+    run_log.debug(' ')
+    run_log.debug('###############################################')
+    run_log.operator('VALORES DE VARIABLES')
+    run_log.debug(' ')
+    run_log.operator('Número de muestras: ' + str(NUM_SAMPLES) + ' (' + str(num_cols) + ' columnas)')
+    run_log.operator('Número de ciclos de lavado: ' + str(NUM_WASHES))
+    run_log.operator('Capacidad de puntas: ' + txt_tip_capacity)
+    run_log.debug(' ') 
+    run_log.operator('Volumen de muestra en el deepwell: ' + str(VOLUME_SAMPLE) + ' ul') 
+    run_log.operator('Volumen de lisis por muestra: ' + str(LYSIS_VOLUME_PER_SAMPLE) + ' ul')
+    run_log.operator('Volumen de solución con bolas magnéticas por muestra: ' + str(BEADS_VOLUME_PER_SAMPLE) + ' ul')
+    run_log.operator('Volumen del primer lavado por muestra: ' + str(WASH_1_VOLUME_PER_SAMPLE) + ' ul') 
+    run_log.operator('Volumen del segundo lavado por muestra: ' + str(WASH_2_VOLUME_PER_SAMPLE) + ' ul') 
+    run_log.operator('Volumen del tercer lavado por muestra: ' + str(WASH_3_VOLUME_PER_SAMPLE) + ' ul')
+    run_log.operator('Volumen de elución por muestra: ' + str(ELUTION_VOLUME_PER_SAMPLE) + ' ul') 	
+    run_log.operator('Volumen de elución a retirar del deepwell: ' + str(ELUTION_FINAL_VOLUME_PER_SAMPLE) + ' ul')
+    run_log.debug(' ') 	 	
+    run_log.operator('Número de mezclas con el lisis: ' + str(LYSIS_NUM_MIXES)) 
+    run_log.operator('Número de mezclas en la primera recogida de un canal con bolas magnéticas: ' + str(BEADS_WELL_FIRST_TIME_NUM_MIXES))
+    run_log.operator('Número de mezclas en el resto de recogidas de un canal con bolas magnéticas: ' + str(BEADS_WELL_NUM_MIXES)) 	
+    run_log.operator('Número de mezclas con la solución de bolas magnéticas: ' + str(BEADS_NUM_MIXES))
+    run_log.operator('Número de mezclas con el primer lavado: ' + str(WASH_1_NUM_MIXES)) 
+    run_log.operator('Número de mezclas con el segundo lavado: ' + str(WASH_2_NUM_MIXES)) 
+    run_log.operator('Número de mezclas con el tercer lavado: ' + str(WASH_3_NUM_MIXES)) 
+    run_log.operator('Número de mezclas con la elución: ' + str(ELUTION_NUM_MIXES))
+    run_log.debug(' ') 	
+    run_log.operator('Reciclado de puntas en los lavados activado: ' + str(TIP_RECYCLING_IN_WASH)) 
+    run_log.operator('Reciclado de puntas en la elución activado: ' + str(TIP_RECYCLING_IN_ELUTION))
+    run_log.debug(' ')
+    run_log.operator('Activar módulo de temperatura: ' + str(SET_TEMP_ON)) 	
+    run_log.operator('Valor objetivo módulo de temepratura: ' + str(TEMPERATURE) + ' ºC')
+    run_log.debug(' ') 	
+    run_log.operator('Foto-sensible: ' + str(PHOTOSENSITIVE)) 	
+    run_log.operator('Repeticiones del sonido final: ' + str(SOUND_NUM_PLAYS))
+    run_log.debug(' ')
 
     #########
     def str_rounded(num):
@@ -298,37 +1341,39 @@ def run(ctx: protocol_api.ProtocolContext):
         if wait_time != 0:
             ctx.delay(seconds=wait_time, msg='Esperando durante ' + str(wait_time) + ' segundos.')
 
-    def calc_height(reagent, cross_section_area, aspirate_volume, min_height = 0.4):
-        nonlocal ctx
-        ctx.comment('¿Volumen útil restante ' + str(reagent.vol_well - reagent.dead_vol) +
+    def calc_height(reagent, heights, aspirate_volume, min_height = 0.4):
+        run_log.debug('¿Volumen útil restante ' + str(reagent.vol_well - reagent.dead_vol) +
                     ' uL < volumen necesario ' + str(aspirate_volume - reagent.disposal_volume * 8) + ' uL?')
         if (reagent.vol_well - reagent.dead_vol + 1) < (aspirate_volume - reagent.disposal_volume * 8):
-            ctx.comment('Se debe utilizar el siguiente canal')
-            ctx.comment('Canal anterior: ' + str(reagent.col))
+            run_log.debug('Se debe utilizar el siguiente canal')
+            run_log.debug('Canal anterior: ' + str(reagent.col))
             # column selector position; intialize to required number
             reagent.col = reagent.col + 1
-            ctx.comment('Nuevo canal: ' + str(reagent.col))
-            reagent.vol_well = reagent.vol_well_original
-            ctx.comment('Nuevo volumen: ' + str(reagent.vol_well) + ' uL')
-            height = (reagent.vol_well - aspirate_volume - reagent.v_cono) / cross_section_area
+            events.event('channel_change', reagent = reagent.name, channel = reagent.channels[reagent.col])
+            run_log.debug('Nuevo canal: ' + str(reagent.col))
+            reagent.vol_well = reagent.channel_volumes[reagent.col]
+            run_log.debug('Nuevo volumen: ' + str(reagent.vol_well) + ' uL')
+            height = heights.height(reagent.vol_well - aspirate_volume) - reagent_follow_depth
             reagent.vol_well = reagent.vol_well - (aspirate_volume - reagent.disposal_volume * 8)
-            ctx.comment('Volumen restante: ' + str(reagent.vol_well) + ' uL')
+            run_log.debug('Volumen restante: ' + str(reagent.vol_well) + ' uL')
             if height < min_height:
                 height = min_height
             col_change = True
         else:
-            height = (reagent.vol_well - aspirate_volume - reagent.v_cono) / cross_section_area
+            height = heights.height(reagent.vol_well - aspirate_volume) - reagent_follow_depth
             reagent.vol_well = reagent.vol_well - (aspirate_volume - (reagent.disposal_volume * 8))
-            ctx.comment('La altura calculada es ' + str(round(height, 2)) + ' mm')
+            run_log.debug('La altura calculada es ' + str(round(height, 2)) + ' mm')
             if height < min_height:
                 height = min_height
-            ctx.comment('La altura utilizada es ' + str(round(height, 2)) + ' mm')
+            run_log.debug('La altura utilizada es ' + str(round(height, 2)) + ' mm')
             col_change = False
         return height, col_change
 
     def move_vol_multi(pipet, reagent, source, dest, vol, x_offset_source, x_offset_dest, pickup_height,
         blow_out, wait_time = 0, touch_tip = False, touch_tip_v_offset = 0, drop_height = -5, 
-        aspirate_with_x_scroll = False, dispense_bottom_air_gap_before = False):
+        aspirate_with_x_scroll = False, dispense_bottom_air_gap_before = False, aspirate_rate = None):
+        if aspirate_rate is None:
+            aspirate_rate = reagent.flow_rate_aspirate
 
         # SOURCE
         if dispense_bottom_air_gap_before and reagent.air_gap_vol_bottom:
@@ -339,10 +1384,10 @@ def run(ctx: protocol_api.ProtocolContext):
             pipet.air_gap(reagent.air_gap_vol_top) #air gap
 
         if aspirate_with_x_scroll:
-            aspirate_with_x_scrolling(pip = pipet, volume = vol, src = source, pickup_height = pickup_height, rate = reagent.flow_rate_aspirate, start_x_offset_src = 0, stop_x_offset_src = x_offset_source)
+            aspirate_with_x_scrolling(pip = pipet, volume = vol, src = source, pickup_height = pickup_height, rate = aspirate_rate, start_x_offset_src = 0, stop_x_offset_src = x_offset_source)
         else:    
             s = source.bottom(pickup_height).move(Point(x = x_offset_source))
-            pipet.aspirate(vol, s, rate = reagent.flow_rate_aspirate) # aspirate liquid
+            pipet.aspirate(vol, s, rate = aspirate_rate) # aspirate liquid
 
         if reagent.air_gap_vol_bottom != 0: #If there is air_gap_vol, switch pipette to slow speed
             pipet.move_to(source.top(z = 0))
@@ -372,155 +1417,33 @@ def run(ctx: protocol_api.ProtocolContext):
             #pipet.air_gap(reagent.air_gap_vol_bottom) #air gap
             #pipet.aspirate(air_gap_vol_bottom, dest.top(z = 0),rate = reagent.flow_rate_aspirate) #air gap
 
-    def aspirate_with_x_scrolling(pip, volume, src, pickup_height = 0, rate = 1, start_x_offset_src = 0, stop_x_offset_src = 0):
+    audio = AudioWorker(path_sounds) # Sounds played in the background
 
-        max_asp = volume/pip.min_volume
-        inc_step = (start_x_offset_src - stop_x_offset_src) / max_asp
+    def play_sound(filename, delay = 0):
+        audio.play([filename], delay)
 
-        for x in reversed(np.arange(stop_x_offset_src, start_x_offset_src, inc_step)):
-            s = src.bottom(pickup_height).move(Point(x = x))
-            pip.aspirate(volume = pip.min_volume, location = s, rate = rate)
-
-    ##########
-    # pick up tip and if there is none left, prompt user for a new rack
-    def pick_up_tip(pip, position = None):
-        nonlocal tip_track
-        #if not ctx.is_simulating():
-        if recycle_tip:
-            pip.pick_up_tip(tips300[0].wells()[0])
-        else:
-            if tip_track['counts'][pip] >= tip_track['maxes'][pip]:
-                for i in range(3):
-                    ctx._hw_manager.hardware.set_lights(rails=False)
-                    ctx._hw_manager.hardware.set_lights(button=(1, 0 ,0))
-                    time.sleep(0.3)
-                    ctx._hw_manager.hardware.set_lights(rails=True)
-                    ctx._hw_manager.hardware.set_lights(button=(0, 0 ,1))
-                    time.sleep(0.3)
-                ctx._hw_manager.hardware.set_lights(button=(0, 1 ,0))
-                ctx.pause('Reemplaza las cajas de puntas de ' + str(pip.max_volume) + 'µl antes \
-                de continuar.')
-                pip.reset_tipracks()
-                tip_track['counts'][pip] = 0
-                tip_track['num_refills'][pip] += 1
-            if position is None:
-                pip.pick_up_tip()
-            else:
-                pip.pick_up_tip(position)
-
-    def drop_tip(pip, recycle = False, increment_count = True):
-        nonlocal tip_track
-        #if not ctx.is_simulating():
-        if recycle or recycle_tip:
-            pip.return_tip()
-        else:
-            pip.drop_tip(home_after = False)
-        if increment_count:
-            tip_track['counts'][pip] += 8
-
-    def start_run():
-        ctx.comment(' ')
-        ctx.comment('###############################################')
-        ctx.comment('Empezando protocolo')
-        if PHOTOSENSITIVE == False:
-            ctx._hw_manager.hardware.set_lights(button = True, rails =  True)
-        else:
-            ctx._hw_manager.hardware.set_lights(button = True, rails =  False)
-        now = datetime.now()
-
-        # dd/mm/YY H:M:S
-        start_time = now.strftime("%Y/%m/%d %H:%M:%S")
-        return start_time
-
-    def run_quiet_process(command):
-        subprocess.check_output('{} &> /dev/null'.format(command), shell=True)
-
-    def play_sound(filename):
-        print('Speaker')
-        print('Next\t--> CTRL-C')
-        try:
-            run_quiet_process('mpg123 {}'.format(path_sounds + filename + '.mp3'))
-        except KeyboardInterrupt:
-            pass
-            print()
-
-    def finish_run(switch_off_lights = False):
-        ctx.comment('###############################################')
-        ctx.comment('Protocolo finalizado')
-        ctx.comment(' ')
-        #Set light color to blue
-        ctx._hw_manager.hardware.set_lights(button = True, rails =  False)
-        now = datetime.now()
-        # dd/mm/YY H:M:S
-        finish_time = now.strftime("%Y/%m/%d %H:%M:%S")
-        if PHOTOSENSITIVE==False:
-            for i in range(10):
-                ctx._hw_manager.hardware.set_lights(button = False, rails =  False)
-                time.sleep(0.3)
-                ctx._hw_manager.hardware.set_lights(button = True, rails =  True)
-                time.sleep(0.3)
-        else:
-            for i in range(10):
-                ctx._hw_manager.hardware.set_lights(button = False, rails =  False)
-                time.sleep(0.3)
-                ctx._hw_manager.hardware.set_lights(button = True, rails =  False)
-                time.sleep(0.3)
-        if switch_off_lights:
-            ctx._hw_manager.hardware.set_lights(button = True, rails =  False)
-
-        used_tips = tip_track['num_refills'][m300] * 96 * len(m300.tip_racks) + tip_track['counts'][m300]
-        ctx.comment('Puntas de 200 ul utilizadas: ' + str(used_tips) + ' (' + str(round(used_tips / 96, 2)) + ' caja(s))')
-        ctx.comment('###############################################')
-
-        if not ctx.is_simulating():
-            for i in range(SOUND_NUM_PLAYS):
-                if i > 0:
-                    time.sleep(60)
-                play_sound('finalizado')
-
-        return finish_time
-
-    def log_step_start():
-        ctx.comment(' ')
-        ctx.comment('###############################################')
-        ctx.comment('PASO '+str(STEP)+': '+STEPS[STEP]['description'])
-        ctx.comment('###############################################')
-        ctx.comment(' ')
-        return datetime.now()
-
-    def log_step_end(start):
-        end = datetime.now()
-        time_taken = (end - start)
-        STEPS[STEP]['Time:'] = str(time_taken)
-
-        ctx.comment(' ')
-        ctx.comment('Paso ' + str(STEP) + ': ' +STEPS[STEP]['description'] + ' hizo un tiempo de ' + str(time_taken))
-        ctx.comment(' ')
-
-    ##########
-    def find_side(col):
-        if col%2 == 0:
-            side = -1 # left
-        else:
-            side = 1 # right
-        return side
-
-
-    def assign_wells(reagent, first_well_pos = None):
-        global next_well_index
-        if first_well_pos is not None and first_well_pos > next_well_index:
-            reagent.first_well = first_well_pos
-        else:
-            reagent.first_well = next_well_index + 1
-
-        next_well_index = reagent.first_well - 1 + reagent.num_wells
-        reagent.reagent_reservoir = reagent_res.rows()[0][reagent.first_well - 1:next_well_index]
-        ctx.comment(reagent.name + ': ' + str(reagent.num_wells) + ' canales desde el canal '+ str(reagent.first_well) +' en el reservorio de 12 canales con un volumen de ' + str_rounded(reagent.vol_well_original) + ' uL cada uno')
+    def reservoir_aspirations(reagent, disposal_volume):
+        '''
+        uL que calc_height toma del reservorio de 12 canales en cada viaje del reactivo, en orden
+        '''
+        trips = math.ceil(reagent.reagent_volume / reagent.max_volume_allowed)
+        return [(reagent.reagent_volume / trips + disposal_volume) * column_tips(NUM_SAMPLES, i) - reagent.disposal_volume * 8
+                for i in range(num_cols) for j in range(trips)] if reagent.reagent_volume > 0 else []
+
+    def assign_channels(reagent, channels):
+        reagent.channels            = [channel for channel, volume in channels]
+        reagent.channel_volumes     = [volume for channel, volume in channels]
+        reagent.num_wells           = len(channels)
+        reagent.first_well          = reagent.channels[0]
+        reagent.vol_well_original   = reagent.channel_volumes[0]
+        reagent.vol_well            = reagent.vol_well_original
+        reagent.reagent_reservoir   = [reagent_res.rows()[0][channel - 1] for channel in reagent.channels]
 
 ####################################
     # load labware and modules
     ######## 12 well rack
     reagent_res = ctx.load_labware('nest_12_reservoir_15ml', '5','reagent deepwell plate')
+    reservoir_heights = height_table(reagent_res) # Altura del líquido a partir del volumen de los canales
 
 ##################################
     ######## Single reservoirs
@@ -539,6 +1462,8 @@ def run(ctx: protocol_api.ProtocolContext):
 ##################################
     ########## tempdeck
     tempdeck = ctx.load_module('Temperature Module Gen2', '1')
+    if SET_TEMP_ON == True:
+        start_temperature(run_log, tempdeck, TEMPERATURE, 'es')
 
     ####### Elution plate - final plate, goes to C
     elution_plate = tempdeck.load_labware('kingfisher_96_aluminumblock_200ul', 'Kingfisher 96 Aluminum Block 200 uL')
@@ -547,6 +1472,7 @@ def run(ctx: protocol_api.ProtocolContext):
     ######## Deepwell - comes from A
     magdeck = ctx.load_module('Magnetic Module Gen2', '4')
     deepwell_plate = magdeck.load_labware('kingfisher_96_wellplate_2000ul', 'KingFisher 96 Well Plate 2mL')
+    deepwell_heights = height_table(deepwell_plate) # Altura del líquido a partir del volumen de los pocillos
     
 ####################################
     ######## Waste reservoir
@@ -568,28 +1494,36 @@ def run(ctx: protocol_api.ProtocolContext):
 
 ###############################################################################
     #Declare which reagents are in each reservoir as well as deepwell and elution plate
-    ctx.comment(' ')
-    ctx.comment('###############################################')
-    ctx.comment('VOLÚMENES PARA ' + str(NUM_SAMPLES) + ' MUESTRAS')
-    ctx.comment(' ')
-    if LYSIS_VOLUME_PER_SAMPLE > 0:
-        assign_wells(Lysis)
-    if BEADS_VOLUME_PER_SAMPLE > 0:
-        assign_wells(Beads)
-    
+    run_log.debug(' ')
+    run_log.debug('###############################################')
+    run_log.operator('VOLÚMENES PARA ' + str(NUM_SAMPLES) + ' MUESTRAS')
+    run_log.debug(' ')
+    # Cada reactivo en el menor número de canales en que caben sus aspiraciones
+    reservoir_packing = pack_channels([(reagent.name, reservoir_aspirations(reagent, disposal_volume), reagent.dead_vol)
+                                       for reagent, disposal_volume in [(Lysis, Lysis.disposal_volume), (Beads, Beads.disposal_volume),
+                                                                        (Elution, Sample.disposal_volume)]])
+    for reagent in [Lysis, Beads, Elution]:
+        if reagent.name in reservoir_packing:
+            assign_channels(reagent, reservoir_packing[reagent.name])
+    run_log.operator('Reservorio de 12 canales:')
+    for line in fill_sheet(reservoir_packing, 'Canal'):
+        run_log.operator(line)
+    if not ctx.is_simulating():
+        with open(folder_path + '/fill_sheet.txt', 'w') as f:
+            f.write('\n'.join(fill_sheet(reservoir_packing, 'Canal')) + '\n')
+
     if NUM_WASHES > 0:
         Wash_1.reagent_reservoir = res_1
-        ctx.comment(Wash_1.name + ': en el reservorio del slot 8 con un volumen de ' + str_rounded(Wash_1.vol_well_original) + ' uL')
+        run_log.operator(Wash_1.name + ': en el reservorio del slot 8 con un volumen de ' + str_rounded(Wash_1.vol_well_original) + ' uL')
         if NUM_WASHES > 1:
             Wash_2.reagent_reservoir = res_2
-            ctx.comment(Wash_2.name + ': en el reservorio del slot 10 con un volumen de ' + str_rounded(Wash_2.vol_well_original) + ' uL')
+            run_log.operator(Wash_2.name + ': en el reservorio del slot 10 con un volumen de ' + str_rounded(Wash_2.vol_well_original) + ' uL')
             if NUM_WASHES > 2:
                 Wash_3.reagent_reservoir = res_3
-                ctx.comment(Wash_3.name + ': en el reservorio del slot 11 con un volumen de ' + str_rounded(Wash_3.vol_well_original) + ' uL')
+                run_log.operator(Wash_3.name + ': en el reservorio del slot 11 con un volumen de ' + str_rounded(Wash_3.vol_well_original) + ' uL')
 
-    assign_wells(Elution)
-    ctx.comment('###############################################')
-    ctx.comment(' ')
+    run_log.debug('###############################################')
+    run_log.debug(' ')
 
     work_destinations           = deepwell_plate.rows()[0][:Sample.num_wells]
     final_destinations          = elution_plate.rows()[0][:Sample.num_wells]
@@ -597,24 +1531,77 @@ def run(ctx: protocol_api.ProtocolContext):
     # pipettes.
     m300 = ctx.load_instrument('p300_multi_gen2', 'right', tip_racks = tips300) # Load multi pipette
 
-    #### used tip counter and set maximum tips available
-    tip_track = {
-        'counts': {m300: 0},
-        'maxes': {m300: 96 * len(m300.tip_racks)}, #96 tips per tiprack * number or tipracks in the layout
-        'num_refills' : {m300 : 0},
-        'tips': { m300: [tip for rack in tips300 for tip in rack.rows()[0]]}
-    }
+    #### punta guardada para cada columna entre las operaciones de una cadena, ver tip_reuse
+    tip_reuse = TipReuse((['WASH_1', 'WASH_2', 'WASH_3'] if TIP_RECYCLING_IN_WASH else []) +
+                         (['ELUTION'] if TIP_RECYCLING_IN_ELUTION else []))
+
+    #### puntas que usa cada PASO, para reemplazar las cajas durante las esperas. La columna
+    #### parcial coge tantas puntas como muestras si una caja no tiene nada delante, ver next_tip
+    columns_tips = NUM_SAMPLES if partial_pickup_racks(m300, ctx.deck) else 8 * num_cols
+    tip_demand = {1: columns_tips, 2: columns_tips, 5: columns_tips, 7: columns_tips, 9: 0 if TIP_RECYCLING_IN_WASH else columns_tips,
+                  11: columns_tips, 13: 0 if TIP_RECYCLING_IN_WASH else columns_tips, 15: columns_tips,
+                  17: 0 if TIP_RECYCLING_IN_WASH else columns_tips, 20: columns_tips, 22: 0 if TIP_RECYCLING_IN_ELUTION else columns_tips}
+
+    #### puntas del protocolo: inventario de las cajas, contador y cajas reemplazadas en las esperas
+    tips = RunTips(ctx, m300, tip_rack_slots, NUM_SAMPLES, STEPS, tip_demand, tip_reuse, events, lights,
+                   NEW_TIPRACK_SLOTS if CONTINUE_TIPRACKS or RESUME_FROM_CHECKPOINT else tip_rack_slots, recycle_tip, 'es')
+
+    #### progreso guardado para continuar un protocolo detenido, ver checkpoint
+    checkpoint_reagents = [Lysis, Beads, Wash_1, Wash_2, Wash_3, Elution]
+    def save_checkpoint(step, column):
+        used_tips = tips.used + tips_before_resume
+        checkpoint.save(step, column, NUM_SAMPLES, checkpoint_reagents, used_tips, magdeck.status == 'engaged')
+
+    def resuming_columns():
+        '''
+        True si el protocolo continúa en las columnas del PASO actual
+        '''
+        return resume is not None and resume['step'] == STEP and resume['column'] is not None
+
+    def step_columns():
+        '''
+        Columnas del PASO, desde la que se detuvo si el protocolo continúa en ellas
+        '''
+        return range(resume['column'] if resuming_columns() else 0, num_cols)
+
+    def column_start(i):
+        save_checkpoint(STEP, i)
+        events.column_start(i + 1)
+
+    resume = checkpoint.load(NUM_SAMPLES) if RESUME_FROM_CHECKPOINT else None
+    if resume is not None and resume['step'] not in STEPS: # Detenido con todos los PASOS hechos
+        resume = None
+    tips_before_resume = 0
+    if resume is not None:
+        for s in STEPS:
+            if s < resume['step']:
+                STEPS[s]['Execute'] = False
+        restore_reagents(checkpoint_reagents, resume)
+        tips_before_resume = resume['tips']
+        where = 'el PASO ' + str(resume['step']) + ': ' + STEPS[resume['step']]['description']
+        if resume['column'] is not None:
+            where += ', columna ' + str(resume['column'] + 1)
+        run_log.operator('Continuando el protocolo detenido el ' + resume['updated'] + ' desde ' + where)
+        events.event('run_resumed', from_step = resume['step'], from_column = None if resume['column'] is None else resume['column'] + 1)
+        ctx.pause('Continuando desde ' + where + ('. Esa columna puede estar a medias, revísala' if resume['column'] is not None else '') + '.')
+
+    #### cajas de puntas a reemplazar durante la ejecución
+    first_step = min(s for s in STEPS if STEPS[s]['Execute'])
+    tips.start(run_log, first_step)
 
 ###############################################################################
-    start_run()
-    magdeck.disengage()
+    start_run(ctx, run_log, button = True, rails = not PHOTOSENSITIVE, language = 'es')
+    if resume is not None and resume['magnet']:
+        magdeck.engage(height = mag_height) # Como estaba al detenerse
+    else:
+        magdeck.disengage()
 
     ###############################################################################
     # STEP 1 Transferir lisis
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = log_step_start()
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
 
         lysis_trips = math.ceil(Lysis.reagent_volume / Lysis.max_volume_allowed)
         lysis_volume = Lysis.reagent_volume / lysis_trips
@@ -624,31 +1611,33 @@ def run(ctx: protocol_api.ProtocolContext):
         x_offset_source = 0
         x_offset_dest   = 0
 
-        for i in range(num_cols):
-            ctx.comment("Column: " + str(i))
+        for i in step_columns():
+            column_start(i)
+            run_log.debug("Column: " + str(i))
             if not m300.hw_pipette['has_tip']:
-                pick_up_tip(m300)
+                tips.pick_up(column_tips(NUM_SAMPLES, i))
             for j,transfer_vol in enumerate(lysis_transfer_vol):
                 #Calculate pickup_height based on remaining volume and shape of container
-                [pickup_height, change_col] = calc_height(Lysis, multi_well_rack_area, transfer_vol * 8)
-                ctx.comment('Aspirando desde la columna del reservorio: ' + str(Lysis.first_well + Lysis.col + 1))
-                ctx.comment('La altura de recogida es ' + str(round(pickup_height, 2)) + ' mm')
+                [pickup_height, change_col] = calc_height(Lysis, reservoir_heights, transfer_vol * column_tips(NUM_SAMPLES, i))
+                run_log.debug('Aspirando desde la columna del reservorio: ' + str(Lysis.first_well + Lysis.col + 1))
+                run_log.debug('La altura de recogida es ' + str(round(pickup_height, 2)) + ' mm')
                 move_vol_multi(m300, reagent = Lysis, source = Lysis.reagent_reservoir[Lysis.col],
                         dest = work_destinations[i], vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
                         pickup_height = pickup_height, blow_out = True, touch_tip = False, drop_height = 1)
             
             if LYSIS_NUM_MIXES > 0:
-                ctx.comment(' ')
-                ctx.comment('Mezclando muestra ')
+                run_log.debug(' ')
+                run_log.debug('Mezclando muestra ')
                 custom_mix(m300, Lysis, location = work_destinations[i], vol =  Lysis.max_volume_allowed,
                         rounds = LYSIS_NUM_MIXES, blow_out = False, mix_height = 1, offset = 0)
             
             m300.move_to(work_destinations[i].top(0))
             m300.air_gap(Lysis.air_gap_vol_bottom) #air gap
             
-            drop_tip(m300)      
+            tips.drop()
             
-        log_step_end(start)
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
         ###############################################################################
         # STEP 1 Transferir lisis
         ########
@@ -658,7 +1647,7 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = log_step_start()
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
 
         beads_trips = math.ceil(Beads.reagent_volume / Beads.max_volume_allowed)
         beads_volume = Beads.reagent_volume / beads_trips
@@ -669,46 +1658,50 @@ def run(ctx: protocol_api.ProtocolContext):
         x_offset_dest   = 0
         first_mix_done = False
 
-        for i in range(num_cols):
-            ctx.comment("Column: " + str(i))
+        for i in step_columns():
+            column_start(i)
+            run_log.debug("Column: " + str(i))
             if not m300.hw_pipette['has_tip']:
-                pick_up_tip(m300)
+                tips.pick_up(column_tips(NUM_SAMPLES, i))
             for j,transfer_vol in enumerate(beads_transfer_vol):
                 #Calculate pickup_height based on remaining volume and shape of container
                 # transfer_vol_extra = transfer_vol if j > 0 else transfer_vol + 100  # Extra 100 isopropanol for calcs
                 # [pickup_height, change_col] = calc_height(Beads, multi_well_rack_area, transfer_vol_extra * 8)    
-                [pickup_height, change_col] = calc_height(Beads, multi_well_rack_area, transfer_vol * 8)    
+                [pickup_height, change_col] = calc_height(Beads, reservoir_heights, transfer_vol * column_tips(NUM_SAMPLES, i))    
                 if change_col == True or not first_mix_done: #If we switch column because there is not enough volume left in current reservoir column we mix new column
-                    ctx.comment('Mezclando nuevo canal del reservorio: ' + str(Beads.first_well + Beads.col))
+                    run_log.debug('Mezclando nuevo canal del reservorio: ' + str(Beads.first_well + Beads.col))
                     custom_mix(m300, Beads, Beads.reagent_reservoir[Beads.col],
                             vol = Beads.max_volume_allowed, rounds = BEADS_WELL_FIRST_TIME_NUM_MIXES, 
                             blow_out = False, mix_height = 1.5, offset = 0)
                     first_mix_done = True
                 else:
-                    ctx.comment('Mezclando canal del reservorio: ' + str(Beads.first_well + Beads.col))
+                    run_log.debug('Mezclando canal del reservorio: ' + str(Beads.first_well + Beads.col))
                     mix_height = 1.5 if pickup_height > 1.5 else pickup_height
                     custom_mix(m300, Beads, Beads.reagent_reservoir[Beads.col],
                             vol = Beads.max_volume_allowed, rounds = BEADS_WELL_NUM_MIXES, 
                             blow_out = False, mix_height = mix_height, offset = 0)
 
-                ctx.comment('Aspirando desde la columna del reservorio: ' + str(Beads.first_well + Beads.col))
-                ctx.comment('La altura de recogida es ' + str(round(pickup_height, 2)) + ' mm')
+                run_log.debug('Aspirando desde la columna del reservorio: ' + str(Beads.first_well + Beads.col))
+                run_log.debug('La altura de recogida es ' + str(round(pickup_height, 2)) + ' mm')
                 move_vol_multi(m300, reagent = Beads, source = Beads.reagent_reservoir[Beads.col],
                         dest = work_destinations[i], vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
                         pickup_height = pickup_height, blow_out = True, touch_tip = False, drop_height = 1)
             
+            incubations.record_dose('BEADS', i)
+
             if BEADS_NUM_MIXES > 0:
-                ctx.comment(' ')
-                ctx.comment('Mezclando muestra ')
+                run_log.debug(' ')
+                run_log.debug('Mezclando muestra ')
                 custom_mix(m300, Beads, location = work_destinations[i], vol =  Beads.max_volume_allowed,
                         rounds = BEADS_NUM_MIXES, blow_out = False, mix_height = 1, offset = 0, wait_time = 2)
             
             m300.move_to(work_destinations[i].top(0))
             m300.air_gap(Beads.air_gap_vol_bottom) #air gap
 
-            drop_tip(m300)      
+            tips.drop()
             
-        log_step_end(start)
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
         ###############################################################################
         # STEP 2 Transferir bolas magnéticas
         ########
@@ -718,13 +1711,15 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = log_step_start()
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
 
-        ctx.comment(' ')
-        ctx.delay(seconds=STEPS[STEP]['wait_time'], msg='Espera durante ' + format(STEPS[STEP]['wait_time']) + ' segundos.') # 
-        ctx.comment(' ')
+        run_log.debug(' ')
+        tips.refill_break(STEP)
+        incubations.delay('BEADS', STEPS[STEP]['wait_time'], msg = 'Espera')
+        run_log.debug(' ')
 
-        log_step_end(start)
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
         ###############################################################################
         # STEP 3 Espera
         ########
@@ -734,14 +1729,16 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = log_step_start()
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
 
-        ctx.comment(' ')
+        run_log.debug(' ')
         magdeck.engage(height = mag_height)
-        ctx.delay(seconds = STEPS[STEP]['wait_time'], msg = 'Incubación con el imán ON durante ' + format(STEPS[STEP]['wait_time']) + ' segundos.')
-        ctx.comment(' ')
+        paused = tips.refill_break(STEP)
+        ctx.delay(seconds = max(0, STEPS[STEP]['wait_time'] - paused), msg = 'Incubación con el imán ON durante ' + format(STEPS[STEP]['wait_time']) + ' segundos.')
+        run_log.debug(' ')
 
-        log_step_end(start)
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
         ###############################################################################
         # STEP 4 Incubación con el imán ON
         ########
@@ -751,7 +1748,7 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = log_step_start()
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
 
         total_supernatant_volume = Sample.reagent_volume
         if LYSIS_VOLUME_PER_SAMPLE > 0:
@@ -759,37 +1756,36 @@ def run(ctx: protocol_api.ProtocolContext):
         if BEADS_VOLUME_PER_SAMPLE > 0:
             total_supernatant_volume += Beads.reagent_volume
 
-        supernatant_trips = math.ceil((total_supernatant_volume) / Sample.max_volume_allowed)
-        supernatant_volume = Sample.max_volume_allowed # We try to remove an exceeding amount of supernatant to make sure it is empty
-        supernatant_transfer_vol = []
-        for i in range(supernatant_trips):
-            supernatant_transfer_vol.append(supernatant_volume + Sample.disposal_volume)
+        supernatant_trips = plan_supernatant_trips(deepwell_heights, total_supernatant_volume, Sample.max_volume_allowed, supernatant_extra_vol, supernatant_follow_depth, supernatant_final_height)
         
         x_offset_rs = 2
-        pickup_height = 0.5 # Original 0.5
 
-        for i in range(num_cols):
+        for i in step_columns():
+            column_start(i)
             x_offset_source = find_side(i) * x_offset_rs
             x_offset_dest   = 0
             not_first_transfer = False
 
             if not m300.hw_pipette['has_tip']:
-                pick_up_tip(m300)
-            for transfer_vol in supernatant_transfer_vol:
-                ctx.comment('Aspirando de la columna del deepwell: ' + str(i+1))
-                ctx.comment('La altura de recogida es ' + str(round(pickup_height, 2)) + ' mm' )
+                tips.pick_up(column_tips(NUM_SAMPLES, i))
+            for transfer_vol, pickup_height, near_pellet in supernatant_trips:
+                run_log.debug('Aspirando de la columna del deepwell: ' + str(i+1))
+                run_log.debug('La altura de recogida es ' + str(round(pickup_height, 2)) + ' mm' )
 
-                move_vol_multi(m300, reagent = Sample, source = work_destinations[i], dest = waste, vol = transfer_vol,
+                move_vol_multi(m300, reagent = Sample, source = work_destinations[i], dest = waste, vol = transfer_vol + Sample.disposal_volume,
                         x_offset_source = x_offset_source, x_offset_dest = x_offset_dest, pickup_height = pickup_height,
-                        wait_time = 2, blow_out = True, drop_height = waste_drop_height,
-                        dispense_bottom_air_gap_before = not_first_transfer)
+                        wait_time = 2 if near_pellet else 0, blow_out = True, drop_height = waste_drop_height,
+                        dispense_bottom_air_gap_before = not_first_transfer,
+                        aspirate_rate = Sample.flow_rate_aspirate if near_pellet else supernatant_fast_rate)
                 m300.move_to(waste.top(z = waste_drop_height))
                 m300.air_gap(Sample.air_gap_vol_bottom)
                 not_first_transfer = True
 
-            drop_tip(m300)
+            tips.drop()
+            incubations.record_dose('DRY', i)
 
-        log_step_end(start)
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
         ###############################################################################
         # STEP 5 Desechar sobrenadante
         ########
@@ -799,12 +1795,13 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = log_step_start()
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
 
         # Imán OFF
         magdeck.disengage()
 
-        log_step_end(start)
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
         ###############################################################################
         # STEP 6 Imán OFF
         ########
@@ -814,7 +1811,7 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = log_step_start()
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
 
         wash_trips = math.ceil(Wash_1.reagent_volume / Wash_1.max_volume_allowed)
         wash_volume = Wash_1.reagent_volume / wash_trips #136.66
@@ -824,15 +1821,14 @@ def run(ctx: protocol_api.ProtocolContext):
         x_offset_rs = 2.5
         pickup_height = 0.5
 
-        for i in range(num_cols):
+        for i in step_columns():
+            column_start(i)
             x_offset_source = 0
             x_offset_dest   = -1 * find_side(i) * x_offset_rs
             if not m300.hw_pipette['has_tip']:
-                pick_up_tip(m300)
-                if TIP_RECYCLING_IN_WASH:
-                    w1_tip_pos_list += [tip_track['tips'][m300][int(tip_track['counts'][m300] / 8)]]
+                tips.pick_up_column('WASH_1', i)
             for transfer_vol in wash_transfer_vol:
-                ctx.comment('Aspirando desde el reservorio del slot 8')
+                run_log.debug('Aspirando desde el reservorio del slot 8')
 
                 move_vol_multi(m300, reagent = Wash_1, source = Wash_1.reagent_reservoir, dest = work_destinations[i],
                         vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
@@ -845,9 +1841,10 @@ def run(ctx: protocol_api.ProtocolContext):
             m300.move_to(work_destinations[i].top(0))
             m300.air_gap(Wash_1.air_gap_vol_bottom) #air gap
 
-            drop_tip(m300, recycle = TIP_RECYCLING_IN_WASH)
+            tips.drop_column('WASH_1', i, keep = True)
 
-        log_step_end(start)
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
         ###############################################################################
         # STEP 7 Transferir primer lavado
         ########
@@ -857,13 +1854,15 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = log_step_start()
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
 
         # switch on magnet
         magdeck.engage(mag_height)
-        ctx.delay(seconds=STEPS[STEP]['wait_time'], msg='Incubación con el imán ON durante ' + format(STEPS[STEP]['wait_time']) + ' segundos.')
+        paused = tips.refill_break(STEP)
+        ctx.delay(seconds = max(0, STEPS[STEP]['wait_time'] - paused), msg = 'Incubación con el imán ON durante ' + format(STEPS[STEP]['wait_time']) + ' segundos.')
 
-        log_step_end(start)
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
         ####################################################################
         # STEP 8 Incubación con el imán ON
         ########
@@ -873,43 +1872,38 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = log_step_start()
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
 
-        supernatant_trips = math.ceil(Wash_1.reagent_volume / Wash_1.max_volume_allowed)
-        supernatant_volume = Wash_1.max_volume_allowed # We try to remove an exceeding amount of supernatant to make sure it is empty
-        supernatant_transfer_vol = []
-        for i in range(supernatant_trips):
-            supernatant_transfer_vol.append(supernatant_volume + Sample.disposal_volume)
+        supernatant_trips = plan_supernatant_trips(deepwell_heights, Wash_1.reagent_volume, Wash_1.max_volume_allowed, supernatant_extra_vol, supernatant_follow_depth, supernatant_final_height)
         
         x_offset_rs = 2
-        pickup_height = 0.5 # Original 0.5
 
-        for i in range(num_cols):
+        for i in step_columns():
+            column_start(i)
             x_offset_source = find_side(i) * x_offset_rs
             x_offset_dest   = 0
             not_first_transfer = False
 
             if not m300.hw_pipette['has_tip']:
-                if TIP_RECYCLING_IN_WASH:
-                    pick_up_tip(m300, w1_tip_pos_list[i])
+                if tips.pick_up_column('WASH_1', i):
                     m300.dispense(Wash_1.air_gap_vol_top, work_destinations[i].top(z = 0), rate = Wash_1.flow_rate_dispense)
-                else:
-                    pick_up_tip(m300)
-            for transfer_vol in supernatant_transfer_vol:
-                #Pickup_height is fixed here
-                ctx.comment('Aspirando de la columna del deepwell: ' + str(i+1))
-                ctx.comment('La altura de recogida es ' + str(round(pickup_height, 2)) + ' mm' )
-                move_vol_multi(m300, reagent = Sample, source = work_destinations[i], dest = waste, vol = transfer_vol,
+            for transfer_vol, pickup_height, near_pellet in supernatant_trips:
+                run_log.debug('Aspirando de la columna del deepwell: ' + str(i+1))
+                run_log.debug('La altura de recogida es ' + str(round(pickup_height, 2)) + ' mm' )
+                move_vol_multi(m300, reagent = Sample, source = work_destinations[i], dest = waste, vol = transfer_vol + Sample.disposal_volume,
                         x_offset_source = x_offset_source, x_offset_dest = x_offset_dest, pickup_height = pickup_height, 
-                        wait_time = 2, blow_out = False, drop_height = waste_drop_height,
-                        dispense_bottom_air_gap_before = not_first_transfer)
+                        wait_time = 2 if near_pellet else 0, blow_out = False, drop_height = waste_drop_height,
+                        dispense_bottom_air_gap_before = not_first_transfer,
+                        aspirate_rate = Sample.flow_rate_aspirate if near_pellet else supernatant_fast_rate)
                 m300.move_to(waste.top(z = waste_drop_height))
                 m300.air_gap(Sample.air_gap_vol_bottom)
                 not_first_transfer = True
 
-            drop_tip(m300, increment_count = not TIP_RECYCLING_IN_WASH)
+            tips.drop_column('WASH_1', i, keep = False)
+            incubations.record_dose('DRY', i)
 
-        log_step_end(start)
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
         ###############################################################################
         # STEP 9 Desechar sobrenadante
         ########
@@ -919,12 +1913,13 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = log_step_start()
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
 
         # Imán OFF
         magdeck.disengage()
 
-        log_step_end(start)
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
         ###############################################################################
         # STEP 10 Imán OFF
         ########
@@ -934,7 +1929,7 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = log_step_start()
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
 
         wash_trips = math.ceil(Wash_2.reagent_volume / Wash_2.max_volume_allowed)
         wash_volume = Wash_2.reagent_volume / wash_trips #136.66
@@ -944,15 +1939,14 @@ def run(ctx: protocol_api.ProtocolContext):
         x_offset_rs = 2.5
         pickup_height = 0.5
 
-        for i in range(num_cols):
+        for i in step_columns():
+            column_start(i)
             x_offset_source = 0
             x_offset_dest   = -1 * find_side(i) * x_offset_rs
             if not m300.hw_pipette['has_tip']:
-                pick_up_tip(m300)
-                if TIP_RECYCLING_IN_WASH:
-                    w2_tip_pos_list += [tip_track['tips'][m300][int(tip_track['counts'][m300] / 8)]]
+                tips.pick_up_column('WASH_2', i)
             for transfer_vol in wash_transfer_vol:
-                ctx.comment('Aspirando desde el reservorio del slot 10')
+                run_log.debug('Aspirando desde el reservorio del slot 10')
 
                 move_vol_multi(m300, reagent = Wash_2, source = Wash_2.reagent_reservoir, dest = work_destinations[i],
                         vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
@@ -965,9 +1959,10 @@ def run(ctx: protocol_api.ProtocolContext):
             m300.move_to(work_destinations[i].top(0))
             m300.air_gap(Wash_2.air_gap_vol_bottom) #air gap
 
-            drop_tip(m300, recycle = TIP_RECYCLING_IN_WASH)
+            tips.drop_column('WASH_2', i, keep = True)
 
-        log_step_end(start)
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
         ###############################################################################
         # STEP 11 ADD WASH
         ########
@@ -977,13 +1972,15 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = log_step_start()
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
 
         # switch on magnet
         magdeck.engage(mag_height)
-        ctx.delay(seconds=STEPS[STEP]['wait_time'], msg='Incubación con el imán ON durante ' + format(STEPS[STEP]['wait_time']) + ' segundos.')
+        paused = tips.refill_break(STEP)
+        ctx.delay(seconds = max(0, STEPS[STEP]['wait_time'] - paused), msg = 'Incubación con el imán ON durante ' + format(STEPS[STEP]['wait_time']) + ' segundos.')
 
-        log_step_end(start)
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
         ####################################################################
         # STEP 12 Incubación con el imán ON
         ########
@@ -993,43 +1990,38 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = log_step_start()
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
 
-        supernatant_trips = math.ceil(Wash_2.reagent_volume / Wash_2.max_volume_allowed)
-        supernatant_volume = Wash_2.max_volume_allowed # We try to remove an exceeding amount of supernatant to make sure it is empty
-        supernatant_transfer_vol = []
-        for i in range(supernatant_trips):
-            supernatant_transfer_vol.append(supernatant_volume + Sample.disposal_volume)
+        supernatant_trips = plan_supernatant_trips(deepwell_heights, Wash_2.reagent_volume, Wash_2.max_volume_allowed, supernatant_extra_vol, supernatant_follow_depth, supernatant_final_height)
         
         x_offset_rs = 2
-        pickup_height = 0.5 # Original 0.5
 
-        for i in range(num_cols):
+        for i in step_columns():
+            column_start(i)
             x_offset_source = find_side(i) * x_offset_rs
             x_offset_dest   = 0
             not_first_transfer = False
 
             if not m300.hw_pipette['has_tip']:
-                if TIP_RECYCLING_IN_WASH:
-                    pick_up_tip(m300, w2_tip_pos_list[i])
+                if tips.pick_up_column('WASH_2', i):
                     m300.dispense(Wash_2.air_gap_vol_top, work_destinations[i].top(z = 0), rate = Wash_2.flow_rate_dispense)
-                else:
-                    pick_up_tip(m300)
-            for transfer_vol in supernatant_transfer_vol:
-                #Pickup_height is fixed here
-                ctx.comment('Aspirando de la columna del deepwell: ' + str(i+1))
-                ctx.comment('La altura de recogida es ' + str(round(pickup_height, 2)) + ' mm' )
-                move_vol_multi(m300, reagent = Sample, source = work_destinations[i], dest = waste, vol = transfer_vol,
+            for transfer_vol, pickup_height, near_pellet in supernatant_trips:
+                run_log.debug('Aspirando de la columna del deepwell: ' + str(i+1))
+                run_log.debug('La altura de recogida es ' + str(round(pickup_height, 2)) + ' mm' )
+                move_vol_multi(m300, reagent = Sample, source = work_destinations[i], dest = waste, vol = transfer_vol + Sample.disposal_volume,
                         x_offset_source = x_offset_source, x_offset_dest = x_offset_dest, pickup_height = pickup_height,
-                        wait_time = 2, blow_out = False, dispense_bottom_air_gap_before = not_first_transfer, 
+                        wait_time = 2 if near_pellet else 0, blow_out = False, dispense_bottom_air_gap_before = not_first_transfer,
+                        aspirate_rate = Sample.flow_rate_aspirate if near_pellet else supernatant_fast_rate,
                         drop_height = waste_drop_height)
                 m300.move_to(waste.top(z = waste_drop_height))
                 m300.air_gap(Sample.air_gap_vol_bottom)
                 not_first_transfer = True
 
-            drop_tip(m300, increment_count = not TIP_RECYCLING_IN_WASH)
+            tips.drop_column('WASH_2', i, keep = False)
+            incubations.record_dose('DRY', i)
 
-        log_step_end(start)
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
         ###############################################################################
         # STEP 13 Desechar sobrenadante
         ########
@@ -1039,12 +2031,13 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = log_step_start()
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
 
         # Imán OFF
         magdeck.disengage()
 
-        log_step_end(start)
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
         ###############################################################################
         # STEP 14 Imán OFF
         ########
@@ -1054,7 +2047,7 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = log_step_start()
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
 
         wash_trips = math.ceil(Wash_3.reagent_volume / Wash_3.max_volume_allowed)
         wash_volume = Wash_3.reagent_volume / wash_trips #136.66
@@ -1064,15 +2057,14 @@ def run(ctx: protocol_api.ProtocolContext):
         x_offset_rs = 2.5
         pickup_height = 0.5
 
-        for i in range(num_cols):
+        for i in step_columns():
+            column_start(i)
             x_offset_source = 0
             x_offset_dest   = -1 * find_side(i) * x_offset_rs
             if not m300.hw_pipette['has_tip']:
-                pick_up_tip(m300)
-                if TIP_RECYCLING_IN_WASH:
-                    w3_tip_pos_list += [tip_track['tips'][m300][int(tip_track['counts'][m300] / 8)]]
+                tips.pick_up_column('WASH_3', i)
             for transfer_vol in wash_transfer_vol:
-                ctx.comment('Aspirando desde el reservorio del slot 11')
+                run_log.debug('Aspirando desde el reservorio del slot 11')
 
                 move_vol_multi(m300, reagent = Wash_3, source = Wash_3.reagent_reservoir, dest = work_destinations[i],
                         vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
@@ -1085,9 +2077,10 @@ def run(ctx: protocol_api.ProtocolContext):
             m300.move_to(work_destinations[i].top(0))
             m300.air_gap(Wash_3.air_gap_vol_bottom) #air gap
 
-            drop_tip(m300, recycle = TIP_RECYCLING_IN_WASH)
+            tips.drop_column('WASH_3', i, keep = True)
 
-        log_step_end(start)
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
         ###############################################################################
         # STEP 15 Transferir tercer lavado
         ########
@@ -1097,13 +2090,15 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = log_step_start()
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
 
         # switch on magnet
         magdeck.engage(mag_height)
-        ctx.delay(seconds=STEPS[STEP]['wait_time'], msg='Incubación con el imán ON durante ' + format(STEPS[STEP]['wait_time']) + ' segundos.')
+        paused = tips.refill_break(STEP)
+        ctx.delay(seconds = max(0, STEPS[STEP]['wait_time'] - paused), msg = 'Incubación con el imán ON durante ' + format(STEPS[STEP]['wait_time']) + ' segundos.')
 
-        log_step_end(start)
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
         ####################################################################
         # STEP 16 Incubación con el imán ON
         ########
@@ -1113,42 +2108,37 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = log_step_start()
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
 
-        supernatant_trips = math.ceil(Wash_3.reagent_volume / Wash_3.max_volume_allowed)
-        supernatant_volume = Wash_3.max_volume_allowed # We try to remove an exceeding amount of supernatant to make sure it is empty
-        supernatant_transfer_vol = []
-        for i in range(supernatant_trips):
-            supernatant_transfer_vol.append(supernatant_volume + Sample.disposal_volume)
+        supernatant_trips = plan_supernatant_trips(deepwell_heights, Wash_3.reagent_volume, Wash_3.max_volume_allowed, supernatant_extra_vol, supernatant_follow_depth, supernatant_final_height)
         
         x_offset_rs = 2
-        pickup_height = 0.5 # Original 0.5
 
-        for i in range(num_cols):
+        for i in step_columns():
+            column_start(i)
             x_offset_source = find_side(i) * x_offset_rs
             x_offset_dest   = 0
             not_first_transfer = False
 
             if not m300.hw_pipette['has_tip']:
-                if TIP_RECYCLING_IN_WASH:
-                    pick_up_tip(m300, w3_tip_pos_list[i])
-                else:
-                    pick_up_tip(m300)
-            for transfer_vol in supernatant_transfer_vol:
-                #Pickup_height is fixed here
-                ctx.comment('Aspirando de la columna del deepwell: ' + str(i+1))
-                ctx.comment('La altura de recogida es ' + str(round(pickup_height, 2)) + ' mm' )
+                tips.pick_up_column('WASH_3', i)
+            for transfer_vol, pickup_height, near_pellet in supernatant_trips:
+                run_log.debug('Aspirando de la columna del deepwell: ' + str(i+1))
+                run_log.debug('La altura de recogida es ' + str(round(pickup_height, 2)) + ' mm' )
                 move_vol_multi(m300, reagent = Sample, source = work_destinations[i],
-                    dest = waste, vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
-                    pickup_height = pickup_height, wait_time = 2, blow_out = False, drop_height = waste_drop_height,
-                    dispense_bottom_air_gap_before = not_first_transfer)
+                    dest = waste, vol = transfer_vol + Sample.disposal_volume, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
+                    pickup_height = pickup_height, wait_time = 2 if near_pellet else 0, blow_out = False, drop_height = waste_drop_height,
+                    dispense_bottom_air_gap_before = not_first_transfer,
+                    aspirate_rate = Sample.flow_rate_aspirate if near_pellet else supernatant_fast_rate)
                 m300.move_to(waste.top(z = waste_drop_height))
                 m300.air_gap(Sample.air_gap_vol_bottom)
                 not_first_transfer = True
 
-            drop_tip(m300, increment_count = not TIP_RECYCLING_IN_WASH)
+            tips.drop_column('WASH_3', i, keep = False)
+            incubations.record_dose('DRY', i)
 
-        log_step_end(start)
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
         ###############################################################################
         # STEP 17 Desechar sobrenadante
         ########
@@ -1158,13 +2148,15 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = log_step_start()
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
 
-        ctx.comment(' ')
-        ctx.delay(seconds=STEPS[STEP]['wait_time'], msg='Secado durante ' + format(STEPS[STEP]['wait_time']) + ' segundos.') # 
-        ctx.comment(' ')
+        run_log.debug(' ')
+        tips.refill_break(STEP)
+        incubations.delay('DRY', STEPS[STEP]['wait_time'], msg = 'Secado')
+        run_log.debug(' ')
 
-        log_step_end(start)
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
         ###############################################################################
         # STEP 18 Secado
         ########
@@ -1174,12 +2166,13 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = log_step_start()
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
 
         # Imán OFF
         magdeck.disengage()
 
-        log_step_end(start)
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
         ###############################################################################
         # STEP 19 Imán OFF
         ########
@@ -1189,7 +2182,7 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = log_step_start()
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
 
         elution_trips = math.ceil(Elution.reagent_volume / Elution.max_volume_allowed)
         elution_volume = Elution.reagent_volume / elution_trips
@@ -1200,35 +2193,35 @@ def run(ctx: protocol_api.ProtocolContext):
 
         ########
         # Water or elution buffer
-        for i in range(num_cols):
+        for i in step_columns():
+            column_start(i)
             x_offset_source = 0
             x_offset_dest   = -1 * find_side(i) * x_offset_rs # Original 0
             if not m300.hw_pipette['has_tip']:
-                pick_up_tip(m300)
-                if TIP_RECYCLING_IN_ELUTION:
-                    elution_tip_pos_list += [tip_track['tips'][m300][int(tip_track['counts'][m300] / 8)]]
+                tips.pick_up_column('ELUTION', i)
             for transfer_vol in elution_wash_vol:
                 #Calculate pickup_height based on remaining volume and shape of container
-                [pickup_height, change_col] = calc_height(Elution, multi_well_rack_area, transfer_vol*8)
-                ctx.comment('Aspirando desde la columna del reservorio: ' + str(Elution.first_well + Elution.col))
-                ctx.comment('La altura de recogida es ' + str(round(pickup_height, 2)) + ' mm')
+                [pickup_height, change_col] = calc_height(Elution, reservoir_heights, transfer_vol * column_tips(NUM_SAMPLES, i))
+                run_log.debug('Aspirando desde la columna del reservorio: ' + str(Elution.first_well + Elution.col))
+                run_log.debug('La altura de recogida es ' + str(round(pickup_height, 2)) + ' mm')
 
                 move_vol_multi(m300, reagent = Elution, source = Elution.reagent_reservoir[Elution.col], dest = work_destinations[i],
                         vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
                         pickup_height = pickup_height, blow_out = False, drop_height = -35)
             
             if ELUTION_NUM_MIXES > 0:
-                ctx.comment(' ')
-                ctx.comment('Mezclando muestra con Elution')
+                run_log.debug(' ')
+                run_log.debug('Mezclando muestra con Elution')
                 custom_mix(m300, Elution, work_destinations[i], vol = Elution.reagent_volume, rounds = ELUTION_NUM_MIXES,
                         blow_out = False, mix_height = 1, offset = x_offset_dest, drop_height = -35)
             
             m300.move_to(work_destinations[i].top(0))
             m300.air_gap(Elution.air_gap_vol_bottom) #air gap
             
-            drop_tip(m300, recycle = TIP_RECYCLING_IN_ELUTION)
+            tips.drop_column('ELUTION', i, keep = True)
             
-        log_step_end(start)
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
         ###############################################################################
         # STEP 20 Transferir elución
         ########
@@ -1238,13 +2231,15 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = log_step_start()
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
 
         # switch on magnet
         magdeck.engage(mag_height)
-        ctx.delay(seconds=STEPS[STEP]['wait_time'], msg='Incubación con el imán ON durante ' + format(STEPS[STEP]['wait_time']) + ' segundos.')
+        paused = tips.refill_break(STEP)
+        ctx.delay(seconds = max(0, STEPS[STEP]['wait_time'] - paused), msg = 'Incubación con el imán ON durante ' + format(STEPS[STEP]['wait_time']) + ' segundos.')
 
-        log_step_end(start)
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
         ####################################################################
         # STEP 21 Incubación con el imán ON
         ########
@@ -1254,7 +2249,10 @@ def run(ctx: protocol_api.ProtocolContext):
     ########
     STEP += 1
     if STEPS[STEP]['Execute']==True:
-        start = log_step_start()
+        start = log_step_start(run_log, events, STEPS, STEP, 'es')
+
+        if SET_TEMP_ON == True:
+            await_temperature(run_log, tempdeck, TEMPERATURE, 'es')
 
         elution_trips = math.ceil(ELUTION_FINAL_VOLUME_PER_SAMPLE / Elution.max_volume_allowed)
         elution_volume = ELUTION_FINAL_VOLUME_PER_SAMPLE / elution_trips
@@ -1262,20 +2260,18 @@ def run(ctx: protocol_api.ProtocolContext):
         for i in range(elution_trips):
             elution_vol.append(elution_volume + Elution.disposal_volume)
         x_offset_rs = 2
-        for i in range(num_cols):
+        for i in step_columns():
+            column_start(i)
             x_offset_source = find_side(i) * x_offset_rs
             x_offset_dest   = 0
             if not m300.hw_pipette['has_tip']:
-                if TIP_RECYCLING_IN_ELUTION:
-                    pick_up_tip(m300, elution_tip_pos_list[i])
+                if tips.pick_up_column('ELUTION', i):
                     m300.dispense(Elution.air_gap_vol_top, work_destinations[i].top(z = 0), rate = Elution.flow_rate_dispense)
-                else:
-                    pick_up_tip(m300)
             for transfer_vol in elution_vol:
                 #Pickup_height is fixed here
                 pickup_height = 1
-                ctx.comment('Aspirando de la columna del deepwell: ' + str(i+1))
-                ctx.comment('La altura de recogida es ' + str(round(pickup_height, 2)) + ' mm' )
+                run_log.debug('Aspirando de la columna del deepwell: ' + str(i+1))
+                run_log.debug('La altura de recogida es ' + str(round(pickup_height, 2)) + ' mm' )
 
                 move_vol_multi(m300, reagent = Sample, source = work_destinations[i],
                         dest = final_destinations[i], vol = transfer_vol, x_offset_source = x_offset_source, x_offset_dest = x_offset_dest,
@@ -1284,12 +2280,10 @@ def run(ctx: protocol_api.ProtocolContext):
             m300.move_to(final_destinations[i].top(0))
             m300.air_gap(Sample.air_gap_vol_bottom) #air gap
 
-            drop_tip(m300, increment_count = not TIP_RECYCLING_IN_ELUTION)
-
-        if SET_TEMP_ON == True:
-            tempdeck.set_temperature(TEMPERATURE)
+            tips.drop_column('ELUTION', i, keep = False)
 
-        log_step_end(start)
+        log_step_end(run_log, events, STEPS, STEP, start, 'es')
+        save_checkpoint(STEP + 1, None)
 
         ###############################################################################
         # STEP 22 Transferir elución a la placa
@@ -1297,23 +2291,13 @@ def run(ctx: protocol_api.ProtocolContext):
 
 
     magdeck.disengage()
-    ctx.comment(' ')
-    ctx.comment('###############################################')
-    ctx.comment('Homing robot')
-    ctx.comment('###############################################')
-    ctx.comment(' ')
+    run_log.banner('Homing robot')
     ctx.home()
 ###############################################################################
-    # Export the time log to a tsv file
+    # Luz azul y parpadeo de fin del protocolo
+    ctx._hw_manager.hardware.set_lights(button = True, rails = False)
+    lights.start('finished', times = 10, end = {'button': True, 'rails': False} if switch_off_lights else None)
+    finish_run(run_log, events, checkpoint, STEPS, tips.used + tips_before_resume, None if ctx.is_simulating() else file_path, 'es')
     if not ctx.is_simulating():
-        with open(file_path, 'w') as f:
-            f.write('STEP\texecution\tdescription\twait_time\texecution_time\n')
-            for key in STEPS.keys():
-                row = str(key)
-                for key2 in STEPS[key].keys():
-                    row += '\t' + format(STEPS[key][key2])
-                f.write(row + '\n')
-        f.close()
-
-    ############################################################################
-    finish_run(switch_off_lights)
\ No newline at end of file
+        for i in range(SOUND_NUM_PLAYS): # Every minute, without holding the run
+            play_sound('finalizado', delay = 60 if i > 0 else 0)
\ No newline at end of file
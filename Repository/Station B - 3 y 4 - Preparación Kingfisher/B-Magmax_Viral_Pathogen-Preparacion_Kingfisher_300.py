@@ -3,11 +3,7 @@ from opentrons.types import Point
 from opentrons import protocol_api
 import subprocess
 import time
-import numpy as np
-from timeit import default_timer as timer
-import json
 from datetime import datetime
-import csv
 
 # metadata
 metadata = {
@@ -4,8 +4,6 @@ from opentrons import protocol_api
 import subprocess
 import time
 import os
-import numpy as np
-from timeit import default_timer as timer
 from datetime import datetime
 
 # metadata
@@ -31,6 +29,7 @@ VOLUME_SAMPLE               = 5     # Volume of the sample
 
 SOUND_NUM_PLAYS             = 1
 PHOTOSENSITIVE              = True # True if it has photosensitive reagents
+RESUME_FROM_WELL_MAP        = False # Restart a stopped run with the wells not done (well_map.json of its folder)
 ################################################
 
 run_id                      = 'C-Certest'
@@ -49,6 +48,97 @@ SHORT_TUBE_PHEIGHT          = 22
 
 size_transfer = math.floor(pipette_allowed_capacity / HYDR_VOL_PER_SAMPLE) # Number of wells the distribute function will fill
 
+# >>> well_map.py
+import json
+import os
+from datetime import datetime
+
+WELL_MAP_STAGES     = ['hydrated', 'mastermix', 'sample', 'controls']
+WELL_MAP_MAX_AGE    = 12 * 3600 # seconds after its last save a map is resumed
+WELL_MAP_FORMAT     = '%Y/%m/%d %H:%M:%S'
+
+
+def well_column(name):
+    return name.lstrip('ABCDEFGHIJKLMNOP')
+
+
+class WellMap:
+    def __init__(self, path, wells, num_samples, protocol = None):
+        self.path = path
+        self.names = [well.well_name for well in wells]
+        self.num_samples = num_samples
+        self.protocol = protocol
+        self.columns = {}
+        for name in self.names:
+            self.columns.setdefault(well_column(name), []).append(name)
+        self.done = {stage: set() for stage in WELL_MAP_STAGES}
+        self.unsaved = None # (stage, column) of the wells marked and not saved yet
+        self.updated = None
+
+    def load(self, max_age = WELL_MAP_MAX_AGE):
+        '''
+        Wells done by a stopped run, True when there are any
+        '''
+        if self.path is None:
+            return False
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            age = (datetime.now() - datetime.strptime(state['updated'], WELL_MAP_FORMAT)).total_seconds()
+        except (IOError, ValueError, KeyError):
+            return False
+        if state.get('protocol') != self.protocol or state.get('num_samples') != self.num_samples \
+                or state.get('wells') != self.names or age > max_age:
+            return False
+        for stage, bitmap in state['stages'].items():
+            self.done[stage] = {name for name, bit in zip(self.names, bitmap) if bit == '1'}
+        self.updated = state['updated']
+        return any(self.done.values())
+
+    def is_done(self, stage, well):
+        return well.well_name in self.done[stage]
+
+    def pending(self, stage, wells):
+        return [well for well in wells if not self.is_done(stage, well)]
+
+    def mark(self, stage, wells):
+        '''
+        Record wells of stage as done, saving the map once per column
+        '''
+        for well in wells:
+            key = (stage, well_column(well.well_name))
+            if self.unsaved is not None and self.unsaved != key:
+                self.save()
+            self.done[stage].add(well.well_name)
+            self.unsaved = key
+        if self.unsaved is not None and all(name in self.done[self.unsaved[0]] for name in self.columns[self.unsaved[1]]):
+            self.save()
+
+    def save(self):
+        self.unsaved = None
+        if self.path is None:
+            return
+        self.updated = datetime.now().strftime(WELL_MAP_FORMAT)
+        state = {'protocol': self.protocol, 'num_samples': self.num_samples, 'updated': self.updated, 'wells': self.names,
+                 'stages': {stage: ''.join('1' if name in done else '0' for name in self.names)
+                            for stage, done in self.done.items()}}
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.path + '.tmp', self.path)
+
+    def summary(self):
+        '''
+        One line per stage with wells done
+        '''
+        return [stage + ': ' + str(len(done)) + ' wells done' for stage, done in self.done.items() if done]
+
+    def clear(self):
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+# <<< well_map.py
+
 def run(ctx: protocol_api.ProtocolContext):
 
     # Define the STEPS of the protocol
@@ -133,7 +223,7 @@ def run(ctx: protocol_api.ProtocolContext):
         for i in range(rounds):
                 pipet.touch_tip(speed = speed, radius = 0.1, v_offset = v_offset)
 
-    def distribute_custom(pipette, volume, src, dest, waste_pool, pickup_height, extra_dispensal, dest_x_offset, disp_height = 0, touch_tip = False, num_shakes = 0):
+    def distribute_custom(pipette, volume, src, dest, waste_pool, pickup_height, extra_dispensal, dest_x_offset, disp_height = 0, touch_tip = False, num_shakes = 0, stage = None):
         pipette.aspirate((len(dest) * volume) + extra_dispensal, src.bottom(pickup_height))
         if touch_tip :
             pipette.touch_tip(speed = 20, v_offset = -5)
@@ -141,6 +231,8 @@ def run(ctx: protocol_api.ProtocolContext):
         for d in dest:
             drop = d.top(z = disp_height)
             pipette.dispense(volume, drop)
+            if stage is not None:
+                well_map.mark(stage, [d])
 
             shake_pipet(pipette, rounds = num_shakes, v_offset = disp_height)
         try:
@@ -295,8 +387,20 @@ def run(ctx: protocol_api.ProtocolContext):
     pcr_wells           = qpcr_plate.wells()[:NUM_SAMPLES]
     pcr_wells_samples   = qpcr_plate.wells()[2:NUM_SAMPLES]
 
+    # Wells of the qPCR plate done, to restart a stopped run with the wells left, see well_map
+    well_map = WellMap(None if ctx.is_simulating() else folder_path + '/well_map.json', qpcr_plate.wells(), NUM_SAMPLES, metadata['protocolName'])
+    step_wells = {1: ('hydrated', pcr_wells), 2: ('controls', [qpcr_plate.wells()[1]]), 3: ('controls', [qpcr_plate.wells()[0]])}
+    if RESUME_FROM_WELL_MAP and well_map.load():
+        for step, (stage, wells) in step_wells.items():
+            if not well_map.pending(stage, wells):
+                STEPS[step]['Execute'] = False
+        for line in well_map.summary():
+            ctx.comment(line)
+        ctx.pause('Continuando con los pocillos que faltan del protocolo detenido el ' + well_map.updated +
+            '. Para hacer todos los pocillos cancela y pon RESUME_FROM_WELL_MAP = False.')
+
     # Divide destination wells in small groups for P300 pipette
-    dests = list(divide_destinations(pcr_wells, size_transfer))
+    dests = list(divide_destinations(well_map.pending('hydrated', pcr_wells), size_transfer))
 
     # pipettes
     p20 = ctx.load_instrument(
@@ -348,7 +452,7 @@ def run(ctx: protocol_api.ProtocolContext):
                 src = Hydr.reagent_reservoir, dest = dest, touch_tip = False,
                 waste_pool = Hydr.reagent_reservoir, pickup_height = 0.2,
                 extra_dispensal = extra_dispensal, dest_x_offset = 0, 
-                disp_height = -15, num_shakes = 1)
+                disp_height = -15, num_shakes = 1, stage = 'hydrated')
             used_vol.append(used_vol_temp)
 
         p300.drop_tip(home_after = False)
@@ -380,6 +484,7 @@ def run(ctx: protocol_api.ProtocolContext):
                 vol = VOLUME_SAMPLE, air_gap_vol = air_gap_sample, x_offset = x_offset,
                 pickup_height = 0.2, disp_height = -10, rinse = False,
                 blow_out = True, touch_tip = False, num_shakes = 1)
+        well_map.mark('controls', [d])
 
         p20.drop_tip(home_after = False)
         tip_track['counts'][p20]+=1
@@ -410,6 +515,7 @@ def run(ctx: protocol_api.ProtocolContext):
                 vol = VOLUME_SAMPLE, air_gap_vol = air_gap_sample, x_offset = x_offset,
                 pickup_height = 0.2, disp_height = -10, rinse = False,
                 blow_out = True, touch_tip = False, num_shakes = 1)
+        well_map.mark('controls', [d])
 
         p20.drop_tip(home_after = False)
         tip_track['counts'][p20]+=1
@@ -432,5 +538,7 @@ def run(ctx: protocol_api.ProtocolContext):
                 f.write(row + '\n')
         f.close()
 
+    well_map.clear() # Every well done
+
     ############################################################################
     finish_run()
@@ -1,13 +1,8 @@
 import math
 from opentrons.types import Point
 from opentrons import protocol_api
-import time
 import os
-import numpy as np
-from timeit import default_timer as timer
-import json
 from datetime import datetime
-import csv
 
 # metadata
 metadata = {
@@ -31,6 +26,7 @@ SET_TEMP_ON_SLOT_1          = True  # Do you want to start temperature module?
 TEMPERATURE_SLOT_1          = 4     # Temperature of temp module
 SET_TEMP_ON_SLOT_4          = True  # Do you want to start temperature module?
 TEMPERATURE_SLOT_4          = 4     # Temperature of temp module
+RESUME_FROM_WELL_MAP       = False # Restart a stopped run with the wells not done (well_map.json of its folder)
 ##################
 
 run_id                      = 'C_Vitro'
@@ -47,11 +43,167 @@ x_offset                    = [0,0]
 size_transfer = math.floor(pipette_allowed_capacity / MMIX_VOL_PER_SAMPLE) # Number of wells the distribute function will fill
 
 # Calculated variables
-area_section_screwcap = (np.pi * diameter_screwcap**2) / 4
+area_section_screwcap = (math.pi * diameter_screwcap**2) / 4
 h_cone = (volume_cone * 3 / area_section_screwcap)
 num_cols = math.ceil(NUM_SAMPLES / 8)  # Columns we are working on
 
+# >>> light_signals.py
+import threading
+
+# steps: (keyword arguments of hardware.set_lights, seconds), repeated in order.
+# end: lights set when the pattern ends or is stopped, None to leave the last step.
+LIGHT_PATTERNS = {
+    'tip_swap': {'steps': [({'rails': False, 'button': (1, 0, 0)}, 0.3), ({'rails': True, 'button': (0, 0, 1)}, 0.3)],
+                 'end': {'button': (0, 1, 0)}},
+    'finished': {'steps': [({'button': False, 'rails': False}, 0.3), ({'button': True, 'rails': True}, 0.3)],
+                 'end': None},
+    'error':    {'steps': [({'rails': False, 'button': (1, 0, 0)}, 0.15), ({'rails': False, 'button': False}, 0.15)],
+                 'end': {'button': (1, 0, 0)}},
+}
+
+
+class LightSignals:
+    def __init__(self, hardware, photosensitive = False):
+        self.hardware = hardware
+        self.photosensitive = photosensitive
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def set_lights(self, lights):
+        if self.photosensitive and lights.get('rails'):
+            lights = dict(lights, rails = False)
+        self.hardware.set_lights(**lights)
+
+    def start(self, pattern, times = None, end = None):
+        '''
+        Play pattern times (None: until stop()) in the background, replacing
+        the pattern being played. end replaces the end lights of the pattern.
+        '''
+        if pattern not in LIGHT_PATTERNS:
+            raise ValueError('Unknown light pattern ' + repr(pattern) + ', use one of ' + ', '.join(sorted(LIGHT_PATTERNS)))
+        self.stop()
+        if self.hardware is None:
+            return
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target = self.play, name = 'light_signals', daemon = True,
+                                       args = (LIGHT_PATTERNS[pattern], times, end, self.stopped))
+        self.thread.start()
+
+    def play(self, pattern, times, end, stopped):
+        repeat = 0
+        while (times is None or repeat < times) and not stopped.is_set():
+            for lights, seconds in pattern['steps']:
+                self.set_lights(lights)
+                if stopped.wait(seconds):
+                    break
+            repeat += 1
+        end = end if end is not None else pattern['end']
+        if end is not None:
+            self.set_lights(end)
+
+    def stop(self):
+        '''
+        Stop the pattern being played, once its end lights are set
+        '''
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+# <<< light_signals.py
+
+# >>> well_map.py
+import json
+import os
+from datetime import datetime
+
+WELL_MAP_STAGES     = ['hydrated', 'mastermix', 'sample', 'controls']
+WELL_MAP_MAX_AGE    = 12 * 3600 # seconds after its last save a map is resumed
+WELL_MAP_FORMAT     = '%Y/%m/%d %H:%M:%S'
+
+
+def well_column(name):
+    return name.lstrip('ABCDEFGHIJKLMNOP')
+
+
+class WellMap:
+    def __init__(self, path, wells, num_samples, protocol = None):
+        self.path = path
+        self.names = [well.well_name for well in wells]
+        self.num_samples = num_samples
+        self.protocol = protocol
+        self.columns = {}
+        for name in self.names:
+            self.columns.setdefault(well_column(name), []).append(name)
+        self.done = {stage: set() for stage in WELL_MAP_STAGES}
+        self.unsaved = None # (stage, column) of the wells marked and not saved yet
+        self.updated = None
+
+    def load(self, max_age = WELL_MAP_MAX_AGE):
+        '''
+        Wells done by a stopped run, True when there are any
+        '''
+        if self.path is None:
+            return False
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            age = (datetime.now() - datetime.strptime(state['updated'], WELL_MAP_FORMAT)).total_seconds()
+        except (IOError, ValueError, KeyError):
+            return False
+        if state.get('protocol') != self.protocol or state.get('num_samples') != self.num_samples \
+                or state.get('wells') != self.names or age > max_age:
+            return False
+        for stage, bitmap in state['stages'].items():
+            self.done[stage] = {name for name, bit in zip(self.names, bitmap) if bit == '1'}
+        self.updated = state['updated']
+        return any(self.done.values())
+
+    def is_done(self, stage, well):
+        return well.well_name in self.done[stage]
+
+    def pending(self, stage, wells):
+        return [well for well in wells if not self.is_done(stage, well)]
+
+    def mark(self, stage, wells):
+        '''
+        Record wells of stage as done, saving the map once per column
+        '''
+        for well in wells:
+            key = (stage, well_column(well.well_name))
+            if self.unsaved is not None and self.unsaved != key:
+                self.save()
+            self.done[stage].add(well.well_name)
+            self.unsaved = key
+        if self.unsaved is not None and all(name in self.done[self.unsaved[0]] for name in self.columns[self.unsaved[1]]):
+            self.save()
+
+    def save(self):
+        self.unsaved = None
+        if self.path is None:
+            return
+        self.updated = datetime.now().strftime(WELL_MAP_FORMAT)
+        state = {'protocol': self.protocol, 'num_samples': self.num_samples, 'updated': self.updated, 'wells': self.names,
+                 'stages': {stage: ''.join('1' if name in done else '0' for name in self.names)
+                            for stage, done in self.done.items()}}
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.path + '.tmp', self.path)
+
+    def summary(self):
+        '''
+        One line per stage with wells done
+        '''
+        return [stage + ': ' + str(len(done)) + ' wells done' for stage, done in self.done.items() if done]
+
+    def clear(self):
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+# <<< well_map.py
+
 def run(ctx: protocol_api.ProtocolContext):
+    lights = LightSignals(None if ctx.is_simulating() else ctx._hw_manager.hardware, photosensitive = True) # Light patterns played in the background
     ctx.comment('Actual used columns: ' + str(num_cols))
 
     # Define the STEPS of the protocol
@@ -135,7 +287,7 @@ def run(ctx: protocol_api.ProtocolContext):
         for i in range(0, len(l), n):
             yield l[i:i + n]
 
-    def distribute_custom(pipette, volume, src, dest, waste_pool, pickup_height, extra_dispensal, dest_x_offset, disp_height=0):
+    def distribute_custom(pipette, volume, src, dest, waste_pool, pickup_height, extra_dispensal, dest_x_offset, disp_height=0, stage=None):
         # Custom distribute function that allows for blow_out in different location and adjustement of touch_tip
         pipette.aspirate((len(dest) * volume) +
                          extra_dispensal, src.bottom(pickup_height))
@@ -146,6 +298,8 @@ def run(ctx: protocol_api.ProtocolContext):
             pipette.dispense(5, d.top())
             drop = d.top(z = disp_height).move(Point(x = dest_x_offset))
             pipette.dispense(volume, drop)
+            if stage is not None:
+                well_map.mark(stage, [d])
             pipette.move_to(d.top(z=5))
             pipette.aspirate(5)  # air gap
         try:
@@ -238,6 +392,18 @@ def run(ctx: protocol_api.ProtocolContext):
             col_change = False
         return height, col_change
 
+    ####################################
+    # Temperature module control: the ramps are started without blocking the run
+    # and only awaited where the temperature matters
+    def start_temperature(module, celsius):
+        module.start_set_temperature(celsius)
+        ctx.comment('Temperature module ramping to ' + str(celsius) + ' C in the background')
+
+    def await_temperature(module, celsius):
+        if module.status != 'holding at target':
+            ctx.comment('Waiting for the temperature module to reach ' + str(celsius) + ' C (now ' + str(module.temperature) + ' C)')
+        module.await_temperature(celsius)
+
     ####################################
     # load labware and modules
     # 24 well rack
@@ -251,9 +417,9 @@ def run(ctx: protocol_api.ProtocolContext):
     tempdeck_dest = ctx.load_module('Temperature Module Gen2', '1')
 
     if SET_TEMP_ON_SLOT_4:
-        tempdeck_orig.set_temperature(TEMPERATURE_SLOT_4)
-    if SET_TEMP_ON_SLOT_1:    
-        tempdeck_dest.set_temperature(TEMPERATURE_SLOT_1)
+        start_temperature(tempdeck_orig, TEMPERATURE_SLOT_4)
+    if SET_TEMP_ON_SLOT_1:
+        start_temperature(tempdeck_dest, TEMPERATURE_SLOT_1)
 
     ##################################
     # Sample plate - comes from B
@@ -289,8 +455,22 @@ def run(ctx: protocol_api.ProtocolContext):
     pcr_wells = qpcr_plate.wells()[:NUM_SAMPLES]
     pcr_wells_samples = qpcr_plate.wells()[2:NUM_SAMPLES]
 
+    # Wells of the qPCR plate done, to restart a stopped run with the wells left, see well_map
+    well_map = WellMap(None if ctx.is_simulating() else folder_path + '/well_map.json', qpcr_plate.wells(), NUM_SAMPLES, metadata['protocolName'])
+    step_wells = {1: ('mastermix', pcr_wells), 2: ('sample', pcr_wells_samples),
+                  3: ('controls', [qpcr_plate.wells()[1]]), 4: ('controls', [qpcr_plate.wells()[0]])}
+    if RESUME_FROM_WELL_MAP and well_map.load():
+        for step, (stage, wells) in step_wells.items():
+            if not well_map.pending(stage, wells):
+                STEPS[step]['Execute'] = False
+        for line in well_map.summary():
+            ctx.comment(line)
+        ctx.pause('Restarting with the wells left by the run stopped at ' + well_map.updated +
+            '. To do every well cancel and set RESUME_FROM_WELL_MAP = False.')
+
     # Divide destination wells in small groups for P300 pipette
-    dests = list(divide_destinations(pcr_wells, size_transfer))
+    dests = list(divide_destinations(well_map.pending('mastermix', pcr_wells), size_transfer))
+    used_vol = [] # Mmix distributed
 
     # pipettes
     p20 = ctx.load_instrument(
@@ -333,15 +513,17 @@ def run(ctx: protocol_api.ProtocolContext):
         ctx.comment('###############################################')
         ctx.comment(' ')
 
+        if SET_TEMP_ON_SLOT_1:
+            await_temperature(tempdeck_dest, TEMPERATURE_SLOT_1)
+
         pick_up(p300)
-        used_vol = []
 
         for dest in dests:
             aspirate_volume = MMIX_VOL_PER_SAMPLE * len(dest) + extra_dispensal
             used_vol_temp = distribute_custom(p300, volume = MMIX_VOL_PER_SAMPLE,
                 src = Mmix.reagent_reservoir, dest = dest,
                 waste_pool = Mmix.reagent_reservoir, pickup_height = 0.2,
-                extra_dispensal = extra_dispensal, dest_x_offset = 2, disp_height = -1)
+                extra_dispensal = extra_dispensal, dest_x_offset = 2, disp_height = -1, stage = 'mastermix')
             used_vol.append(used_vol_temp)
         p300.drop_tip(home_after = False)
         tip_track['counts'][p300]+=1
@@ -364,12 +546,20 @@ def run(ctx: protocol_api.ProtocolContext):
         ctx.comment('###############################################')
         ctx.comment(' ')
 
+        if SET_TEMP_ON_SLOT_4:
+            await_temperature(tempdeck_orig, TEMPERATURE_SLOT_4)
+        if SET_TEMP_ON_SLOT_1:
+            await_temperature(tempdeck_dest, TEMPERATURE_SLOT_1)
+
         for s, d in zip(samples, pcr_wells_samples):
+            if well_map.is_done('sample', d):
+                continue
             pick_up(p20)
             move_vol_multichannel(p20, reagent = Samples, source = s, dest = d,
                     vol = VOLUME_SAMPLE, air_gap_vol = air_gap_sample, x_offset = x_offset,
                     pickup_height = 0.2, disp_height = 0, rinse = False,
                     blow_out=True, touch_tip=True)
+            well_map.mark('sample', [d])
             p20.drop_tip(home_after = False)
             tip_track['counts'][p20]+=1
 
@@ -398,6 +588,7 @@ def run(ctx: protocol_api.ProtocolContext):
                 vol = VOLUME_SAMPLE, air_gap_vol = air_gap_sample, x_offset = x_offset,
                 pickup_height = 0.2, disp_height = 0, rinse = False,
                 blow_out=True, touch_tip=True)
+        well_map.mark('controls', [d])
         p20.drop_tip(home_after = False)
         tip_track['counts'][p20]+=1
 
@@ -426,6 +617,7 @@ def run(ctx: protocol_api.ProtocolContext):
                 vol = VOLUME_SAMPLE, air_gap_vol = air_gap_sample, x_offset = x_offset,
                 pickup_height = 0.2, disp_height = 0, rinse = False,
                 blow_out=True, touch_tip=True)
+        well_map.mark('controls', [d])
         p20.drop_tip(home_after = False)
         tip_track['counts'][p20]+=1
 
@@ -447,25 +639,20 @@ def run(ctx: protocol_api.ProtocolContext):
                 f.write(row + '\n')
         f.close()
 
+    well_map.clear() # Every well done
+
     ############################################################################
     # Light flash end of program
-    for i in range(3):
-        #ctx._hw_manager.hardware.set_lights(rails=False)
-        ctx._hw_manager.hardware.set_lights(button=(1, 0 ,0))
-        time.sleep(0.3)
-        #ctx._hw_manager.hardware.set_lights(rails=True)
-        ctx._hw_manager.hardware.set_lights(button=(0, 0 ,1))
-        time.sleep(0.3)
-    ctx._hw_manager.hardware.set_lights(button=(0, 1 ,0))
+    lights.start('finished', times = 3, end = {'button': (0, 1, 0)})
     ctx.comment('Finished! \nMove plate to PCR')
 
-    total_used_vol = np.sum(used_vol)
+    total_used_vol = sum(used_vol)
     total_needed_volume = total_used_vol
     ctx.comment('Total Mmix used volume is: ' + str(total_used_vol) + '\u03BCl.')
     ctx.comment('Needed Mmix volume is ' +
                 str(total_needed_volume + extra_dispensal*len(dests)) +'\u03BCl')
     ctx.comment('Mmix remaining in tubes is: ' +
-                format(np.sum(Mmix.unused) + extra_dispensal * len(dests) + Mmix.vol_well) + '\u03BCl.')
+                format(sum(Mmix.unused) + extra_dispensal * len(dests) + Mmix.vol_well) + '\u03BCl.')
     ctx.comment('200 ul Used tips in total: ' + str(tip_track['counts'][p300]))
     ctx.comment('200 ul Used racks in total: ' + str(tip_track['counts'][p300] / 96))
     ctx.comment('20 ul Used tips in total: ' + str(tip_track['counts'][p20]))
@@ -1,11 +1,7 @@
 import math
 from opentrons.types import Point
 from opentrons import protocol_api
-import subprocess
-import time
 import os
-import numpy as np
-from timeit import default_timer as timer
 from datetime import datetime
 
 # metadata
@@ -29,6 +25,7 @@ VOLUME_SAMPLE               = 5     # Volume of the sample
 
 SOUND_NUM_PLAYS             = 1
 PHOTOSENSITIVE              = True # True if it has photosensitive reagents
+RESUME_FROM_WELL_MAP        = False # Restart a stopped run with the wells not done (well_map.json of its folder)
 ################################################
 
 run_id                      = 'C-Dispensacion'
@@ -45,7 +42,200 @@ pipette_allowed_capacity    = 180   # Volume allowed in the pipette of 200µl
 x_offset                    = [0,0]
 num_cols                    = math.ceil(NUM_SAMPLES / 8) # Columns we are working on
 
+# >>> audio_worker.py
+import os
+import subprocess
+import threading
+import time
+from queue import Queue
+
+
+class AudioWorker:
+    def __init__(self, sounds_path):
+        self.sounds_path = sounds_path
+        self.queue = Queue()
+        self.thread = None
+
+    def play(self, filenames, delay = 0):
+        '''
+        Queue the sounds (mp3 files of sounds_path, the extension may be left
+        out) to play in order, delay seconds after the previous cue ends
+        '''
+        self.queue.put((delay, list(filenames)))
+        if self.thread is None:
+            self.thread = threading.Thread(target = self.work, name = 'audio_worker', daemon = True)
+            self.thread.start()
+
+    def work(self):
+        while True:
+            delay, filenames = self.queue.get()
+            time.sleep(delay)
+            for filename in filenames:
+                path = os.path.join(self.sounds_path, filename if filename.endswith('.mp3') else filename + '.mp3')
+                try:
+                    subprocess.call(['mpg123', '-q', path], stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+                except OSError: # mpg123 not installed
+                    pass
+            self.queue.task_done()
+# <<< audio_worker.py
+
+# >>> light_signals.py
+import threading
+
+# steps: (keyword arguments of hardware.set_lights, seconds), repeated in order.
+# end: lights set when the pattern ends or is stopped, None to leave the last step.
+LIGHT_PATTERNS = {
+    'tip_swap': {'steps': [({'rails': False, 'button': (1, 0, 0)}, 0.3), ({'rails': True, 'button': (0, 0, 1)}, 0.3)],
+                 'end': {'button': (0, 1, 0)}},
+    'finished': {'steps': [({'button': False, 'rails': False}, 0.3), ({'button': True, 'rails': True}, 0.3)],
+                 'end': None},
+    'error':    {'steps': [({'rails': False, 'button': (1, 0, 0)}, 0.15), ({'rails': False, 'button': False}, 0.15)],
+                 'end': {'button': (1, 0, 0)}},
+}
+
+
+class LightSignals:
+    def __init__(self, hardware, photosensitive = False):
+        self.hardware = hardware
+        self.photosensitive = photosensitive
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def set_lights(self, lights):
+        if self.photosensitive and lights.get('rails'):
+            lights = dict(lights, rails = False)
+        self.hardware.set_lights(**lights)
+
+    def start(self, pattern, times = None, end = None):
+        '''
+        Play pattern times (None: until stop()) in the background, replacing
+        the pattern being played. end replaces the end lights of the pattern.
+        '''
+        if pattern not in LIGHT_PATTERNS:
+            raise ValueError('Unknown light pattern ' + repr(pattern) + ', use one of ' + ', '.join(sorted(LIGHT_PATTERNS)))
+        self.stop()
+        if self.hardware is None:
+            return
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target = self.play, name = 'light_signals', daemon = True,
+                                       args = (LIGHT_PATTERNS[pattern], times, end, self.stopped))
+        self.thread.start()
+
+    def play(self, pattern, times, end, stopped):
+        repeat = 0
+        while (times is None or repeat < times) and not stopped.is_set():
+            for lights, seconds in pattern['steps']:
+                self.set_lights(lights)
+                if stopped.wait(seconds):
+                    break
+            repeat += 1
+        end = end if end is not None else pattern['end']
+        if end is not None:
+            self.set_lights(end)
+
+    def stop(self):
+        '''
+        Stop the pattern being played, once its end lights are set
+        '''
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+# <<< light_signals.py
+
+# >>> well_map.py
+import json
+import os
+from datetime import datetime
+
+WELL_MAP_STAGES     = ['hydrated', 'mastermix', 'sample', 'controls']
+WELL_MAP_MAX_AGE    = 12 * 3600 # seconds after its last save a map is resumed
+WELL_MAP_FORMAT     = '%Y/%m/%d %H:%M:%S'
+
+
+def well_column(name):
+    return name.lstrip('ABCDEFGHIJKLMNOP')
+
+
+class WellMap:
+    def __init__(self, path, wells, num_samples, protocol = None):
+        self.path = path
+        self.names = [well.well_name for well in wells]
+        self.num_samples = num_samples
+        self.protocol = protocol
+        self.columns = {}
+        for name in self.names:
+            self.columns.setdefault(well_column(name), []).append(name)
+        self.done = {stage: set() for stage in WELL_MAP_STAGES}
+        self.unsaved = None # (stage, column) of the wells marked and not saved yet
+        self.updated = None
+
+    def load(self, max_age = WELL_MAP_MAX_AGE):
+        '''
+        Wells done by a stopped run, True when there are any
+        '''
+        if self.path is None:
+            return False
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            age = (datetime.now() - datetime.strptime(state['updated'], WELL_MAP_FORMAT)).total_seconds()
+        except (IOError, ValueError, KeyError):
+            return False
+        if state.get('protocol') != self.protocol or state.get('num_samples') != self.num_samples \
+                or state.get('wells') != self.names or age > max_age:
+            return False
+        for stage, bitmap in state['stages'].items():
+            self.done[stage] = {name for name, bit in zip(self.names, bitmap) if bit == '1'}
+        self.updated = state['updated']
+        return any(self.done.values())
+
+    def is_done(self, stage, well):
+        return well.well_name in self.done[stage]
+
+    def pending(self, stage, wells):
+        return [well for well in wells if not self.is_done(stage, well)]
+
+    def mark(self, stage, wells):
+        '''
+        Record wells of stage as done, saving the map once per column
+        '''
+        for well in wells:
+            key = (stage, well_column(well.well_name))
+            if self.unsaved is not None and self.unsaved != key:
+                self.save()
+            self.done[stage].add(well.well_name)
+            self.unsaved = key
+        if self.unsaved is not None and all(name in self.done[self.unsaved[0]] for name in self.columns[self.unsaved[1]]):
+            self.save()
+
+    def save(self):
+        self.unsaved = None
+        if self.path is None:
+            return
+        self.updated = datetime.now().strftime(WELL_MAP_FORMAT)
+        state = {'protocol': self.protocol, 'num_samples': self.num_samples, 'updated': self.updated, 'wells': self.names,
+                 'stages': {stage: ''.join('1' if name in done else '0' for name in self.names)
+                            for stage, done in self.done.items()}}
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.path + '.tmp', self.path)
+
+    def summary(self):
+        '''
+        One line per stage with wells done
+        '''
+        return [stage + ': ' + str(len(done)) + ' wells done' for stage, done in self.done.items() if done]
+
+    def clear(self):
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+# <<< well_map.py
+
 def run(ctx: protocol_api.ProtocolContext):
+    lights = LightSignals(None if ctx.is_simulating() else ctx._hw_manager.hardware, photosensitive = PHOTOSENSITIVE) # Light patterns played in the background
 
     # Define the STEPS of the protocol
     STEP = 0
@@ -202,19 +392,10 @@ def run(ctx: protocol_api.ProtocolContext):
         if blow_out == True:
             pipet.blow_out(location.top(z = -2))  # Blow out
 
-    def run_quiet_process(command):
-        subprocess.check_output('{} &> /dev/null'.format(command), shell=True)
-    
-    def play_sound(filename):
-        print('Speaker')
-        print('Next\t--> CTRL-C')
-        try:
-            run_quiet_process('mpg123 {}'.format(path_sounds + filename + '.mp3'))
-            run_quiet_process('mpg123 {}'.format(path_sounds + sonido_defecto))
-            run_quiet_process('mpg123 {}'.format(path_sounds + filename + '.mp3'))
-        except KeyboardInterrupt:
-            pass
-            print()
+    audio = AudioWorker(path_sounds) # Sounds played in the background
+
+    def play_sound(filename, delay = 0):
+        audio.play([filename, sonido_defecto, filename], delay)
 
     def finish_run(switch_off_lights = False):
         ctx.comment('###############################################')
@@ -225,29 +406,14 @@ def run(ctx: protocol_api.ProtocolContext):
         now = datetime.now()
         # dd/mm/YY H:M:S
         finish_time = now.strftime("%Y/%m/%d %H:%M:%S")
-        if PHOTOSENSITIVE==False:
-            for i in range(10):
-                ctx._hw_manager.hardware.set_lights(button = False, rails =  False)
-                time.sleep(0.3)
-                ctx._hw_manager.hardware.set_lights(button = True, rails =  True)
-                time.sleep(0.3)
-        else:
-            for i in range(10):
-                ctx._hw_manager.hardware.set_lights(button = False, rails =  False)
-                time.sleep(0.3)
-                ctx._hw_manager.hardware.set_lights(button = True, rails =  False)
-                time.sleep(0.3)
-        if switch_off_lights:
-            ctx._hw_manager.hardware.set_lights(button = True, rails =  False)
+        lights.start('finished', times = 10, end = {'button': True, 'rails': False} if switch_off_lights else None)
 
         ctx.comment('Puntas de 20 uL utilizadas: ' + str(tip_track['counts'][m20]) + ' (' + str(round(tip_track['counts'][m20] / 96, 2)) + ' caja(s))')
         ctx.comment('###############################################')
 
         if not ctx.is_simulating():
-            for i in range(SOUND_NUM_PLAYS):
-                if i > 0:
-                    time.sleep(60)
-                play_sound('finished_process_esp')
+            for i in range(SOUND_NUM_PLAYS): # Every minute, without holding the run
+                play_sound('finished_process_esp', delay = 60 if i > 0 else 0)
 
         return finish_time
 
@@ -274,6 +440,18 @@ def run(ctx: protocol_api.ProtocolContext):
     pcr_wells_samples   = qpcr_plate.rows()[0][:num_cols]
     tipCols             = tips20[0].rows()[0][:num_cols]
 
+    # Wells of the qPCR plate done, to restart a stopped run with the wells left, see well_map
+    well_map = WellMap(None if ctx.is_simulating() else folder_path + '/well_map.json', qpcr_plate.wells(), NUM_SAMPLES, metadata['protocolName'])
+    step_wells = {1: ('sample', qpcr_plate.wells()[:8 * num_cols])}
+    if RESUME_FROM_WELL_MAP and well_map.load():
+        for step, (stage, wells) in step_wells.items():
+            if not well_map.pending(stage, wells):
+                STEPS[step]['Execute'] = False
+        for line in well_map.summary():
+            ctx.comment(line)
+        ctx.pause('Continuando con los pocillos que faltan del protocolo detenido el ' + well_map.updated +
+            '. Para hacer todos los pocillos cancela y pon RESUME_FROM_WELL_MAP = False.')
+
 
     # pipettes
     m20 = ctx.load_instrument(
@@ -313,19 +491,20 @@ def run(ctx: protocol_api.ProtocolContext):
         ctx.comment('###############################################')
         ctx.comment(' ')
         
-        i = 0
-        for s, d in zip(samples, pcr_wells_samples):
+        for i, (s, d) in enumerate(zip(samples, pcr_wells_samples)):
+            if not well_map.pending('sample', qpcr_plate.columns()[i]):
+                continue
             pick_up(m20)
 
             move_vol_multichannel(m20, reagent = Samples, source = s, dest = d,
                     vol = VOLUME_SAMPLE, air_gap_vol = air_gap_sample, x_offset = x_offset,
                     pickup_height = 0.2, disp_height = -10, rinse = False,
                     blow_out=False, touch_tip=False, num_shakes = 1)
+            well_map.mark('sample', qpcr_plate.columns()[i])
             
             m20.drop_tip(home_after = False)
 
             tip_track['counts'][m20] += 8
-            i = i + 1
 
         end = datetime.now()
         time_taken = (end - start)
@@ -344,5 +523,7 @@ def run(ctx: protocol_api.ProtocolContext):
                 f.write(row + '\n')
         f.close()
 
+    well_map.clear() # Every well done
+
     ############################################################################
     finish_run()
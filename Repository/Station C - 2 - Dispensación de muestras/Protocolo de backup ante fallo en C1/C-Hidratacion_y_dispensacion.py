@@ -1,11 +1,7 @@
 import math
 from opentrons.types import Point
 from opentrons import protocol_api
-import subprocess
-import time
 import os
-import numpy as np
-from timeit import default_timer as timer
 from datetime import datetime
 
 # metadata
@@ -48,7 +44,109 @@ x_offset                    = [0,0]
 num_cols                    = math.ceil(NUM_SAMPLES / 8) # Columns we are working on
 size_transfer = math.floor(pipette_allowed_capacity / HYDR_VOL_PER_SAMPLE) # Number of wells the distribute function will fill
 
+# >>> audio_worker.py
+import os
+import subprocess
+import threading
+import time
+from queue import Queue
+
+
+class AudioWorker:
+    def __init__(self, sounds_path):
+        self.sounds_path = sounds_path
+        self.queue = Queue()
+        self.thread = None
+
+    def play(self, filenames, delay = 0):
+        '''
+        Queue the sounds (mp3 files of sounds_path, the extension may be left
+        out) to play in order, delay seconds after the previous cue ends
+        '''
+        self.queue.put((delay, list(filenames)))
+        if self.thread is None:
+            self.thread = threading.Thread(target = self.work, name = 'audio_worker', daemon = True)
+            self.thread.start()
+
+    def work(self):
+        while True:
+            delay, filenames = self.queue.get()
+            time.sleep(delay)
+            for filename in filenames:
+                path = os.path.join(self.sounds_path, filename if filename.endswith('.mp3') else filename + '.mp3')
+                try:
+                    subprocess.call(['mpg123', '-q', path], stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+                except OSError: # mpg123 not installed
+                    pass
+            self.queue.task_done()
+# <<< audio_worker.py
+
+# >>> light_signals.py
+import threading
+
+# steps: (keyword arguments of hardware.set_lights, seconds), repeated in order.
+# end: lights set when the pattern ends or is stopped, None to leave the last step.
+LIGHT_PATTERNS = {
+    'tip_swap': {'steps': [({'rails': False, 'button': (1, 0, 0)}, 0.3), ({'rails': True, 'button': (0, 0, 1)}, 0.3)],
+                 'end': {'button': (0, 1, 0)}},
+    'finished': {'steps': [({'button': False, 'rails': False}, 0.3), ({'button': True, 'rails': True}, 0.3)],
+                 'end': None},
+    'error':    {'steps': [({'rails': False, 'button': (1, 0, 0)}, 0.15), ({'rails': False, 'button': False}, 0.15)],
+                 'end': {'button': (1, 0, 0)}},
+}
+
+
+class LightSignals:
+    def __init__(self, hardware, photosensitive = False):
+        self.hardware = hardware
+        self.photosensitive = photosensitive
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def set_lights(self, lights):
+        if self.photosensitive and lights.get('rails'):
+            lights = dict(lights, rails = False)
+        self.hardware.set_lights(**lights)
+
+    def start(self, pattern, times = None, end = None):
+        '''
+        Play pattern times (None: until stop()) in the background, replacing
+        the pattern being played. end replaces the end lights of the pattern.
+        '''
+        if pattern not in LIGHT_PATTERNS:
+            raise ValueError('Unknown light pattern ' + repr(pattern) + ', use one of ' + ', '.join(sorted(LIGHT_PATTERNS)))
+        self.stop()
+        if self.hardware is None:
+            return
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target = self.play, name = 'light_signals', daemon = True,
+                                       args = (LIGHT_PATTERNS[pattern], times, end, self.stopped))
+        self.thread.start()
+
+    def play(self, pattern, times, end, stopped):
+        repeat = 0
+        while (times is None or repeat < times) and not stopped.is_set():
+            for lights, seconds in pattern['steps']:
+                self.set_lights(lights)
+                if stopped.wait(seconds):
+                    break
+            repeat += 1
+        end = end if end is not None else pattern['end']
+        if end is not None:
+            self.set_lights(end)
+
+    def stop(self):
+        '''
+        Stop the pattern being played, once its end lights are set
+        '''
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+# <<< light_signals.py
+
 def run(ctx: protocol_api.ProtocolContext):
+    lights = LightSignals(None if ctx.is_simulating() else ctx._hw_manager.hardware, photosensitive = PHOTOSENSITIVE) # Light patterns played in the background
 
     # Define the STEPS of the protocol
     STEP = 0
@@ -216,17 +314,10 @@ def run(ctx: protocol_api.ProtocolContext):
         if blow_out == True:
             pipet.blow_out(location.top(z = -2))  # Blow out
 
-    def run_quiet_process(command):
-        subprocess.check_output('{} &> /dev/null'.format(command), shell=True)
-    
-    def play_sound(filename):
-        print('Speaker')
-        print('Next\t--> CTRL-C')
-        try:
-            run_quiet_process('mpg123 {}'.format(path_sounds + filename + '.mp3'))
-        except KeyboardInterrupt:
-            pass
-            print()
+    audio = AudioWorker(path_sounds) # Sounds played in the background
+
+    def play_sound(filename, delay = 0):
+        audio.play([filename], delay)
 
     def finish_run(switch_off_lights = False):
         ctx.comment('###############################################')
@@ -237,29 +328,14 @@ def run(ctx: protocol_api.ProtocolContext):
         now = datetime.now()
         # dd/mm/YY H:M:S
         finish_time = now.strftime("%Y/%m/%d %H:%M:%S")
-        if PHOTOSENSITIVE==False:
-            for i in range(10):
-                ctx._hw_manager.hardware.set_lights(button = False, rails =  False)
-                time.sleep(0.3)
-                ctx._hw_manager.hardware.set_lights(button = True, rails =  True)
-                time.sleep(0.3)
-        else:
-            for i in range(10):
-                ctx._hw_manager.hardware.set_lights(button = False, rails =  False)
-                time.sleep(0.3)
-                ctx._hw_manager.hardware.set_lights(button = True, rails =  False)
-                time.sleep(0.3)
-        if switch_off_lights:
-            ctx._hw_manager.hardware.set_lights(button = True, rails =  False)
+        lights.start('finished', times = 10, end = {'button': True, 'rails': False} if switch_off_lights else None)
 
         ctx.comment('Puntas de 20 uL utilizadas: ' + str(tip_track['counts'][m20]) + ' (' + str(round(tip_track['counts'][m20] / 96, 2)) + ' caja(s))')
         ctx.comment('###############################################')
 
         if not ctx.is_simulating():
-            for i in range(SOUND_NUM_PLAYS):
-                if i > 0:
-                    time.sleep(60)
-                play_sound('finalizado')
+            for i in range(SOUND_NUM_PLAYS): # Every minute, without holding the run
+                play_sound('finalizado', delay = 60 if i > 0 else 0)
 
         return finish_time
 
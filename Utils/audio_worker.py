@@ -0,0 +1,46 @@
+'''
+Sound cues played in the background.
+
+mpg123 takes as long as the sound to return, and the cues of the end of a run
+are repeated every minute, so playing them from the protocol kept it running
+for minutes after the work was done. AudioWorker plays the queued sounds one
+after the other in a daemon thread: play() returns at once and the protocol
+finishes while the speaker is still playing. The thread is started with the
+first sound, so simulations never start it.
+
+Copied into the protocols by Utils/sync_inline.py.
+'''
+import os
+import subprocess
+import threading
+import time
+from queue import Queue
+
+
+class AudioWorker:
+    def __init__(self, sounds_path):
+        self.sounds_path = sounds_path
+        self.queue = Queue()
+        self.thread = None
+
+    def play(self, filenames, delay = 0):
+        '''
+        Queue the sounds (mp3 files of sounds_path, the extension may be left
+        out) to play in order, delay seconds after the previous cue ends
+        '''
+        self.queue.put((delay, list(filenames)))
+        if self.thread is None:
+            self.thread = threading.Thread(target = self.work, name = 'audio_worker', daemon = True)
+            self.thread.start()
+
+    def work(self):
+        while True:
+            delay, filenames = self.queue.get()
+            time.sleep(delay)
+            for filename in filenames:
+                path = os.path.join(self.sounds_path, filename if filename.endswith('.mp3') else filename + '.mp3')
+                try:
+                    subprocess.call(['mpg123', '-q', path], stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+                except OSError: # mpg123 not installed
+                    pass
+            self.queue.task_done()
@@ -0,0 +1,107 @@
+'''
+Offline throughput benchmark for the station protocols.
+
+Every protocol is loaded through the Opentrons simulator and the published
+command stream is split by STEP (see simulation.py, which needs opentrons 4.x).
+For each STEP it reports the number of
+commands, tips consumed, aspirate/dispense counts and the wall time predicted
+by estimator.py.
+
+Usage:
+    python Utils/benchmark.py                              # every protocol
+    python Utils/benchmark.py "Repository/Station A/A-Dispensacion_muestras.py"
+    python Utils/benchmark.py --set NUM_SAMPLES=48 --output bench.tsv
+'''
+import argparse
+import json
+import os
+import sys
+
+from estimator import Estimator
+from simulation import (NoCommandsError, PROTOCOLS_PATH, TipCounter, format_seconds, leaf_commands, parse_overrides,
+                        resolve_protocols, simulate_protocol, split_steps)
+
+
+def summarize(steps, model = None):
+    '''
+    Per STEP totals: commands, tips, aspirates, dispenses and estimated seconds
+    '''
+    estimate = Estimator(model)
+    estimate.plan_ramps([c for step in steps for c in leaf_commands(step['commands'])])
+    tips = TipCounter()
+    rows = []
+    for step in steps:
+        row = {'step': step['step'], 'description': step['description'], 'commands': 0, 'tips': 0,
+               'aspirates': 0, 'dispenses': 0, 'seconds': 0.0}
+        for command in step['commands']:
+            row['tips'] += tips.consumed(command)
+        for command in leaf_commands(step['commands']):
+            if command['name'] == 'command.COMMENT':
+                continue
+            row['commands'] += 1
+            if command['name'] == 'command.ASPIRATE':
+                row['aspirates'] += 1
+            elif command['name'] == 'command.DISPENSE':
+                row['dispenses'] += 1
+            row['seconds'] += estimate(command)
+        rows.append(row)
+    return rows
+
+
+def benchmark(protocol_path, overrides = None, model = None):
+    commands = simulate_protocol(protocol_path, overrides)
+    return summarize(split_steps(commands), model)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Simulate the station protocols and report per STEP throughput')
+    parser.add_argument('protocols', nargs = '*', help = 'Protocol files (default: every station protocol)')
+    parser.add_argument('--set', action = 'append', metavar = 'NAME=VALUE',
+                        help = 'Override a protocol variable, e.g. NUM_SAMPLES=48')
+    parser.add_argument('--output', help = 'Write the results to a tsv file')
+    parser.add_argument('--model', help = 'Model json written by fit_time_model.py')
+    args = parser.parse_args(argv)
+
+    overrides = parse_overrides(args.set)
+    model = None
+    if args.model:
+        with open(args.model, encoding = 'utf-8') as f:
+            model = json.load(f)
+    header = ['protocol', 'step', 'description', 'commands', 'tips', 'aspirates', 'dispenses', 'seconds']
+    lines = []
+    failed = False
+    for path in resolve_protocols(args.protocols):
+        name = os.path.relpath(path, PROTOCOLS_PATH)
+        print('###############################################')
+        print(name)
+        try:
+            rows = benchmark(path, overrides, model)
+        except NoCommandsError as e:
+            print('  NO COMMANDS: ' + str(e))
+            failed = True
+            continue
+        except Exception as e:
+            print('  Simulation failed: ' + repr(e))
+            failed = True
+            continue
+        for row in rows:
+            print('  %-6s %-45s %6d cmds %5d tips %5d asp %5d disp %10s' % (
+                row['step'], row['description'][:45], row['commands'], row['tips'],
+                row['aspirates'], row['dispenses'], format_seconds(row['seconds'])))
+            lines.append([name] + [str(round(row[k], 1)) if k == 'seconds' else str(row[k]) for k in header[1:]])
+        print('  TOTAL  %-45s %6d cmds %5d tips %5d asp %5d disp %10s' % ('',
+            sum(r['commands'] for r in rows), sum(r['tips'] for r in rows),
+            sum(r['aspirates'] for r in rows), sum(r['dispenses'] for r in rows),
+            format_seconds(sum(r['seconds'] for r in rows))))
+
+    if args.output:
+        with open(args.output, 'w', encoding = 'utf-8') as f:
+            f.write('\t'.join(header) + '\n')
+            for line in lines:
+                f.write('\t'.join(line) + '\n')
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
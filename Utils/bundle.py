@@ -0,0 +1,89 @@
+'''
+Single file protocol from a thin station script and the shared modules of Utils/.
+
+The robot takes one self-contained file per protocol. A thin station script
+imports the shared code from the modules of Utils/ at module level as usual:
+
+    from run_log import RunLog
+    from liquid_classes import EXTRACTION_FIELDS, liquid_class
+
+and this script writes the file to upload, with every such import replaced by
+the part of the module it needs between the marker lines of sync_inline.py:
+
+    # >>> liquid_classes.py: EXTRACTION_FIELDS, liquid_class
+    ...
+    # <<< liquid_classes.py
+
+Only the names imported, the definitions they use and the imports they need are
+copied (see sync_inline.shaken_body), so the file uploaded stays small.
+Imports of other modules (opentrons, math...) are left as they are. The file
+written is kept up to date with Utils/ by sync_inline.py like every protocol.
+
+The thin scripts are kept in the Fuentes/ folder of their station and bundled
+into the station folder with the same name, e.g. Fuentes/B-Extraccion_total_TurboBeads.py
+into B-Extraccion_total_TurboBeads.py (Utils/tests/test_bundle.py checks them).
+
+Usage:
+    python Utils/bundle.py station.py -o protocol.py            # write the single file
+    python Utils/bundle.py station.py --check protocol.py       # exit 1 if protocol.py is out of date
+'''
+import argparse
+import ast
+import os
+import sys
+
+import sync_inline
+
+
+def shared_imports(source):
+    '''
+    Module level "from <module of Utils/> import ..." statements of a script
+    '''
+    return [statement for statement in ast.parse(source).body if isinstance(statement, ast.ImportFrom)
+            and statement.level == 0 and statement.module is not None
+            and os.path.isfile(os.path.join(sync_inline.UTILS_PATH, statement.module + '.py'))]
+
+
+def bundle_source(source, bodies = None):
+    '''
+    Single file source of a thin station script
+    '''
+    lines = source.splitlines(True)
+    for statement in reversed(shared_imports(source)):
+        module = statement.module + '.py'
+        for alias in statement.names:
+            if alias.name == '*' or alias.asname not in (None, alias.name):
+                raise ValueError('Line ' + str(statement.lineno) + ': import the names of ' + module + ' one by one and without "as"')
+        names = ', '.join(alias.name for alias in statement.names)
+        block = ['# >>> ' + module + ': ' + names + '\n', '# <<< ' + module + '\n']
+        if lines[statement.end_lineno:statement.end_lineno + 1] and lines[statement.end_lineno].startswith('# >>> '):
+            block.append('\n') # A blank line between the blocks of consecutive imports
+        lines[statement.lineno - 1:statement.end_lineno] = block
+    return sync_inline.sync_source(''.join(lines), bodies)[0]
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Write the single file protocol of a thin station script')
+    parser.add_argument('script', help = 'Thin station script importing from the modules of Utils/')
+    group = parser.add_mutually_exclusive_group(required = True)
+    group.add_argument('-o', '--output', help = 'Single file protocol to write')
+    group.add_argument('--check', metavar = 'PROTOCOL', help = 'Only check that PROTOCOL is the single file of script')
+    args = parser.parse_args(argv)
+
+    with open(args.script, encoding = 'utf-8') as f:
+        bundled = bundle_source(f.read())
+    if args.check:
+        with open(args.check, encoding = 'utf-8') as f:
+            if f.read() != bundled:
+                print('OUTDATED ' + args.check)
+                return 1
+        print('Up to date ' + args.check)
+        return 0
+    with open(args.output, 'w', encoding = 'utf-8') as f:
+        f.write(bundled)
+    print('Written ' + args.output + ' (' + str(bundled.count('\n')) + ' lines)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
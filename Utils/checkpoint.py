@@ -0,0 +1,74 @@
+'''
+Progress of a run kept on the robot to resume it after a stop.
+
+A tip jam or a power cut in the middle of an extraction meant starting again
+or editing the 'Execute' of the STEPS by hand. The protocol saves a checkpoint
+when every column of a STEP starts and when every STEP ends: the STEP and the
+column to continue from, the channel and volume left of every reagent, the tips
+used and whether the magnet is engaged. When a protocol started with
+RESUME_FROM_CHECKPOINT = True finds a checkpoint saved by the same protocol
+(its protocolName) for the same number of samples less than
+CHECKPOINT_MAX_AGE seconds ago, it skips the STEPS done and starts the STEP at
+the column it had started. Where the tips are comes from the tip inventory.
+
+column None means the STEP had not reached its columns. The file is replaced
+atomically and removed at the end of the run.
+
+Copied into the protocols by Utils/sync_inline.py. Pass path = None while
+simulating: nothing is read or written.
+'''
+import json
+import os
+from datetime import datetime
+
+CHECKPOINT_MAX_AGE  = 6 * 3600 # seconds after its last save a checkpoint is resumed
+CHECKPOINT_FORMAT   = '%Y/%m/%d %H:%M:%S'
+
+
+class Checkpoint:
+    def __init__(self, path = None, protocol = None):
+        self.path = path
+        self.protocol = protocol
+
+    def load(self, num_samples, max_age = CHECKPOINT_MAX_AGE):
+        '''
+        State saved, None without a checkpoint of this protocol and num_samples
+        younger than max_age
+        '''
+        if self.path is None:
+            return None
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            age = (datetime.now() - datetime.strptime(state['updated'], CHECKPOINT_FORMAT)).total_seconds()
+        except (IOError, ValueError, KeyError):
+            return None
+        if state.get('protocol') != self.protocol or state.get('num_samples') != num_samples or age > max_age:
+            return None
+        return state
+
+    def save(self, step, column, num_samples, reagents, tips, magnet):
+        if self.path is None:
+            return
+        state = {'protocol': self.protocol, 'step': step, 'column': column, 'num_samples': num_samples,
+                 'reagents': {reagent.name: {'col': reagent.col, 'vol_well': reagent.vol_well} for reagent in reagents},
+                 'tips': tips, 'magnet': magnet, 'updated': datetime.now().strftime(CHECKPOINT_FORMAT)}
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.path + '.tmp', self.path)
+
+    def clear(self):
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def restore_reagents(reagents, state):
+    '''
+    Channel and volume left of the reagents as saved in state
+    '''
+    for reagent in reagents:
+        if reagent.name in state['reagents']:
+            reagent.col         = state['reagents'][reagent.name]['col']
+            reagent.vol_well    = state['reagents'][reagent.name]['vol_well']
@@ -0,0 +1,296 @@
+'''
+Kinematic run time estimator for the STEPS of a protocol.
+
+Walks the simulated command stream and predicts the duration of every STEP:
+gantry travel between deck positions (arc moves up to a safe height), plunger
+time (volume / (pipette flow rate * Reagent.flow_rate_*)), ctx.delay waits,
+touch_tip at the protocols' speed of 20 mm/s, tip handling and module actions.
+Consecutive aspirate/dispense pairs in the same well (custom_mix rounds) are
+reported as mix rounds. The pauses of the run (tipracks to replace...) are
+listed with the time they are expected at, so the operator knows in advance.
+
+Usage:
+    python Utils/estimator.py "Repository/Station B - 1 y 2 - Extracción total/B-Extraccion_total_Magmax_CORE.py"
+    python Utils/estimator.py protocol.py --set NUM_SAMPLES=48 --model time_model.json
+'''
+import argparse
+import json
+import math
+import os
+import sys
+
+import simulation
+
+DEFAULT_MODEL = {
+    'speed_xy':                 400,    # mm/s, default gantry speed of the pipettes
+    'speed_z':                  125,    # mm/s
+    'arc_clearance':            10,     # mm above the highest of both points in a move between wells
+    'move_overhead':            0.25,   # s per move (acceleration / deceleration)
+    'per_mm_travel':            None,   # s/mm, replaces the speeds once fitted from the time logs
+    'per_ul':                   {},     # s/uL by flow rate (uL/s), fitted from the time logs
+    'command_overhead':         0.05,   # s per command sent to the robot
+    'tip_pickup':               3.5,    # s pressing the tips (travel apart)
+    'tip_drop':                 2.5,    # s ejecting the tips (travel apart)
+    'blow_out':                 1,
+    'touch_tip':                None,   # s per touch_tip, replaces path / speed once fitted
+    'touch_tip_speed':          20,     # mm/s, speed used by move_vol_multi
+    'touch_tip_path':           16,     # mm travelled around the well by a touch_tip
+    'magdeck_engage':           4,
+    'magdeck_disengage':        3,
+    'home':                     12,
+    'ambient_temperature':      25,     # C
+    'temperature_ramp':         20,     # s per C for the temperature module
+}
+
+HOME_POINT = (418, 353, 218)
+
+
+def point_of(location):
+    '''
+    (x, y, z) of a Location or a Well (its top), None if unknown
+    '''
+    if location is None:
+        return None
+    point = getattr(location, 'point', None)
+    if point is None and hasattr(location, 'top'):
+        point = location.top().point
+    if point is None:
+        return None
+    return (point.x, point.y, point.z)
+
+
+def well_of(location):
+    labware = getattr(location, 'labware', None)
+    if labware is None and hasattr(location, 'top'):
+        labware = location
+    return simulation.location_key(labware) if labware is not None else None
+
+
+def flow_key(flow_rate):
+    return '%g' % round(flow_rate, 1)
+
+
+class Estimator:
+    '''
+    Stateful estimator: keeps the pipette position between commands. Calling
+    it with a command returns the predicted seconds; the components of every
+    estimate are accumulated in self.components and the linear features used
+    to fit the model (see fit_time_model.py) in self.features.
+    '''
+    def __init__(self, model = None):
+        self.model = dict(DEFAULT_MODEL)
+        self.model.update(model or {})
+        self.position = HOME_POINT
+        self.well = None
+        self.last_liquid = None
+        self.clock = 0.0
+        self.nonblocking_ramps = set()
+        self.ramps = []
+        self.reset_totals()
+
+    def reset_totals(self):
+        self.components = {'travel': 0.0, 'liquid': 0.0, 'tips': 0.0, 'delay': 0.0, 'modules': 0.0, 'other': 0.0}
+        self.features = {}
+        self.mix_rounds = 0
+
+    def plan_ramps(self, commands):
+        '''
+        Find the temperature ramps started with start_set_temperature: both it
+        and set_temperature publish TEMPDECK_SET_TEMP, so a set is taken as
+        non-blocking when a later TEMPDECK_AWAIT_TEMP to the same target waits
+        for it (first set, first await).
+        '''
+        pending = {}
+        for command in commands:
+            celsius = command['payload'].get('celsius')
+            if command['name'] == 'command.TEMPDECK_SET_TEMP':
+                pending.setdefault(celsius, []).append(id(command))
+            elif command['name'] == 'command.TEMPDECK_AWAIT_TEMP' and pending.get(celsius):
+                self.nonblocking_ramps.add(pending[celsius].pop(0))
+
+    def add_feature(self, name, value):
+        self.features[name] = self.features.get(name, 0) + value
+
+    def travel(self, location):
+        target = point_of(location)
+        well = well_of(location)
+        if target is None:
+            return 0
+        m = self.model
+        x0, y0, z0 = self.position
+        x1, y1, z1 = target
+        xy = math.hypot(x1 - x0, y1 - y0)
+        if well is not None and well == self.well:
+            # Same well: straight move, usually only in Z
+            z_path = abs(z1 - z0)
+        else:
+            arc_z = max(z0, z1) + m['arc_clearance']
+            z_path = (arc_z - z0) + (arc_z - z1)
+        self.position = target
+        self.well = well
+        if xy + z_path < 0.01:
+            return 0
+        self.add_feature('travel_mm', xy + z_path)
+        self.add_feature('moves', 1)
+        if m['per_mm_travel'] is not None:
+            return (xy + z_path) * m['per_mm_travel'] + m['move_overhead']
+        return xy / m['speed_xy'] + z_path / m['speed_z'] + m['move_overhead']
+
+    def liquid(self, command):
+        payload = command['payload']
+        instrument = payload.get('instrument')
+        volume = payload.get('volume') or 0
+        rate = payload.get('rate') or 1
+        flow_rates = command.get('flow_rate')
+        if flow_rates is None: # Commands not recorded by simulation.simulate_protocol
+            try:
+                flow_rates = {'aspirate': instrument.flow_rate.aspirate, 'dispense': instrument.flow_rate.dispense}
+            except AttributeError:
+                return 0
+        flow_rate = flow_rates['aspirate' if command['name'] == 'command.ASPIRATE' else 'dispense'] * rate
+        if flow_rate <= 0 or volume <= 0:
+            return 0
+        key = flow_key(flow_rate)
+        self.add_feature('ul@' + key, volume)
+        if key in self.model['per_ul']:
+            return volume * self.model['per_ul'][key]
+        return volume / flow_rate
+
+    def estimate(self, command):
+        '''
+        Components (travel, liquid, tips, delay, modules, other) of a command
+        '''
+        m = self.model
+        name = command['name']
+        payload = command['payload']
+        c = {'travel': 0.0, 'liquid': 0.0, 'tips': 0.0, 'delay': 0.0, 'modules': 0.0, 'other': 0.0}
+        if name == 'command.COMMENT':
+            return c
+        c['other'] += m['command_overhead']
+        self.add_feature('commands', 1)
+
+        if name in ('command.ASPIRATE', 'command.DISPENSE'):
+            c['travel'] += self.travel(payload.get('location'))
+            c['liquid'] += self.liquid(command)
+            if name == 'command.DISPENSE' and self.last_liquid == ('command.ASPIRATE', self.well):
+                self.mix_rounds += 1
+            self.last_liquid = (name, self.well)
+        elif name == 'command.PICK_UP_TIP':
+            c['travel'] += self.travel(payload.get('location'))
+            c['tips'] += m['tip_pickup']
+            self.add_feature('tip_pickups', 1)
+        elif name == 'command.DROP_TIP':
+            c['travel'] += self.travel(payload.get('location'))
+            c['tips'] += m['tip_drop']
+            self.add_feature('tip_drops', 1)
+        elif name == 'command.BLOW_OUT':
+            c['travel'] += self.travel(payload.get('location'))
+            c['other'] += m['blow_out']
+            self.add_feature('blow_outs', 1)
+        elif name == 'command.MOVE_TO':
+            c['travel'] += self.travel(payload.get('location'))
+        elif name == 'command.TOUCH_TIP':
+            c['travel'] += self.travel(payload.get('location'))
+            self.add_feature('touch_tips', 1)
+            if m['touch_tip'] is not None:
+                c['travel'] += m['touch_tip']
+            else:
+                c['travel'] += m['touch_tip_path'] / (payload.get('speed') or m['touch_tip_speed'])
+        elif name == 'command.DELAY':
+            c['delay'] += (payload.get('minutes') or 0) * 60 + (payload.get('seconds') or 0)
+        elif name == 'command.HOME':
+            c['modules'] += m['home']
+            self.position = HOME_POINT
+            self.well = None
+        elif name == 'command.MAGDECK_ENGAGE':
+            c['modules'] += m['magdeck_engage']
+        elif name == 'command.MAGDECK_DISENGAGE':
+            c['modules'] += m['magdeck_disengage']
+        elif name == 'command.TEMPDECK_SET_TEMP':
+            # Ramps start from ambient temperature, the modules are not shared between sets
+            ramp = abs(m['ambient_temperature'] - payload.get('celsius', m['ambient_temperature'])) * m['temperature_ramp']
+            if id(command) in self.nonblocking_ramps:
+                self.ramps.append((payload.get('celsius'), self.clock + ramp))
+            else:
+                c['modules'] += ramp
+        elif name == 'command.TEMPDECK_AWAIT_TEMP':
+            for i, (celsius, end) in enumerate(self.ramps):
+                if celsius == payload.get('celsius'):
+                    c['modules'] += max(0, end - self.clock)
+                    del self.ramps[i]
+                    break
+
+        if name not in ('command.ASPIRATE', 'command.DISPENSE'):
+            self.last_liquid = None
+        self.add_feature('fixed_seconds', c['delay'] + c['modules'])
+        for k in c:
+            self.components[k] += c[k]
+        self.clock += sum(c.values())
+        return c
+
+    def __call__(self, command):
+        return sum(self.estimate(command).values())
+
+
+def load_model(path):
+    if path is None:
+        return None
+    with open(path, encoding = 'utf-8') as f:
+        return json.load(f)
+
+
+def estimate_steps(steps, model = None):
+    '''
+    Per STEP estimate with the time components, the number of mix rounds and
+    the pauses as (seconds from the start of the run, message)
+    '''
+    estimator = Estimator(model)
+    estimator.plan_ramps([c for step in steps for c in simulation.leaf_commands(step['commands'])])
+    rows = []
+    for step in steps:
+        estimator.reset_totals()
+        seconds = 0.0
+        pauses = []
+        for command in simulation.leaf_commands(step['commands']):
+            if command['name'] == 'command.PAUSE':
+                pauses.append((estimator.clock, command['payload'].get('userMessage') or command['payload'].get('text', '')))
+            seconds += estimator(command)
+        row = {'step': step['step'], 'description': step['description'], 'seconds': seconds,
+               'mix_rounds': estimator.mix_rounds, 'features': dict(estimator.features), 'pauses': pauses}
+        row.update(estimator.components)
+        rows.append(row)
+    return rows
+
+
+def estimate_protocol(protocol_path, overrides = None, model = None):
+    commands = simulation.simulate_protocol(protocol_path, overrides)
+    return estimate_steps(simulation.split_steps(commands), model)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Predict the duration of each STEP of a protocol')
+    parser.add_argument('protocol', help = 'Protocol file')
+    parser.add_argument('--set', action = 'append', metavar = 'NAME=VALUE',
+                        help = 'Override a protocol variable, e.g. NUM_SAMPLES=48')
+    parser.add_argument('--model', help = 'Model json written by fit_time_model.py')
+    args = parser.parse_args(argv)
+
+    rows = estimate_protocol(os.path.abspath(args.protocol), simulation.parse_overrides(args.set),
+                             load_model(args.model))
+    elapsed = 0
+    print('%-6s %-40s %9s %9s %9s %9s %9s %6s %10s' % ('STEP', 'description', 'travel', 'liquid', 'tips',
+          'delay', 'modules', 'mixes', 'ends at'))
+    for row in rows:
+        elapsed += row['seconds']
+        print('%-6s %-40s %9.0f %9.0f %9.0f %9.0f %9.0f %6d %10s' % (row['step'], row['description'][:40],
+              row['travel'], row['liquid'], row['tips'], row['delay'], row['modules'], row['mix_rounds'],
+              simulation.format_seconds(elapsed)))
+    print('Estimated total: ' + simulation.format_seconds(elapsed))
+    for row in rows:
+        for seconds, message in row['pauses']:
+            print('Pause at ' + simulation.format_seconds(seconds) + ' (STEP ' + str(row['step']) + '): ' + message)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
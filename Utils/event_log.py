@@ -0,0 +1,84 @@
+'''
+Events of a run streamed to a JSON lines file.
+
+The time log of the STEPS is only written once the robot has homed, so a run
+stopped half way leaves no timing at all. EventLog appends one json object per
+line as the run goes: STEPS and columns started and ended, tips picked up,
+channels of the reservoir changed and pauses, each with its time and the STEP
+and column it happened in. Every line goes to the file when it is logged and
+the file is synced to the disk every EVENT_SYNC_LINES lines, EVENT_SYNC_SECONDS
+seconds and at the end of every STEP, so a crash loses at most the last lines.
+The file is only appended to: a restarted run adds its events after the ones of
+the previous attempt.
+
+Copied into the protocols by Utils/sync_inline.py. Pass path = None while
+simulating: nothing is written.
+'''
+import json
+import os
+import time
+from datetime import datetime
+
+EVENT_SYNC_LINES    = 20
+EVENT_SYNC_SECONDS  = 30
+
+
+class EventLog:
+    def __init__(self, path = None):
+        self.file = None if path is None else open(path, 'a')
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+        self.step = None
+        self.column = None
+
+    def event(self, event, **fields):
+        if self.file is None:
+            return
+        record = {'time': datetime.now().isoformat(timespec = 'milliseconds'), 'event': event}
+        if self.step is not None:
+            record['step'] = self.step
+        if self.column is not None:
+            record['column'] = self.column
+        record.update(fields)
+        self.file.write(json.dumps(record, default = str) + '\n')
+        self.file.flush()
+        self.unsynced += 1
+        if self.unsynced >= EVENT_SYNC_LINES or time.monotonic() - self.synced_at >= EVENT_SYNC_SECONDS:
+            self.sync()
+
+    def sync(self):
+        if self.file is None or not self.unsynced:
+            return
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+
+    def step_start(self, step, description):
+        self.column = None
+        self.step = step
+        self.event('step_start', description = description)
+
+    def step_end(self, seconds):
+        self.column_end()
+        self.event('step_end', seconds = round(seconds, 1))
+        self.step = None
+        self.sync()
+
+    def column_start(self, column):
+        '''
+        Column (from 1) the STEP works on next, the previous one ends
+        '''
+        self.column_end()
+        self.column = column
+        self.event('column_start')
+
+    def column_end(self):
+        if self.column is not None:
+            self.event('column_end')
+            self.column = None
+
+    def close(self):
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
@@ -0,0 +1,217 @@
+'''
+Fit the run time model of estimator.py from the time logs of real runs.
+
+The protocols export a tab separated time log (STEP, execution, description,
+wait_time, execution_time) to /var/lib/jupyter/notebooks/<run_id>/. Copy those
+run folders to a directory and add a parameters.json to every folder with the
+protocol and the variables used in that run:
+
+    {"protocol": "Repository/Station B - 1 y 2 - Extracción total/B-Extraccion_total_Magmax_CORE.py",
+     "variables": {"NUM_SAMPLES": 48}}
+
+(--protocol is used for folders without parameters.json). Every run is
+simulated with its parameters and the per-operation costs (per mm of travel,
+per move, per uL at each flow rate, per tip pickup/drop, per blow out and
+touch_tip, per command) are fitted by least squares against the measured STEP
+times, after subtracting the delays and module waits the protocol already
+knows. Costs are regularized towards the estimator defaults so that a few runs
+do not produce absurd values for operations they barely exercise.
+
+Usage:
+    python Utils/fit_time_model.py runs/ --output time_model.json
+    python Utils/estimator.py protocol.py --model time_model.json
+'''
+import argparse
+import json
+import os
+import re
+import sys
+
+import numpy as np
+
+import estimator
+import simulation
+
+LOG_PATTERN     = re.compile(r'time_log.*\.txt$')
+TIME_PATTERN    = re.compile(r'^(?:(\d+) days?, )?(\d+):(\d{2}):(\d{2}(?:\.\d+)?)$')
+
+# Feature -> model parameter it is fitted into
+PARAMETERS = {
+    'travel_mm':    'per_mm_travel',
+    'moves':        'move_overhead',
+    'tip_pickups':  'tip_pickup',
+    'tip_drops':    'tip_drop',
+    'blow_outs':    'blow_out',
+    'touch_tips':   'touch_tip',
+    'commands':     'command_overhead',
+}
+
+
+def parse_time(text):
+    '''
+    Seconds of a str(timedelta) such as 0:05:23.123456, None if it is not one
+    '''
+    match = TIME_PATTERN.match(text.strip())
+    if not match:
+        return None
+    days, hours, minutes, seconds = match.groups()
+    return int(days or 0) * 86400 + int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def read_time_log(path):
+    '''
+    {STEP: seconds} of the executed STEPS of a time log. The rows are the values
+    of the STEPS dict, so wait_time is missing in the rows of STEPS without it.
+    '''
+    times = {}
+    with open(path, encoding = 'utf-8') as f:
+        next(f, None)
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 3 or not fields[0].strip().isdigit() or fields[1] != 'True':
+                continue
+            for field in fields[3:]:
+                seconds = parse_time(field)
+                if seconds is not None:
+                    times[int(fields[0])] = seconds
+    return times
+
+
+def find_runs(directory, default_protocol = None):
+    '''
+    (time log path, protocol path, variables) of every run below directory
+    '''
+    runs = []
+    for root, dirs, files in os.walk(directory):
+        logs = [f for f in files if LOG_PATTERN.search(f)]
+        if not logs:
+            continue
+        protocol, variables = default_protocol, {}
+        parameters_path = os.path.join(root, 'parameters.json')
+        if os.path.isfile(parameters_path):
+            with open(parameters_path, encoding = 'utf-8') as f:
+                parameters = json.load(f)
+            protocol = parameters.get('protocol', protocol)
+            variables = parameters.get('variables', {})
+        if protocol is None:
+            print('Skipping ' + root + ': no parameters.json and no --protocol')
+            continue
+        if not os.path.isabs(protocol):
+            protocol = os.path.join(simulation.REPO_PATH, protocol)
+        for log in sorted(logs):
+            runs.append((os.path.join(root, log), protocol, variables))
+    return runs
+
+
+def collect_rows(runs):
+    '''
+    One row per executed STEP: simulated features, known seconds and measured seconds
+    '''
+    simulations = {}
+    rows = []
+    for log_path, protocol, variables in runs:
+        key = (protocol, json.dumps(variables, sort_keys = True))
+        if key not in simulations:
+            steps = estimator.estimate_protocol(protocol, variables)
+            simulations[key] = {s['step']: s for s in steps}
+        simulated = simulations[key]
+        for step, measured in read_time_log(log_path).items():
+            if step not in simulated:
+                continue
+            features = simulated[step]['features']
+            rows.append({'run': log_path, 'step': step, 'features': features,
+                         'fixed': features.get('fixed_seconds', 0), 'measured': measured})
+    return rows
+
+
+def prior_value(model, feature):
+    '''
+    Default cost of a feature, from the kinematic parameters when not fitted yet
+    '''
+    if feature.startswith('ul@'):
+        return 1 / float(feature[3:])
+    parameter = PARAMETERS[feature]
+    if model.get(parameter) is not None:
+        return model[parameter]
+    if feature == 'travel_mm':
+        return 2 / (model['speed_xy'] + model['speed_z'])
+    if feature == 'touch_tips':
+        return model['touch_tip_path'] / model['touch_tip_speed']
+    return 0
+
+
+def fit(rows, model = None, regularization = 10):
+    '''
+    Least squares fit of the cost of every feature. Costs are expressed as a
+    scale of their default value and regularized towards 1 (the default);
+    negative costs are clipped to zero.
+    '''
+    model = dict(estimator.DEFAULT_MODEL, **(model or {}))
+    names = sorted(set(f for r in rows for f in r['features'] if f == 'travel_mm' or f in PARAMETERS or f.startswith('ul@')))
+    priors = np.array([prior_value(model, n) for n in names])
+    x = np.array([[r['features'].get(n, 0) for n in names] for r in rows], dtype = float) * priors
+    y = np.array([r['measured'] - r['fixed'] for r in rows], dtype = float)
+
+    weight = np.sqrt(regularization)
+    x = np.vstack([x, weight * np.eye(len(names))])
+    y = np.concatenate([y, weight * np.ones(len(names))])
+    scales, _, _, _ = np.linalg.lstsq(x, y, rcond = None)
+    costs = dict(zip(names, np.clip(scales, 0, None) * priors))
+
+    fitted = {'per_ul': {}}
+    for name, cost in costs.items():
+        if name.startswith('ul@'):
+            fitted['per_ul'][name[3:]] = float(cost)
+        else:
+            fitted[PARAMETERS[name]] = float(cost)
+    return fitted
+
+
+def predict(row, fitted, model = None):
+    model = dict(estimator.DEFAULT_MODEL, **(model or {}))
+    seconds = row['fixed']
+    for name, value in row['features'].items():
+        if name.startswith('ul@'):
+            cost = fitted.get('per_ul', {}).get(name[3:], prior_value(model, name))
+        elif name in PARAMETERS:
+            cost = fitted.get(PARAMETERS[name], prior_value(model, name))
+        else:
+            continue
+        seconds += cost * value
+    return seconds
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Fit the run time model from the time logs of real runs')
+    parser.add_argument('directory', help = 'Directory with the run folders (time log + parameters.json)')
+    parser.add_argument('--protocol', help = 'Protocol of the runs without parameters.json')
+    parser.add_argument('--regularization', type = float, default = 10,
+                        help = 'Pull of the costs towards the defaults (default 10)')
+    parser.add_argument('--output', default = 'time_model.json', help = 'Model json for estimator.py')
+    args = parser.parse_args(argv)
+
+    runs = find_runs(args.directory, args.protocol)
+    rows = collect_rows(runs)
+    if not rows:
+        print('No executed STEPS found in ' + args.directory)
+        return 1
+
+    fitted = fit(rows, regularization = args.regularization)
+    error_default = sum(abs(predict(r, {}) - r['measured']) for r in rows) / len(rows)
+    error_fitted = sum(abs(predict(r, fitted) - r['measured']) for r in rows) / len(rows)
+    print('Runs: ' + str(len(runs)) + ', STEPS: ' + str(len(rows)))
+    print('Mean absolute error per STEP: %.1f s with the defaults, %.1f s fitted' % (error_default, error_fitted))
+    for name in sorted(fitted):
+        if name != 'per_ul':
+            print('  %-20s %.4f' % (name, fitted[name]))
+    for flow, cost in sorted(fitted['per_ul'].items(), key = lambda i: float(i[0])):
+        print('  uL at %8s uL/s   %.4f s/uL' % (flow, cost))
+
+    with open(args.output, 'w', encoding = 'utf-8') as f:
+        json.dump(fitted, f, indent = 4, sort_keys = True)
+    print('Model written to ' + args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,64 @@
+'''
+Incubations of the extraction protocols.
+
+A column starts incubating when it receives the reagent, so the wait after the
+pipetting of a stage only has to cover the last column dosed: Incubations keeps
+the time every column of a stage was dosed and delay waits what is left of it.
+Simulated runs keep the full wait.
+
+The temperature module is ramped without blocking the run (start_temperature)
+and only awaited where the temperature matters (await_temperature).
+
+Imported by the thin station scripts and copied into the uploaded protocols by
+Utils/bundle.py. The messages are in English ('en') or Spanish ('es').
+'''
+import math
+from datetime import datetime
+
+INCUBATION_MESSAGES = {
+    'en': {'ramp': 'Temperature module ramping to {celsius} C in the background',
+           'await': 'Waiting for the temperature module to reach {celsius} C (now {temperature} C)',
+           'dosed': 'Last column dosed {elapsed} seconds ago, first column will have {longest} seconds.',
+           'delay': '{msg} for {seconds} seconds.'},
+    'es': {'ramp': 'Módulo de temperatura en rampa hacia {celsius} ºC en segundo plano',
+           'await': 'Esperando a que el módulo de temperatura llegue a {celsius} ºC (ahora {temperature} ºC)',
+           'dosed': 'La última columna recibió el reactivo hace {elapsed} segundos, la primera tendrá {longest} segundos.',
+           'delay': '{msg} durante {seconds} segundos.'},
+}
+
+
+def start_temperature(run_log, module, celsius, language = 'en'):
+    module.start_set_temperature(celsius)
+    run_log.operator(INCUBATION_MESSAGES[language]['ramp'].format(celsius = celsius))
+
+
+def await_temperature(run_log, module, celsius, language = 'en'):
+    if module.status != 'holding at target':
+        run_log.operator(INCUBATION_MESSAGES[language]['await'].format(celsius = celsius, temperature = module.temperature))
+    module.await_temperature(celsius)
+
+
+class Incubations:
+    def __init__(self, ctx, run_log, language = 'en'):
+        self.ctx = ctx
+        self.run_log = run_log
+        self.messages = INCUBATION_MESSAGES[language]
+        self.dose_times = {}
+
+    def record_dose(self, stage, col):
+        self.dose_times.setdefault(stage, {})[col] = datetime.now()
+
+    def delay(self, stage, wait_time, msg):
+        '''
+        Wait until the last column dosed in stage has incubated wait_time seconds
+        '''
+        remaining = wait_time
+        doses = self.dose_times.get(stage)
+        if doses and not self.ctx.is_simulating(): # Simulated runs keep the full wait
+            now = datetime.now()
+            elapsed = (now - max(doses.values())).total_seconds()
+            remaining = max(0, math.ceil(wait_time - elapsed))
+            longest = (now - min(doses.values())).total_seconds() + remaining
+            self.run_log.operator(self.messages['dosed'].format(elapsed = int(elapsed), longest = int(longest)))
+        if remaining > 0:
+            self.ctx.delay(seconds = remaining, msg = self.messages['delay'].format(msg = msg, seconds = remaining))
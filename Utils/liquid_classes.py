@@ -0,0 +1,77 @@
+'''
+Liquid classes shared by the extraction protocols of Station B.
+
+Flow rates (multipliers of the pipette default flow rates, as in the Reagent
+classes of the protocols), air gaps and disposal volume of every liquid
+of the extraction, with a 'safe' profile (the settings the protocols were
+validated with) and, for the liquids with faster settings validated, a 'fast'
+profile. Values missing in the 'fast' profile are taken from 'safe', and a
+liquid without a 'fast' profile always uses 'safe'. Stations A and C handle a
+single liquid at a fixed speed each, so they keep their flow rates in their
+Reagent and have no SPEED_PROFILE.
+
+The protocols are uploaded to the robot as a single file, so this module is
+copied into them by Utils/sync_inline.py; edit it here and run the script
+instead of editing the copies.
+'''
+SPEED_PROFILES = ['safe', 'fast']
+
+# Arguments of the Reagent classes of the extraction protocols
+EXTRACTION_FIELDS   = ['flow_rate_aspirate', 'flow_rate_dispense', 'flow_rate_aspirate_mix', 'flow_rate_dispense_mix',
+                       'air_gap_vol_bottom', 'air_gap_vol_top', 'disposal_volume']
+
+LIQUID_DEFAULTS = {
+    'air_gap_vol_bottom':   5,
+    'air_gap_vol_top':      0,
+    'disposal_volume':      1,
+}
+
+LIQUID_CLASSES = {
+    'lysis': {
+        'safe': {'flow_rate_aspirate': 1, 'flow_rate_dispense': 1, 'flow_rate_aspirate_mix': 1, 'flow_rate_dispense_mix': 1},
+        'fast': {'flow_rate_aspirate': 25, 'flow_rate_dispense': 100, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 100},
+    },
+    'lysis_binding': {  # Magmax CORE lysis + binding solution, viscous
+        'safe': {'flow_rate_aspirate': 0.5, 'flow_rate_dispense': 0.5, 'flow_rate_aspirate_mix': 0.5, 'flow_rate_dispense_mix': 0.5},
+    },
+    'beads': {
+        'safe': {'flow_rate_aspirate': 3, 'flow_rate_dispense': 3, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 50},
+        'fast': {'flow_rate_aspirate': 25, 'flow_rate_dispense': 100, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 100},
+    },
+    'beads_pk': {
+        'safe': {'flow_rate_aspirate': 3, 'flow_rate_dispense': 3, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 50},
+        'fast': {'flow_rate_aspirate': 25, 'flow_rate_dispense': 100, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 100},
+    },
+    'wash': {
+        'safe': {'flow_rate_aspirate': 3, 'flow_rate_dispense': 3, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 100},
+        'fast': {'flow_rate_aspirate': 25, 'flow_rate_dispense': 100, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 100},
+    },
+    'ethanol': {        # Drips from the tips when aspirated fast
+        'safe': {'flow_rate_aspirate': 3, 'flow_rate_dispense': 3, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 100},
+    },
+    'elution': {
+        'safe': {'flow_rate_aspirate': 3, 'flow_rate_dispense': 3, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 40},
+        'fast': {'flow_rate_aspirate': 25, 'flow_rate_dispense': 100, 'flow_rate_aspirate_mix': 25, 'flow_rate_dispense_mix': 100},
+    },
+    'sample': {         # Sample / supernatant in the deepwell plate
+        'safe': {'flow_rate_aspirate': 0.5, 'flow_rate_dispense': 1, 'flow_rate_aspirate_mix': 1, 'flow_rate_dispense_mix': 1},
+        'fast': {'flow_rate_aspirate': 5, 'flow_rate_dispense': 100},
+    },
+}
+
+
+def liquid_class(name, profile = 'safe', fields = None):
+    '''
+    Settings of a liquid class for a speed profile, as keyword arguments of a
+    Reagent. fields restricts them to the arguments the Reagent class accepts.
+    '''
+    if name not in LIQUID_CLASSES:
+        raise ValueError('Unknown liquid class ' + repr(name) + ', use one of ' + ', '.join(sorted(LIQUID_CLASSES)))
+    if profile not in SPEED_PROFILES:
+        raise ValueError('Unknown speed profile ' + repr(profile) + ', use one of ' + ', '.join(SPEED_PROFILES))
+    settings = dict(LIQUID_DEFAULTS)
+    settings.update(LIQUID_CLASSES[name]['safe'])
+    settings.update(LIQUID_CLASSES[name].get(profile, {}))
+    if fields is not None:
+        settings = dict((field, settings[field]) for field in fields)
+    return settings
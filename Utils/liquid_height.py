@@ -0,0 +1,117 @@
+'''
+Height of the liquid in a well from the volume it holds.
+
+The volume of a well is not proportional to the height of the liquid: the V
+bottom of the reservoirs, the bottom of the deepwells and the cone of the
+falcons hold less volume per mm than the rest of the well. HeightTable builds a
+piecewise table of (volume, height) points every TABLE_STEP mm from the well of
+the labware definition (shape, diameter or x and y dimensions, depth and
+totalLiquidVolume) and the shape of its bottom, which the definitions do not
+describe: BOTTOM_SHAPES, flat for the labware not listed. The depth of a tube
+goes up to its rim, above its nominal volume: the table ends at the height that
+holds totalLiquidVolume. The table of every labware is built once and each
+lookup is a binary search.
+
+Copied into the protocols by Utils/sync_inline.py.
+'''
+import math
+from bisect import bisect_right
+
+TABLE_STEP = 0.1 # mm between the points of the tables
+
+# (shape, depth in mm) of the bottom of the wells: 'flat', 'v' (a groove along
+# the well, as in the 12 well reservoir), 'pyramid' (square wells) or 'cone'
+# (round wells, to a point)
+BOTTOM_SHAPES = {
+    'kingfisher_96_wellplate_2000ul':           ('pyramid', 4),
+    'nest_12_reservoir_15ml':                   ('v', 1.95),
+    'nest_1_reservoir_195ml':                   ('flat', 0),
+    'opentrons_6_tuberack_falcon_50ml_conical': ('cone', 20),
+}
+
+HEIGHT_TABLES = {}
+
+
+def cross_section(well, bottom_shape, bottom_depth, z):
+    '''
+    Area in mm2 of the well at z mm over its bottom
+    '''
+    if well['shape'] == 'circular':
+        area = math.pi * (well['diameter'] / 2) ** 2
+    else:
+        area = well['xDimension'] * well['yDimension']
+    if bottom_shape == 'flat' or z >= bottom_depth:
+        return area
+    if bottom_shape == 'v':
+        return area * z / bottom_depth
+    if bottom_shape in ['pyramid', 'cone']:
+        return area * (z / bottom_depth) ** 2
+    raise ValueError('Unknown bottom shape ' + repr(bottom_shape) + ', use flat, v, pyramid or cone')
+
+
+class HeightTable:
+    '''
+    (volume, height) points of a well. The area of a section is at most
+    quadratic in the height, so the volume of every step (Simpson) is exact and
+    only the interpolation between points is approximated.
+    '''
+    def __init__(self, well, bottom_shape = 'flat', bottom_depth = 0, step = TABLE_STEP):
+        num_steps = max(1, int(math.ceil(well['depth'] / step)))
+        self.heights = [well['depth'] * i / num_steps for i in range(num_steps + 1)]
+        self.volumes = [0]
+        for z0, z1 in zip(self.heights, self.heights[1:]):
+            areas = [cross_section(well, bottom_shape, bottom_depth, z) for z in [z0, (z0 + z1) / 2, z1]]
+            self.volumes.append(self.volumes[-1] + (z1 - z0) * (areas[0] + 4 * areas[1] + areas[2]) / 6)
+        capacity = well.get('totalLiquidVolume')
+        if capacity is not None and capacity < self.volumes[-1]: # Up to the nominal volume
+            i = bisect_right(self.volumes, capacity)
+            top = self.heights[i - 1] + (self.heights[i] - self.heights[i - 1]) * (capacity - self.volumes[i - 1]) / (self.volumes[i] - self.volumes[i - 1])
+            self.heights = self.heights[:i] + [top]
+            self.volumes = self.volumes[:i] + [capacity]
+        self.depth = self.heights[-1]
+
+    def height(self, volume):
+        '''
+        Height in mm of volume uL in the well, 0 when empty and the depth of the
+        well when full
+        '''
+        if volume <= 0:
+            return 0
+        if volume >= self.volumes[-1]:
+            return self.depth
+        i = bisect_right(self.volumes, volume)
+        v0, v1 = self.volumes[i - 1], self.volumes[i]
+        return self.heights[i - 1] + (self.heights[i] - self.heights[i - 1]) * (volume - v0) / (v1 - v0)
+
+    def volume(self, height):
+        '''
+        uL in the well up to height mm
+        '''
+        if height <= 0:
+            return 0
+        if height >= self.depth:
+            return self.volumes[-1]
+        i = bisect_right(self.heights, height)
+        h0, h1 = self.heights[i - 1], self.heights[i]
+        return self.volumes[i - 1] + (self.volumes[i] - self.volumes[i - 1]) * (height - h0) / (h1 - h0)
+
+
+def well_definition(labware):
+    '''
+    Entry of the first well of labware in its definition: older robot software
+    keeps it in labware._definition, newer in the implementation of the labware
+    '''
+    definition = getattr(labware, '_definition', None)
+    if definition is None:
+        definition = labware._implementation.get_definition()
+    return definition['wells'][labware.wells()[0].well_name]
+
+
+def height_table(labware):
+    '''
+    HeightTable of the wells of a labware, built the first time
+    '''
+    if labware.load_name not in HEIGHT_TABLES:
+        bottom_shape, bottom_depth = BOTTOM_SHAPES.get(labware.load_name, ('flat', 0))
+        HEIGHT_TABLES[labware.load_name] = HeightTable(well_definition(labware), bottom_shape, bottom_depth)
+    return HEIGHT_TABLES[labware.load_name]
@@ -0,0 +1,178 @@
+'''
+Performance regression gate for the station protocols.
+
+Stores a snapshot of every protocol in Utils/Snapshots/: the normalized
+simulated command stream and its totals (moves, tip pickups, tips, delays and
+estimated seconds), per STEP and for the whole run. The check simulates the
+protocols again and fails when the estimated run time or the tip usage grows
+beyond the thresholds, showing the STEPS that changed and the first command
+where the stream diverges from the snapshot.
+
+Usage:
+    python Utils/perf_gate.py --update                  # write the snapshots
+    python Utils/perf_gate.py                           # check every protocol
+    python Utils/perf_gate.py "Repository/Station B - 1 y 2 - Extracción total/B-Extraccion_total_TurboBeads.py"
+
+Run the check before committing changes to a protocol and --update once the
+new timings are intended. A protocol without a snapshot fails: record it with
+--update (a new protocol) and commit the new file of Utils/Snapshots/ with it.
+The protocols the simulator cannot run (simulation.UNSIMULATED) are skipped
+unless given explicitly. The snapshots need the Opentrons simulator (see
+simulation.SIMULATOR_REQUIREMENT) with the apiLevel of the protocols.
+'''
+import argparse
+import json
+import os
+import re
+import sys
+
+import estimator
+import simulation
+
+SNAPSHOTS_PATH  = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Snapshots')
+FLOAT_PATTERN   = re.compile(r'\d+\.\d+')
+TOTALS          = ['commands', 'moves', 'tip_pickups', 'tips', 'delays', 'delay_seconds', 'seconds']
+
+SECONDS_THRESHOLD   = 0.02  # Allowed relative increase of the estimated time
+TIPS_THRESHOLD      = 0     # Allowed increase of tips consumed
+
+
+def snapshot_path(protocol_path):
+    name = os.path.relpath(protocol_path, simulation.PROTOCOLS_PATH)
+    name = re.sub(r'[^\w.-]+', '_', os.path.splitext(name)[0])
+    return os.path.join(SNAPSHOTS_PATH, name + '.json')
+
+
+def normalize(command):
+    '''
+    Text of a command without simulator noise (floats rounded to 0.1)
+    '''
+    text = command['payload'].get('text', '') or ''
+    text = FLOAT_PATTERN.sub(lambda m: '%.1f' % float(m.group(0)), text)
+    return command['name'].replace('command.', '') + ' ' + text
+
+
+def take_snapshot(protocol_path, overrides = None, model = None):
+    commands = simulation.simulate_protocol(protocol_path, overrides)
+    steps = simulation.split_steps(commands)
+    estimate = estimator.Estimator(model)
+    estimate.plan_ramps([c for step in steps for c in simulation.leaf_commands(step['commands'])])
+    tips = simulation.TipCounter()
+    snapshot = {'protocol': os.path.relpath(protocol_path, simulation.REPO_PATH),
+                'overrides': overrides or {}, 'steps': [], 'commands': []}
+    for step in steps:
+        totals = dict((k, 0) for k in TOTALS)
+        for command in step['commands']:
+            totals['tips'] += tips.consumed(command)
+        estimate.reset_totals()
+        for command in simulation.leaf_commands(step['commands']):
+            if command['name'] == 'command.COMMENT':
+                continue
+            totals['commands'] += 1
+            totals['seconds'] += estimate(command)
+            if command['name'] == 'command.DELAY':
+                totals['delays'] += 1
+            snapshot['commands'].append(normalize(command))
+        totals['moves'] = estimate.features.get('moves', 0)
+        totals['tip_pickups'] = estimate.features.get('tip_pickups', 0)
+        totals['delay_seconds'] = estimate.components['delay']
+        totals['seconds'] = round(totals['seconds'], 1)
+        snapshot['steps'].append(dict(step = step['step'], description = step['description'], **totals))
+    snapshot['totals'] = dict((k, round(sum(s[k] for s in snapshot['steps']), 1)) for k in TOTALS)
+    return snapshot
+
+
+def first_difference(old, new):
+    for i, (a, b) in enumerate(zip(old, new)):
+        if a != b:
+            return i, a, b
+    if len(old) != len(new):
+        i = min(len(old), len(new))
+        return i, old[i] if i < len(old) else '<end>', new[i] if i < len(new) else '<end>'
+    return None
+
+
+def compare(old, new, seconds_threshold = SECONDS_THRESHOLD, tips_threshold = TIPS_THRESHOLD):
+    '''
+    List of regressions of new against old, empty when the protocol passes
+    '''
+    regressions = []
+    seconds_limit = old['totals']['seconds'] * (1 + seconds_threshold)
+    if new['totals']['seconds'] > seconds_limit:
+        regressions.append('estimated time %s -> %s (+%.1f%%)' % (
+            simulation.format_seconds(old['totals']['seconds']), simulation.format_seconds(new['totals']['seconds']),
+            100 * (new['totals']['seconds'] / max(old['totals']['seconds'], 1) - 1)))
+    if new['totals']['tips'] > old['totals']['tips'] + tips_threshold:
+        regressions.append('tips %d -> %d' % (old['totals']['tips'], new['totals']['tips']))
+    return regressions
+
+
+def report_steps(old, new):
+    old_steps = dict((s['step'], s) for s in old['steps'])
+    for step in new['steps']:
+        before = old_steps.get(step['step'])
+        if before is None:
+            print('    STEP %s: new' % step['step'])
+            continue
+        changes = ['%s %s -> %s' % (k, before[k], step[k]) for k in TOTALS if before[k] != step[k]]
+        if changes:
+            print('    STEP %s %s: %s' % (step['step'], step['description'][:30], ', '.join(changes)))
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Check the protocols against their performance snapshots')
+    parser.add_argument('protocols', nargs = '*', help = 'Protocol files (default: every station protocol)')
+    parser.add_argument('--update', action = 'store_true', help = 'Write the snapshots instead of checking')
+    parser.add_argument('--seconds-threshold', type = float, default = SECONDS_THRESHOLD,
+                        help = 'Allowed relative increase of the estimated time (default 0.02)')
+    parser.add_argument('--tips-threshold', type = int, default = TIPS_THRESHOLD,
+                        help = 'Allowed increase of tips consumed (default 0)')
+    parser.add_argument('--model', help = 'Model json written by fit_time_model.py')
+    args = parser.parse_args(argv)
+
+    model = estimator.load_model(args.model)
+    failed = False
+    for path in simulation.resolve_protocols(args.protocols):
+        name = os.path.relpath(path, simulation.PROTOCOLS_PATH)
+        target = snapshot_path(path)
+        if not args.protocols and name in simulation.UNSIMULATED:
+            print('SKIPPED ' + name + ': ' + simulation.UNSIMULATED[name])
+            continue
+        if not args.update and not os.path.isfile(target):
+            print('FAIL    ' + name + ': no snapshot, record it with --update and commit ' +
+                  os.path.relpath(target, simulation.REPO_PATH))
+            failed = True
+            continue
+        try:
+            new = take_snapshot(path, model = model)
+        except Exception as e:
+            print('FAIL    ' + name + ': simulation failed: ' + repr(e))
+            failed = True
+            continue
+
+        if args.update:
+            os.makedirs(SNAPSHOTS_PATH, exist_ok = True)
+            with open(target, 'w', encoding = 'utf-8') as f:
+                json.dump(new, f, indent = 1, ensure_ascii = False)
+            print('UPDATED ' + name + ' (' + simulation.format_seconds(new['totals']['seconds']) +
+                  ', ' + str(new['totals']['tips']) + ' tips)')
+            continue
+
+        with open(target, encoding = 'utf-8') as f:
+            old = json.load(f)
+        regressions = compare(old, new, args.seconds_threshold, args.tips_threshold)
+        print(('FAIL    ' if regressions else 'OK      ') + name)
+        for regression in regressions:
+            print('    ' + regression)
+        if regressions or old['totals'] != new['totals']:
+            report_steps(old, new)
+            difference = first_difference(old['commands'], new['commands'])
+            if difference:
+                print('    first different command (#%d):\n      - %s\n      + %s' % difference)
+        failed = failed or bool(regressions)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+'''
+Pipetting helpers of the multichannel protocols of Station B.
+
+They were nested in run(ctx) of every protocol and drifted apart; here the run
+objects they used (the protocol context, the run log and the event log) are
+parameters, so a fix reaches every station. calc_height takes the pickup height
+of a reagent of the 12 well reservoir and changes channel when the one in use
+runs out, move_vol_multichannel moves a volume from a source to a destination
+with the air gaps and the options of the reagent, and custom_mix mixes in place.
+plan_supernatant_trips splits the removal of the supernatant of a deepwell.
+
+Imported by the thin station scripts and copied into the uploaded protocols by
+Utils/bundle.py, or inlined with Utils/sync_inline.py.
+'''
+import math
+from opentrons.types import Point
+
+
+def find_side(col):
+    '''
+    Side of the wells of column col the offsets in x go to: -1 (left) for the
+    even columns, 1 (right) for the odd ones
+    '''
+    if col%2 == 0:
+        side = -1 # left
+    else:
+        side = 1 # right
+    return side
+
+
+def custom_mix(ctx, pipet, reagent, location, vol, rounds, blow_out, mix_height, offset, wait_time = 0, drop_height = -1, two_thirds_mix_bottom = False):
+    '''
+    Function for mix in the same location a certain number of rounds. Blow out optional. Offset
+    can set to 0 or a higher/lower value which indicates the lateral movement
+    '''
+    if mix_height <= 0:
+        mix_height = 1
+    pipet.aspirate(1, location = location.bottom(z = mix_height), rate = reagent.flow_rate_aspirate_mix)
+    for i in range(rounds):
+        pipet.aspirate(vol, location = location.bottom(z = mix_height), rate = reagent.flow_rate_aspirate_mix)
+        if two_thirds_mix_bottom and i < ((rounds / 3) * 2):
+            pipet.dispense(vol, location = location.bottom(z = 5).move(Point(x = offset)), rate = reagent.flow_rate_dispense_mix)
+        else:
+            pipet.dispense(vol, location = location.top(z = drop_height).move(Point(x = offset)), rate = reagent.flow_rate_dispense_mix)
+    pipet.dispense(1, location = location.bottom(z = mix_height), rate = reagent.flow_rate_dispense_mix)
+    if blow_out == True:
+        pipet.blow_out(location.top(z = -2)) # Blow out
+    if wait_time != 0:
+        ctx.delay(seconds=wait_time, msg='Waiting for ' + str(wait_time) + ' seconds.')
+
+
+def calc_height(run_log, events, reagent, heights, aspirate_volume, follow_depth = 0, min_height = 0.4):
+    '''
+    (pickup height follow_depth mm below the liquid left once aspirate_volume
+    uL are taken from the channel of reagent, True if the channel changed).
+    heights is the HeightTable of the reservoir (see liquid_height).
+    '''
+    run_log.debug('Remaining volume ' + str(reagent.vol_well) +
+                '< needed volume ' + str(aspirate_volume) + '?')
+    if (reagent.vol_well - reagent.dead_vol) < aspirate_volume:
+        run_log.debug('Next column should be picked')
+        run_log.debug('Previous to change: ' + str(reagent.col))
+        # column selector position; intialize to required number
+        reagent.col = reagent.col + 1
+        events.event('channel_change', reagent = reagent.name, channel = reagent.channels[reagent.col])
+        run_log.debug(str('After change: ' + str(reagent.col)))
+        reagent.vol_well = reagent.channel_volumes[reagent.col]
+        run_log.debug('New volume:' + str(reagent.vol_well))
+        height = heights.height(reagent.vol_well - aspirate_volume) - follow_depth
+        reagent.vol_well = reagent.vol_well - aspirate_volume
+        run_log.debug('Remaining volume:' + str(reagent.vol_well))
+        if height < min_height:
+            height = min_height
+        col_change = True
+    else:
+        height = heights.height(reagent.vol_well - aspirate_volume) - follow_depth
+        reagent.vol_well = reagent.vol_well - aspirate_volume
+        run_log.debug('Calculated height is ' + str(height))
+        if height < min_height:
+            height = min_height
+        run_log.debug('Used height is ' + str(height))
+        col_change = False
+    return height, col_change
+
+
+def plan_supernatant_trips(heights, volume, max_trip_vol, extra_vol, follow_depth, final_height):
+    '''
+    Trips (volume, pickup height, near pellet) to remove volume uL from a well of
+    HeightTable heights, extra_vol uL more to leave it empty. The upper trips
+    aspirate fast follow_depth mm below the liquid level; only the trips that
+    reach final_height, next to the pellet, go slowly, and the final one removes
+    what is left.
+    '''
+    num_trips = math.ceil((volume + extra_vol) / max_trip_vol)
+    trips = []
+    remaining = volume
+    for i in range(num_trips - 1):
+        remaining -= max_trip_vol
+        height = heights.height(remaining) - follow_depth
+        trips.append((max_trip_vol, max(height, final_height), height <= final_height))
+    trips.append((max_trip_vol, final_height, True))
+    return trips
+
+
+def aspirate_with_x_scrolling(pip, volume, src, pickup_height = 0, rate = 1, start_x_offset_src = 0, stop_x_offset_src = 0):
+    '''
+    Aspirate volume uL pip.min_volume at a time, moving from stop_x_offset_src
+    to start_x_offset_src mm across the bottom of src
+    '''
+    max_asp = volume/pip.min_volume
+    inc_step = (start_x_offset_src - stop_x_offset_src) / max_asp
+
+    num_asp = math.ceil((start_x_offset_src - stop_x_offset_src) / inc_step) # Points of numpy.arange(stop, start, inc_step)
+    for x in reversed([stop_x_offset_src + k * inc_step for k in range(num_asp)]):
+        s = src.bottom(pickup_height).move(Point(x = x))
+        pip.aspirate(volume = pip.min_volume, location = s, rate = rate)
+
+
+def move_vol_multichannel(ctx, run_log, pipet, reagent, source, dest, vol, x_offset_source, x_offset_dest, pickup_height, rinse,
+    avoid_droplet, wait_time, blow_out, touch_tip = False, touch_tip_v_offset = -10, drop_height = -5,
+    aspirate_with_x_scroll = False, dispense_bottom_air_gap_before = False, aspirate_rate = None):
+    if aspirate_rate is None:
+        aspirate_rate = reagent.flow_rate_aspirate
+    # Rinse before aspirating
+    if rinse == True:
+        custom_mix(ctx, pipet, reagent, location = source, vol = vol, rounds = 20, blow_out = False, mix_height = 3, offset = 0)
+
+    # SOURCE
+    if dispense_bottom_air_gap_before and reagent.air_gap_vol_bottom:
+        pipet.dispense(reagent.air_gap_vol_bottom, source.top(z = -2), rate = reagent.flow_rate_dispense)
+
+    if reagent.air_gap_vol_top != 0: #If there is air_gap_vol, switch pipette to slow speed
+        pipet.move_to(source.top(z = 0))
+        pipet.air_gap(reagent.air_gap_vol_top) #air gap
+
+    if aspirate_with_x_scroll:
+        aspirate_with_x_scrolling(pip = pipet, volume = vol, src = source, pickup_height = pickup_height, rate = aspirate_rate, start_x_offset_src = 0, stop_x_offset_src = x_offset_source)
+    else:
+        s = source.bottom(pickup_height).move(Point(x = x_offset_source))
+        pipet.aspirate(vol, s, rate = aspirate_rate) # aspirate liquid
+
+    if reagent.air_gap_vol_bottom != 0: #If there is air_gap_vol, switch pipette to slow speed
+        pipet.move_to(source.top(z = 0))
+        pipet.air_gap(reagent.air_gap_vol_bottom) #air gap
+
+    if wait_time != 0:
+        ctx.delay(seconds=wait_time, msg='Waiting for ' + str(wait_time) + ' seconds.')
+
+    if avoid_droplet == True: # Touch the liquid surface to avoid droplets
+        run_log.debug("Moving to: " + str(round(pickup_height, 2)) + ' mm')
+        pipet.move_to(source.bottom(pickup_height))
+
+    # GO TO DESTINATION
+    d = dest.top(z = drop_height).move(Point(x = x_offset_dest))
+    pipet.dispense(vol - reagent.disposal_volume + reagent.air_gap_vol_bottom, d, rate = reagent.flow_rate_dispense)
+
+    if reagent.air_gap_vol_top != 0:
+        pipet.dispense(reagent.air_gap_vol_top, dest.top(z = 0), rate = reagent.flow_rate_dispense)
+
+    if blow_out == True:
+        pipet.blow_out(dest.top(z = -5))
+
+    if touch_tip == True:
+        pipet.touch_tip(speed = 20, v_offset = touch_tip_v_offset, radius=0.7)
+
+    if wait_time != 0:
+        ctx.delay(seconds=wait_time, msg='Waiting for ' + str(wait_time) + ' seconds.')
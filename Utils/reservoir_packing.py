@@ -0,0 +1,69 @@
+'''
+Reagents of a run packed into the channels of the 12 well reservoir.
+
+Every channel keeps its dead volume at the bottom, and every change of channel
+in the middle of a STEP means a fresh channel to mix (beads) and a new pickup
+height. pack_channels fills each reagent into as few consecutive channels as
+its aspirations fit in, so both the dead volume and the changes of channel are
+the minimum, and sizes every channel to the aspirations it serves instead of
+splitting the volume evenly: calc_height changes channel exactly when the
+aspirations of a channel are done. fill_sheet gives the volumes the operator
+fills the channels with: the volume of every channel plus FILL_MARGIN of it, so
+the pipetting losses and the evaporation of a long run do not leave the last
+aspirations of a channel short. The protocols track the volume without the
+margin, which stays in the channel.
+
+Copied into the protocols by Utils/sync_inline.py.
+'''
+import math
+
+CHANNEL_MAX_VOLUME  = 12200 # uL a channel is filled with at most, dead volume and margin included
+FILL_MARGIN         = 0.1   # Fraction of the volume of a channel added when it is filled
+
+
+def pack_channels(demands, num_channels = 12, max_volume = CHANNEL_MAX_VOLUME):
+    '''
+    demands: (name, uL of every aspiration in the order they are taken, dead
+    volume of a channel) of each reagent. Reagents without aspirations take no
+    channel. Returns {name: [(channel from 1, uL to fill)]}, the channels of the
+    reagents consecutive and in the order of demands. The uL to fill do not
+    include the margin (see fill_volume).
+    '''
+    max_volume = max_volume / (1 + FILL_MARGIN)
+    packing = {}
+    channel = 1
+    for name, aspirations, dead_vol in demands:
+        if not aspirations:
+            continue
+        useful = [0]
+        for volume in aspirations:
+            if volume > max_volume - dead_vol:
+                raise ValueError('An aspiration of ' + str(round(volume, 1)) + ' uL of ' + name +
+                                 ' does not fit in a channel of ' + str(int(max_volume * (1 + FILL_MARGIN))) + ' uL')
+            if useful[-1] + volume > max_volume - dead_vol:
+                useful.append(0)
+            useful[-1] += volume
+        # 1 uL more so that rounding does not change channel before its last aspiration
+        packing[name] = [(channel + k, int(math.ceil(volume)) + dead_vol + 1) for k, volume in enumerate(useful)]
+        channel += len(useful)
+    if channel - 1 > num_channels:
+        raise ValueError('The reagents need ' + str(channel - 1) + ' channels and the reservoir has ' + str(num_channels))
+    return packing
+
+
+def fill_volume(volume):
+    '''
+    uL to fill a channel the run takes volume uL from (dead volume included) with
+    '''
+    return int(math.ceil(volume * (1 + FILL_MARGIN)))
+
+
+def fill_sheet(packing, label = 'Channel'):
+    '''
+    One line per channel with the reagent and the uL to fill it with
+    '''
+    lines = []
+    for name, channels in packing.items():
+        for channel, volume in channels:
+            lines.append(label + ' ' + str(channel) + ': ' + name + ', ' + str(fill_volume(volume)) + ' uL')
+    return lines
@@ -0,0 +1,65 @@
+'''
+Run log with levels.
+
+Every protocol comment is a command the robot has to analyse and the app has
+to show, so the detail of every pickup height and column is kept out of them.
+'operator' messages (STEPS, volumes, waits, tips) are protocol comments;
+'debug' messages are only comments when the log level is 'debug'. Both go to a
+local file, kept in a buffer and written every LOG_BUFFER_LINES lines, at
+every operator message and at close().
+
+Copied into the protocols by Utils/sync_inline.py. Pass path = None while
+simulating: nothing is written.
+'''
+from datetime import datetime
+
+LOG_LEVELS          = ['operator', 'debug']
+LOG_BUFFER_LINES    = 200
+LOG_SEPARATOR       = '###############################################'
+
+
+class RunLog:
+    def __init__(self, ctx, path = None, level = 'operator'):
+        if level not in LOG_LEVELS:
+            raise ValueError('Unknown log level ' + repr(level) + ', use one of ' + ', '.join(LOG_LEVELS))
+        self.ctx = ctx
+        self.path = path
+        self.level = level
+        self.buffer = []
+
+    def write(self, level, msg):
+        if self.path is None:
+            return
+        self.buffer.append(datetime.now().strftime('%Y/%m/%d %H:%M:%S') + '\t' + level + '\t' + msg)
+        if len(self.buffer) >= LOG_BUFFER_LINES:
+            self.flush()
+
+    def operator(self, msg):
+        self.ctx.comment(msg)
+        self.write('operator', msg)
+        self.flush()
+
+    def debug(self, msg):
+        if self.level == 'debug':
+            self.ctx.comment(msg)
+        self.write('debug', msg)
+
+    def banner(self, title):
+        '''
+        Title of a part of the run, between separator lines in debug level
+        '''
+        self.debug(' ')
+        self.debug(LOG_SEPARATOR)
+        self.operator(title)
+        self.debug(LOG_SEPARATOR)
+        self.debug(' ')
+
+    def flush(self):
+        if self.path is None or not self.buffer:
+            return
+        with open(self.path, 'a') as f:
+            f.write('\n'.join(self.buffer) + '\n')
+        self.buffer = []
+
+    def close(self):
+        self.flush()
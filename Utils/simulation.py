@@ -0,0 +1,248 @@
+'''
+Simulation of the station protocols, shared by the benchmark, the estimator
+and the performance gate.
+
+simulate_protocol loads a protocol through the Opentrons simulator, with some of
+its variables overridden (NUM_SAMPLES...), and returns the published command
+stream; split_steps groups it by STEP (using the 'Step N: ...' / 'PASO N: ...'
+banners the protocols already print) and TipCounter counts the tips consumed.
+
+The simulator is the one of opentrons 4.x: opentrons.commands, where the command
+stream is published, does not exist in opentrons 5 and later. A run that only
+publishes comments (a check of the parameters of the protocol failed, every
+STEP is off...) raises NoCommandsError instead of giving a run of 0 seconds.
+'''
+import glob
+import json
+import os
+import re
+
+
+class NoCommandsError(Exception):
+    pass
+
+
+REPO_PATH       = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LABWARE_PATH    = os.path.join(REPO_PATH, 'Labware')
+PROTOCOLS_PATH  = os.path.join(REPO_PATH, 'Repository')
+
+PROTOCOLS = [
+    'Station A/A-Dispensacion_muestras.py',
+    'Station A/Dilución Antibióticos/NEW_A-Dilucion_Seriada.py',
+    'Station A/Dilución Antibióticos/NEW_A-Dilucion_Seriada_Inversa.py',
+    'Station B - 1 y 2 - Extracción total/B-Extraccion_total_Magmax_CORE.py',
+    'Station B - 1 y 2 - Extracción total/B-Extraccion_total_Magmax_Viral_Pathogen.py',
+    'Station B - 1 y 2 - Extracción total/B-Extraccion_total_Magmax_Viral_Pathogen_Virgen_Del_Rocio.py',
+    'Station B - 1 y 2 - Extracción total/B-Extraccion_total_TurboBeads.py',
+    'Station B - 1 y 2 - Extracción total/Protocolos en desarrollo/NEW_B-Extraccion_total_Generico.py',
+    'Station B - 3 y 4 - Preparación Kingfisher/B-Magmax_Viral_Pathogen-Preparacion_Kingfisher.py',
+    'Station B - 3 y 4 - Preparación Kingfisher/B-Magmax_Viral_Pathogen-Preparacion_Kingfisher_300.py',
+    'Station B - 3 y 4 - Preparación Kingfisher/B-Preparacion_Kingfisher_Magmax_CORE.py',
+    'Station B - 3 y 4 - Preparación Kingfisher/B-Preparacion_Kingfisher_Magmax_Viral_Pathogen (pool).py',
+    'Station B - 3 y 4 - Preparación Kingfisher/B-Preparacion_Kingfisher_TurboBeads.py',
+    'Station C - 1 - Dispensación de reactivos/C-Certest.py',
+    'Station C - 1 - Dispensación de reactivos/C-Generico.py',
+    'Station C - 2 - Dispensación de muestras/C-Dispensacion_muestras.py',
+]
+
+# Protocols of PROTOCOLS that the simulator cannot run as they are in the repository
+UNSIMULATED = {
+    'Station A/Dilución Antibióticos/NEW_A-Dilucion_Seriada_Inversa.py':
+        'its check of the samples per rack stops the run with the default values',
+    'Station B - 1 y 2 - Extracción total/B-Extraccion_total_Magmax_Viral_Pathogen_Virgen_Del_Rocio.py':
+        'thermo_96_wellplate_2200ul is not in Labware/',
+    'Station B - 3 y 4 - Preparación Kingfisher/B-Preparacion_Kingfisher_Magmax_Viral_Pathogen (pool).py':
+        'IndexError in the setup of the pools with the default values',
+}
+
+SIMULATOR_REQUIREMENT   = "opentrons 4.x (pip install 'opentrons>=4,<5', Python 3.7), which simulates the apiLevel 2.x of the protocols and publishes the command stream in opentrons.commands, removed in opentrons 5"
+NO_COMMANDS_COMMENTS    = 5 # Last comments shown for a run without commands (a check of its parameters failed...)
+
+LIQUID_COMMANDS         = ['command.ASPIRATE', 'command.DISPENSE']
+
+SETUP_STEP  = 'setup'
+STEP_BANNER = re.compile(r'^\s*(?:Step|PASO|Paso)\s+(\d+)\s*:\s*(.*)$')
+STEP_END    = re.compile(r'\s(?:took|hizo un tiempo de)\s')
+
+
+def override_variables(source, overrides):
+    '''
+    Replace the value of module level assignments such as NUM_SAMPLES = 96
+    so the derived variables (num_cols...) are recalculated by the protocol.
+    '''
+    for name, value in overrides.items():
+        pattern = re.compile(r'^(' + re.escape(name) + r'\s*=\s*)[^#\n]*', re.MULTILINE)
+        source, count = pattern.subn(lambda m: m.group(1) + repr(value) + ' ', source, count = 1)
+        if count == 0:
+            raise ValueError('Variable ' + name + ' not found in protocol')
+    return source
+
+
+def load_custom_labware(protocol_path):
+    '''
+    Custom labware definitions in Labware/ and next to the protocol, by load name
+    '''
+    paths = glob.glob(os.path.join(LABWARE_PATH, '*.json'))
+    paths += glob.glob(os.path.join(os.path.dirname(protocol_path), '*.json'))
+    labware = {}
+    for path in paths:
+        with open(path, encoding = 'utf-8') as f:
+            definition = json.load(f)
+        if 'parameters' in definition:
+            labware[definition['parameters']['loadName']] = definition
+    return labware
+
+
+def simulate_protocol(protocol_path, overrides = None):
+    '''
+    Run the protocol in the Opentrons simulator and return the published
+    commands as a list of {'name', 'payload', 'level'} dicts, in order. The
+    aspirates and dispenses also keep the 'flow_rate' (uL/s, 'aspirate' and
+    'dispense') of their pipette when they were published.
+    Raises NoCommandsError when the run only publishes comments.
+    '''
+    try:
+        from opentrons import simulate
+        try:
+            from opentrons.commands import types as command_types
+        except ImportError:
+            from opentrons.commands import command_types
+    except ImportError as e:
+        raise ImportError('The simulation needs ' + SIMULATOR_REQUIREMENT + ' (' + str(e) + ')') from e
+
+    with open(protocol_path, encoding = 'utf-8') as f:
+        source = f.read()
+    source = override_variables(source, overrides or {})
+    namespace = {'__name__': 'protocol', '__file__': protocol_path}
+    exec(compile(source, protocol_path, 'exec'), namespace)
+
+    api_level = namespace.get('metadata', {}).get('apiLevel', '2.3')
+    ctx = simulate.get_protocol_api(api_level, extra_labware = load_custom_labware(protocol_path))
+
+    commands = []
+    depth = [0]
+
+    def on_command(message):
+        if message['$'] == 'before':
+            command = {'name': message['name'], 'payload': message['payload'], 'level': depth[0]}
+            flow_rate = getattr(message['payload'].get('instrument'), 'flow_rate', None)
+            if message['name'] in LIQUID_COMMANDS and flow_rate is not None:
+                # Flow rates when the command runs: the protocols change them along the run
+                command['flow_rate'] = {'aspirate': flow_rate.aspirate, 'dispense': flow_rate.dispense}
+            commands.append(command)
+            depth[0] += 1
+        else:
+            depth[0] -= 1
+
+    unsubscribe = ctx.broker.subscribe(command_types.COMMAND, on_command)
+    try:
+        namespace['run'](ctx)
+    finally:
+        unsubscribe()
+    if all(command['name'] == 'command.COMMENT' for command in commands):
+        raise NoCommandsError('The run published no commands' + ''.join('\n    ' + command['payload'].get('text', '')
+                              for command in commands[-NO_COMMANDS_COMMENTS:]))
+    return commands
+
+
+def leaf_commands(commands):
+    '''
+    Commands that did not publish nested commands (a mix or an air gap is
+    reported through the aspirate/dispense commands it is made of)
+    '''
+    leaves = []
+    for i, command in enumerate(commands):
+        if i + 1 == len(commands) or commands[i + 1]['level'] <= command['level']:
+            leaves.append(command)
+    return leaves
+
+
+def split_steps(commands):
+    '''
+    Group the commands by protocol STEP. Commands before the first STEP banner
+    (labware loading, reservoir fill comments...) go to the 'setup' group and
+    commands after a STEP stay with it until the next banner.
+    '''
+    steps = [{'step': SETUP_STEP, 'description': '', 'commands': []}]
+    for command in commands:
+        if command['name'] == 'command.COMMENT':
+            text = command['payload'].get('text', '')
+            banner = STEP_BANNER.match(text)
+            if banner and not STEP_END.search(text):
+                steps.append({'step': int(banner.group(1)), 'description': banner.group(2).strip(), 'commands': []})
+                continue
+        steps[-1]['commands'].append(command)
+    return [s for s in steps if s['commands'] or s['step'] != SETUP_STEP]
+
+
+def location_key(location):
+    '''
+    Hashable description of a well or location (used to follow the tips)
+    '''
+    labware = getattr(location, 'labware', None)
+    return str(labware if labware is not None else location)
+
+
+def tips_taken(location, channels):
+    '''
+    Tips a pickup at location takes: one per channel, fewer when a multichannel
+    picks up from the last wells of a column (partial column)
+    '''
+    labware = getattr(location, 'parent', None)
+    if channels == 1 or not hasattr(labware, 'columns'):
+        return channels
+    for column in labware.columns():
+        names = [well.well_name for well in column]
+        if location.well_name in names:
+            return min(channels, len(names) - names.index(location.well_name))
+    return channels
+
+
+class TipCounter:
+    '''
+    Counts consumed tips. A tip that was returned to its rack and picked up
+    again (tip recycling) is not counted twice.
+    '''
+    def __init__(self):
+        self.returned = set()
+        self.returning = False
+
+    def consumed(self, command):
+        name = command['name']
+        payload = command['payload']
+        if name == 'command.RETURN_TIP':
+            self.returning = True
+        elif name == 'command.DROP_TIP':
+            if self.returning:
+                self.returned.add(location_key(payload.get('location')))
+            self.returning = False
+        elif name == 'command.PICK_UP_TIP':
+            key = location_key(payload.get('location'))
+            if key in self.returned:
+                self.returned.discard(key)
+                return 0
+            return tips_taken(payload.get('location'), getattr(payload.get('instrument'), 'channels', 1))
+        return 0
+
+
+def format_seconds(seconds):
+    minutes, seconds = divmod(int(seconds + 0.5), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '%d:%02d:%02d' % (hours, minutes, seconds)
+
+
+def parse_overrides(values):
+    overrides = {}
+    for value in values or []:
+        name, _, text = value.partition('=')
+        try:
+            overrides[name.strip()] = json.loads(text)
+        except ValueError:
+            overrides[name.strip()] = text
+    return overrides
+
+
+def resolve_protocols(paths):
+    if not paths:
+        return [os.path.join(PROTOCOLS_PATH, p) for p in PROTOCOLS]
+    return [os.path.abspath(p) for p in paths]
@@ -0,0 +1,143 @@
+'''
+Start-up benchmark of the station protocols.
+
+The robot analyses every protocol when it is uploaded and again before it runs,
+each time in a new Python process, so the modules a protocol imports are
+loaded every time. This script times that in new processes, repeat times for
+every protocol, and reports the median and the best time in seconds:
+
+    imports     only the module level imports of the protocol
+    analysis    the whole protocol in the Opentrons simulator (simulation.py),
+                the analysis the robot does
+
+With --baseline the same is timed for the protocol at a git revision and the
+reduction is reported, e.g. the imports removed from the protocols.
+
+Usage:
+    python Utils/startup_benchmark.py                                   # every protocol, analysis
+    python Utils/startup_benchmark.py --mode imports --baseline HEAD~1
+    python Utils/startup_benchmark.py "Repository/Station C - 1 - Dispensación de reactivos/C-Generico.py" --repeat 10
+'''
+import argparse
+import ast
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import simulation
+
+UTILS_PATH      = os.path.dirname(os.path.abspath(__file__))
+MODES           = ['imports', 'analysis']
+DEFAULT_REPEAT  = 5
+
+
+def import_source(source):
+    '''
+    Module level import statements of a protocol
+    '''
+    lines = source.splitlines()
+    tree = ast.parse(source)
+    return '\n'.join('\n'.join(lines[node.lineno - 1:node.end_lineno]) for node in tree.body
+                     if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def timed_process(args):
+    '''
+    Seconds a new Python process takes to run args, None if it fails
+    '''
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable] + args, stdout = subprocess.DEVNULL, stderr = subprocess.PIPE)
+    seconds = time.perf_counter() - start
+    if result.returncode != 0:
+        errors = result.stderr.decode('utf-8', 'replace').strip().splitlines()
+        print('  Failed: ' + (errors[-1] if errors else 'exit code ' + str(result.returncode)))
+        return None
+    return seconds
+
+
+def time_protocol(protocol_path, source, mode, repeat):
+    '''
+    (median, best) seconds of repeat new processes, None if one fails
+    '''
+    if mode == 'imports':
+        args = ['-c', import_source(source)]
+    else:
+        # Written next to the protocol so the labware beside it is found
+        protocol_path = os.path.join(os.path.dirname(protocol_path), '.startup_' + os.path.basename(protocol_path))
+        with open(protocol_path, 'w', encoding = 'utf-8') as f:
+            f.write(source)
+        args = ['-c', 'import sys; sys.path.insert(0, sys.argv[1]); import simulation; simulation.simulate_protocol(sys.argv[2])',
+                UTILS_PATH, protocol_path]
+    try:
+        times = []
+        for _ in range(repeat):
+            seconds = timed_process(args)
+            if seconds is None:
+                return None
+            times.append(seconds)
+    finally:
+        if mode == 'analysis':
+            os.remove(protocol_path)
+    return statistics.median(times), min(times)
+
+
+def git_source(protocol_path, revision):
+    '''
+    Protocol at a git revision, None if it did not exist
+    '''
+    name = os.path.relpath(protocol_path, simulation.REPO_PATH).replace(os.sep, '/')
+    result = subprocess.run(['git', 'show', revision + ':' + name], cwd = simulation.REPO_PATH,
+                            stdout = subprocess.PIPE, stderr = subprocess.DEVNULL)
+    if result.returncode != 0:
+        return None
+    return result.stdout.decode('utf-8')
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Time the start-up of the station protocols in new processes')
+    parser.add_argument('protocols', nargs = '*', help = 'Protocol files (default: every station protocol)')
+    parser.add_argument('--mode', choices = MODES, default = 'analysis', help = 'What is timed (default: analysis)')
+    parser.add_argument('--repeat', type = int, default = DEFAULT_REPEAT, help = 'Processes timed per protocol')
+    parser.add_argument('--baseline', metavar = 'REVISION', help = 'Git revision to compare with, e.g. HEAD~1')
+    parser.add_argument('--output', help = 'Write the results to a tsv file')
+    args = parser.parse_args(argv)
+
+    header = ['protocol', 'mode', 'median', 'best'] + (['baseline_median', 'baseline_best', 'reduction'] if args.baseline else [])
+    lines = []
+    failed = False
+    for path in simulation.resolve_protocols(args.protocols):
+        name = os.path.relpath(path, simulation.PROTOCOLS_PATH)
+        print(name)
+        with open(path, encoding = 'utf-8') as f:
+            current = time_protocol(path, f.read(), args.mode, args.repeat)
+        if current is None:
+            failed = True
+            continue
+        line = [name, args.mode, '%.3f' % current[0], '%.3f' % current[1]]
+        text = '  %-8s median %.3f s  best %.3f s' % (args.mode, current[0], current[1])
+        if args.baseline:
+            source = git_source(path, args.baseline)
+            baseline = time_protocol(path, source, args.mode, args.repeat) if source is not None else None
+            if baseline is None:
+                print('  No baseline at ' + args.baseline)
+                line += ['', '', '']
+            else:
+                reduction = 1 - current[0] / baseline[0]
+                line += ['%.3f' % baseline[0], '%.3f' % baseline[1], '%.1f%%' % (100 * reduction)]
+                text += '  (' + args.baseline + ': median %.3f s, %.1f%% less)' % (baseline[0], 100 * reduction)
+        print(text)
+        lines.append(line)
+
+    if args.output:
+        with open(args.output, 'w', encoding = 'utf-8') as f:
+            f.write('\t'.join(header) + '\n')
+            for line in lines:
+                f.write('\t'.join(line) + '\n')
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
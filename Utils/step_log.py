@@ -0,0 +1,83 @@
+'''
+Start and end of a protocol run and of its STEPS in the run log and the event log.
+
+Every STEP of a protocol opens with a banner and closes logging the time it
+took, which is also kept in the STEPS dictionary for the time log of the run.
+finish_run writes that time log, logs the tips used and closes the logs of the
+run. The messages are in English ('en') or Spanish ('es').
+
+Imported by the thin station scripts and copied into the uploaded protocols by
+Utils/bundle.py, or inlined with Utils/sync_inline.py.
+'''
+from datetime import datetime
+
+STEP_LOG_MESSAGES = {
+    'en': {'step': 'Step', 'took': ' took ', 'start': 'Starting the run', 'finish': 'Run finished',
+           'tips': 'Used tips in total: {tips} ({racks} racks)'},
+    'es': {'step': 'PASO', 'took': ' hizo un tiempo de ', 'start': 'Empezando protocolo', 'finish': 'Protocolo finalizado',
+           'tips': 'Puntas utilizadas: {tips} ({racks} caja(s))'},
+}
+
+
+def log_step_start(run_log, events, steps, step, language = 'en'):
+    '''
+    Log the start of STEP step, returns its start time for log_step_end
+    '''
+    start = datetime.now()
+    run_log.banner(STEP_LOG_MESSAGES[language]['step'] + ' ' + str(step) + ': ' + steps[step]['description'])
+    events.step_start(step, steps[step]['description'])
+    return start
+
+
+def log_step_end(run_log, events, steps, step, start, language = 'en'):
+    '''
+    Log the end of STEP step and keep the time it took in steps, returns it
+    '''
+    messages = STEP_LOG_MESSAGES[language]
+    time_taken = datetime.now() - start
+    run_log.operator(messages['step'] + ' ' + str(step) + ': ' + steps[step]['description'] + messages['took'] + str(time_taken))
+    steps[step]['Time:'] = str(time_taken)
+    events.step_end(time_taken.total_seconds())
+    return time_taken
+
+
+def start_run(ctx, run_log, button = None, rails = None, language = 'en'):
+    '''
+    Log the start of the run and set the lights (None leaves them as they are),
+    returns the start time
+    '''
+    run_log.debug(' ')
+    run_log.debug('###############################################')
+    run_log.operator(STEP_LOG_MESSAGES[language]['start'])
+    ctx._hw_manager.hardware.set_lights(button = button, rails = rails)
+    return datetime.now().strftime('%Y/%m/%d %H:%M:%S')
+
+
+def write_time_log(path, steps):
+    '''
+    Tab separated time log of the STEPS: activation, description, wait and time taken
+    '''
+    with open(path, 'w') as f:
+        f.write('STEP\texecution\tdescription\twait_time\texecution_time\n')
+        for key in steps.keys():
+            row = str(key)
+            for key2 in steps[key].keys():
+                row += '\t' + format(steps[key][key2])
+            f.write(row + '\n')
+
+
+def finish_run(run_log, events, checkpoint, steps, used_tips, time_log_path = None, language = 'en'):
+    '''
+    Write the time log of the STEPS to time_log_path (None while simulating), log
+    the tips used and close the logs of the run. The run ended, so its checkpoint
+    is cleared. Returns the finish time.
+    '''
+    if time_log_path is not None:
+        write_time_log(time_log_path, steps)
+    run_log.debug('###############################################')
+    run_log.operator(STEP_LOG_MESSAGES[language]['finish'])
+    run_log.operator(STEP_LOG_MESSAGES[language]['tips'].format(tips = used_tips, racks = round(used_tips / 96, 2)))
+    run_log.close()
+    events.close()
+    checkpoint.clear()
+    return datetime.now().strftime('%Y/%m/%d %H:%M:%S')
@@ -0,0 +1,168 @@
+'''
+NUM_SAMPLES scaling profile of the Station B extraction protocols.
+
+Simulates every protocol with NUM_SAMPLES = 8, 16 ... 96 and reports, per STEP,
+the estimated time and the tips used. The time of every STEP is split in a
+fixed part (magnet incubations, drying, homing: delays and module actions,
+which do not depend on the samples) and a per column part fitted as
+time = fixed + per_column * columns. The batching table compares running two
+days of n samples in separate runs, 2 * T(n), with a single run of 2n samples,
+T(2n).
+
+Usage:
+    python Utils/sweep_samples.py
+    python Utils/sweep_samples.py --output sweep.tsv --chart sweep.png
+'''
+import argparse
+import math
+import os
+import sys
+
+import benchmark
+import estimator
+import simulation
+
+STATION_B_PATH = 'Station B - 1 y 2 - Extracción total'
+PROTOCOLS = [
+    os.path.join(STATION_B_PATH, 'B-Extraccion_total_Magmax_CORE.py'),
+    os.path.join(STATION_B_PATH, 'B-Extraccion_total_TurboBeads.py'),
+    os.path.join(STATION_B_PATH, 'Protocolos en desarrollo', 'NEW_B-Extraccion_total_Generico.py'),
+]
+SAMPLES = list(range(8, 97, 8))
+
+
+def sweep(protocol_path, samples = SAMPLES, model = None):
+    '''
+    {num_samples: [{'step', 'description', 'seconds', 'fixed', 'tips'}]}
+    '''
+    results = {}
+    for num_samples in samples:
+        commands = simulation.simulate_protocol(protocol_path, {'NUM_SAMPLES': num_samples})
+        steps = simulation.split_steps(commands)
+        times = estimator.estimate_steps(steps, model)
+        tips = benchmark.summarize(steps, model)
+        results[num_samples] = [{'step': t['step'], 'description': t['description'], 'seconds': t['seconds'],
+                                 'fixed': t['delay'] + t['modules'], 'tips': s['tips']}
+                                for t, s in zip(times, tips)]
+    return results
+
+
+def linear_fit(xs, ys):
+    '''
+    Least squares (intercept, slope) of ys = intercept + slope * xs
+    '''
+    n = len(xs)
+    mean_x = sum(xs) / n
+    mean_y = sum(ys) / n
+    var_x = sum((x - mean_x) ** 2 for x in xs)
+    if var_x == 0:
+        return mean_y, 0
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+    return mean_y - slope * mean_x, slope
+
+
+def step_profile(results):
+    '''
+    Per STEP: fixed seconds, fitted per column seconds and tips per column
+    '''
+    samples = sorted(results)
+    columns = [math.ceil(n / 8) for n in samples]
+    profile = []
+    for i, step in enumerate(results[samples[-1]]):
+        rows = [results[n][i] if i < len(results[n]) else None for n in samples]
+        if any(r is None or r['step'] != step['step'] for r in rows):
+            continue
+        intercept, per_column = linear_fit(columns, [r['seconds'] for r in rows])
+        _, tips_per_column = linear_fit(columns, [r['tips'] for r in rows])
+        profile.append({'step': step['step'], 'description': step['description'],
+                        'fixed': step['fixed'], 'intercept': intercept, 'per_column': per_column,
+                        'tips_per_column': tips_per_column})
+    return profile
+
+
+def batching(results):
+    '''
+    (n, 2 * T(n), T(2n)) for every n with 2n in the sweep
+    '''
+    totals = dict((n, sum(r['seconds'] for r in rows)) for n, rows in results.items())
+    return [(n, 2 * totals[n], totals[2 * n]) for n in sorted(totals) if 2 * n in totals]
+
+
+def chart(all_results, path):
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print('matplotlib is not installed, chart not written')
+        return
+    fig, axes = plt.subplots(len(all_results), 2, figsize = (14, 5 * len(all_results)), squeeze = False)
+    for row, (name, results) in enumerate(all_results.items()):
+        samples = sorted(results)
+        steps = results[samples[-1]]
+        bottom = [0] * len(samples)
+        for i, step in enumerate(steps):
+            minutes = [results[n][i]['seconds'] / 60 if i < len(results[n]) else 0 for n in samples]
+            axes[row][0].bar(samples, minutes, width = 6, bottom = bottom, label = str(step['step']))
+            bottom = [b + m for b, m in zip(bottom, minutes)]
+        axes[row][0].set_title(os.path.basename(name) + ': time per STEP')
+        axes[row][0].set_xlabel('NUM_SAMPLES')
+        axes[row][0].set_ylabel('minutes')
+        axes[row][0].legend(fontsize = 6, ncol = 2)
+        axes[row][1].plot(samples, [sum(r['tips'] for r in results[n]) for n in samples], marker = 'o')
+        axes[row][1].set_title(os.path.basename(name) + ': tips')
+        axes[row][1].set_xlabel('NUM_SAMPLES')
+    fig.tight_layout()
+    fig.savefig(path)
+    print('Chart written to ' + path)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'NUM_SAMPLES scaling profile of the Station B extraction protocols')
+    parser.add_argument('protocols', nargs = '*', help = 'Protocol files (default: Station B extraction protocols)')
+    parser.add_argument('--model', help = 'Model json written by fit_time_model.py')
+    parser.add_argument('--output', help = 'Write the per STEP results to a tsv file')
+    parser.add_argument('--chart', help = 'Write a png chart (needs matplotlib)')
+    args = parser.parse_args(argv)
+
+    model = estimator.load_model(args.model)
+    paths = [os.path.abspath(p) for p in args.protocols] or [os.path.join(simulation.PROTOCOLS_PATH, p) for p in PROTOCOLS]
+    all_results = {}
+    lines = []
+    for path in paths:
+        name = os.path.relpath(path, simulation.PROTOCOLS_PATH)
+        print('###############################################')
+        print(name)
+        results = sweep(path, model = model)
+        all_results[name] = results
+        for n in sorted(results):
+            for row in results[n]:
+                lines.append([name, str(n), str(row['step']), row['description'], str(round(row['seconds'], 1)),
+                              str(round(row['fixed'], 1)), str(row['tips'])])
+
+        profile = step_profile(results)
+        print('  %-6s %-40s %10s %12s %10s' % ('STEP', 'description', 'fixed', 'per column', 'tips/col'))
+        for p in profile:
+            print('  %-6s %-40s %10s %12s %10.1f' % (p['step'], p['description'][:40],
+                  simulation.format_seconds(p['fixed']), simulation.format_seconds(p['per_column']), p['tips_per_column']))
+        fixed = sum(p['fixed'] for p in profile)
+        per_column = sum(p['per_column'] for p in profile)
+        print('  Fixed: %s, per column: %s' % (simulation.format_seconds(fixed), simulation.format_seconds(per_column)))
+
+        print('  %-8s %14s %14s %10s' % ('samples', '2 runs of n', '1 run of 2n', 'saved'))
+        for n, separate, batched in batching(results):
+            print('  %-8d %14s %14s %6.1f min' % (n, simulation.format_seconds(separate),
+                  simulation.format_seconds(batched), (separate - batched) / 60))
+
+    if args.output:
+        with open(args.output, 'w', encoding = 'utf-8') as f:
+            f.write('\t'.join(['protocol', 'num_samples', 'step', 'description', 'seconds', 'fixed', 'tips']) + '\n')
+            for line in lines:
+                f.write('\t'.join(line) + '\n')
+    if args.chart:
+        chart(all_results, args.chart)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+'''
+Copy the shared modules of Utils/ into the protocols that use them.
+
+The protocols are uploaded to the robot as a single file, so shared code such
+as liquid_classes.py is inlined in them between two marker lines:
+
+    # >>> liquid_classes.py
+    ...
+    # <<< liquid_classes.py
+
+This script replaces what is between the markers with the current module
+(without its docstring) in every protocol of Repository/. To start using a
+module in a protocol add the two marker lines at module level and run it.
+
+A protocol that only needs part of a module lists the names it uses after the
+module name:
+
+    # >>> liquid_classes.py: EXTRACTION_FIELDS, liquid_class
+    ...
+    # <<< liquid_classes.py
+
+and only these definitions of the module, the ones they use and the imports
+they need are copied, in the order of the module (see shaken_body). bundle.py
+writes these blocks from the imports of a thin station script.
+
+Usage:
+    python Utils/sync_inline.py             # refresh every copy
+    python Utils/sync_inline.py --check     # list the out of date copies, exit 1 if any
+'''
+import argparse
+import ast
+import os
+import re
+import sys
+
+import simulation
+
+UTILS_PATH      = os.path.dirname(os.path.abspath(__file__))
+BLOCK_PATTERN   = re.compile(r'^# >>> (?P<module>[\w.]+\.py)(?:: (?P<names>\w+(?:, \w+)*))?\n(?P<body>.*?)^# <<< (?P=module)\n',
+                             re.MULTILINE | re.DOTALL)
+
+
+def module_statements(module):
+    '''
+    (module level statements of a module of Utils/ without its docstring, source
+    of each one with the blank lines and comments above it)
+    '''
+    with open(os.path.join(UTILS_PATH, module), encoding = 'utf-8') as f:
+        source = f.read()
+    lines = source.splitlines(True)
+    statements = ast.parse(source).body
+    if statements and isinstance(statements[0], ast.Expr) and isinstance(statements[0].value, ast.Constant) \
+            and isinstance(statements[0].value.value, str):
+        start = statements[0].end_lineno
+        statements = statements[1:]
+    else:
+        start = 0
+    texts = []
+    for statement in statements:
+        texts.append(''.join(lines[start:statement.end_lineno]))
+        start = statement.end_lineno
+    return statements, texts
+
+
+def module_body(module):
+    '''
+    Source of a module of Utils/ without its docstring
+    '''
+    return ''.join(module_statements(module)[1]).strip('\n') + '\n'
+
+
+def defined_names(statement):
+    if isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return {statement.name}
+    if isinstance(statement, (ast.Import, ast.ImportFrom)):
+        return {(alias.asname or alias.name).split('.')[0] for alias in statement.names}
+    if isinstance(statement, (ast.Assign, ast.AnnAssign, ast.AugAssign)):
+        targets = statement.targets if isinstance(statement, ast.Assign) else [statement.target]
+        return {node.id for target in targets for node in ast.walk(target) if isinstance(node, ast.Name)}
+    return set()
+
+
+def used_names(statement):
+    return {node.id for node in ast.walk(statement) if isinstance(node, ast.Name)}
+
+
+def shaken_body(module, names):
+    '''
+    Source of the definitions names of a module of Utils/, with the ones they
+    use, the imports they need and the statements that define nothing, in the
+    order of the module
+    '''
+    statements, texts = module_statements(module)
+    definitions = {}
+    for index, statement in enumerate(statements):
+        for name in defined_names(statement):
+            definitions.setdefault(name, []).append(index)
+    unknown = [name for name in names if name not in definitions]
+    if unknown:
+        raise ValueError(module + ' does not define ' + ', '.join(unknown))
+    kept = {index for index, statement in enumerate(statements) if not defined_names(statement)}
+    pending = list(names) + [name for index in kept for name in used_names(statements[index])]
+    while pending:
+        for index in definitions.get(pending.pop(), []):
+            if index not in kept:
+                kept.add(index)
+                pending.extend(used_names(statements[index]))
+    return ''.join(texts[index] for index in sorted(kept)).strip('\n') + '\n'
+
+
+def sync_source(source, bodies = None):
+    '''
+    (source with the inlined blocks refreshed, modules found)
+    '''
+    bodies = {} if bodies is None else bodies
+    modules = []
+
+    def replace(match):
+        module, names = match.group('module', 'names')
+        modules.append(module)
+        if (module, names) not in bodies:
+            bodies[module, names] = shaken_body(module, names.split(', ')) if names else module_body(module)
+        return '# >>> ' + module + (': ' + names if names else '') + '\n' + bodies[module, names] + '# <<< ' + module + '\n'
+
+    return BLOCK_PATTERN.sub(replace, source), modules
+
+
+def protocol_files():
+    for root, dirs, files in os.walk(simulation.PROTOCOLS_PATH):
+        for name in sorted(files):
+            if name.endswith('.py'):
+                yield os.path.join(root, name)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Copy the shared modules of Utils/ into the protocols')
+    parser.add_argument('--check', action = 'store_true', help = 'Only list the protocols with out of date copies')
+    args = parser.parse_args(argv)
+
+    bodies = {}
+    outdated = []
+    for path in protocol_files():
+        with open(path, encoding = 'utf-8') as f:
+            source = f.read()
+        synced, modules = sync_source(source, bodies)
+        if synced == source:
+            continue
+        name = os.path.relpath(path, simulation.PROTOCOLS_PATH)
+        outdated.append(name)
+        if args.check:
+            print('OUTDATED ' + name + ': ' + ', '.join(sorted(set(modules))))
+        else:
+            with open(path, 'w', encoding = 'utf-8') as f:
+                f.write(synced)
+            print('UPDATED  ' + name + ': ' + ', '.join(sorted(set(modules))))
+    if not outdated:
+        print('Every inlined module is up to date')
+    return 1 if args.check and outdated else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,10 @@
+'''
+Unit tests of the modules of Utils/ that do not need the Opentrons simulator.
+
+Run them from the root of the repository with:
+    python -m pytest Utils/tests
+'''
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
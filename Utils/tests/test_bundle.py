@@ -0,0 +1,36 @@
+import glob
+import os
+
+import pytest
+
+import simulation
+from bundle import bundle_source
+
+
+def thin_scripts():
+    return sorted(glob.glob(os.path.join(simulation.PROTOCOLS_PATH, '**', 'Fuentes', '*.py'), recursive = True))
+
+
+@pytest.mark.parametrize('script', thin_scripts(), ids = os.path.basename)
+def test_uploaded_protocol_is_the_bundle_of_its_thin_script(script):
+    protocol = os.path.join(os.path.dirname(os.path.dirname(script)), os.path.basename(script))
+    with open(script, encoding = 'utf-8') as f:
+        bundled = bundle_source(f.read())
+    with open(protocol, encoding = 'utf-8') as f:
+        assert f.read() == bundled, 'Run Utils/bundle.py ' + script + ' -o ' + protocol
+
+
+def test_bundle_copies_only_the_names_imported_and_what_they_use():
+    bundled = bundle_source('from reservoir_packing import fill_sheet\nfrom run_log import RunLog\n\nprint(fill_sheet({}))\n')
+    assert bundled.startswith('# >>> reservoir_packing.py: fill_sheet\nimport math\n')
+    assert 'def fill_volume' in bundled and 'FILL_MARGIN' in bundled
+    assert 'def pack_channels' not in bundled and 'CHANNEL_MAX_VOLUME' not in bundled
+    assert '# <<< reservoir_packing.py\n\n# >>> run_log.py: RunLog\n' in bundled
+    assert bundled.endswith('# <<< run_log.py\n\nprint(fill_sheet({}))\n')
+
+
+def test_bundle_rejects_imports_it_cannot_inline():
+    with pytest.raises(ValueError):
+        bundle_source('from reservoir_packing import *\n')
+    with pytest.raises(ValueError):
+        bundle_source('from reservoir_packing import fill_sheet as sheet\n')
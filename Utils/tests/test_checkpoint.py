@@ -0,0 +1,71 @@
+import json
+from types import SimpleNamespace
+
+from checkpoint import Checkpoint, restore_reagents
+
+
+def make_reagents():
+    return [SimpleNamespace(name = 'Lysis', col = 1, vol_well = 4500.0),
+            SimpleNamespace(name = 'Wash', col = 0, vol_well = 11000.0)]
+
+
+def test_save_and_load_the_same_protocol(tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    Checkpoint(path, 'B_Extraccion').save(3, 2, 48, make_reagents(), {'p300': 40}, True)
+    state = Checkpoint(path, 'B_Extraccion').load(48)
+    assert state['step'] == 3 and state['column'] == 2
+    assert state['tips'] == {'p300': 40} and state['magnet'] is True
+    reagents = [SimpleNamespace(name = 'Lysis', col = 0, vol_well = 0), SimpleNamespace(name = 'Elution', col = 0, vol_well = 0)]
+    restore_reagents(reagents, state)
+    assert (reagents[0].col, reagents[0].vol_well) == (1, 4500.0)
+    assert (reagents[1].col, reagents[1].vol_well) == (0, 0) # Not in the checkpoint
+
+
+def test_checkpoint_of_another_protocol_is_not_resumed(tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    Checkpoint(path, 'B_Extraccion_total_Magmax_CORE').save(3, None, 48, make_reagents(), {}, False)
+    assert Checkpoint(path, 'B_Extraccion_total_TurboBeads').load(48) is None
+    assert Checkpoint(path, None).load(48) is None
+
+
+def test_checkpoint_of_other_samples_is_not_resumed(tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    Checkpoint(path, 'B').save(3, None, 48, make_reagents(), {}, False)
+    assert Checkpoint(path, 'B').load(96) is None
+
+
+def test_old_checkpoint_is_not_resumed(tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    checkpoint = Checkpoint(path, 'B')
+    checkpoint.save(3, None, 48, make_reagents(), {}, False)
+    with open(path) as f:
+        state = json.load(f)
+    state['updated'] = '2020/01/01 00:00:00'
+    with open(path, 'w') as f:
+        json.dump(state, f)
+    assert checkpoint.load(48) is None
+    assert checkpoint.load(48, max_age = float('inf')) is not None
+
+
+def test_missing_or_broken_checkpoint_is_not_resumed(tmp_path):
+    path = tmp_path / 'checkpoint.json'
+    assert Checkpoint(str(path), 'B').load(48) is None
+    path.write_text('{"step": ')
+    assert Checkpoint(str(path), 'B').load(48) is None
+
+
+def test_clear_removes_the_checkpoint(tmp_path):
+    path = tmp_path / 'checkpoint.json'
+    checkpoint = Checkpoint(str(path), 'B')
+    checkpoint.save(1, None, 8, [], {}, False)
+    assert path.exists()
+    checkpoint.clear()
+    assert not path.exists()
+    checkpoint.clear() # Nothing to remove
+
+
+def test_nothing_is_written_while_simulating(tmp_path):
+    checkpoint = Checkpoint(None, 'B')
+    checkpoint.save(1, None, 8, make_reagents(), {}, False)
+    assert checkpoint.load(8) is None
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from incubation import Incubations
+
+
+class FakeContext:
+    def __init__(self, simulating = False):
+        self.simulating = simulating
+        self.delays = []
+
+    def is_simulating(self):
+        return self.simulating
+
+    def delay(self, seconds, msg):
+        self.delays.append((seconds, msg))
+
+
+class FakeRunLog:
+    def __init__(self):
+        self.lines = []
+
+    def operator(self, msg):
+        self.lines.append(msg)
+
+
+def test_delay_only_covers_the_last_column_dosed():
+    ctx = FakeContext()
+    incubations = Incubations(ctx, FakeRunLog())
+    incubations.record_dose('LYSIS', 0)
+    incubations.record_dose('LYSIS', 1)
+    incubations.dose_times['LYSIS'][0] -= timedelta(seconds = 200)
+    incubations.dose_times['LYSIS'][1] -= timedelta(seconds = 100)
+    incubations.delay('LYSIS', 300, 'Rest')
+    assert len(ctx.delays) == 1
+    assert 199 <= ctx.delays[0][0] <= 200
+    assert ctx.delays[0][1].startswith('Rest for ')
+
+
+def test_no_delay_once_the_last_column_has_incubated():
+    ctx = FakeContext()
+    incubations = Incubations(ctx, FakeRunLog(), 'es')
+    incubations.dose_times['DRY'] = {0: datetime.now() - timedelta(seconds = 400)}
+    incubations.delay('DRY', 300, 'Secado')
+    assert ctx.delays == []
+
+
+def test_simulated_runs_and_stages_without_doses_keep_the_full_wait():
+    ctx = FakeContext(simulating = True)
+    incubations = Incubations(ctx, SimpleNamespace(operator = None))
+    incubations.record_dose('BEADS', 0)
+    incubations.delay('BEADS', 300, 'Rest')
+    incubations.delay('ELUTION', 60, 'Wait')
+    assert ctx.delays == [(300, 'Rest for 300 seconds.'), (60, 'Wait for 60 seconds.')]
@@ -0,0 +1,73 @@
+import math
+
+import pytest
+
+import liquid_height
+from liquid_height import HeightTable, height_table
+
+FALCON_50ML = {'shape': 'circular', 'diameter': 27.81, 'depth': 113, 'totalLiquidVolume': 50000}
+
+
+class FakeWell:
+    well_name = 'A1'
+
+
+class FakeImplementation:
+    def __init__(self, definition):
+        self.definition = definition
+
+    def get_definition(self):
+        return self.definition
+
+
+class FakeLabware:
+    '''
+    Labware of the newer robot software: the definition is in its implementation
+    '''
+    def __init__(self, load_name, well):
+        self.load_name = load_name
+        self._implementation = FakeImplementation({'wells': {'A1': well}})
+
+    def wells(self):
+        return [FakeWell()]
+
+
+@pytest.fixture(autouse = True)
+def empty_tables():
+    liquid_height.HEIGHT_TABLES.clear()
+
+
+def test_flat_well_height_is_proportional_to_the_volume():
+    table = HeightTable({'shape': 'rectangular', 'xDimension': 10, 'yDimension': 5, 'depth': 20})
+    assert table.height(500) == pytest.approx(10)
+    assert table.volume(10) == pytest.approx(500)
+    assert table.height(0) == 0
+    assert table.height(5000) == 20
+
+
+def test_falcon_cone_holds_a_third_of_its_cylinder():
+    table = HeightTable(FALCON_50ML, 'cone', 20)
+    area = math.pi * (27.81 / 2) ** 2
+    assert table.volume(20) == pytest.approx(area * 20 / 3)
+    assert table.volume(50) == pytest.approx(area * (20 / 3 + 30))
+
+
+def test_table_ends_at_the_nominal_volume():
+    table = HeightTable(FALCON_50ML, 'cone', 20)
+    assert table.volumes[-1] == 50000
+    assert table.depth == pytest.approx(95.7, abs = 0.1)
+    assert table.height(60000) == table.depth
+
+
+def test_wells_are_read_from_the_labware_definition():
+    falcon = FakeLabware('opentrons_6_tuberack_falcon_50ml_conical', FALCON_50ML)
+    assert height_table(falcon).volume(20) == pytest.approx(math.pi * (27.81 / 2) ** 2 * 20 / 3)
+    old = FakeLabware('old_labware', {'shape': 'circular', 'diameter': 10, 'depth': 10})
+    old._definition = old._implementation.get_definition()
+    del old._implementation
+    assert height_table(old).volume(10) == pytest.approx(math.pi * 25 * 10)
+
+
+def test_labware_without_bottom_shape_is_flat():
+    plate = FakeLabware('unknown_96_wellplate', {'shape': 'rectangular', 'xDimension': 8, 'yDimension': 8, 'depth': 40})
+    assert height_table(plate).height(640) == pytest.approx(10)
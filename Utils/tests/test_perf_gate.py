@@ -0,0 +1,24 @@
+import os
+
+import perf_gate
+import simulation
+
+
+def test_protocol_without_snapshot_fails(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(perf_gate, 'SNAPSHOTS_PATH', str(tmp_path))
+    protocol = tmp_path / 'protocol.py'
+    protocol.write_text('')
+    assert perf_gate.main([str(protocol)]) == 1
+    assert 'no snapshot' in capsys.readouterr().out
+
+
+def test_every_simulated_protocol_has_a_snapshot():
+    for name in simulation.PROTOCOLS:
+        path = perf_gate.snapshot_path(os.path.join(simulation.PROTOCOLS_PATH, name))
+        assert name in simulation.UNSIMULATED or os.path.isfile(path), name
+
+
+def test_regressions_of_time_and_tips():
+    old = {'totals': {'seconds': 1000, 'tips': 96}}
+    assert perf_gate.compare(old, {'totals': {'seconds': 1015, 'tips': 96}}) == []
+    assert len(perf_gate.compare(old, {'totals': {'seconds': 1030, 'tips': 97}})) == 2
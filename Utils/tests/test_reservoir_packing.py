@@ -0,0 +1,39 @@
+import pytest
+
+from reservoir_packing import CHANNEL_MAX_VOLUME, FILL_MARGIN, fill_sheet, fill_volume, pack_channels
+
+
+def test_reagents_take_consecutive_channels_in_order():
+    packing = pack_channels([('beads', [1000] * 20, 1200), ('empty', [], 1200), ('lysis', [500] * 3, 1200)])
+    assert packing == {'beads': [(1, 10201), (2, 10201), (3, 3201)], 'lysis': [(4, 2701)]}
+
+
+def test_channels_are_filled_with_the_margin_within_the_max_volume():
+    packing = pack_channels([('wash', [950] * 30, 1200)])
+    for channel, volume in packing['wash']:
+        assert fill_volume(volume) <= CHANNEL_MAX_VOLUME
+    assert fill_volume(1000) == int(1000 * (1 + FILL_MARGIN))
+    assert fill_sheet(pack_channels([('lysis', [500] * 3, 1200)])) == ['Channel 1: lysis, 2972 uL']
+
+
+def test_every_aspiration_is_served_by_one_channel():
+    aspirations = [700, 300, 1250, 900] * 9
+    dead_vol = 1000
+    left = [volume - dead_vol for channel, volume in pack_channels([('beads', aspirations, dead_vol)])['beads']]
+    k = 0
+    for volume in aspirations:
+        if left[k] < volume:
+            k += 1
+        assert left[k] >= volume
+        left[k] -= volume
+
+
+def test_aspiration_larger_than_a_channel_fails():
+    with pytest.raises(ValueError):
+        pack_channels([('beads', [11000], 1200)])
+
+
+def test_more_channels_than_the_reservoir_fails():
+    with pytest.raises(ValueError):
+        pack_channels([('wash', [1000] * 120, 1200)])
+    assert len(pack_channels([('wash', [1000] * 120, 1200)], num_channels = 14)['wash']) == 14
@@ -0,0 +1,34 @@
+from types import SimpleNamespace
+
+from simulation import TipCounter, tips_taken
+
+
+class FakeTipRack:
+    def __init__(self):
+        self._columns = [[SimpleNamespace(well_name = row + str(col), parent = self) for row in 'ABCDEFGH']
+                         for col in range(1, 13)]
+
+    def columns(self):
+        return self._columns
+
+
+def pickup(well, channels = 8):
+    return {'name': 'command.PICK_UP_TIP', 'payload': {'location': well, 'instrument': SimpleNamespace(channels = channels)}}
+
+
+def test_partial_column_takes_the_tips_to_the_end_of_the_column():
+    rack = FakeTipRack()
+    assert tips_taken(rack.columns()[0][0], 8) == 8
+    assert tips_taken(rack.columns()[2][5], 8) == 3
+    assert tips_taken(rack.columns()[2][5], 1) == 1
+    assert tips_taken(None, 8) == 8
+
+
+def test_returned_tips_are_not_counted_again():
+    rack = FakeTipRack()
+    tips = TipCounter()
+    assert tips.consumed(pickup(rack.columns()[0][5])) == 3
+    tips.consumed({'name': 'command.RETURN_TIP', 'payload': {}})
+    tips.consumed({'name': 'command.DROP_TIP', 'payload': {'location': rack.columns()[0][5]}})
+    assert tips.consumed(pickup(rack.columns()[0][5])) == 0
+    assert tips.consumed(pickup(rack.columns()[1][0])) == 8
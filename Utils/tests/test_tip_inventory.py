@@ -0,0 +1,143 @@
+from types import SimpleNamespace
+
+from tip_inventory import column_tips, free_tips, next_tip, partial_pickup_racks, pick_up, plan_tip_refills, used_tips
+
+
+class FakeRack:
+    '''
+    96 tip rack, wells in the order of the labware (A1, B1... H1, A2...)
+    '''
+    def __init__(self, taken = (), slot = '1'):
+        self._wells = [SimpleNamespace(has_tip = i not in taken) for i in range(96)]
+        self.parent = slot
+
+    def wells(self):
+        return self._wells
+
+    def columns(self):
+        return [self._wells[i:i + 8] for i in range(0, 96, 8)]
+
+    def next_tip(self, num_tips):
+        for column in self.columns():
+            for i in range(8 - num_tips + 1):
+                if all(well.has_tip for well in column[i:i + num_tips]):
+                    return column[i]
+        return None
+
+
+def make_deck(*racks):
+    '''
+    ctx.deck with the racks in their slots, None in the empty ones
+    '''
+    deck = dict((str(slot), None) for slot in range(1, 13))
+    deck.update((rack.parent, rack) for rack in racks)
+    return deck
+
+
+class FakePipette:
+    def __init__(self, tip_racks, channels = 8):
+        self.tip_racks = tip_racks
+        self.channels = channels
+        self.picked = []
+
+    def pick_up_tip(self, tip):
+        self.picked.append(tip)
+
+
+def test_no_refill_when_the_tips_reach_the_end():
+    assert plan_tip_refills([96, 96], 96, [('1', 96, False), ('2', 0, True), ('3', 96, False)]) == []
+
+
+def test_refill_at_the_wait_before_the_step_that_runs_out():
+    demand = [('1', 96, False), ('2', 0, True), ('3', 96, False), ('4', 8, False)]
+    assert plan_tip_refills([96, 0], 96, demand) == [('2', [0, 1])]
+
+
+def test_refill_before_the_first_step_replaces_only_the_empty_racks_if_enough():
+    assert plan_tip_refills([0, 50], 96, [('1', 100, False)]) == [('1', [0])]
+
+
+def test_refill_replaces_every_rack_when_the_empty_ones_are_not_enough():
+    assert plan_tip_refills([8, 96], 96, [('1', 200, False)]) == [('1', [0, 1])]
+
+
+def test_tips_are_taken_rack_by_rack_between_waits():
+    demand = [('1', 100, False), ('2', 0, True), ('3', 90, False), ('4', 0, True), ('5', 96, False)]
+    assert plan_tip_refills([96, 96], 96, demand) == [('4', [0])]
+
+
+def test_one_full_swap_when_replacing_the_empty_racks_needs_another_pause():
+    # CORE at 96 samples: the empty racks replaced at STEP 9 would run out again at STEP 19
+    demand = [(1, 8, False), (2, 0, True), (3, 96, False), (4, 0, True), (5, 0, True), (6, 96, False), (7, 0, False),
+              (8, 96, False), (9, 0, True), (10, 96, False), (11, 0, False), (12, 96, False), (13, 0, True),
+              (14, 96, False), (15, 0, True), (16, 0, False), (17, 96, False), (18, 0, True), (19, 0, True), (20, 96, False)]
+    assert plan_tip_refills([96] * 5, 96, demand) == [(9, [0, 1, 2, 3, 4])]
+
+
+def test_used_tips_counts_the_gaps_of_recycled_tips():
+    assert used_tips(FakeRack()) == 0
+    assert used_tips(FakeRack(taken = range(16))) == 16
+    assert used_tips(FakeRack(taken = [3, 20])) == 21
+
+
+def test_free_tips_of_a_multichannel_only_counts_full_columns():
+    rack = FakeRack(taken = [0, 9, 10])
+    assert free_tips(SimpleNamespace(channels = 1, tip_racks = [rack])) == [93]
+    assert free_tips(SimpleNamespace(channels = 8, tip_racks = [rack])) == [80]
+
+
+def test_next_tip_of_a_partial_column_takes_the_back_nozzles():
+    racks = [FakeRack(taken = range(5), slot = '2'), FakeRack(slot = '3')]
+    pip = SimpleNamespace(channels = 8, tip_racks = racks)
+    deck = make_deck(*racks)
+    # The first column has its last 3 tips left, enough for 3 channels
+    assert next_tip(pip, 3, deck) is racks[0].wells()[5]
+    assert next_tip(pip, 4, deck) is racks[0].wells()[12]
+    assert next_tip(pip, deck = deck) is racks[0].wells()[8]
+    assert next_tip(pip, 8, deck) is racks[0].wells()[8]
+
+
+def test_partial_column_only_from_racks_with_nothing_in_front():
+    racks = [FakeRack(slot = '5'), FakeRack(slot = '2'), FakeRack(slot = '9')]
+    deck = make_deck(*racks)
+    pip = SimpleNamespace(channels = 8, tip_racks = racks)
+    # 5 has the rack of 2 in front, 9 has the empty slot 6
+    assert partial_pickup_racks(pip, deck) == [racks[1], racks[2]]
+    assert next_tip(pip, 3, deck) is racks[1].wells()[5]
+
+
+def test_partial_column_falls_back_to_a_full_column():
+    racks = [FakeRack(taken = range(5), slot = '5'), FakeRack(slot = '6')]
+    pip = SimpleNamespace(channels = 8, tip_racks = racks)
+    deck = make_deck(FakeRack(slot = '2'), FakeRack(slot = '3'), *racks)
+    assert partial_pickup_racks(pip, deck) == []
+    assert next_tip(pip, 3, deck) is racks[0].wells()[8]
+    assert next_tip(pip, 3) is racks[0].wells()[8] # Without deck
+
+
+def test_next_tip_is_none_when_the_racks_are_empty():
+    pip = SimpleNamespace(channels = 8, tip_racks = [FakeRack(taken = range(93))])
+    assert next_tip(pip) is None
+    assert next_tip(pip, 3, make_deck(*pip.tip_racks)) is pip.tip_racks[0].wells()[93]
+
+
+def test_pick_up_replaces_the_racks_without_kept_tips_when_the_tips_run_out():
+    racks = [FakeRack(taken = range(96)), FakeRack(taken = range(88))]
+    pip = FakePipette(racks)
+    tip_track = {'counts': {pip: 184}, 'maxes': {pip: 192}}
+    replaced = []
+    assert pick_up(pip, tip_track, lambda pip, ks: replaced.append(ks)) is racks[1].wells()[88]
+    assert replaced == [] and pip.picked == [racks[1].wells()[88]]
+
+    tip_track['counts'][pip] = 192
+    kept = SimpleNamespace(holds = lambda rack: rack is racks[1])
+    def replace_tipracks(pip, ks):
+        replaced.append(ks)
+        racks[0]._wells = FakeRack().wells()
+    assert pick_up(pip, tip_track, replace_tipracks, tip_reuse = kept) is racks[0].wells()[0]
+    assert replaced == [[0]]
+
+
+def test_column_tips_of_the_last_partial_column():
+    assert [column_tips(45, col) for col in range(6)] == [8, 8, 8, 8, 8, 5]
+    assert column_tips(96, 11) == 8
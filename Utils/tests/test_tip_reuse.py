@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+import pytest
+
+from tip_reuse import TipReuse
+
+
+def make_rack():
+    rack = SimpleNamespace()
+    rack.tips = [SimpleNamespace(parent = rack, name = 'A' + str(i + 1)) for i in range(12)]
+    return rack
+
+
+def test_keep_and_pick_up_again_for_the_same_column():
+    rack = make_rack()
+    reuse = TipReuse(['WASH'])
+    reuse.keep('WASH', 0, rack.tips[0])
+    reuse.keep('WASH', 1, rack.tips[1])
+    assert reuse.tip('WASH', 0) is rack.tips[0]
+    assert reuse.tip('WASH', 1) is rack.tips[1]
+    assert reuse.tip('WASH', 2) is None
+
+
+def test_chains_not_enabled_keep_nothing():
+    rack = make_rack()
+    reuse = TipReuse(['WASH'])
+    reuse.keep('ELUTION', 0, rack.tips[0])
+    assert not reuse.enabled('ELUTION')
+    assert reuse.tip('ELUTION', 0) is None
+    assert not reuse.holds(rack)
+
+
+def test_a_tip_is_never_kept_for_two_columns():
+    rack = make_rack()
+    reuse = TipReuse(['WASH', 'ELUTION'])
+    reuse.keep('WASH', 0, rack.tips[0])
+    with pytest.raises(ValueError):
+        reuse.keep('WASH', 1, rack.tips[0])
+    with pytest.raises(ValueError):
+        reuse.keep('ELUTION', 0, rack.tips[0])
+    reuse.keep('WASH', 0, rack.tips[0]) # The same column again is fine
+
+
+def test_holds_the_racks_with_kept_tips_until_released():
+    rack, other_rack = make_rack(), make_rack()
+    reuse = TipReuse(['WASH'])
+    reuse.keep('WASH', 3, rack.tips[3])
+    assert reuse.holds(rack)
+    assert not reuse.holds(other_rack)
+    reuse.release('WASH', 3)
+    assert reuse.tip('WASH', 3) is None
+    assert not reuse.holds(rack)
+    reuse.release('ELUTION', 3) # Nothing kept, nothing to do
@@ -0,0 +1,87 @@
+import json
+from types import SimpleNamespace
+
+from well_map import WellMap
+
+
+def make_wells(num_wells = 96):
+    return [SimpleNamespace(well_name = 'ABCDEFGH'[i % 8] + str(i // 8 + 1)) for i in range(num_wells)]
+
+
+def test_a_new_run_resumes_the_wells_done(tmp_path):
+    path, wells = str(tmp_path / 'well_map.json'), make_wells()
+    stopped = WellMap(path, wells, 24)
+    stopped.mark('mastermix', wells[:24])
+    stopped.mark('sample', wells[:10])
+
+    resumed = WellMap(path, make_wells(), 24)
+    assert resumed.load()
+    assert resumed.is_done('mastermix', wells[23]) and not resumed.is_done('mastermix', wells[24])
+    # The stop lost the wells of the column in progress (saved once per column)
+    assert [well.well_name for well in resumed.pending('sample', wells[:24])] == [well.well_name for well in wells[8:24]]
+    assert resumed.pending('controls', wells[:2]) == wells[:2]
+    assert resumed.summary() == ['mastermix: 24 wells done', 'sample: 8 wells done']
+
+
+def test_map_of_other_samples_or_wells_is_not_resumed(tmp_path):
+    path, wells = str(tmp_path / 'well_map.json'), make_wells()
+    WellMap(path, wells, 24).mark('sample', wells[:10])
+    assert not WellMap(path, wells, 48).load()
+    assert not WellMap(path, make_wells(48), 24).load()
+    assert WellMap(path, wells, 24).load()
+
+
+def test_old_or_empty_map_is_not_resumed(tmp_path):
+    path, wells = str(tmp_path / 'well_map.json'), make_wells()
+    well_map = WellMap(path, wells, 24)
+    well_map.save()
+    assert not WellMap(path, wells, 24).load() # Saved, but nothing done
+    well_map.mark('hydrated', wells[:8])
+    with open(path) as f:
+        state = json.load(f)
+    state['updated'] = '2020/01/01 00:00:00'
+    with open(path, 'w') as f:
+        json.dump(state, f)
+    assert not WellMap(path, wells, 24).load()
+    assert WellMap(path, wells, 24).load(max_age = float('inf'))
+
+
+def test_map_of_another_protocol_is_not_resumed(tmp_path):
+    path, wells = str(tmp_path / 'well_map.json'), make_wells()
+    WellMap(path, wells, 24, 'Station C - Certest setup').mark('hydrated', wells[:8])
+    assert not WellMap(path, wells, 24, 'Station C - Vitro').load()
+    assert not WellMap(path, wells, 24).load()
+    assert WellMap(path, wells, 24, 'Station C - Certest setup').load()
+
+
+def test_map_is_saved_once_per_column(tmp_path, monkeypatch):
+    path, wells = str(tmp_path / 'well_map.json'), make_wells()
+    well_map = WellMap(path, wells, 24)
+    saves = []
+    save = well_map.save
+    monkeypatch.setattr(well_map, 'save', lambda: saves.append(sorted(well_map.done['sample'])) or save())
+    for well in wells[:12]:
+        well_map.mark('sample', [well])
+    assert len(saves) == 1 and len(saves[0]) == 8 # Column 1 complete, column 2 in progress
+    well_map.mark('controls', wells[:1])
+    assert len(saves) == 2 and len(saves[1]) == 12 # The wells of column 2 before another stage
+    resumed = WellMap(path, wells, 24)
+    assert resumed.load()
+    assert len(resumed.pending('sample', wells[:24])) == 12 and not resumed.done['controls']
+
+
+def test_clear_removes_the_map(tmp_path):
+    path, wells = tmp_path / 'well_map.json', make_wells()
+    well_map = WellMap(str(path), wells, 24)
+    well_map.mark('sample', wells[:1])
+    well_map.clear()
+    assert not path.exists()
+    assert not WellMap(str(path), wells, 24).load()
+
+
+def test_nothing_is_written_while_simulating():
+    wells = make_wells()
+    well_map = WellMap(None, wells, 24)
+    well_map.mark('sample', wells[:4])
+    assert well_map.is_done('sample', wells[3]) # Still known during the run
+    assert not WellMap(None, wells, 24).load()
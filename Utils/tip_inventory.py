@@ -0,0 +1,372 @@
+'''
+Tip inventory kept on the robot between runs.
+
+One json file per deck slot and tip type in TIP_INVENTORY_PATH holds the tips
+already taken from the rack of that slot. The protocols start with new racks
+and save them after every pickup; when the operator chooses to continue the
+racks of the previous run, the tips of the files are marked as used. Files are replaced atomically:
+a run stopped while saving leaves the previous count.
+
+plan_tip_refills places the replacement of the racks in the waits of the run
+(incubations, drying) from the tips every STEP will use, so the operator does
+not have to replace them in the middle of a STEP. pick_up takes the next tip,
+replacing the racks first when the tips counted run out. RunTips keeps all of
+it for the multichannel pipette of an extraction run, with the tip of every
+column reused along a chain (see tip_reuse) and the pause for the operator.
+
+Copied into the protocols by Utils/sync_inline.py. Nothing is read or written
+while simulating.
+'''
+import json
+import os
+from datetime import datetime
+
+TIP_INVENTORY_PATH = '/var/lib/jupyter/notebooks/tip_inventory'
+
+
+def tip_inventory_file(slot, tip_type):
+    return os.path.join(TIP_INVENTORY_PATH, 'slot_' + str(slot) + '_' + tip_type + '.json')
+
+
+def read_tip_count(slot, tip_type):
+    '''
+    Tips already taken from the rack of a slot, 0 for a slot without inventory
+    '''
+    try:
+        with open(tip_inventory_file(slot, tip_type)) as f:
+            return int(json.load(f)['used'])
+    except (IOError, ValueError, KeyError):
+        return 0
+
+
+def write_tip_count(slot, tip_type, used):
+    path = tip_inventory_file(slot, tip_type)
+    os.makedirs(TIP_INVENTORY_PATH, exist_ok = True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'slot': str(slot), 'tip_type': tip_type, 'used': used,
+                   'updated': datetime.now().strftime('%Y/%m/%d %H:%M:%S')}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def used_tips(rack):
+    '''
+    Position after the last tip taken from the rack. Tips returned to the rack
+    (tip recycling) have been used, so the gaps before it count as used too.
+    '''
+    wells = rack.wells()
+    for i in reversed(range(len(wells))):
+        if not wells[i].has_tip:
+            return i + 1
+    return 0
+
+
+def free_tips(pip):
+    '''
+    Tips the pipette can still pick up from each of its racks: multichannel
+    pipettes need full columns
+    '''
+    if pip.channels == 1:
+        return [len([well for well in rack.wells() if well.has_tip]) for rack in pip.tip_racks]
+    return [pip.channels * len([column for column in rack.columns() if all(well.has_tip for well in column)])
+            for rack in pip.tip_racks]
+
+
+def available_tips(pip):
+    return sum(free_tips(pip))
+
+
+def tip_refills(free, capacity, demand, replace_all = False):
+    '''
+    Refills of plan_tip_refills, replacing all the racks every time with
+    replace_all
+    '''
+    free = list(free)
+    refills = []
+    for i, (step, tips, wait) in enumerate(demand):
+        if i == 0 or wait:
+            needed = tips
+            for later_step, later_tips, later_wait in demand[i + 1:]:
+                if later_wait:
+                    break
+                needed += later_tips
+            if sum(free) < needed:
+                racks = [k for k in range(len(free)) if free[k] == 0]
+                if replace_all or sum(free) + capacity * len(racks) < needed:
+                    racks = list(range(len(free)))
+                for k in racks:
+                    free[k] = capacity
+                refills.append((step, racks))
+        for k in range(len(free)):
+            taken = min(free[k], tips)
+            free[k] -= taken
+            tips -= taken
+    return refills
+
+
+def plan_tip_refills(free, capacity, demand):
+    '''
+    Racks to replace so that the tips do not run out in the middle of a STEP.
+    free: tips left in each rack (free_tips), capacity: tips of a full rack,
+    demand: (STEP, tips it uses, True if it is a wait) for the STEPS still to
+    run, in order. The racks are checked before the first STEP and at every
+    wait: when the tips left do not reach the next wait, the empty racks are
+    replaced, or all of them if that is not enough. When replacing only the
+    empty racks needs more pauses than replacing all of them, every refill is a
+    full swap. Returns [(STEP, [rack indexes])].
+    '''
+    refills = tip_refills(free, capacity, demand)
+    full_swaps = tip_refills(free, capacity, demand, replace_all = True)
+    return full_swaps if len(full_swaps) < len(refills) else refills
+
+
+def load_tip_inventory(pip, slots, new_slots = None):
+    '''
+    Mark as used the tips the previous runs took from the racks of pip (loaded
+    in slots, in the same order). The racks in new_slots start from their first
+    tip: pass every slot unless the operator chose to continue the racks of the
+    previous run. Returns the counts to pass to save_tip_inventory.
+    '''
+    new_slots = [str(slot) for slot in (new_slots or [])]
+    saved = {}
+    for slot, rack in zip(slots, pip.tip_racks):
+        used = 0 if str(slot) in new_slots else min(read_tip_count(slot, rack.load_name), len(rack.wells()))
+        for well in rack.wells()[:used]:
+            rack.use_tips(well)
+        write_tip_count(slot, rack.load_name, used)
+        saved[str(slot)] = used
+    return saved
+
+
+def save_tip_inventory(pip, slots, saved):
+    '''
+    Write the racks of pip whose used tips changed since the last save
+    '''
+    for slot, rack in zip(slots, pip.tip_racks):
+        used = max(used_tips(rack), saved.get(str(slot), 0))
+        if saved.get(str(slot)) != used:
+            write_tip_count(slot, rack.load_name, used)
+            saved[str(slot)] = used
+
+
+def front_slot(slot):
+    '''
+    Deck slot in front of slot (closer to the operator), None for the front row
+    '''
+    return str(int(slot) - 3) if int(slot) > 3 else None
+
+
+def partial_pickup_racks(pip, deck):
+    '''
+    Racks of pip a partial column can be picked up from: the front nozzles
+    without tip hang past row H, so only the racks with nothing loaded in the
+    slot in front of them (deck: ctx.deck)
+    '''
+    return [rack for rack in pip.tip_racks if front_slot(rack.parent) is None or deck[front_slot(rack.parent)] is None]
+
+
+def next_tip(pip, num_tips = None, deck = None):
+    '''
+    Tip (well of its rack) the next pip.pick_up_tip() without location takes,
+    None when the racks are empty. With num_tips fewer than the channels of a
+    multichannel pipette, the well of the first column whose last num_tips
+    tips are left in the racks of partial_pickup_racks: picking up from it the
+    back nozzles take those tips and the front ones stay out of the rack. A full
+    column without such a rack (or deck).
+    '''
+    if num_tips is not None and num_tips < pip.channels and deck is not None:
+        for rack in partial_pickup_racks(pip, deck):
+            for column in rack.columns():
+                if all(well.has_tip for well in column[len(column) - num_tips:]):
+                    return column[len(column) - num_tips]
+    for rack in pip.tip_racks:
+        tip = rack.next_tip(pip.channels)
+        if tip is not None:
+            return tip
+    return None
+
+
+def pick_up(pip, tip_track, replace_tipracks, num_tips = None, tip_reuse = None, events = None, slots = None, saved = None,
+            deck = None):
+    '''
+    Pick up the next tip of pip (num_tips of a multichannel, see next_tip with
+    deck) and return it. When tip_track counts as many tips as its maxes,
+    replace_tipracks(pip, racks) replaces first the racks without tips kept by
+    tip_reuse. The pickup goes to events and the racks to the inventory (slots
+    and saved as in save_tip_inventory) when given.
+    '''
+    if tip_track['counts'][pip] >= tip_track['maxes'][pip]:
+        replace_tipracks(pip, [k for k, rack in enumerate(pip.tip_racks) if tip_reuse is None or not tip_reuse.holds(rack)])
+    tip = next_tip(pip, num_tips, deck)
+    pip.pick_up_tip(tip)
+    if events is not None:
+        events.event('tip_pickup', tip = tip.display_name)
+    if slots is not None:
+        save_tip_inventory(pip, slots, saved)
+    return tip
+
+
+def column_tips(num_samples, col):
+    '''
+    Tips of column col of num_samples samples: the last column has fewer samples
+    when num_samples is not a multiple of 8
+    '''
+    full_cols = num_samples // 8
+    return 8 if col < full_cols else num_samples - 8 * full_cols
+
+
+RUN_TIPS_MESSAGES = {
+    'en': {'replace': 'Replace the {volume}µl tipracks in slots {slots} before resuming.',
+           'planned': 'Tipracks in slots {slots} will be replaced {when}',
+           'before': 'before starting',
+           'in_step': 'in STEP {step}: {description}'},
+    'es': {'replace': 'Reemplaza las cajas de puntas de {volume}µl de los slots {slots} antes de continuar.',
+           'planned': 'Las cajas de puntas de los slots {slots} se reemplazarán {when}',
+           'before': 'antes de empezar',
+           'in_step': 'en el PASO {step}: {description}'},
+}
+
+
+class RunTips:
+    '''
+    Tips of the multichannel pipette pip of an extraction run, loaded with its
+    racks in slots. Counts the tips used (track, as in pick_up), keeps the
+    inventory of the racks (new_slots as in load_tip_inventory, nothing is read
+    or saved while simulating) and the tip of every column of the chains of
+    tip_reuse, and replaces the racks in the waits of the STEPS: demand holds
+    the tips every STEP uses, see plan_tip_refills. With recycle (testing
+    only) the tips are returned to their racks instead of dropped.
+    '''
+    def __init__(self, ctx, pip, slots, num_samples, steps, demand, tip_reuse, events, lights, new_slots = None,
+                 recycle = False, language = 'en'):
+        self.ctx = ctx
+        self.pip = pip
+        self.slots = slots
+        self.num_samples = num_samples
+        self.steps = steps
+        self.demand = demand
+        self.tip_reuse = tip_reuse
+        self.events = events
+        self.lights = lights
+        self.recycle = recycle
+        self.messages = RUN_TIPS_MESSAGES[language]
+        self.saved = {}
+        self.inventory_slots = None
+        if not ctx.is_simulating():
+            self.saved = load_tip_inventory(pip, slots, new_slots)
+            self.inventory_slots = slots
+        self.track = {'counts': {pip: 0}, 'maxes': {pip: available_tips(pip)}}
+
+    @property
+    def used(self):
+        return self.track['counts'][self.pip]
+
+    @property
+    def maximum(self):
+        return self.track['maxes'][self.pip]
+
+    # ctx.pause() returns at once and the run only stops at the next motion, so the
+    # pipette waits above the trash: the lights blink until the operator resumes
+    def wait_for_operator(self, message):
+        '''
+        Seconds from the pause until the run is resumed
+        '''
+        self.events.event('pause', reason = 'tipracks')
+        self.lights.start('tip_swap')
+        start = datetime.now()
+        self.ctx.pause(message)
+        self.pip.move_to(self.ctx.fixed_trash['A1'].top(z = 10))
+        waited = 0 if self.ctx.is_simulating() else (datetime.now() - start).total_seconds()
+        self.lights.stop()
+        self.events.event('resume', seconds = round(waited, 1))
+        return waited
+
+    # Racks with tips kept for a chain (tip_reuse) are never replaced: those tips are picked up again
+    def replace_tipracks(self, pip, racks):
+        '''
+        Replace the tipracks racks (indexes in pip.tip_racks), returns the seconds paused
+        '''
+        paused = self.wait_for_operator(self.messages['replace'].format(volume = pip.max_volume,
+                                        slots = ', '.join(self.slots[k] for k in racks)))
+        for k in racks:
+            pip.tip_racks[k].reset()
+            self.saved.pop(self.slots[k], None)
+        self.track['maxes'][pip] = self.track['counts'][pip] + available_tips(pip)
+        if self.inventory_slots is not None:
+            save_tip_inventory(pip, self.slots, self.saved)
+        return paused
+
+    def pick_up(self, num_tips = None):
+        '''
+        Pick up a new tip (num_tips of the column, see next_tip) and return it
+        '''
+        return pick_up(self.pip, self.track, self.replace_tipracks, num_tips, tip_reuse = self.tip_reuse, events = self.events,
+                       slots = self.inventory_slots, saved = self.saved, deck = self.ctx.deck)
+
+    def drop(self):
+        '''
+        Drop the tip and count it
+        '''
+        if self.recycle:
+            self.pip.return_tip()
+        else:
+            self.pip.drop_tip(home_after = False)
+        self.track['counts'][self.pip] += 8
+
+    # The same tip for a column along a chain of operations (the wash and the removal
+    # of its supernatant...): it is returned to its rack in between, see tip_reuse
+    def pick_up_column(self, chain, column):
+        '''
+        Pick up the tip kept for column in chain (returns True) or a new one
+        '''
+        tip = self.tip_reuse.tip(chain, column)
+        if tip is not None:
+            self.pip.pick_up_tip(tip)
+            self.events.event('tip_pickup', tip = tip.display_name, kept = True)
+            return True
+        self.tip_reuse.keep(chain, column, self.pick_up(column_tips(self.num_samples, column)))
+        self.track['counts'][self.pip] += 8
+        return False
+
+    def drop_column(self, chain, column, keep):
+        '''
+        Return the tip to its rack if the chain goes on (keep), otherwise drop it
+        '''
+        if self.recycle or (keep and self.tip_reuse.enabled(chain)):
+            self.pip.return_tip()
+        else:
+            self.pip.drop_tip(home_after = False)
+        if not keep:
+            self.tip_reuse.release(chain, column)
+
+    # Tipracks replaced in the waits: the tips of every STEP are known before the run,
+    # so the racks that would run out are replaced in the last wait before it happens
+    def refill_plan(self, first_step):
+        if self.recycle:
+            return []
+        demand = [(s, self.demand.get(s, 0), 'wait_time' in self.steps[s]) for s in sorted(self.steps)
+                  if s >= first_step and self.steps[s]['Execute']]
+        return plan_tip_refills(free_tips(self.pip), len(self.pip.tip_racks[0].wells()), demand)
+
+    def refill_break(self, step):
+        '''
+        Replace the tipracks planned for step, returns the seconds paused
+        '''
+        refills = self.refill_plan(step)
+        if not refills or refills[0][0] != step:
+            return 0
+        racks = [k for k in refills[0][1] if not self.tip_reuse.holds(self.pip.tip_racks[k])] # Not the racks with kept tips
+        if not racks:
+            return 0
+        return self.replace_tipracks(self.pip, racks)
+
+    def start(self, run_log, first_step):
+        '''
+        Log the tipracks the run will replace and replace the ones planned before first_step
+        '''
+        for step, racks in self.refill_plan(first_step):
+            when = self.messages['before'] if step == first_step else \
+                self.messages['in_step'].format(step = step, description = self.steps[step]['description'])
+            run_log.operator(self.messages['planned'].format(slots = ', '.join(self.slots[k] for k in racks), when = when))
+        return self.refill_break(first_step)
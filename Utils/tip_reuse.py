@@ -0,0 +1,53 @@
+'''
+Tips reused by the same column along a chain of operations.
+
+A column that receives a wash and later has its supernatant removed can do
+both with the same tip, which is returned to its rack in between. TipReuse
+keeps the tip of every column for each chain ('WASH', 'ELUTION'...): the first
+operation of the chain takes the next tip of the racks and the following ones
+pick that tip up again for the same column only. The chain uses one tip per
+column, and a tip is never given to two columns. The tips are thrown away at
+the last operation of the chain.
+
+Copied into the protocols by Utils/sync_inline.py.
+'''
+
+
+class TipReuse:
+    '''
+    Tips kept for each column of the enabled chains. Chains not enabled get a
+    new tip for every operation.
+    '''
+    def __init__(self, chains):
+        self.chains = dict((chain, {}) for chain in chains)
+
+    def enabled(self, chain):
+        return chain in self.chains
+
+    def tip(self, chain, column):
+        '''
+        Tip kept for column in chain, None when the column needs a new tip
+        '''
+        return self.chains.get(chain, {}).get(column)
+
+    def keep(self, chain, column, tip):
+        if not self.enabled(chain):
+            return
+        for other_chain, tips in self.chains.items():
+            for other_column, other_tip in tips.items():
+                if other_tip is tip and (other_chain, other_column) != (chain, column):
+                    raise ValueError('Tip ' + str(tip) + ' is already kept for column ' + str(other_column + 1) +
+                                     ' in ' + other_chain)
+        self.chains[chain][column] = tip
+
+    def release(self, chain, column):
+        '''
+        The tip of column in chain is thrown away
+        '''
+        self.chains.get(chain, {}).pop(column, None)
+
+    def holds(self, rack):
+        '''
+        True if a tip kept for a chain is in rack (it must not be replaced)
+        '''
+        return any(tip.parent is rack for tips in self.chains.values() for tip in tips.values())
@@ -0,0 +1,105 @@
+'''
+Wells of the qPCR plate done, kept on the robot to restart a stopped run.
+
+When a Station C run stopped half way the plate had to be finished by hand or
+with a backup protocol. WellMap records every well as soon as it is done, one
+map per stage (WELL_MAP_STAGES), and saves them as strings of '0' and '1' in
+the order of the wells of the plate. The map is saved once per column, when a
+column of a stage is complete or before the wells of another column or stage
+are marked, so a stop loses at most the wells of the column in progress. A run
+started with RESUME_FROM_WELL_MAP = True that finds the map of the same
+protocol (its protocolName) for the same number of samples saved less than
+WELL_MAP_MAX_AGE seconds ago only processes the wells that are not done. The
+file is replaced atomically and removed at the end of the run.
+
+Copied into the protocols by Utils/sync_inline.py. Pass path = None while
+simulating: nothing is read or written.
+'''
+import json
+import os
+from datetime import datetime
+
+WELL_MAP_STAGES     = ['hydrated', 'mastermix', 'sample', 'controls']
+WELL_MAP_MAX_AGE    = 12 * 3600 # seconds after its last save a map is resumed
+WELL_MAP_FORMAT     = '%Y/%m/%d %H:%M:%S'
+
+
+def well_column(name):
+    return name.lstrip('ABCDEFGHIJKLMNOP')
+
+
+class WellMap:
+    def __init__(self, path, wells, num_samples, protocol = None):
+        self.path = path
+        self.names = [well.well_name for well in wells]
+        self.num_samples = num_samples
+        self.protocol = protocol
+        self.columns = {}
+        for name in self.names:
+            self.columns.setdefault(well_column(name), []).append(name)
+        self.done = {stage: set() for stage in WELL_MAP_STAGES}
+        self.unsaved = None # (stage, column) of the wells marked and not saved yet
+        self.updated = None
+
+    def load(self, max_age = WELL_MAP_MAX_AGE):
+        '''
+        Wells done by a stopped run, True when there are any
+        '''
+        if self.path is None:
+            return False
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            age = (datetime.now() - datetime.strptime(state['updated'], WELL_MAP_FORMAT)).total_seconds()
+        except (IOError, ValueError, KeyError):
+            return False
+        if state.get('protocol') != self.protocol or state.get('num_samples') != self.num_samples \
+                or state.get('wells') != self.names or age > max_age:
+            return False
+        for stage, bitmap in state['stages'].items():
+            self.done[stage] = {name for name, bit in zip(self.names, bitmap) if bit == '1'}
+        self.updated = state['updated']
+        return any(self.done.values())
+
+    def is_done(self, stage, well):
+        return well.well_name in self.done[stage]
+
+    def pending(self, stage, wells):
+        return [well for well in wells if not self.is_done(stage, well)]
+
+    def mark(self, stage, wells):
+        '''
+        Record wells of stage as done, saving the map once per column
+        '''
+        for well in wells:
+            key = (stage, well_column(well.well_name))
+            if self.unsaved is not None and self.unsaved != key:
+                self.save()
+            self.done[stage].add(well.well_name)
+            self.unsaved = key
+        if self.unsaved is not None and all(name in self.done[self.unsaved[0]] for name in self.columns[self.unsaved[1]]):
+            self.save()
+
+    def save(self):
+        self.unsaved = None
+        if self.path is None:
+            return
+        self.updated = datetime.now().strftime(WELL_MAP_FORMAT)
+        state = {'protocol': self.protocol, 'num_samples': self.num_samples, 'updated': self.updated, 'wells': self.names,
+                 'stages': {stage: ''.join('1' if name in done else '0' for name in self.names)
+                            for stage, done in self.done.items()}}
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.path + '.tmp', self.path)
+
+    def summary(self):
+        '''
+        One line per stage with wells done
+        '''
+        return [stage + ': ' + str(len(done)) + ' wells done' for stage, done in self.done.items() if done]
+
+    def clear(self):
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)